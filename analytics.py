@@ -0,0 +1,122 @@
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import Integer, case, cast, func, or_, select
+from sqlalchemy.orm import Session
+
+import models
+
+# Agregados del dashboard del bot (GET /api/bots/analytics), calculados en SQL y acotados al tenant: la memoria no
+# depende del largo del período (antes se traían todos los ChatHistory del rango, hasta 10 años en 'Todo').
+# - Actividad: width_bucket sobre el epoch de created_at -> un COUNT por bucket.
+# - Tiempo de respuesta: LAG(role / created_at) por conversación; una respuesta del bot cuenta si el mensaje anterior
+#   fue del usuario y llegó hace menos de RESPONSE_WINDOW_SECONDS (mismo criterio que el loop anterior).
+# - Temas: SUM(CASE WHEN texto LIKE ...) en una sola pasada, sobre el texto decodificado de parts (message_text): el
+#   cast del JSON a texto deja los acentos como \uXXXX y "dónde" o "cuánto" no matcheaban.
+# Fuera de Postgres (tests) el epoch sale de julianday() y los buckets de una división entera.
+
+BOT_ROLES = ("model", "assistant", "bot")
+RESPONSE_WINDOW_SECONDS = 300
+
+TOPIC_KEYWORDS = {
+    "Precios": ("precio", "cuanto", "cuánto", "valor"),
+    "Agendar Visita": ("visita", "ver", "mostrar", "agendar"),
+    "Financiación": ("financia", "cuota", "credito", "crédito"),
+    "Ubicación": ("ubicacion", "ubicación", "dónde", "donde", "zona"),
+    "Requisitos": ("requisit", "garant", "recibo"),
+}
+
+def epoch(column, dialect: str):
+    """Segundos desde 1970 de un DateTime naive en UTC."""
+    if dialect == "postgresql":
+        return func.extract("epoch", column)
+    return (func.julianday(column) - 2440587.5) * 86400.0
+
+def _utc_epoch(moment: datetime) -> float:
+    return (moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)).timestamp()
+
+def _messages(tenant_id: int, start: datetime, end: datetime):
+    return (
+        models.ChatHistory.tenant_id == tenant_id,
+        models.ChatHistory.created_at >= start,
+        models.ChatHistory.created_at < end,
+    )
+
+def active_conversations(db: Session, tenant_id: int, start: datetime, end: datetime) -> int:
+    """Conversaciones (sender_id) con al menos un mensaje en [start, end)."""
+    return db.scalar(select(func.count(func.distinct(models.ChatHistory.sender_id))).where(*_messages(tenant_id, start, end))) or 0
+
+def activity_buckets(db: Session, tenant_id: int, start: datetime, end: datetime, buckets: int) -> List[int]:
+    """Mensajes por bucket: `buckets` intervalos del mismo ancho entre start y end."""
+    dialect = db.get_bind().dialect.name
+    low, high = _utc_epoch(start), _utc_epoch(end)
+    seconds = epoch(models.ChatHistory.created_at, dialect)
+    if dialect == "postgresql":
+        bucket = func.width_bucket(seconds, low, high, buckets)
+    else:
+        bucket = cast((seconds - low) * buckets / (high - low), Integer) + 1
+    rows = db.execute(
+        select(bucket.label("bucket"), func.count().label("messages")).where(*_messages(tenant_id, start, end)).group_by(bucket)
+    ).all()
+    counts = [0] * buckets
+    for b, messages in rows:
+        if b is not None and 1 <= b <= buckets:
+            counts[int(b) - 1] = messages
+    return counts
+
+def response_time(db: Session, tenant_id: int, start: datetime, end: datetime) -> Optional[float]:
+    """Promedio (segundos) entre el último mensaje del usuario y la respuesta del bot. None si no hubo respuestas."""
+    dialect = db.get_bind().dialect.name
+    role = func.lower(models.ChatHistory.role)
+    window = dict(partition_by=models.ChatHistory.sender_id, order_by=(models.ChatHistory.created_at, models.ChatHistory.id))
+    turns = select(
+        role.label("role"),
+        func.lag(role).over(**window).label("previous_role"),
+        epoch(models.ChatHistory.created_at, dialect).label("at"),
+        func.lag(epoch(models.ChatHistory.created_at, dialect)).over(**window).label("previous_at"),
+    ).where(*_messages(tenant_id, start, end)).subquery("turns")
+    latency = turns.c.at - turns.c.previous_at
+    return db.scalar(select(func.avg(latency)).where(
+        turns.c.role.in_(BOT_ROLES),
+        turns.c.previous_role == "user",
+        latency >= 0,
+        latency < RESPONSE_WINDOW_SECONDS,
+    ))
+
+def message_text(dialect: str):
+    """Strings de parts (lista JSON) unidos por espacios, ya decodificados. Subconsulta correlacionada con chat_history."""
+    parts = models.ChatHistory.parts
+    if dialect == "postgresql":
+        array = case((func.json_typeof(parts) == "array", parts), else_=func.json_build_array(parts))
+        elements = func.json_array_elements_text(array).table_valued("value")
+        return select(func.string_agg(elements.c.value, " ")).scalar_subquery()
+    elements = func.json_each(parts).table_valued("value")
+    return select(func.group_concat(elements.c.value, " ")).scalar_subquery()
+
+def topic_counts(db: Session, tenant_id: int, start: datetime, end: datetime) -> Dict[str, int]:
+    text = func.lower(func.coalesce(message_text(db.get_bind().dialect.name), ""))
+    sums = [
+        func.coalesce(func.sum(case((or_(*(text.like(f"%{k}%") for k in keywords)), 1), else_=0)), 0).label(f"t{i}")
+        for i, keywords in enumerate(TOPIC_KEYWORDS.values())
+    ]
+    row = db.execute(select(*sums).where(*_messages(tenant_id, start, end))).one()
+    return dict(zip(TOPIC_KEYWORDS, row))
+
+def sentiment_counts(db: Session, tenant_id: int, start: datetime) -> Dict[str, int]:
+    rows = db.execute(select(func.upper(models.Contact.lead_sentiment), func.count(models.Contact.id)).where(
+        models.Contact.tenant_id == tenant_id,
+        models.Contact.created_at >= start,
+        models.Contact.lead_sentiment != None,
+    ).group_by(func.upper(models.Contact.lead_sentiment))).all()
+    return {sentiment: count for sentiment, count in rows}
+
+def lead_counts(db: Session, tenant_id: int, start: datetime, end: Optional[datetime] = None) -> Dict[str, int]:
+    """Leads creados y cuántos de ellos están HOT, en una consulta."""
+    conditions = [models.Contact.tenant_id == tenant_id, models.Contact.created_at >= start]
+    if end is not None:
+        conditions.append(models.Contact.created_at < end)
+    total, hot = db.execute(select(
+        func.count(models.Contact.id),
+        func.coalesce(func.sum(case((models.Contact.status == "HOT", 1), else_=0)), 0),
+    ).where(*conditions)).one()
+    return {"total": total, "hot": hot}
@@ -1,4 +1,8 @@
 import os
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from jose import JWTError, jwt
@@ -6,7 +10,11 @@ from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from settings import settings
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import bcrypt
+import models
+from database import get_async_db
 
 # --- FIX DE COMPATIBILIDAD BCRYPT / PASSLIB ---
 # Las versiones nuevas de bcrypt (4.0.0+) eliminaron el atributo '__about__'
@@ -82,4 +90,71 @@ async def get_current_user_email(request: Request, token: str = Depends(oauth2_s
                 f.write(f"[{datetime.now()}] JWT Error: {str(e)} | Token: {token[:20]}... | Secret: {SECRET_KEY[:5]}...\n")
         except:
              pass
-        raise credentials_exception
\ No newline at end of file
+        raise credentials_exception
+# --- Principal autenticado ---
+# Casi todas las rutas hacían `db.query(User).filter(User.email == email).first()` después de decodificar el JWT:
+# un round trip extra por request. get_current_principal devuelve solo lo que las rutas usan (id, tenant, rol,
+# activo) desde un cache LRU con TTL por proceso, keyed por el `sub` del token. Las escrituras sobre usuarios
+# (team.update_member / delete_member, users.update_profile, register) llaman a invalidate_principal; en otros
+# workers el cambio se ve como mucho después de principal_cache_ttl_seconds.
+
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    email: str
+    tenant_id: Optional[int]
+    role: Optional[str]
+    is_active: bool
+
+_principals = OrderedDict() # email -> (expira_en, Principal)
+_principals_lock = threading.Lock()
+_principal_counters = {"hits": 0, "misses": 0}
+
+def _principal_get(email: str) -> Optional[Principal]:
+    with _principals_lock:
+        entry = _principals.get(email)
+        if entry is None or entry[0] < time.monotonic():
+            _principals.pop(email, None)
+            _principal_counters["misses"] += 1
+            return None
+        _principals.move_to_end(email)
+        _principal_counters["hits"] += 1
+        return entry[1]
+
+def _principal_put(principal: Principal):
+    with _principals_lock:
+        _principals[principal.email] = (time.monotonic() + settings.principal_cache_ttl_seconds, principal)
+        _principals.move_to_end(principal.email)
+        while len(_principals) > settings.principal_cache_size:
+            _principals.popitem(last=False)
+
+def invalidate_principal(*emails: Optional[str]):
+    """Descarta el principal cacheado de `emails` (llamar después de cambiar rol, tenant, email o estado)."""
+    with _principals_lock:
+        for email in emails:
+            _principals.pop(email, None)
+
+def clear_principals():
+    with _principals_lock:
+        _principals.clear()
+
+def principal_stats() -> dict:
+    with _principals_lock:
+        return {**_principal_counters, "entries": len(_principals), "ttl_seconds": settings.principal_cache_ttl_seconds}
+
+async def get_current_principal(email: str = Depends(get_current_user_email), db: AsyncSession = Depends(get_async_db)) -> Principal:
+    """Usuario autenticado (inmutable). 401 si el token no corresponde a un usuario, 403 si está desactivado."""
+    principal = _principal_get(email)
+    if principal is None:
+        row = (await db.execute(select(
+            models.User.id, models.User.email, models.User.tenant_id, models.User.role, models.User.is_active
+        ).where(models.User.email == email))).first()
+        if row is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials",
+                                headers={"WWW-Authenticate": "Bearer"})
+        # is_active NULL (filas previas a la columna) cuenta como activo
+        principal = Principal(id=row.id, email=row.email, tenant_id=row.tenant_id, role=row.role, is_active=row.is_active is not False)
+        _principal_put(principal)
+    if not principal.is_active:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Usuario desactivado")
+    return principal
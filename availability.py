@@ -0,0 +1,240 @@
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, load_only
+
+import models
+from settings import settings
+
+# Disponibilidad de visitas (tool get_availability del bot y GET /api/bots/{instance}/availability).
+#
+# Una sola consulta por rango trae los eventos que se solapan con toda la ventana pedida. Un sweep-line sobre los
+# bordes ordenados arma los segmentos de ocupación (inicio, fin, visitas simultáneas) y cada slot toma el pico de
+# ocupación de los segmentos que cruza: cupo restante = max_simultaneous_visits - pico. El paso entre slots (step)
+# es independiente de la duración de la visita (slots de 60 min cada 30, por ejemplo).
+#
+# Con propiedad, los slots de cada día quedan en un cache por proceso keyed (propiedad, día, configuración) hasta
+# que se escribe un evento de esa propiedad (listener de abajo) o vence availability_cache_ttl_seconds (escrituras
+# en otros workers).
+
+DEFAULT_SLOT_MINUTES = 30
+# Eventos que empiezan antes de la ventana y todavía la ocupan: se miran hasta un día hacia atrás (acota el rango
+# sobre ix_calendar_events_property_start en vez de recorrer toda la historia de la propiedad)
+MAX_EVENT_SPAN = timedelta(days=1)
+
+@dataclass(frozen=True)
+class DayWindow:
+    date: str # 2026-10-19
+    day: str # Mon, Tue...
+    start: datetime
+    end: datetime
+
+def day_windows(start_date: datetime, days: int, schedules: Optional[dict]) -> List[DayWindow]:
+    """Horario de atención de cada día: { "Mon": {"enabled": true, "start": "09:00", "end": "18:00"}, ... }.
+    Días sin configuración, deshabilitados o con horas mal formadas quedan afuera."""
+    windows = []
+    for i in range(days):
+        current_day = start_date + timedelta(days=i)
+        day_str = current_day.strftime("%a")
+        date_str = current_day.strftime("%Y-%m-%d")
+        schedule = (schedules or {}).get(day_str)
+        if not schedule or not schedule.get("enabled"):
+            continue
+        try:
+            work_start = datetime.strptime(f"{date_str} {schedule['start']}", "%Y-%m-%d %H:%M")
+            work_end = datetime.strptime(f"{date_str} {schedule['end']}", "%Y-%m-%d %H:%M")
+        except (KeyError, TypeError, ValueError):
+            continue
+        windows.append(DayWindow(date_str, day_str, work_start, work_end))
+    return windows
+
+def events_query(window_start: datetime, window_end: datetime, property_id: int = None, agent_id: int = None):
+    """Eventos no cancelados que se solapan con [window_start, window_end), de la propiedad o, sin propiedad, del agente."""
+    CalendarEvent = models.CalendarEvent
+    owner = CalendarEvent.property_id == property_id if property_id else CalendarEvent.agent_id == agent_id
+    return select(CalendarEvent.start_time, CalendarEvent.end_time).where(
+        owner,
+        CalendarEvent.start_time < window_end,
+        CalendarEvent.start_time >= window_start - MAX_EVENT_SPAN,
+        CalendarEvent.end_time > window_start,
+        CalendarEvent.status != "CANCELLED",
+    ).order_by(CalendarEvent.start_time)
+
+def busy_segments(intervals) -> List[Tuple[datetime, datetime, int]]:
+    """[(inicio, fin)] -> [(inicio, fin, ocupación)] ordenados, disjuntos y con ocupación > 0 (sweep-line)."""
+    points = []
+    for start, end in intervals:
+        if start and end and start < end:
+            points.append((start, 1))
+            points.append((end, -1))
+    # Intervalos semiabiertos: en el mismo instante primero salen y después entran
+    points.sort()
+    segments, count, previous = [], 0, None
+    for at, delta in points:
+        if count > 0 and previous < at:
+            segments.append((previous, at, count))
+        count += delta
+        previous = at
+    return segments
+
+def day_slots(window: DayWindow, segments, segment_ends, duration: timedelta, step: timedelta, capacity: int) -> List[dict]:
+    """Slots de `duration` cada `step` dentro del horario del día, con el cupo que les queda."""
+    slots = []
+    i = bisect.bisect_right(segment_ends, window.start)
+    slot_start = window.start
+    while slot_start + duration <= window.end:
+        slot_end = slot_start + duration
+        while i < len(segments) and segments[i][1] <= slot_start:
+            i += 1
+        peak, j = 0, i
+        while j < len(segments) and segments[j][0] < slot_end:
+            peak = max(peak, segments[j][2])
+            j += 1
+        if peak < capacity:
+            slots.append({
+                "date": window.date,
+                "day": window.day,
+                "start": slot_start.strftime("%H:%M"),
+                "end": slot_end.strftime("%H:%M"),
+                "remaining": capacity - peak,
+            })
+        slot_start += step
+    return slots
+
+# --- Cache (propiedad, día) ---
+
+_days = OrderedDict() # property_id -> {(día, configuración): (expira_en, slots)}
+_days_lock = threading.Lock()
+_day_counters = {"hits": 0, "misses": 0}
+
+def _cache_get(property_id: int, key) -> Optional[List[dict]]:
+    with _days_lock:
+        entry = _days.get(property_id, {}).get(key)
+        if entry is None or entry[0] < time.monotonic():
+            _day_counters["misses"] += 1
+            return None
+        _days.move_to_end(property_id)
+        _day_counters["hits"] += 1
+        return entry[1]
+
+def _cache_put(property_id: int, key, slots: List[dict]):
+    with _days_lock:
+        _days.setdefault(property_id, {})[key] = (time.monotonic() + settings.availability_cache_ttl_seconds, slots)
+        _days.move_to_end(property_id)
+        while len(_days) > settings.availability_cache_properties:
+            _days.popitem(last=False)
+
+def invalidate_property(*property_ids: Optional[int]):
+    with _days_lock:
+        for property_id in property_ids:
+            _days.pop(property_id, None)
+
+def clear_cache():
+    with _days_lock:
+        _days.clear()
+
+def cache_stats() -> dict:
+    with _days_lock:
+        return {**_day_counters, "properties": len(_days)}
+
+_TOUCHED = "availability_touched_properties"
+
+@event.listens_for(Session, "after_flush")
+def _collect_touched_properties(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, models.CalendarEvent):
+            # Valor nuevo y anterior: mover una visita de propiedad libera cupo en la otra
+            session.info.setdefault(_TOUCHED, set()).update(
+                p for p in inspect(obj).attrs.property_id.history.sum() if p is not None
+            )
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_touched_properties(session):
+    # Recién después del commit: invalidar en el flush dejaría que otro request recalcule y cachee el estado viejo
+    touched = session.info.pop(_TOUCHED, None)
+    if touched:
+        invalidate_property(*touched)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_touched_properties(session):
+    session.info.pop(_TOUCHED, None)
+
+# --- Consulta ---
+
+def available_slots(
+    db: Session,
+    windows: Sequence[DayWindow],
+    duration_minutes: int,
+    step_minutes: Optional[int] = None,
+    capacity: int = 1,
+    property_id: Optional[int] = None,
+    agent_id: Optional[int] = None,
+) -> List[dict]:
+    """Slots libres de todos los días de `windows`. Con property_id cuenta el cupo de esa propiedad (y cachea por
+    día); sin propiedad, cualquier evento del agente bloquea."""
+    duration = timedelta(minutes=duration_minutes or DEFAULT_SLOT_MINUTES)
+    step = timedelta(minutes=step_minutes) if step_minutes and step_minutes > 0 else duration
+    capacity = max(capacity or 1, 1) if property_id else 1
+
+    by_date: Dict[str, List[dict]] = {}
+    missing = []
+    for window in windows:
+        cached = None
+        if property_id:
+            cached = _cache_get(property_id, (window.date, window.start, window.end, duration, step, capacity))
+        if cached is None:
+            missing.append(window)
+        else:
+            by_date[window.date] = cached
+
+    if missing:
+        rows = db.execute(events_query(missing[0].start, missing[-1].end, property_id, agent_id)).all()
+        segments = busy_segments(rows)
+        segment_ends = [s[1] for s in segments]
+        for window in missing:
+            slots = day_slots(window, segments, segment_ends, duration, step, capacity)
+            by_date[window.date] = slots
+            if property_id:
+                _cache_put(property_id, (window.date, window.start, window.end, duration, step, capacity), slots)
+
+    return [slot for window in windows for slot in by_date[window.date]]
+
+def bot_availability(db: Session, instance_name: str, date: Optional[str] = None, days: int = 3,
+                     property_id: Optional[int] = None, step_minutes: Optional[int] = None,
+                     bot: Optional[models.Bot] = None) -> dict:
+    """
+    Slots libres para el bot `instance_name` en los próximos `days` días desde `date` (hoy si no viene).
+    - Con property_id: horarios, duración de visita y cupo (max_simultaneous_visits) de esa propiedad; solo
+      cuentan los eventos de la propiedad (la agenda personal del agente no la bloquea).
+    - Sin propiedad: horario del bot, slots de 30 min, bloquea cualquier evento del agente dueño del bot.
+    `bot`: el Bot ya cargado (memo de las tools del turno, bot_tools.py), evita volver a consultarlo.
+    LookupError si no existe el bot o la propiedad.
+    """
+    if bot is None:
+        bot = db.scalar(select(models.Bot).where(models.Bot.instance_name == instance_name))
+    if not bot:
+        raise LookupError("Bot instance not found")
+    start_date = datetime.strptime(date, "%Y-%m-%d") if date else datetime.now()
+
+    if not property_id:
+        windows = day_windows(start_date, days, bot.business_hours)
+        return {"available_slots": available_slots(db, windows, DEFAULT_SLOT_MINUTES, step_minutes, agent_id=bot.user_id)}
+
+    tenant_id = db.scalar(select(models.User.tenant_id).where(models.User.id == bot.user_id))
+    prop = db.scalar(select(models.Property).options(
+        load_only(models.Property.id, models.Property.status, models.Property.visit_availability,
+                  models.Property.visit_duration, models.Property.max_simultaneous_visits)
+    ).where(models.Property.id == property_id, models.Property.tenant_id == tenant_id))
+    if not prop or prop.status == "Deleted":
+        raise LookupError("Property not found of not enabled.")
+
+    windows = day_windows(start_date, days, prop.visit_availability)
+    return {"available_slots": available_slots(
+        db, windows, prop.visit_duration, step_minutes, prop.max_simultaneous_visits, property_id=prop.id
+    )}
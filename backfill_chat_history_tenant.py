@@ -0,0 +1,45 @@
+import sys
+import os
+
+sys.path.append(os.getcwd())
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import argparse
+import time
+from sqlalchemy import text
+from database import SessionLocal
+import phones
+
+# Sufijo del teléfono (phones.PHONE_SUFFIX_DIGITS) del remitente que coincide con contactos de un solo tenant. El jid
+# de WhatsApp pierde el ":device" y el "@dominio" antes de quedarse con los dígitos, igual que phones.normalize_phone
+BACKFILL_SQL = f"""
+    UPDATE chat_history h SET tenant_id = m.tenant_id
+    FROM (SELECT right(phone_normalized, {phones.PHONE_SUFFIX_DIGITS}) AS suffix, min(tenant_id) AS tenant_id FROM contacts
+          WHERE phone_normalized IS NOT NULL GROUP BY 1 HAVING count(DISTINCT tenant_id) = 1) m
+    WHERE h.tenant_id IS NULL AND h.id > :start AND h.id <= :end
+      AND right(regexp_replace(split_part(split_part(h.sender_id, '@', 1), ':', 1), '[^0-9]', '', 'g'), {phones.PHONE_SUFFIX_DIGITS}) = m.suffix
+"""
+
+def backfill(batch_size=50000):
+    """Asigna el tenant a los mensajes del bot anteriores a chat_history.tenant_id (analytics.py), de a `batch_size`
+    ids por transacción. Correrlo una vez después de migrar; los que no coinciden con ningún contacto quedan en NULL."""
+    print("Starting chat_history tenant backfill...")
+    started = time.perf_counter()
+    with SessionLocal() as db:
+        try:
+            last_id = db.execute(text("SELECT coalesce(max(id), 0) FROM chat_history WHERE tenant_id IS NULL")).scalar()
+            updated = 0
+            for start in range(0, last_id, batch_size):
+                updated += db.execute(text(BACKFILL_SQL), {"start": start, "end": start + batch_size}).rowcount
+                db.commit()
+            print(f"Backfill completed successfully. {updated} messages assigned in {time.perf_counter() - started:.1f}s.")
+        except Exception as e:
+            db.rollback()
+            print(f"Critical Error: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=50000)
+    backfill(parser.parse_args().batch_size)
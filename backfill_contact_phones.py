@@ -0,0 +1,42 @@
+import sys
+import os
+
+sys.path.append(os.getcwd())
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import argparse
+import time
+from sqlalchemy import text
+from database import SessionLocal
+import phones
+
+# Misma normalización que phones.normalize_phone. Los teléfonos sin dígitos útiles quedan en NULL, por eso se recorre
+# por rangos de id en lugar de repetir "WHERE phone_normalized IS NULL" hasta que no quede nada
+BACKFILL_SQL = f"""
+    UPDATE contacts SET phone_normalized = {phones.NORMALIZE_SQL}
+    WHERE phone_normalized IS NULL AND phone ~ '[0-9]' AND id > :start AND id <= :end
+"""
+
+def backfill(batch_size=50000):
+    """Normaliza el teléfono de los contactos anteriores a contacts.phone_normalized (phones.py), de a `batch_size`
+    ids por transacción. Correrlo una vez después de migrar; los contactos nuevos ya se guardan normalizados."""
+    print("Starting contact phone backfill...")
+    started = time.perf_counter()
+    with SessionLocal() as db:
+        try:
+            last_id = db.execute(text("SELECT coalesce(max(id), 0) FROM contacts WHERE phone_normalized IS NULL")).scalar()
+            updated = 0
+            for start in range(0, last_id, batch_size):
+                updated += db.execute(text(BACKFILL_SQL), {"start": start, "end": start + batch_size}).rowcount
+                db.commit()
+            print(f"Backfill completed successfully. {updated} contacts normalized in {time.perf_counter() - started:.1f}s.")
+        except Exception as e:
+            db.rollback()
+            print(f"Critical Error: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=50000)
+    backfill(parser.parse_args().batch_size)
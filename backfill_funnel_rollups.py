@@ -0,0 +1,30 @@
+import sys
+import os
+
+sys.path.append(os.getcwd())
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import argparse
+import time
+from database import SessionLocal
+import funnel
+
+def backfill(tenant_id=None):
+    """Recalcula los rollups del embudo (funnel.rebuild) desde deals + deal_history. Correrlo una vez después de
+    crear las tablas; los deals que se muevan mientras corre pueden quedar contados dos veces (volver a correrlo)."""
+    print("Starting funnel rollups backfill...")
+    started = time.perf_counter()
+    with SessionLocal() as db:
+        try:
+            processed = funnel.rebuild(db, tenant_id)
+            print(f"Backfill completed successfully. {processed} deals replayed in {time.perf_counter() - started:.1f}s.")
+        except Exception as e:
+            db.rollback()
+            print(f"Critical Error: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tenant-id", type=int, default=None)
+    backfill(parser.parse_args().tenant_id)
@@ -0,0 +1,43 @@
+import sys
+import os
+
+sys.path.append(os.getcwd())
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import argparse
+import time
+from sqlalchemy import text
+from database import SessionLocal
+
+# Portales en minúscula (models.Property._lower_portals): los filtros @> y el feed comparan en minúscula
+BACKFILL_SQL = """
+    UPDATE properties SET published_on_portals = (
+        SELECT coalesce(jsonb_agg(lower(p)), '[]'::jsonb) FROM jsonb_array_elements_text(published_on_portals) p
+    )
+    WHERE id > :start AND id <= :end
+      AND jsonb_typeof(published_on_portals) = 'array' AND published_on_portals::text <> lower(published_on_portals::text)
+"""
+
+def backfill(batch_size=50000):
+    """Pasa a minúscula published_on_portals de las propiedades cargadas antes del validador, de a `batch_size` ids
+    por transacción. Correrlo una vez después de convertir la columna a JSONB (main.py)."""
+    print("Starting published_on_portals backfill...")
+    started = time.perf_counter()
+    with SessionLocal() as db:
+        try:
+            last_id = db.execute(text("SELECT coalesce(max(id), 0) FROM properties")).scalar()
+            updated = 0
+            for start in range(0, last_id, batch_size):
+                updated += db.execute(text(BACKFILL_SQL), {"start": start, "end": start + batch_size}).rowcount
+                db.commit()
+            print(f"Backfill completed successfully. {updated} properties updated in {time.perf_counter() - started:.1f}s.")
+        except Exception as e:
+            db.rollback()
+            print(f"Critical Error: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=50000)
+    backfill(parser.parse_args().batch_size)
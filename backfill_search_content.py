@@ -1,4 +1,3 @@
-
 import sys
 import os
 
@@ -10,53 +9,27 @@ import os
 # Load local backend .env (where API_KEY and DB_URL are now)
 load_dotenv()
 
-from sqlalchemy.orm import Session
-from database import SessionLocal
-import models
-from routers import ai_service
+import logging
 import time
+from background_tasks import backfill_property_embeddings
 
 def backfill():
     print("Starting backfill process...")
-    db = SessionLocal()
+    # Progreso por chunk vía logger "urbanocrm.background"
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+    started = time.perf_counter()
     try:
-        props = db.query(models.Property).all()
-        print(f"Found {len(props)} properties.")
-        
-        count = 0
-        for prop in props:
-            count += 1
-            print(f"[{count}/{len(props)}] Processing Property ID {prop.id}: {prop.address}")
-            
-            # 1. Generate new context (includes Address now)
-            try:
-                context_str = ai_service.generate_property_context_string(prop)
-                
-                # 2. Save to search_content
-                prop.search_content = context_str
-                
-                # 3. Regenerate Embedding (task_type=retrieval_document)
-                vector = ai_service.get_embedding(context_str, task_type="retrieval_document")
-                
-                if vector:
-                    prop.embedding_descripcion = vector
-                    print("   -> Context and Embedding updated.")
-                else:
-                    print("   -> Context updated. Embedding failed (API error?).")
-                    
-                # Commit every item or batch to save progress
-                db.commit()
-                time.sleep(0.5) 
-                
-            except Exception as e:
-                print(f"   -> Error processing property {prop.id}: {e}")
-                
-        print("Backfill completed successfully.")
-        
+        # 1. Regenera el contexto (incluye Address) y lo guarda en search_content
+        # 2. Regenera el embedding (task_type=retrieval_document) en batches, con UPDATE masivo por chunk
+        updated = backfill_property_embeddings(
+            only_missing=False,
+            refresh_search_content=True,
+            task_type="retrieval_document"
+        )
+        print(f"Backfill completed successfully. {updated} embeddings updated in {time.perf_counter() - started:.1f}s.")
+
     except Exception as e:
         print(f"Critical Error: {e}")
-    finally:
-        db.close()
 
 if __name__ == "__main__":
     backfill()
@@ -1,15 +1,20 @@
 import logging
+from sqlalchemy import update
+from sqlalchemy.orm import load_only
 from database import SessionLocal
+from settings import settings
 import models
 from routers import ai_service
+import embedding_cache
 
 logger = logging.getLogger("urbanocrm.background")
 
 def background_sync_property_ai(property_id: int):
     """
-    Ejecuta el pipeline de IA en background.
+    Ejecuta el pipeline de IA en background (job "property_ai_sync" del job_queue).
     Instancia una nueva sesión DB para evitar problemas si 
     FastAPI cierra la sesión del Request principal antes de correr esto.
+    Lanza excepción si Gemini falla para que el worker reintente con backoff.
     """
     db = SessionLocal()
     try:
@@ -20,16 +25,138 @@ def background_sync_property_ai(property_id: int):
             
         context_str = ai_service.generate_property_context_string(property)
         property.search_content = context_str
-        vector = ai_service.get_embedding(context_str)
-        if vector:
-            property.embedding_descripcion = vector
-            db.commit()
-            logger.info(f"[Background Sync] Éxito para Propiedad {property_id}.")
-        else:
-            logger.warning(f"[Background Sync] No se pudo obtener vector para {property_id}")
-            
+        # Si el contexto no cambió desde el último embedding, el cache evita la llamada a Gemini
+        vector = embedding_cache.get_embedding(context_str)
+        if not vector:
+            raise RuntimeError(f"No se pudo obtener vector para propiedad {property_id}")
+        property.embedding_descripcion = vector
+        db.commit()
+        logger.info(f"[Background Sync] Éxito para Propiedad {property_id}.")
     except Exception as e:
         logger.error(f"[Background Sync] Error procesando propiedad {property_id}: {e}")
         db.rollback()
+        raise
+    finally:
+        db.close()
+
+def background_sync_development_ai(development_id: int):
+    """Genera el string de contexto y el embedding de un emprendimiento (job "development_ai_sync")."""
+    db = SessionLocal()
+    try:
+        dev = db.query(models.Development).filter(models.Development.id == development_id).first()
+        if not dev:
+            logger.warning(f"[Background Sync] Emprendimiento {development_id} no encontrado.")
+            return
+
+        vector = embedding_cache.get_embedding(ai_service.generate_development_context_string(dev))
+        if not vector:
+            raise RuntimeError(f"No se pudo obtener vector para emprendimiento {development_id}")
+        dev.embedding_proyecto = vector
+        db.commit()
+        logger.info(f"[Background Sync] Éxito para Emprendimiento {development_id}.")
+    except Exception as e:
+        logger.error(f"[Background Sync] Error procesando emprendimiento {development_id}: {e}")
+        db.rollback()
+        raise
     finally:
         db.close()
+
+def background_sync_contact_preferences(contact_id: int):
+    """Embebe las notas/preferencias del lead para el Reverse Matching (job "contact_preferences_embedding")."""
+    db = SessionLocal()
+    try:
+        contact = db.query(models.Contact).filter(models.Contact.id == contact_id).first()
+        if not contact or not contact.notes:
+            return
+
+        vector = embedding_cache.get_embedding(contact.notes)
+        if not vector:
+            raise RuntimeError(f"No se pudo obtener vector de preferencias para contacto {contact_id}")
+        contact.embedding_preferences = vector
+        db.commit()
+        logger.info(f"[Background Sync] Preferencias embebidas para Contacto {contact_id}.")
+    except Exception as e:
+        logger.error(f"[Background Sync] Error procesando preferencias de contacto {contact_id}: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+# Columnas que usan generate_*_context_string (evita traer el vector y la galería en los backfills)
+PROPERTY_CONTEXT_COLUMNS = (
+    models.Property.neighborhood, models.Property.city, models.Property.address, models.Property.type,
+    models.Property.rooms, models.Property.bedrooms, models.Property.currency, models.Property.price,
+    models.Property.description, models.Property.attributes,
+)
+DEVELOPMENT_CONTEXT_COLUMNS = (
+    models.Development.name, models.Development.address, models.Development.status,
+    models.Development.amenities, models.Development.description,
+)
+
+def _backfill_embeddings(model, columns, vector_column: str, context_fn, only_missing: bool, task_type: str,
+                         search_content_column: str = None, chunk_size: int = None) -> int:
+    """
+    Recorre la tabla por chunks (keyset sobre id), embebe cada chunk con get_embeddings
+    y persiste el resultado con un UPDATE masivo por primary key.
+    Cada chunk usa sesiones cortas: no se retiene una conexión mientras se espera a Gemini.
+    """
+    chunk_size = chunk_size or settings.embedding_backfill_chunk_size
+    vector_attr = getattr(model, vector_column)
+    updated = 0
+    last_id = 0
+
+    while True:
+        with SessionLocal() as db:
+            query = db.query(model).options(load_only(*columns)).filter(model.id > last_id)
+            if only_missing:
+                query = query.filter(vector_attr == None)
+            rows = query.order_by(model.id).limit(chunk_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        contexts = [context_fn(r) for r in rows]
+        vectors = embedding_cache.get_embeddings(contexts, task_type=task_type)
+
+        values = []
+        for r, ctx, vec in zip(rows, contexts, vectors):
+            row = {"id": r.id}
+            if vec:
+                row[vector_column] = vec
+            if search_content_column:
+                row[search_content_column] = ctx
+            if len(row) > 1:
+                values.append(row)
+
+        if values:
+            with SessionLocal() as db:
+                db.execute(update(model), values)
+                db.commit()
+        embedded = sum(1 for v in vectors if v)
+        updated += embedded
+        logger.info(f"[Backfill] {model.__tablename__}: chunk hasta id {last_id} -> {embedded}/{len(rows)} embebidos.")
+
+    return updated
+
+def backfill_property_embeddings(only_missing: bool = True, refresh_search_content: bool = False,
+                                 task_type: str = "retrieval_query", chunk_size: int = None) -> int:
+    return _backfill_embeddings(
+        models.Property, PROPERTY_CONTEXT_COLUMNS, "embedding_descripcion",
+        ai_service.generate_property_context_string, only_missing, task_type,
+        search_content_column="search_content" if refresh_search_content else None,
+        chunk_size=chunk_size
+    )
+
+def backfill_development_embeddings(only_missing: bool = True, task_type: str = "retrieval_query", chunk_size: int = None) -> int:
+    return _backfill_embeddings(
+        models.Development, DEVELOPMENT_CONTEXT_COLUMNS, "embedding_proyecto",
+        ai_service.generate_development_context_string, only_missing, task_type,
+        chunk_size=chunk_size
+    )
+
+def run_embedding_backfill() -> dict:
+    """Rellena los embeddings faltantes de propiedades y emprendimientos."""
+    return {
+        "properties": backfill_property_embeddings(),
+        "developments": backfill_development_embeddings(),
+    }
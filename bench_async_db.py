@@ -0,0 +1,129 @@
+"""
+Load test: ruta sync (def + get_db, threadpool de anyio) vs ruta async (async def + get_async_db, asyncpg).
+Requiere Postgres.
+
+Levanta uvicorn en proceso con dos endpoints que hacen la misma lectura que GET /api/contacts (contactos del
+tenant, 50 por página) y los golpea con N clientes concurrentes (default 500) usando httpx. --db-latency-ms
+agrega pg_sleep a cada consulta para simular la latencia de una base remota (el caso de las ráfagas de WhatsApp:
+muchos requests esperando I/O, no CPU).
+
+Reporta por variante: requests/s, p50/p99, errores (timeouts / pool agotado) y la configuración de pools.
+
+Uso:
+  DATABASE_URL=postgresql://... python bench_async_db.py --clients 500 --requests 5000 --db-latency-ms 20
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import threading
+
+sys.path.append(os.getcwd())
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Depends
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import models
+from database import DATABASE_URL, get_db, get_async_db, engine
+from settings import settings
+from bench_vector_search import percentile
+
+def contacts_query(tenant_id: int):
+    return select(models.Contact.id, models.Contact.name, models.Contact.phone).where(
+        models.Contact.tenant_id == tenant_id
+    ).order_by(models.Contact.id.desc()).limit(50)
+
+def build_app(latency_ms: int) -> FastAPI:
+    app = FastAPI()
+    sleep = text("SELECT pg_sleep(:seconds)").bindparams(seconds=latency_ms / 1000.0)
+
+    @app.get("/sync/contacts")
+    def sync_contacts(tenant_id: int = 1, db: Session = Depends(get_db)):
+        if latency_ms:
+            db.execute(sleep)
+        return [dict(r._mapping) for r in db.execute(contacts_query(tenant_id))]
+
+    @app.get("/async/contacts")
+    async def async_contacts(tenant_id: int = 1, db: AsyncSession = Depends(get_async_db)):
+        if latency_ms:
+            await db.execute(sleep)
+        return [dict(r._mapping) for r in await db.execute(contacts_query(tenant_id))]
+
+    return app
+
+async def load(base_url: str, path: str, clients: int, total: int, timeout: float):
+    latencies, errors = [], 0
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(None)
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as http:
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                queue.get_nowait()
+                started = time.perf_counter()
+                try:
+                    response = await http.get(path)
+                    response.raise_for_status()
+                    latencies.append((time.perf_counter() - started) * 1000)
+                except Exception:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--db-latency-ms", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=1000, help="Contactos a sembrar en el tenant 1 si no hay.")
+    args = parser.parse_args()
+
+    if not DATABASE_URL.startswith("postgresql"):
+        sys.exit("Este benchmark necesita Postgres (DATABASE_URL).")
+
+    with engine.begin() as conn:
+        if not conn.execute(text("SELECT EXISTS (SELECT 1 FROM contacts WHERE tenant_id = 1)")).scalar():
+            conn.execute(text(f"""
+                INSERT INTO contacts (tenant_id, name, phone, status, type)
+                SELECT 1, 'Bench ' || g, '549341' || lpad(g::text, 7, '0'), 'WARM', 'CLIENT' FROM generate_series(1, {args.seed}) g
+            """))
+
+    config = uvicorn.Config(build_app(args.db_latency_ms), port=args.port, log_level="warning", backlog=4096)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    print(f"pools: sync {settings.db_pool_size}+{settings.db_max_overflow}, async {settings.async_db_pool_size}+{settings.async_db_max_overflow}, "
+          f"threadpool {settings.threadpool_size} (sin lifespan: default de anyio 40)")
+    print(f"{args.clients} clientes, {args.requests} requests, latencia simulada {args.db_latency_ms} ms\n")
+    print(f"{'variante':<16} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'errores':>8}")
+    base_url = f"http://127.0.0.1:{args.port}"
+    for label, path in (("sync (threads)", "/sync/contacts"), ("async", "/async/contacts")):
+        latencies, errors, elapsed = asyncio.run(load(base_url, path, args.clients, args.requests, args.timeout))
+        ok = len(latencies)
+        print(f"{label:<16} {ok / elapsed:8.1f} {percentile(latencies, 50) if ok else 0:9.1f} "
+              f"{percentile(latencies, 99) if ok else 0:9.1f} {errors:8d}")
+
+    server.should_exit = True
+    thread.join()
+
+if __name__ == "__main__":
+    main()
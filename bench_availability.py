@@ -0,0 +1,130 @@
+"""
+Benchmark de disponibilidad de visitas con agendas densas: algoritmo anterior vs availability.py.
+
+- antes: una consulta de CalendarEvent por día y, por cada slot, recorrer todos los eventos del día
+  (O(días × slots × eventos)), step = duración de la visita.
+- motor (frío): una consulta por rango para toda la ventana + sweep-line.
+- motor (cache): mismos días desde el cache (propiedad, día).
+
+Corre sobre un SQLite en memoria (no necesita la base del CRM): siembra una propiedad con --events-per-day visitas
+aleatorias por día durante --days días, horario 08:00-20:00 y cupo --capacity.
+
+Uso:
+  python bench_availability.py --days 14 --events-per-day 40 --duration 30 --step 15 --capacity 3
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+
+sys.path.append(os.getcwd())
+
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.orm import sessionmaker
+
+import models
+import availability
+from database import Base
+from bench_vector_search import percentile
+
+START = datetime(2026, 10, 19)
+OPEN, CLOSE = "08:00", "20:00"
+
+def seed(db, days: int, events_per_day: int, duration: int, capacity: int, rng: random.Random):
+    schedule = {(START + timedelta(days=i)).strftime("%a"): {"enabled": True, "start": OPEN, "end": CLOSE} for i in range(7)}
+    prop = models.Property(code="URB-BENCH", status="Active", visit_availability=schedule,
+                           visit_duration=duration, max_simultaneous_visits=capacity)
+    db.add(prop)
+    db.flush()
+    events = []
+    for d in range(days):
+        day = START + timedelta(days=d, hours=7)
+        for _ in range(events_per_day):
+            start = day + timedelta(minutes=rng.randrange(0, 14 * 60, 5))
+            events.append(models.CalendarEvent(property_id=prop.id, status="CONFIRMED", start_time=start,
+                                               end_time=start + timedelta(minutes=rng.choice((15, 30, 45, 60)))))
+    db.add_all(events)
+    db.commit()
+    return prop
+
+def legacy_slots(db, prop, days: int):
+    """El cálculo de bots.check_bot_availability antes del motor por intervalos (solo la rama con propiedad)."""
+    available = []
+    for i in range(days):
+        current_day = START + timedelta(days=i)
+        date_str = current_day.strftime("%Y-%m-%d")
+        schedule = prop.visit_availability.get(current_day.strftime("%a"))
+        work_start = datetime.strptime(f"{date_str} {schedule['start']}", "%Y-%m-%d %H:%M")
+        work_end = datetime.strptime(f"{date_str} {schedule['end']}", "%Y-%m-%d %H:%M")
+        events = db.scalars(select(models.CalendarEvent).where(
+            models.CalendarEvent.start_time >= work_start,
+            models.CalendarEvent.start_time < work_end,
+            models.CalendarEvent.status != "CANCELLED",
+            models.CalendarEvent.property_id == prop.id,
+        )).all()
+        duration = timedelta(minutes=prop.visit_duration)
+        curr_slot = work_start
+        while curr_slot + duration <= work_end:
+            slot_end = curr_slot + duration
+            count = sum(1 for e in events if not (slot_end <= e.start_time or curr_slot >= e.end_time))
+            if count < prop.max_simultaneous_visits:
+                available.append((date_str, curr_slot.strftime("%H:%M")))
+            curr_slot = slot_end
+    return available
+
+def measure(fn, repeat: int, counter: list):
+    latencies, queries = [], 0
+    for _ in range(repeat):
+        counter[0] = 0
+        started = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - started) * 1000)
+        queries += counter[0]
+    return latencies, queries / repeat
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--events-per-day", type=int, default=40)
+    parser.add_argument("--duration", type=int, default=30)
+    parser.add_argument("--step", type=int, default=15)
+    parser.add_argument("--capacity", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    counter = [0]
+    event.listen(engine, "before_cursor_execute", lambda *a: counter.__setitem__(0, counter[0] + 1))
+    db = sessionmaker(bind=engine)()
+    prop = seed(db, args.days, args.events_per_day, args.duration, args.capacity, random.Random(args.seed))
+    windows = availability.day_windows(START, args.days, prop.visit_availability)
+
+    def engine_cold(step):
+        availability.clear_cache()
+        return availability.available_slots(db, windows, args.duration, step, args.capacity, property_id=prop.id)
+
+    # Con el step de antes (= duración) para comparar los slots libres que da cada uno
+    legacy = legacy_slots(db, prop, args.days)
+    same_step = [(s["date"], s["start"]) for s in engine_cold(None)]
+    print(f"{args.days} días, {args.events_per_day} eventos/día, visita {args.duration} min, cupo {args.capacity}")
+    print(f"slots con step = duración: antes {len(legacy)}, motor {len(same_step)} "
+          f"(distintos: {len(set(legacy) ^ set(same_step))}; el motor cuenta el pico simultáneo, no todos los eventos del slot)\n")
+
+    engine_cold(args.step)
+    variants = [
+        ("antes", lambda: legacy_slots(db, prop, args.days)),
+        (f"motor frío (step {args.step})", lambda: engine_cold(args.step)),
+        (f"motor cache (step {args.step})", lambda: availability.available_slots(
+            db, windows, args.duration, args.step, args.capacity, property_id=prop.id)),
+    ]
+    print(f"{'variante':<24} {'p50 ms':>9} {'p99 ms':>9} {'queries':>8}")
+    for label, fn in variants:
+        latencies, queries = measure(fn, args.repeat, counter)
+        print(f"{label:<24} {percentile(latencies, 50):9.2f} {percentile(latencies, 99):9.2f} {queries:8.1f}")
+
+if __name__ == "__main__":
+    main()
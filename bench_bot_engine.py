@@ -0,0 +1,82 @@
+"""
+Overhead por mensaje del bot antes de llamar a Gemini: BotEngine nuevo por mensaje (antes) vs engine del registro
+(bot_registry, después).
+
+Por mensaje mide lo que corre antes de send_message: armar el engine (consulta del Bot y del tenant, modelo con las
+declaraciones de las tools y el system prompt) solo en "antes", y en los dos abrir el turno, leer el historial y
+start_chat. No llama a Gemini ni escribe ChatHistory. Cuenta también los statements SQL por mensaje.
+
+Uso:
+  python bench_bot_engine.py --instance whatsapp_cloud_12 --messages 200
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.getcwd())
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from sqlalchemy import event
+
+import models
+import bot_engine
+import bot_registry
+from database import SessionLocal, engine
+from bench_vector_search import percentile
+
+class StatementCounter:
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, conn, cursor, statement, *args):
+        self.total += 1
+
+def setup_turn(bot: "bot_engine.BotEngine", phone: str):
+    with bot.open_turn(phone):
+        history = bot.get_history(phone)
+        bot.model.start_chat(history=history, enable_automatic_function_calling=True)
+
+def run(instance: str, phone: str, messages: int, cached: bool):
+    counter = StatementCounter()
+    event.listen(engine, "before_cursor_execute", counter)
+    latencies = []
+    try:
+        for _ in range(messages):
+            started = time.perf_counter()
+            bot = bot_engine.get_engine(instance) if cached else bot_engine.BotEngine(instance)
+            setup_turn(bot, phone)
+            latencies.append((time.perf_counter() - started) * 1000)
+    finally:
+        event.remove(engine, "before_cursor_execute", counter)
+    return latencies, counter.total / messages
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--instance", help="instance_name del Bot (default: el primero con instancia).")
+    parser.add_argument("--phone", default="5493410000000")
+    parser.add_argument("--messages", type=int, default=200)
+    args = parser.parse_args()
+
+    instance = args.instance
+    if not instance:
+        with SessionLocal() as db:
+            instance = db.query(models.Bot.instance_name).filter(models.Bot.instance_name != None).order_by(models.Bot.id).scalar()
+        if not instance:
+            sys.exit("No hay bots con instance_name: usar --instance.")
+
+    # Calentamiento (conexiones, caches de compilación de SQLAlchemy)
+    setup_turn(bot_engine.BotEngine(instance), args.phone)
+
+    print(f"instancia {instance}, {args.messages} mensajes por variante\n")
+    print(f"{'variante':<10} {'p50 ms':>8} {'p99 ms':>8} {'stmts/msg':>10}")
+    for label, cached in (("antes", False), ("después", True)):
+        bot_registry.clear()
+        latencies, statements = run(instance, args.phone, args.messages, cached)
+        print(f"{label:<10} {percentile(latencies, 50):8.2f} {percentile(latencies, 99):8.2f} {statements:10.2f}")
+    print(f"\nregistro: {bot_registry.stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Cuántos turnos reales resuelve el atajo de bot_intents sin Gemini y cuánta latencia ahorra.
+
+Reproduce las conversaciones de chat_history (base configurada en .env) en orden sobre una copia en SQLite en memoria
+(con las propiedades del tenant), así cada mensaje ve solo el historial anterior. Para cada mensaje del usuario prueba
+el atajo (con las tools reales del bot: get_property_requisites y get_availability) y, si lo resuelve, compara su
+latencia con lo que tardó la respuesta del modelo que efectivamente siguió en el historial.
+La copia no trae bots ni agenda: las consultas de horarios caen al modelo (cuentan como no_answer).
+
+Uso:
+  python bench_bot_intents.py --conversations 200
+"""
+import os
+import sys
+import time
+import argparse
+from collections import defaultdict
+
+sys.path.append(os.getcwd())
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import models
+import bot_engine
+import bot_intents
+import bot_tools
+from database import Base, SessionLocal
+from bench_vector_search import percentile
+
+PROPERTY_COLUMNS = ("id", "tenant_id", "code", "title", "price", "currency", "operation", "status", "address", "neighborhood",
+                    "lat", "lng", "transaction_requirements", "assigned_agent_id")
+
+def load_source(conversations: int):
+    with SessionLocal() as db:
+        senders = [s for (s,) in db.query(models.ChatHistory.sender_id).group_by(models.ChatHistory.sender_id)
+                   .order_by(models.ChatHistory.sender_id).limit(conversations)]
+        messages = db.query(models.ChatHistory).filter(models.ChatHistory.sender_id.in_(senders)).order_by(
+            models.ChatHistory.sender_id, models.ChatHistory.created_at, models.ChatHistory.id).all()
+        properties = [{c: getattr(p, c) for c in PROPERTY_COLUMNS} for p in db.query(models.Property).all()]
+        return [(m.sender_id, m.tenant_id, m.role, m.parts, m.created_at) for m in messages], properties
+
+def replay_db(properties):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        db.add_all(models.Property(**p) for p in properties)
+        db.commit()
+    return Session
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--conversations", type=int, default=200)
+    args = parser.parse_args()
+
+    messages, properties = load_source(args.conversations)
+    Session = replay_db(properties)
+    tools = {name: getattr(bot_engine, name) for name in bot_tools.READ_TOOLS}
+
+    fast_ms, saved_ms, by_intent = [], [], defaultdict(int)
+    user_turns = 0
+    with Session() as db:
+        for i, (phone, tenant_id, role, parts, created_at) in enumerate(messages):
+            if role == "user":
+                user_turns += 1
+                text = " ".join(p for p in parts or [] if isinstance(p, str))
+                with bot_tools.open_turn(Session):
+                    started = time.perf_counter()
+                    reply = bot_intents.answer(db, phone, text, tools, tenant_id)
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                if reply:
+                    fast_ms.append(elapsed_ms)
+                    by_intent[bot_intents.classify(text).topic] += 1
+                    following = messages[i + 1] if i + 1 < len(messages) else None
+                    if following and following[0] == phone and following[2] == "model" and created_at and following[4]:
+                        saved_ms.append((following[4] - created_at).total_seconds() * 1000 - elapsed_ms)
+            db.add(models.ChatHistory(sender_id=phone, tenant_id=tenant_id, role=role, parts=parts, created_at=created_at))
+            db.commit()
+
+    handled = len(fast_ms)
+    print(f"{user_turns} mensajes de usuario en {args.conversations} conversaciones máx.")
+    print(f"atajo: {handled} turnos ({handled / user_turns * 100 if user_turns else 0:.1f}%) {dict(by_intent)}")
+    print(f"fallbacks: {bot_intents.stats()['fallbacks']}")
+    if fast_ms:
+        print(f"latencia del atajo: p50={percentile(fast_ms, 50):.2f}ms p99={percentile(fast_ms, 99):.2f}ms")
+    if saved_ms:
+        print(f"ahorro vs la respuesta del modelo en el historial: p50={percentile(saved_ms, 50):.0f}ms por turno, "
+              f"total {sum(saved_ms) / 1000:.1f}s en {len(saved_ms)} turnos")
+
+if __name__ == "__main__":
+    main()
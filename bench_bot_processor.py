@@ -0,0 +1,85 @@
+"""
+Prueba de carga del procesador de conversaciones (bot_processor.py) con un modelo simulado.
+
+Cada turno es bloqueante (time.sleep de --latency-ms, como la llamada a Gemini con function calling) y no toca la
+base. Escala la cantidad de teléfonos con --messages mensajes cada uno y reporta throughput, p50/p99 de espera por
+mensaje (desde submit hasta la respuesta) y el máximo de turnos en paralelo. Verifica que cada teléfono recibió sus
+respuestas en orden y sin turnos superpuestos.
+
+"secuencial" es la línea base: un mensaje por vez, como procesar el webhook inline.
+
+Uso:
+  python bench_bot_processor.py --phones 1 4 16 64 256 --messages 5 --latency-ms 200 --concurrency 16
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import threading
+
+sys.path.append(os.getcwd())
+
+from bot_processor import ConversationProcessor
+from bench_vector_search import percentile
+
+class StubModel:
+    def __init__(self, latency_ms: float):
+        self.latency = latency_ms / 1000
+        self.lock = threading.Lock()
+        self.running = set()
+        self.replies = {}
+        self.overlaps = 0
+
+    def __call__(self, instance_name: str, phone: str, text: str) -> str:
+        with self.lock:
+            if phone in self.running:
+                self.overlaps += 1
+            self.running.add(phone)
+        time.sleep(self.latency)
+        with self.lock:
+            self.running.discard(phone)
+            self.replies.setdefault(phone, []).append(text)
+        return f"respuesta a {text}"
+
+async def run(phones: int, messages: int, latency_ms: float, concurrency: int):
+    model = StubModel(latency_ms)
+    processor = ConversationProcessor(model, max_concurrency=concurrency)
+    waits = []
+
+    async def timed(future, submitted):
+        await future
+        waits.append((time.perf_counter() - submitted) * 1000)
+
+    started = time.perf_counter()
+    pending = []
+    for i in range(messages):
+        for p in range(phones):
+            pending.append(timed(processor.submit("bench", f"549341{p:07d}", f"m{i}"), time.perf_counter()))
+    await asyncio.gather(*pending)
+    elapsed = time.perf_counter() - started
+    await processor.shutdown()
+
+    ordered = all(texts == [f"m{i}" for i in range(messages)] for texts in model.replies.values())
+    return elapsed, waits, processor.stats()["max_in_flight"], ordered and model.overlaps == 0
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--phones", type=int, nargs="+", default=[1, 4, 16, 64, 256])
+    parser.add_argument("--messages", type=int, default=5, help="Mensajes por teléfono.")
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    print(f"modelo simulado {args.latency_ms:.0f} ms/turno, {args.messages} mensajes por teléfono, tope {args.concurrency}\n")
+    print(f"{'teléfonos':>9} {'variante':<11} {'msgs':>6} {'msg/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'paralelo':>9} {'orden':>6}")
+    for phones in args.phones:
+        total = phones * args.messages
+        sequential = total * args.latency_ms / 1000
+        print(f"{phones:>9} {'secuencial':<11} {total:>6} {total / sequential:8.1f} {'':>9} {'':>9} {1:>9} {'ok':>6}")
+        elapsed, waits, max_in_flight, ok = asyncio.run(run(phones, args.messages, args.latency_ms, args.concurrency))
+        print(f"{phones:>9} {'procesador':<11} {total:>6} {total / elapsed:8.1f} {percentile(waits, 50):9.1f} "
+              f"{percentile(waits, 99):9.1f} {max_in_flight:>9} {'ok' if ok else 'MAL':>6}")
+
+if __name__ == "__main__":
+    main()
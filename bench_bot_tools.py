@@ -0,0 +1,79 @@
+"""
+Lote de tools de una respuesta del modelo: una por una, cada una con su sesión (antes) vs bot_tools.execute con
+lecturas en paralelo, sesión compartida y memo del turno (después).
+
+El lote es el típico de "mostrame opciones y decime requisitos y horarios": search_properties + get_property_requisites
+de las propiedades encontradas + get_availability de la primera. No llama a Gemini para elegir las tools (sí para el
+embedding de la búsqueda, con el cache de consultas como en producción). Cuenta también los statements SQL por lote.
+
+Uso:
+  python bench_bot_tools.py --query "dos ambientes con balcón" --batches 50
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.getcwd())
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from sqlalchemy import event
+
+import bot_engine
+import bot_tools
+from database import engine
+from bench_vector_search import percentile
+from bench_bot_engine import StatementCounter
+
+def batch_calls(query: str):
+    found = bot_engine.search_properties(semantic_query=query)
+    if not isinstance(found, list) or not found:
+        sys.exit(f"search_properties no encontró propiedades para {query!r}.")
+    ids = [p["id"] for p in found[:3]]
+    return ([("search_properties", {"semantic_query": query})]
+            + [("get_property_requisites", {"property_id": i}) for i in ids]
+            + [("get_availability", {"property_id": ids[0]})])
+
+def run_sequential(calls):
+    # Como antes: cada tool abre y cierra su propia sesión, sin memo
+    for name, args in calls:
+        getattr(bot_engine, name)(**args)
+
+def run_batch(calls):
+    with bot_tools.open_turn():
+        bot_tools.execute(calls, {name: getattr(bot_engine, name) for name in bot_tools.READ_TOOLS})
+
+def measure(run, calls, batches: int):
+    counter = StatementCounter()
+    event.listen(engine, "before_cursor_execute", counter)
+    latencies = []
+    try:
+        for _ in range(batches):
+            started = time.perf_counter()
+            run(calls)
+            latencies.append((time.perf_counter() - started) * 1000)
+    finally:
+        event.remove(engine, "before_cursor_execute", counter)
+    return latencies, counter.total / batches
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--query", default="departamento dos ambientes con balcón")
+    parser.add_argument("--batches", type=int, default=50)
+    args = parser.parse_args()
+
+    calls = batch_calls(args.query) # también calienta el cache de embeddings y las conexiones
+    print(f"{len(calls)} tools por lote, {args.batches} lotes por variante\n")
+    print(f"{'variante':<10} {'p50 ms':>8} {'p99 ms':>8} {'stmts/lote':>11}")
+    for label, run in (("antes", run_sequential), ("después", run_batch)):
+        latencies, statements = measure(run, calls, args.batches)
+        print(f"{label:<10} {percentile(latencies, 50):8.2f} {percentile(latencies, 99):8.2f} {statements:11.2f}")
+
+    print("\nlatencia por tool (después, bot_tools.stats):")
+    for name, tool in bot_tools.stats()["tools"].items():
+        print(f"  {name:<26} llamadas={tool['calls']:<5} avg={tool['avg_ms']}ms max={tool['max_ms']}ms")
+
+if __name__ == "__main__":
+    main()
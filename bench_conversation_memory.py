@@ -0,0 +1,151 @@
+"""
+Historial del bot en conversaciones reproducidas: últimos 15 mensajes tal cual (antes) vs resumen + turnos recientes
+dentro del presupuesto de tokens (conversation_memory, después).
+
+Reproduce N conversaciones sintéticas de M turnos sobre SQLite en memoria. En cada turno arma el historial con las
+dos variantes y mide los tokens del prompt (historial + mensaje, estimados por largo) y la latencia de armarlo.
+En "después" el resumen se actualiza cuando corresponde, como lo haría el worker (sin contar en la latencia del
+turno); sin --live el resumen es un recorte del texto plegado, con --live lo escribe Gemini.
+
+Con --live además manda cada turno a Gemini (google-genai, API_KEY) y reporta prompt_token_count y latencia reales.
+
+Uso:
+  python bench_conversation_memory.py --conversations 20 --turns 40
+  python bench_conversation_memory.py --conversations 2 --turns 20 --live
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import logging
+
+sys.path.append(os.getcwd())
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database import Base
+import models
+import conversation_memory
+from conversation_memory import estimate_tokens, message_text
+from bench_vector_search import percentile
+
+USER_LINES = [
+    "Hola, estoy buscando un departamento de dos ambientes en Centro, hasta 90 mil dólares.",
+    "¿Tiene balcón? ¿Cuánto son las expensas? Me interesa que sea luminoso y con buena ventilación.",
+    "Somos una pareja con un perro chico, ¿aceptan mascotas en el edificio?",
+    "¿Puedo ir a verlo el sábado a la mañana? Después de las 10 me queda bien.",
+    "También me interesaría algo en Fisherton si hay con patio, aunque sea un PH.",
+    "¿Qué requisitos piden para alquilar? Tengo garantía propietaria de mi viejo.",
+]
+MODEL_LINES = [
+    "¡Hola! Te paso tres opciones en Centro dentro de tu presupuesto: URB-00123, URB-00456 y URB-00789. "
+    "La primera tiene balcón al frente, 48 m² y expensas de $45.000; la segunda es interna pero muy luminosa.",
+    "Sí, URB-00123 acepta mascotas y tiene balcón corrido. Las expensas incluyen agua y limpieza de espacios comunes. "
+    "Si querés te cuento también de una opción nueva que entró esta semana en Pichincha.",
+    "Tengo disponible el sábado a las 10:30 o a las 11:30 con Martín, el agente de la zona. ¿Cuál te queda mejor?",
+    "Para alquilar piden garantía propietaria en Rosario, recibo de sueldo y un mes de depósito. "
+    "Con la garantía de tu papá alcanza; te mando la lista completa de documentación por acá.",
+]
+
+def setup():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+def history_before(db, phone):
+    """BotEngine.get_history previo: los últimos 15 mensajes tal cual."""
+    rows = db.query(models.ChatHistory).filter(models.ChatHistory.sender_id == phone).order_by(
+        models.ChatHistory.created_at.desc()).limit(15).all()
+    return [{"role": row.role, "parts": row.parts} for row in reversed(rows)]
+
+def truncating_summarizer(previous, messages):
+    text = " ".join(message_text(m["parts"]) for m in messages)
+    return ((previous or "") + " " + text)[-conversation_memory.settings.bot_memory_summary_max_tokens * conversation_memory.CHARS_PER_TOKEN:].strip()
+
+def prompt_tokens(history, text):
+    return sum(estimate_tokens(message_text(m["parts"])) for m in history) + estimate_tokens(text)
+
+def ask_gemini(client, model, history, text):
+    contents = [{"role": m["role"], "parts": [{"text": message_text(m["parts"])}]} for m in history]
+    contents.append({"role": "user", "parts": [{"text": text}]})
+    started = time.perf_counter()
+    response = client.models.generate_content(model=model, contents=contents)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    return response.usage_metadata.prompt_token_count, elapsed_ms, response.text or ""
+
+def replay(Session, conversations: int, turns: int, live: bool):
+    rng = random.Random(7)
+    summarizer = conversation_memory.summarize_with_gemini if live else truncating_summarizer
+    client, model = None, os.getenv("CHATBOT_MODEL", "gemini-1.5-flash")
+    if live:
+        from routers import ai_service
+        client = ai_service.client
+        if not client:
+            sys.exit("Sin cliente de Gemini (API_KEY).")
+
+    results = {"antes": {"tokens": [], "ms": [], "live_tokens": [], "live_ms": []},
+               "después": {"tokens": [], "ms": [], "live_tokens": [], "live_ms": []}}
+    summaries = 0
+    with Session() as db:
+        for c in range(conversations):
+            phone = f"54934100{c:05d}"
+            for t in range(turns):
+                text = " ".join(rng.sample(USER_LINES, rng.randint(1, 2)))
+
+                started = time.perf_counter()
+                before = history_before(db, phone)
+                results["antes"]["ms"].append((time.perf_counter() - started) * 1000)
+                started = time.perf_counter()
+                memory = conversation_memory.load(db, phone)
+                results["después"]["ms"].append((time.perf_counter() - started) * 1000)
+
+                reply = " ".join(rng.sample(MODEL_LINES, rng.randint(1, 3)))
+                for label, history in (("antes", before), ("después", memory.history)):
+                    results[label]["tokens"].append(prompt_tokens(history, text))
+                    if live:
+                        tokens, elapsed_ms, reply = ask_gemini(client, model, history, text)
+                        results[label]["live_tokens"].append(tokens)
+                        results[label]["live_ms"].append(elapsed_ms)
+
+                db.add(models.ChatHistory(sender_id=phone, role="user", parts=[text]))
+                db.add(models.ChatHistory(sender_id=phone, role="model", parts=[reply]))
+                db.commit()
+                if memory.needs_summary:
+                    # Lo que haría el job conversation_summary en el worker
+                    conversation_memory.schedule_summary(db, phone)
+                    summary = db.query(models.ConversationSummary).filter(models.ConversationSummary.sender_id == phone).one()
+                    summaries += conversation_memory.summarize(db, summary, summarizer=summarizer)
+                    db.query(models.Job).delete()
+                    db.commit()
+    return results, summaries
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--conversations", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--live", action="store_true", help="Manda cada turno a Gemini y mide tokens y latencia reales.")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    Session = setup()
+    results, summaries = replay(Session, args.conversations, args.turns, args.live)
+
+    print(f"{args.conversations} conversaciones x {args.turns} turnos, presupuesto {conversation_memory.settings.bot_memory_token_budget} tokens, "
+          f"{summaries} resúmenes\n")
+    print(f"{'variante':<10} {'tokens p50':>10} {'tokens p99':>10} {'tokens máx':>10} {'armado p50 ms':>14} {'armado p99 ms':>14}")
+    for label, r in results.items():
+        print(f"{label:<10} {percentile(r['tokens'], 50):>10.0f} {percentile(r['tokens'], 99):>10.0f} {max(r['tokens']):>10} "
+              f"{percentile(r['ms'], 50):>14.3f} {percentile(r['ms'], 99):>14.3f}")
+    if args.live:
+        print(f"\n{'variante':<10} {'prompt_token_count p50':>22} {'Gemini p50 ms':>14} {'Gemini p99 ms':>14}")
+        for label, r in results.items():
+            print(f"{label:<10} {percentile(r['live_tokens'], 50):>22.0f} {percentile(r['live_ms'], 50):>14.1f} {percentile(r['live_ms'], 99):>14.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Benchmark del pipeline de embeddings contra un servidor stub local (no consume cuota de Gemini).
+
+Compara:
+  1. Backfill legacy: un get_embedding por fila + commit por fila.
+  2. Backfill por chunks: get_embeddings (batch + concurrencia + token bucket) + UPDATE masivo.
+  3. El mismo backfill con contenido sin cambios (todo hit en embedding_cache).
+
+Uso:
+  python bench_embeddings.py --rows 2000 --latency-ms 120
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.getcwd())
+
+from google import genai
+from sqlalchemy import create_engine
+
+import models
+from database import Base, SessionLocal
+from routers import ai_service
+import background_tasks
+import embedding_cache
+
+DIMS = ai_service.EMBEDDING_DIMENSIONS
+
+class StubEmbeddingHandler(BaseHTTPRequestHandler):
+    """Imita POST /v1beta/models/<model>:batchEmbedContents con latencia configurable."""
+    latency = 0.1
+    per_item_latency = 0.0005
+    calls = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        requests_ = body.get("requests", [])
+        StubEmbeddingHandler.calls += 1
+        time.sleep(self.latency + self.per_item_latency * len(requests_))
+        payload = json.dumps({"embeddings": [{"values": [random.random() for _ in range(DIMS)]} for _ in requests_]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+def seed(rows: int):
+    with SessionLocal() as db:
+        db.query(models.Property).delete()
+        db.bulk_save_objects([
+            models.Property(
+                title=f"Propiedad {i}", address=f"Calle {i}", city="Rosario", neighborhood="Centro",
+                price=100000 + i, type="Apartment", operation="Sale", rooms=2, bedrooms=1,
+                description="Departamento luminoso " * 10, attributes=["balcony", "pool"], status="Active"
+            ) for i in range(rows)
+        ])
+        db.commit()
+
+def legacy_backfill():
+    """Réplica del loop anterior (main.backfill_embeddings / ai_matching.run_backfill)."""
+    with SessionLocal() as db:
+        props = db.query(models.Property).filter(models.Property.embedding_descripcion == None).all()
+        for p in props:
+            vec = ai_service.get_embedding(ai_service.generate_property_context_string(p))
+            if vec:
+                p.embedding_descripcion = vec
+                db.commit()
+
+def timed(label: str, fn, rows: int):
+    StubEmbeddingHandler.calls = 0
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    with SessionLocal() as db:
+        done = db.query(models.Property).filter(models.Property.embedding_descripcion != None).count()
+    print(f"{label:<28} {elapsed:8.2f}s  {rows / elapsed:8.1f} filas/s  {StubEmbeddingHandler.calls:5d} requests  ({done}/{rows} embebidas)")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--concurrency", type=int, default=None)
+    parser.add_argument("--rpm", type=int, default=1_000_000, help="Token bucket (textos/min). Default: sin límite efectivo.")
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    StubEmbeddingHandler.latency = args.latency_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubEmbeddingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    ai_service.client = genai.Client(api_key="stub", http_options={"base_url": f"http://127.0.0.1:{server.server_port}"})
+    ai_service.rate_limiter = ai_service.TokenBucket(args.rpm)
+    if args.batch_size:
+        ai_service.settings.embedding_batch_size = args.batch_size
+    if args.concurrency:
+        ai_service.settings.embedding_concurrency = args.concurrency
+
+    db_path = os.path.join(tempfile.mkdtemp(), "bench_embeddings.db")
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    SessionLocal.configure(bind=engine)
+
+    print(f"Stub: {args.latency_ms:.0f}ms/request | filas: {args.rows} | batch: {ai_service.settings.embedding_batch_size} | concurrencia: {ai_service.settings.embedding_concurrency}")
+
+    legacy = None
+    if not args.skip_legacy:
+        seed(args.rows)
+        legacy = timed("legacy (1 fila/request)", legacy_backfill, args.rows)
+
+    seed(args.rows)
+    batched = timed("batch + bulk UPDATE", background_tasks.backfill_property_embeddings, args.rows)
+
+    if legacy:
+        print(f"Speedup: x{legacy / batched:.1f}")
+
+    # Mismo contenido otra vez: todo sale del embedding_cache, sin requests al stub
+    with SessionLocal() as db:
+        db.query(models.Property).update({models.Property.embedding_descripcion: None})
+        db.commit()
+    timed("re-embed (contenido igual)", background_tasks.backfill_property_embeddings, args.rows)
+    print(f"Cache: {embedding_cache.stats()}")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
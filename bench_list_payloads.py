@@ -0,0 +1,136 @@
+"""
+Benchmark de los listados: tamaño de payload y latencia de GET /api/properties y /api/contacts completos vs
+sparse fieldset (?fields=) y sin comprimir vs gzip, más la carga ORM con y sin las columnas pesadas diferidas.
+
+Corre en proceso (TestClient) sobre SQLite en memoria con N propiedades con galería, descripción, embedding y
+search_content: mide la capa API (SELECT, ORM, serialización, compresión), no la red. En Postgres la diferencia
+de las columnas diferidas es mayor (los vectores se leen de TOAST).
+
+Uso:
+  python bench_list_payloads.py --rows 500 --limit 100 --requests 50
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import logging
+
+sys.path.append(os.getcwd())
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker, undefer
+from sqlalchemy.pool import StaticPool
+import aiosqlite
+from fastapi.testclient import TestClient
+
+from main import app
+from database import Base, get_db, get_async_db
+from auth import get_current_user_email
+import models
+from bench_vector_search import percentile
+
+EMAIL = "bench@urbanocrm.com"
+CARD_FIELDS = "code,title,price,currency,thumbnail_url,operation,type,city,neighborhood"
+
+def setup_app():
+    connection = sqlite3.connect(":memory:", check_same_thread=False)
+    engine = create_engine("sqlite://", creator=lambda: connection, poolclass=StaticPool)
+    async def creator():
+        return await aiosqlite.Connection(lambda: connection, iter_chunk_size=64)
+    async_engine = create_async_engine("sqlite+aiosqlite://", async_creator=creator, poolclass=StaticPool)
+    Session = sessionmaker(bind=engine)
+    AsyncSession = async_sessionmaker(async_engine, expire_on_commit=False)
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+    async def override_get_async_db():
+        async with AsyncSession() as db:
+            yield db
+
+    fastapi_app = app.other_asgi_app if hasattr(app, "other_asgi_app") else app
+    fastapi_app.dependency_overrides[get_db] = override_get_db
+    fastapi_app.dependency_overrides[get_async_db] = override_get_async_db
+    fastapi_app.dependency_overrides[get_current_user_email] = lambda: EMAIL
+    Base.metadata.create_all(bind=engine)
+    return TestClient(fastapi_app), Session
+
+def seed(Session, rows: int):
+    rng = random.Random(42)
+    with Session() as db:
+        tenant = models.Tenant(name="Bench")
+        db.add(tenant)
+        db.flush()
+        db.add(models.User(email=EMAIL, tenant_id=tenant.id, role="SUPER_ADMIN", is_active=True))
+        for i in range(rows):
+            db.add(models.Property(
+                tenant_id=tenant.id, code=f"URB-{i:05d}", title=f"Propiedad {i}", address=f"Calle {i}", price=rng.randint(50, 500) * 1000,
+                operation="Sale", type="Apartment", city="Rosario", neighborhood="Centro", status="Active",
+                description="Luminoso departamento con balcón al frente. " * 20,
+                gallery=[f"https://cdn.example.com/props/{i}/{n}.webp" for n in range(15)],
+                attributes=["pool", "pets", "grill"],
+                embedding_descripcion=[rng.random() for _ in range(768)],
+                search_content="Departamento luminoso en Centro, Rosario. " * 30,
+            ))
+            db.add(models.Contact(tenant_id=tenant.id, name=f"Contacto {i}", email=f"lead{i}@mail.com", phone=f"+54 9 341 {i:07d}",
+                                  notes="Busca 2 ambientes con balcón. " * 10, embedding_preferences=[rng.random() for _ in range(768)]))
+        db.commit()
+
+def measure(client, url: str, params: dict, gzip: bool, requests: int):
+    headers = {"Accept-Encoding": "gzip" if gzip else "identity"}
+    latencies, wire = [], 0
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get(url, params=params, headers=headers)
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.text
+        wire = response.num_bytes_downloaded
+    return wire, latencies
+
+def measure_orm(Session, options, requests: int):
+    latencies = []
+    for _ in range(requests):
+        with Session() as db:
+            start = time.perf_counter()
+            db.scalars(select(models.Property).options(*options).order_by(models.Property.id.desc()).limit(100)).all()
+            latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    client, Session = setup_app()
+    seed(Session, args.rows)
+
+    cases = [
+        ("properties completo", "/api/properties", {}),
+        ("properties ?fields=card", "/api/properties", {"fields": CARD_FIELDS}),
+        ("contacts completo", "/api/contacts", {}),
+        ("contacts ?fields=name,phone", "/api/contacts", {"fields": "name,phone"}),
+    ]
+    print(f"{'caso':32} {'gzip':>5} {'bytes':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for label, url, params in cases:
+        for gzip in (False, True):
+            wire, latencies = measure(client, url, {**params, "limit": args.limit}, gzip, args.requests)
+            print(f"{label:32} {'sí' if gzip else 'no':>5} {wire:>10} {percentile(latencies, 50):>8.2f} {percentile(latencies, 99):>8.2f}")
+
+    print("\nCarga ORM de 100 propiedades")
+    for label, options in (("columnas pesadas diferidas", ()),
+                           ("con embedding + search_content", (undefer(models.Property.embedding_descripcion),
+                                                               undefer(models.Property.search_content)))):
+        latencies = measure_orm(Session, options, args.requests)
+        print(f"{label:32} p50={percentile(latencies, 50):.2f}ms p99={percentile(latencies, 99):.2f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Queries por request antes/después del principal cacheado (auth.get_current_principal).
+
+Antes cada ruta autenticada hacía `SELECT ... FROM users WHERE email = ?` para sacar tenant_id/rol. El "antes" se
+reproduce vaciando el cache antes de cada request (exactamente una búsqueda del usuario por request, como el
+código viejo); el "después" es el cache caliente. Cuenta los statements que llegan al cursor en los dos motores
+(sync y async) con eventos de SQLAlchemy, así que sirve igual contra Postgres o un sqlite local.
+
+Reporta por endpoint: statements/request, de ellos cuántos van a users (en /api/team el listado mismo también
+cuenta), y ms/request.
+
+Uso:
+  python bench_principal.py --requests 200
+  python bench_principal.py --email agente@inmobiliaria.com --endpoint /api/contacts --endpoint /api/properties
+"""
+import os
+import sys
+import time
+import argparse
+import logging
+
+sys.path.append(os.getcwd())
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import auth
+import models
+from database import SessionLocal, engine, async_engine
+from main import app as asgi_app
+
+# main envuelve FastAPI en el ASGIApp de socketio
+app = asgi_app.other_asgi_app
+
+DEFAULT_ENDPOINTS = [
+    "/api/contacts",
+    "/api/properties",
+    "/api/opportunities/pipelines",
+    "/api/calendar/events",
+    "/api/team",
+    "/api/branches",
+]
+
+class StatementCounter:
+    def __init__(self):
+        self.total = 0
+        self.users = 0
+
+    def __call__(self, conn, cursor, statement, *args):
+        self.total += 1
+        if "FROM users" in statement:
+            self.users += 1
+
+def run(client: TestClient, path: str, requests: int, cold: bool):
+    counter = StatementCounter()
+    targets = (engine, async_engine.sync_engine)
+    for target in targets:
+        event.listen(target, "before_cursor_execute", counter)
+    started = time.perf_counter()
+    try:
+        for _ in range(requests):
+            if cold:
+                auth.clear_principals()
+            client.get(path).raise_for_status()
+    finally:
+        for target in targets:
+            event.remove(target, "before_cursor_execute", counter)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    return counter.total / requests, counter.users / requests, elapsed_ms / requests
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--email", help="Usuario a autenticar (default: el primer usuario activo).")
+    parser.add_argument("--endpoint", action="append", help="Repetible. Default: un set de listados del CRM.")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    email = args.email
+    if not email:
+        with SessionLocal() as db:
+            user = db.query(models.User).filter(models.User.is_active != False).order_by(models.User.id).first()
+            if not user:
+                sys.exit("No hay usuarios activos en la base: usar --email o crear uno.")
+            email = user.email
+
+    app.dependency_overrides[auth.get_current_user_email] = lambda: email
+    client = TestClient(app)
+    # Un request de calentamiento por endpoint (conexiones, caches de compilación de SQLAlchemy)
+    endpoints = args.endpoint or DEFAULT_ENDPOINTS
+    for path in endpoints:
+        client.get(path)
+
+    print(f"usuario {email}, {args.requests} requests por variante\n")
+    print(f"{'endpoint':<32} {'variante':<8} {'stmts/req':>10} {'users/req':>10} {'ms/req':>8}")
+    for path in endpoints:
+        for label, cold in (("antes", True), ("después", False)):
+            total, users, ms = run(client, path, args.requests, cold)
+            print(f"{path:<32} {label:<8} {total:10.2f} {users:10.2f} {ms:8.2f}")
+    stats = auth.principal_stats()
+    print(f"\ncache: {stats}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Benchmark del type-ahead (ILIKE '%x%' de list_contacts y /api/search/suggest) con y sin índices pg_trgm.
+Requiere Postgres (extensión pg_trgm disponible).
+
+Siembra N contactos (default 1M) en un schema aislado (bench_suggest) con generate_series, mide
+p50/p99 sin índices, crea los índices GIN gin_trgm_ops de models.py y vuelve a medir.
+
+Uso:
+  DATABASE_URL=postgresql://... python bench_suggest.py --rows 1000000 --queries 200
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.append(os.getcwd())
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+import models
+from database import Base, DATABASE_URL
+import search
+from bench_vector_search import percentile
+
+SCHEMA = "bench_suggest"
+FIRST_NAMES = ["Juan", "María", "Lucía", "Martín", "Sofía", "Mateo", "Valentina", "Santiago", "Camila", "Benjamín", "Agustina", "Joaquín", "Florencia", "Tomás", "Julieta"]
+LAST_NAMES = ["González", "Rodríguez", "Gómez", "Fernández", "López", "Díaz", "Martínez", "Pérez", "García", "Sánchez", "Romero", "Sosa", "Álvarez", "Torres", "Ruiz"]
+
+def seed(engine, rows: int, tenants: int):
+    first = "ARRAY[" + ",".join(f"'{n}'" for n in FIRST_NAMES) + "]"
+    last = "ARRAY[" + ",".join(f"'{n}'" for n in LAST_NAMES) + "]"
+    with engine.begin() as conn:
+        conn.execute(text(f"INSERT INTO tenants (id, name) SELECT g, 'Bench ' || g FROM generate_series(1, {tenants}) g"))
+        conn.execute(text(f"""
+            INSERT INTO contacts (tenant_id, name, email, phone, status, type)
+            SELECT 1 + (g % {tenants}),
+                   ({first})[1 + (g * 7) % {len(FIRST_NAMES)}] || ' ' || ({last})[1 + (g * 13) % {len(LAST_NAMES)}] || ' ' || g,
+                   'lead' || g || '@mail.com',
+                   '549341' || lpad((g * 7919 % 10000000)::text, 7, '0'),
+                   'WARM', 'CLIENT'
+            FROM generate_series(1, {rows}) g
+        """))
+        conn.execute(text("ANALYZE contacts"))
+
+def list_contacts_query(db, tenant_id: int, q: str):
+    """Mismo filtro que routers/contacts.list_contacts."""
+    term = f"%{q}%"
+    return db.query(models.Contact.id).filter(
+        models.Contact.tenant_id == tenant_id,
+        models.Contact.name.ilike(term) | models.Contact.email.ilike(term) | models.Contact.phone.ilike(term)
+    ).order_by(models.Contact.id.desc()).limit(50).all()
+
+def measure(Session, label: str, fn, workload):
+    latencies = []
+    for tenant_id, q in workload:
+        with Session() as db:
+            started = time.perf_counter()
+            fn(db, tenant_id, q)
+            latencies.append((time.perf_counter() - started) * 1000)
+    print(f"{label:<34} {percentile(latencies, 50):9.2f} {percentile(latencies, 99):9.2f}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--tenants", type=int, default=1)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--keep", action="store_true")
+    args = parser.parse_args()
+
+    if not DATABASE_URL.startswith("postgresql"):
+        sys.exit("Este benchmark necesita Postgres + pg_trgm (DATABASE_URL).")
+
+    admin = create_engine(DATABASE_URL, isolation_level="AUTOCOMMIT")
+    with admin.connect() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+
+    engine = create_engine(DATABASE_URL, connect_args={"options": f"-csearch_path={SCHEMA},public"})
+    Session = sessionmaker(bind=engine)
+
+    # Tablas sin índices secundarios de texto; se crean después de la primera medición
+    contacts = models.Contact.__table__
+    trgm = [i for i in contacts.indexes if i.dialect_options["postgresql"]["using"] == "gin"]
+    hnsw = [i for i in contacts.indexes if i.dialect_options["postgresql"]["using"] == "hnsw"]
+    for index in trgm + hnsw:
+        contacts.indexes.discard(index)
+    Base.metadata.create_all(bind=engine, tables=[models.Tenant.__table__, models.User.__table__, contacts])
+    for index in trgm + hnsw:
+        contacts.indexes.add(index)
+
+    started = time.perf_counter()
+    seed(engine, args.rows, args.tenants)
+    print(f"Seed: {args.rows} contactos en {time.perf_counter() - started:.1f}s")
+
+    rng = random.Random(3)
+    # Type-ahead realista: prefijos y fragmentos de nombre, apellido, teléfono y email
+    samples = [n.lower()[:k] for n in FIRST_NAMES + LAST_NAMES for k in (3, 4, 6)] + ["341555", "lead12", "@mail", "gonz", "mart"]
+    workload = [(rng.randint(1, args.tenants), rng.choice(samples)) for _ in range(args.queries)]
+
+    suggest = lambda db, tenant_id, q: search.suggest(db, tenant_id, q, limit=10, types=["contact"])
+    print(f"\n{'consulta':<34} {'p50 ms':>9} {'p99 ms':>9}")
+    measure(Session, "list_contacts ILIKE (sin índice)", list_contacts_query, workload)
+    measure(Session, "suggest (sin índice)", suggest, workload)
+
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(text("SET maintenance_work_mem = '512MB'"))
+        for index in trgm:
+            index.create(bind=conn)
+        conn.execute(text("ANALYZE contacts"))
+    print(f"Índices pg_trgm: {time.perf_counter() - started:.1f}s")
+
+    measure(Session, "list_contacts ILIKE (pg_trgm)", list_contacts_query, workload)
+    measure(Session, "suggest (pg_trgm)", suggest, workload)
+
+    if not args.keep:
+        with admin.connect() as conn:
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+
+if __name__ == "__main__":
+    main()
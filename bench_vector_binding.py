@@ -0,0 +1,134 @@
+"""
+Benchmark: vector embebido como literal en el SQL (bot_engine anterior) vs vector como parámetro tipado
+(vector_search.nearest_query). Requiere Postgres con la extensión vector.
+
+Reporta por variante:
+  - hits/misses del cache de compilación de SQLAlchemy y cantidad de textos SQL distintos enviados
+  - tamaño medio de la sentencia y latencia p50/p99
+  - con PREPARE/EXECUTE (lo que haría un driver con prepared statements): planes genéricos reutilizados
+    según pg_prepared_statements. La variante literal no se puede preparar: cada texto es único.
+
+Uso:
+  DATABASE_URL=postgresql://... python bench_vector_binding.py --rows 20000 --queries 300
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from collections import Counter
+
+sys.path.append(os.getcwd())
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import default
+from sqlalchemy.orm import sessionmaker
+
+import models
+from database import Base, DATABASE_URL
+import vector_search
+from bench_vector_search import seed, synthetic_vectors, percentile
+
+SCHEMA = "bench_bind"
+
+def legacy_search(db, vec):
+    """Réplica de bot_engine.search_properties antes del cambio."""
+    return db.query(models.Property).filter(
+        models.Property.status == "Active", models.Property.embedding_descripcion != None
+    ).order_by(text(f"(1 - (embedding_descripcion <=> '{vec}')) DESC")).limit(5).all()
+
+def helper_search(db, vec):
+    rows = vector_search.nearest(db, models.Property.embedding_descripcion, vec, status="Active", limit=5)
+    return [row[0] for row in rows]
+
+def run(engine, Session, label, fn, queries):
+    stats = Counter()
+    statements = set()
+    sizes = []
+
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        if "FROM properties" not in statement:
+            return
+        statements.add(statement)
+        sizes.append(len(statement))
+        if context.cache_hit is default.CACHE_HIT:
+            stats["hit"] += 1
+        elif context.cache_hit is default.CACHE_MISS:
+            stats["miss"] += 1
+        else:
+            stats["other"] += 1
+
+    event.listen(engine, "after_cursor_execute", after_execute)
+    latencies = []
+    try:
+        for vec in queries:
+            with Session() as db:
+                started = time.perf_counter()
+                fn(db, vec)
+                latencies.append((time.perf_counter() - started) * 1000)
+    finally:
+        event.remove(engine, "after_cursor_execute", after_execute)
+
+    print(f"{label:<22} {percentile(latencies, 50):8.2f} {percentile(latencies, 99):8.2f} "
+          f"{stats['hit']:6d} {stats['miss'] + stats['other']:6d} {len(statements):9d} {sum(sizes) / max(len(sizes), 1):10.0f}")
+
+def prepared_plan_reuse(engine, queries):
+    """Mismo SELECT que genera el helper, preparado una vez y ejecutado N veces."""
+    sql = str(vector_search.nearest_query(
+        sessionmaker(bind=engine)(), models.Property.embedding_descripcion, queries[0], models.Property.id,
+        status="Active", limit=5
+    ).statement.compile(dialect=engine.dialect, compile_kwargs={"render_postcompile": True}))
+    # %(param)s -> $n para PREPARE
+    params = ["query_vector", "status_1_1", "param_1"]
+    for i, name in enumerate(params, start=1):
+        sql = sql.replace(f"%({name})s", f"${i}")
+    latencies = []
+    with engine.connect() as conn:
+        conn.execute(text(f"PREPARE bench_bot_search(vector, text, int) AS {sql}"))
+        for vec in queries:
+            started = time.perf_counter()
+            conn.execute(text("EXECUTE bench_bot_search(CAST(:vec AS vector), 'Active', 5)"), {"vec": str(vec)})
+            latencies.append((time.perf_counter() - started) * 1000)
+        plans = conn.execute(text(
+            "SELECT generic_plans, custom_plans FROM pg_prepared_statements WHERE name = 'bench_bot_search'"
+        )).first()
+        conn.execute(text("DEALLOCATE bench_bot_search"))
+    print(f"{'PREPARE/EXECUTE':<22} {percentile(latencies, 50):8.2f} {percentile(latencies, 99):8.2f}"
+          f"   planes genéricos: {plans.generic_plans if plans else '?'} / custom: {plans.custom_plans if plans else '?'}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--keep", action="store_true")
+    args = parser.parse_args()
+
+    if not DATABASE_URL.startswith("postgresql"):
+        sys.exit("Este benchmark necesita Postgres + pgvector (DATABASE_URL).")
+
+    admin = create_engine(DATABASE_URL, isolation_level="AUTOCOMMIT")
+    with admin.connect() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+
+    engine = create_engine(DATABASE_URL, connect_args={"options": f"-csearch_path={SCHEMA},public"})
+    Session = sessionmaker(bind=engine)
+    Base.metadata.create_all(bind=engine, tables=[models.Tenant.__table__, models.User.__table__, models.Property.__table__])
+    seed(Session, args.rows, 1, 50, random.Random(42))
+
+    queries = list(synthetic_vectors(args.queries, 50, random.Random(7)))
+    print(f"\n{'variante':<22} {'p50 ms':>8} {'p99 ms':>8} {'hits':>6} {'misses':>6} {'SQL únicos':>9} {'bytes/SQL':>10}")
+    run(engine, Session, "literal (f-string)", legacy_search, queries)
+    run(engine, Session, "parámetro tipado", helper_search, queries)
+    prepared_plan_reuse(engine, queries)
+
+    if not args.keep:
+        with admin.connect() as conn:
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Benchmark de búsqueda vectorial (pgvector HNSW vs búsqueda exacta). Requiere Postgres con la extensión vector.
+
+Crea un schema aislado (bench_ann), siembra N propiedades con vectores sintéticos agrupados en clusters,
+construye el índice HNSW y mide para cada ef_search:
+  - latencia p50/p99 de vector_search.nearest (tenant + estado, igual que /ai-matching/match)
+  - recall@k contra la búsqueda exacta (mismo query con enable_indexscan = off)
+
+Uso:
+  DATABASE_URL=postgresql://... python bench_vector_search.py --rows 100000 --queries 200 --ef 20,40,100,200
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+sys.path.append(os.getcwd())
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+import models
+from database import Base, DATABASE_URL
+import vector_search
+
+DIMS = 768
+SCHEMA = "bench_ann"
+
+def synthetic_vectors(count: int, clusters: int, rng: random.Random):
+    """Vectores alrededor de `clusters` centroides (más realista que ruido uniforme para HNSW)."""
+    centroids = [[rng.gauss(0, 1) for _ in range(DIMS)] for _ in range(clusters)]
+    for _ in range(count):
+        c = centroids[rng.randrange(clusters)]
+        yield [x + rng.gauss(0, 0.35) for x in c]
+
+def seed(Session, rows: int, tenants: int, clusters: int, rng: random.Random):
+    with Session() as db:
+        db.execute(models.Tenant.__table__.insert(), [{"id": t, "name": f"Bench {t}"} for t in range(1, tenants + 1)])
+        batch = []
+        for i, vec in enumerate(synthetic_vectors(rows, clusters, rng)):
+            batch.append({
+                "tenant_id": rng.randint(1, tenants), "code": f"BENCH-{i}", "title": f"Propiedad {i}",
+                "status": "Deleted" if rng.random() < 0.1 else "Active", "embedding_descripcion": vec,
+            })
+            if len(batch) == 1000:
+                db.execute(models.Property.__table__.insert(), batch)
+                db.commit()
+                batch = []
+                print(f"\r  sembradas {i + 1}/{rows}", end="", flush=True)
+        if batch:
+            db.execute(models.Property.__table__.insert(), batch)
+            db.commit()
+        print()
+
+def run_queries(Session, queries, tenant_ids, k: int, ef_search: int = None, exact: bool = False):
+    latencies, results = [], []
+    for vec, tenant_id in zip(queries, tenant_ids):
+        with Session() as db:
+            if exact:
+                db.execute(text("SET LOCAL enable_indexscan = off"))
+            started = time.perf_counter()
+            if exact:
+                rows = vector_search.nearest_query(
+                    db, models.Property.embedding_descripcion, vec, models.Property.id,
+                    tenant_id=tenant_id, exclude_status="Deleted", limit=k
+                ).all()
+            else:
+                rows = vector_search.nearest(
+                    db, models.Property.embedding_descripcion, vec, models.Property.id,
+                    tenant_id=tenant_id, exclude_status="Deleted", limit=k, ef_search=ef_search
+                )
+            latencies.append((time.perf_counter() - started) * 1000)
+            results.append({r.id for r in rows})
+    return latencies, results
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--tenants", type=int, default=1, help="Con >1 el filtro de tenant descarta candidatos del índice (ver hnsw.iterative_scan).")
+    parser.add_argument("--clusters", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--ef", default="20,40,100,200")
+    parser.add_argument("--keep", action="store_true", help="No borrar el schema al terminar (para re-correr con --skip-seed).")
+    parser.add_argument("--skip-seed", action="store_true")
+    args = parser.parse_args()
+
+    if not DATABASE_URL.startswith("postgresql"):
+        sys.exit("Este benchmark necesita Postgres + pgvector (DATABASE_URL).")
+
+    admin = create_engine(DATABASE_URL, isolation_level="AUTOCOMMIT")
+    with admin.connect() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        if not args.skip_seed:
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}"))
+
+    engine = create_engine(DATABASE_URL, connect_args={"options": f"-csearch_path={SCHEMA},public"})
+    Session = sessionmaker(bind=engine)
+    rng = random.Random(42)
+
+    if not args.skip_seed:
+        # Tablas sin índices HNSW para sembrar rápido; el índice se construye al final
+        tables = [models.Tenant.__table__, models.User.__table__, models.Property.__table__]
+        hnsw = [i for i in models.Property.__table__.indexes if i.dialect_options["postgresql"]["using"] == "hnsw"]
+        for index in hnsw:
+            models.Property.__table__.indexes.discard(index)
+        Base.metadata.create_all(bind=engine, tables=tables)
+        for index in hnsw:
+            models.Property.__table__.indexes.add(index)
+
+        started = time.perf_counter()
+        seed(Session, args.rows, args.tenants, args.clusters, rng)
+        print(f"Seed: {args.rows} vectores en {time.perf_counter() - started:.1f}s")
+
+        started = time.perf_counter()
+        with engine.connect() as conn:
+            conn.execute(text("SET maintenance_work_mem = '1GB'"))
+            for index in hnsw:
+                index.create(bind=conn)
+            conn.execute(text("ANALYZE properties"))
+            conn.commit()
+        print(f"Índice HNSW (m=16, ef_construction=64): {time.perf_counter() - started:.1f}s")
+
+    queries = list(synthetic_vectors(args.queries, args.clusters, random.Random(7)))
+    tenant_ids = [rng.randint(1, args.tenants) for _ in queries]
+
+    exact_lat, exact_ids = run_queries(Session, queries, tenant_ids, args.k, exact=True)
+    print(f"\n{'modo':<16} {'p50 ms':>8} {'p99 ms':>8} {'recall@' + str(args.k):>10}")
+    print(f"{'exacta (seq)':<16} {percentile(exact_lat, 50):8.2f} {percentile(exact_lat, 99):8.2f} {1.0:10.3f}")
+
+    for ef in [int(x) for x in args.ef.split(",")]:
+        lat, ids = run_queries(Session, queries, tenant_ids, args.k, ef_search=ef)
+        recall = statistics.mean(len(a & b) / max(len(b), 1) for a, b in zip(ids, exact_ids))
+        print(f"{'hnsw ef=' + str(ef):<16} {percentile(lat, 50):8.2f} {percentile(lat, 99):8.2f} {recall:10.3f}")
+
+    if not args.keep:
+        with admin.connect() as conn:
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+
+if __name__ == "__main__":
+    main()
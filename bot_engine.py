@@ -1,10 +1,22 @@
 import os
+import time
 import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from typing import Optional
 import google.generativeai as genai
 from sqlalchemy.orm import Session
 import models
+import phones
+import bot_registry
+import bot_intents
+import bot_tools
+import conversation_memory
+import embedding_cache
 from database import SessionLocal
+from settings import settings
 
 logger = logging.getLogger("urbanocrm.bot_engine")
 
@@ -17,7 +29,7 @@ def get_bot_context(db: Session, bot_id: int):
     bot = db.query(models.Bot).get(bot_id)
     return bot
 
-def search_properties(semantic_query: str = None, operation: str = None, property_type: str = None, budget_max: float = None, zone: str = None, rooms: int = None):
+def search_properties(semantic_query: str = None, operation: str = None, property_type: str = None, budget_max: float = None, zone: str = None, rooms: int = None, amenities: list[str] = None):
     """
     Busca propiedades disponibles en el CRM basándose en criterios o texto natural.
     Args:
@@ -27,48 +39,46 @@ def search_properties(semantic_query: str = None, operation: str = None, propert
         budget_max: Presupuesto máximo estimado.
         zone: Barrio o zona de interés.
         rooms: Cantidad de ambientes.
+        amenities: Comodidades que tiene que tener, en inglés (Ej: ['pool'], ['pets', 'balcony'], ['garden', 'grill']).
     """
-    db = SessionLocal()
-    try:
-        from sqlalchemy import text
-        from routers import ai_service
-        
-        query = db.query(models.Property).filter(models.Property.status == "Active")
-        if operation: query = query.filter(models.Property.operation.ilike(operation))
-        if property_type: query = query.filter(models.Property.type.ilike(property_type))
-        if budget_max: query = query.filter(models.Property.price <= budget_max)
-        if zone: query = query.filter(models.Property.neighborhood.ilike(f"%{zone}%"))
-        if rooms: query = query.filter(models.Property.rooms >= rooms)
+    import search
+    with bot_tools.turn_tools() as tools:
+        with tools.read() as db:
+            dialect = db.get_bind().dialect.name
+        conditions = search.property_filters(
+            status="Active",
+            operation=search.normalize_operation(operation),
+            property_type=search.normalize_property_type(property_type),
+            max_price=budget_max,
+            min_rooms=rooms,
+            neighborhood=zone,
+            amenities=amenities,
+            dialect=dialect,
+        )
+        # El embedding de la búsqueda se pide fuera de la sesión compartida: se solapa con las otras tools del lote
+        text = (semantic_query or "").strip()
+        query_vector = embedding_cache.get_query_embedding(text) if text and dialect == "postgresql" else None
         
-        # SI el bot provee una búsqueda semántica, aplicamos pgvector sorting
-        if semantic_query:
-            query_vector = ai_service.get_embedding(semantic_query)
-            if query_vector:
-                # Filtrar nulos para no romper la distancia y ordenar por COSINE similarity inversa
-                query = query.filter(models.Property.embedding_descripcion != None)
-                query = query.order_by(text(f"(1 - (embedding_descripcion <=> '{query_vector}')) DESC"))
-        else:
-            query = query.order_by(models.Property.created_at.desc())
-            
-        results = query.limit(5).all()
-        return [
-            {
-                "id": p.id, 
-                "title": p.title, 
-                "price": f"{p.currency} {p.price:,.0f}", 
-                "zone": p.neighborhood,
-                "rooms": p.rooms,
-                "code": p.code,
-                "agent": f"{p.assigned_agent.first_name} {p.assigned_agent.last_name}" if p.assigned_agent else "Oficina",
-                "agent_phone": p.assigned_agent.phone_mobile if p.assigned_agent else None,
-                "link": f"https://app.inmobiliarias.ai/p/{p.code}" if p.code else None,
-                "maps_link": f"https://www.google.com/maps/search/?api=1&query={p.lat},{p.lng}" if p.lat and p.lng else None,
-                "features": ", ".join(p.attributes) if p.attributes else "",
-                "description": (p.description or "")[:150] + "..."
-            } for p in results
-        ]
-    finally:
-        db.close()
+        with tools.read() as db:
+            # Mismo motor que el CRM: texto (tsvector) + semántica (pgvector) fusionados por RRF
+            results = [p for p, _ in search.search_properties(db, semantic_query, conditions, limit=5, semantic=False, query_vector=query_vector)]
+            tools.remember_properties(results)
+            return [
+                {
+                    "id": p.id, 
+                    "title": p.title, 
+                    "price": f"{p.currency} {p.price:,.0f}", 
+                    "zone": p.neighborhood,
+                    "rooms": p.rooms,
+                    "code": p.code,
+                    "agent": f"{p.assigned_agent.first_name} {p.assigned_agent.last_name}" if p.assigned_agent else "Oficina",
+                    "agent_phone": p.assigned_agent.phone_mobile if p.assigned_agent else None,
+                    "link": f"https://app.inmobiliarias.ai/p/{p.code}" if p.code else None,
+                    "maps_link": f"https://www.google.com/maps/search/?api=1&query={p.lat},{p.lng}" if p.lat and p.lng else None,
+                    "features": ", ".join(p.attributes) if p.attributes else "",
+                    "description": (p.description or "")[:150] + "..."
+                } for p in results
+            ]
 
 def get_availability(property_id: int):
     """
@@ -76,22 +86,22 @@ def get_availability(property_id: int):
     Args:
         property_id: El ID de la propiedad que el cliente quiere visitar.
     """
-    # Usar lógica existente en routers/bots.py
-    from routers.bots import check_bot_availability
-    db = SessionLocal()
-    try:
-        # Buscamos la instancia del bot para esta propiedad (dueño)
-        prop = db.query(models.Property).get(property_id)
+    # Mismo motor que GET /api/bots/{instance}/availability
+    import availability
+    with bot_tools.turn_tools() as tools:
+        prop = tools.property(property_id)
         if not prop or prop.status == 'Deleted': return "Propiedad no encontrada o no disponible."
         
-        bot = db.query(models.Bot).filter(models.Bot.user_id == prop.assigned_agent_id).first()
+        # Bot del agente asignado (dueño de la agenda); memo del turno
+        bot = tools.agent_bot(prop.assigned_agent_id)
         if not bot: return "Agente no tiene bot activo."
         
         # Llamar a la lógica de disponibilidad (3 días por defecto)
-        result = check_bot_availability(bot.instance_name, property_id=property_id, db=db)
-        return result
-    finally:
-        db.close()
+        with tools.read() as db:
+            try:
+                return availability.bot_availability(db, bot.instance_name, property_id=prop.id, bot=bot)
+            except LookupError:
+                return "Propiedad no encontrada o no disponible."
 
 def get_property_requisites(property_id: int):
     """
@@ -100,54 +110,105 @@ def get_property_requisites(property_id: int):
     Args:
         property_id: El ID numérico de la propiedad.
     """
-    db = SessionLocal()
-    try:
-        prop = db.query(models.Property).get(property_id)
+    with bot_tools.turn_tools() as tools:
+        prop = tools.property(property_id)
         if not prop or prop.status == 'Deleted': 
             return "Propiedad no encontrada o no disponible."
         
-        reqs = prop.transaction_requirements or "No hay requisitos especiales documentados. Por favor, consultar directo con el agente para más detalles."
-        
-        return f"Requisitos y condiciones para propiedad {prop.code or prop.title}:\n{reqs}"
-    finally:
-        db.close()
+        with tools.read():
+            reqs = prop.transaction_requirements or "No hay requisitos especiales documentados. Por favor, consultar directo con el agente para más detalles."
+            return f"Requisitos y condiciones para propiedad {prop.code or prop.title}:\n{reqs}"
+
+@dataclass
+class Turn:
+    """Estado de un mensaje: sesión corta y teléfono del cliente. El engine es compartido entre mensajes."""
+    db: Session
+    phone: str
+
+# Turno en curso: las tools del engine (schedule_visit, update_lead_preferences) lo leen de acá. Corren en el hilo
+# del turno (las de lectura van a hilos de bot_tools con una copia del contexto), así que cada mensaje ve su propio
+# turno aunque haya varios en paralelo.
+_current_turn: ContextVar[Optional[Turn]] = ContextVar("bot_turn", default=None)
+
+def get_engine(instance_name: str) -> "BotEngine":
+    """Engine de la instancia, reusado entre mensajes (ver bot_registry.py)."""
+    return bot_registry.get(instance_name, BotEngine)
 
 class BotEngine:
+    """
+    Modelo configurado (system prompt + tools) de una instancia de bot. Vive entre mensajes: preferir get_engine();
+    cada process_message abre su propia sesión (open_turn) y la cierra al terminar.
+    """
     def __init__(self, bot_instance_name: str):
         self.instance_name = bot_instance_name
-        self.db = SessionLocal()
-        self.bot = self.db.query(models.Bot).filter(models.Bot.instance_name == bot_instance_name).first()
-        
-        if not self.bot:
-            logger.error(f"Bot instance {bot_instance_name} not found in DB")
-            return
+        with SessionLocal() as db:
+            self.bot = db.query(models.Bot).filter(models.Bot.instance_name == bot_instance_name).first()
+            
+            if not self.bot:
+                logger.error(f"Bot instance {bot_instance_name} not found in DB")
+                return
+            
+            # Tenant del dueño del bot: acota contactos y etiqueta el historial (analytics por tenant)
+            self.tenant_id = db.query(models.User.tenant_id).filter(models.User.id == self.bot.user_id).scalar() if self.bot.user_id else None
+            system_prompt = self.bot.system_prompt
+            db.expunge(self.bot) # snapshot de solo lectura; los turnos consultan con su propia sesión
 
         # Initialize Model with Tools
         model_name = os.getenv("CHATBOT_MODEL", "gemini-1.5-flash")
-        logger.info(f"Bot Engine: Initializing model {model_name}")
+        logger.info(f"Bot Engine: Initializing model {model_name} for {bot_instance_name}")
         
+        tools = [search_properties, get_availability, get_property_requisites, self.schedule_visit, self.update_lead_preferences]
+        self.tools = {tool.__name__: tool for tool in tools}
         self.model = genai.GenerativeModel(
             model_name=model_name,
-            tools=[search_properties, get_availability, get_property_requisites, self.schedule_visit, self.update_lead_preferences],
-            system_instruction=self.bot.system_prompt or "Eres una asesora inmobiliaria llamada Agustina."
+            tools=tools,
+            system_instruction=system_prompt or "Eres una asesora inmobiliaria llamada Agustina."
         )
-        self.current_phone = None
+
+    @contextmanager
+    def open_turn(self, phone: str):
+        """Sesión corta para un mensaje de `phone`; las tools la ven como self.db / self.current_phone."""
+        db = SessionLocal()
+        token = _current_turn.set(Turn(db=db, phone=phone))
+        try:
+            with bot_tools.open_turn(): # sesión de lectura y memo compartidos por las tools del turno
+                yield _current_turn.get()
+        finally:
+            _current_turn.reset(token)
+            db.close()
+
+    @property
+    def db(self) -> Session:
+        turn = _current_turn.get()
+        if turn is None:
+            raise RuntimeError("BotEngine: fuera de un turno (usar open_turn)")
+        return turn.db
+
+    @property
+    def current_phone(self) -> Optional[str]:
+        turn = _current_turn.get()
+        return turn.phone if turn else None
+
+    def find_contact(self):
+        """Contacto del número actual, sin importar cómo se cargó el teléfono (+54 9..., 0341 15..., jid)."""
+        condition = phones.match_condition(models.Contact.phone_normalized, self.current_phone, self.db.get_bind().dialect.name)
+        if condition is None:
+            return None
+        if not self.tenant_id:
+            # Sin tenant no hay forma de saber de qué agencia es el contacto (ni de usar ix_contacts_phone_reversed)
+            logger.warning(f"Bot Engine: bot {self.bot.id} has no tenant, skipping contact lookup")
+            return None
+        return self.db.query(models.Contact).filter(
+            models.Contact.tenant_id == self.tenant_id, condition
+        ).order_by(models.Contact.id).first()
 
     def get_history(self, phone: str):
-        history = self.db.query(models.ChatHistory).filter(
-            models.ChatHistory.sender_id == phone
-        ).order_by(models.ChatHistory.created_at.desc()).limit(15).all()
-        
-        formatted_history = []
-        for msg in reversed(history):
-            formatted_history.append({
-                "role": msg.role,
-                "parts": msg.parts
-            })
-        return formatted_history
+        """Resumen de la conversación + turnos recientes dentro del presupuesto de tokens (conversation_memory)."""
+        return conversation_memory.load(self.db, phone, self.tenant_id).history
 
     def save_message(self, phone: str, role: str, text: str):
         new_msg = models.ChatHistory(
+            tenant_id=self.tenant_id,
             sender_id=phone,
             role=role,
             parts=[text]
@@ -155,28 +216,62 @@ class BotEngine:
         self.db.add(new_msg)
         self.db.commit()
 
+    def schedule_summary(self, phone: str):
+        """Los turnos viejos ya no entran en el presupuesto: el worker los pliega en el resumen (no bloquea la respuesta)."""
+        try:
+            conversation_memory.schedule_summary(self.db, phone, self.tenant_id)
+            self.db.commit()
+        except Exception as e:
+            logger.warning(f"Could not schedule conversation summary for {phone}: {e}")
+            self.db.rollback()
+
+    def run_tools(self, chat, response):
+        """
+        Function calling del turno: mientras el modelo pida tools, se ejecutan todas las de la respuesta juntas
+        (bot_tools.execute: lecturas en paralelo) y se le devuelven los resultados. Hasta bot_tool_max_rounds vueltas.
+        """
+        for _ in range(settings.bot_tool_max_rounds):
+            calls = [(part.function_call.name, dict(part.function_call.args)) for part in response.parts if part.function_call.name]
+            if not calls:
+                break
+            results = bot_tools.execute(calls, self.tools)
+            response = chat.send_message([
+                genai.protos.Part(function_response=genai.protos.FunctionResponse(
+                    name=r.name, response=r.result if isinstance(r.result, dict) else {"result": r.result}
+                )) for r in results
+            ])
+        return response
+
     def process_message(self, phone: str, user_text: str):
         if not self.bot: return "Error: Bot no configurado."
         
-        self.current_phone = phone
-        if not self.bot: return "Error: Bot no configurado."
-        
-        self.save_message(phone, "user", user_text)
-        history = self.get_history(phone)
-        
-        # history[:-1] because start_chat expects history without the current message
-        chat = self.model.start_chat(history=history[:-1], enable_automatic_function_calling=True)
-        
-        try:
-            response = chat.send_message(user_text)
-            bot_response = response.text
-            self.save_message(phone, "model", bot_response)
-            return bot_response
-        except Exception as e:
-            logger.error(f"Gemini Error for {phone}: {e}")
-            return "Lo siento, tuve un problema técnico. ¿Podemos seguir en un ratito?"
-        finally:
-            self.db.close()
+        started = time.perf_counter()
+        with self.open_turn(phone):
+            # Consultas puntuales sobre la propiedad de la conversación: plantilla, sin vuelta a Gemini
+            if settings.bot_fast_path_enabled:
+                reply = bot_intents.answer(self.db, phone, user_text, self.tools, self.tenant_id)
+                if reply:
+                    self.save_message(phone, "user", user_text)
+                    self.save_message(phone, "model", reply)
+                    return reply
+
+            # El historial se lee antes de guardar el mensaje: start_chat lo espera sin el mensaje actual
+            memory = conversation_memory.load(self.db, phone, self.tenant_id)
+            self.save_message(phone, "user", user_text)
+            chat = self.model.start_chat(history=memory.history)
+            bot_registry.record_turn_setup((time.perf_counter() - started) * 1000)
+            
+            try:
+                response = self.run_tools(chat, chat.send_message(user_text))
+                bot_response = response.text
+                bot_intents.record_llm_turn((time.perf_counter() - started) * 1000)
+                self.save_message(phone, "model", bot_response)
+                if memory.needs_summary:
+                    self.schedule_summary(phone)
+                return bot_response
+            except Exception as e:
+                logger.error(f"Gemini Error for {phone}: {e}")
+                return "Lo siento, tuve un problema técnico. ¿Podemos seguir en un ratito?"
 
     def update_lead_preferences(self, budget: float = None, zone: str = None, property_type: str = None, operation: str = None, notes: str = None):
         """
@@ -195,7 +290,7 @@ class BotEngine:
             return "No pude identificar tu número."
             
         try:
-            contact = self.db.query(models.Contact).filter(models.Contact.phone == self.current_phone).first()
+            contact = self.find_contact()
             if not contact:
                 return "No encontré tu contacto en la base de datos."
                 
@@ -222,14 +317,9 @@ class BotEngine:
             if contact.lead_score < 100:
                 contact.lead_score = min(contact.lead_score + 5, 100)
                 
-            # Generar embedding del nuevo perfil para Reverse Matching
-            try:
-                from routers import ai_service
-                pref_vec = ai_service.get_embedding(contact.notes)
-                if pref_vec:
-                    contact.embedding_preferences = pref_vec
-            except Exception as e:
-                logger.error(f"Error generating embedding for lead pref: {e}")
+            # Generar embedding del nuevo perfil para Reverse Matching (job persistente, fuera del turno del bot)
+            import job_queue
+            job_queue.enqueue(self.db, job_queue.CONTACT_PREFERENCES_EMBEDDING, contact.id)
                 
             self.db.commit()
             return "Perfil de cliente enriquecido en el CRM exitosamente. Ahora el sistema de IA emparejará estas preferencias con el catálogo."
@@ -252,7 +342,7 @@ class BotEngine:
 
         try:
             # 1. Contact
-            contact = self.db.query(models.Contact).filter(models.Contact.phone == self.current_phone).first()
+            contact = self.find_contact()
             if not contact:
                 return "No encontré tu contacto registrado."
 
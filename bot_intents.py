@@ -0,0 +1,222 @@
+import logging
+import re
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from settings import settings
+import analytics
+import models
+
+logger = logging.getLogger("urbanocrm.bot_intents")
+
+# Atajo determinístico delante de BotEngine.process_message.
+#
+# Muchos mensajes de WhatsApp son consultas puntuales sobre una propiedad que ya está en la conversación ("requisitos?",
+# "precio?", "cuándo la puedo ver?") y pagaban una vuelta completa de Gemini. Acá se contestan con plantillas a partir
+# de las mismas tools del bot (get_property_requisites, get_availability) o de los datos de la propiedad:
+# - El tema sale de las reglas de analytics.TOPIC_KEYWORDS (las del tablero del bot); tiene que haber uno solo y tener
+#   una intención registrada (register).
+# - Alta confianza: mensaje corto (bot_fast_path_max_words) en el que todas las palabras son del tema, relleno
+#   ("cuáles son los...", "hola", "gracias") o el código de la propiedad. Cualquier otra cosa va al modelo.
+# - La propiedad: el código en el mensaje o, si no, el único código del último mensaje de la conversación que
+#   mencione alguno. Si hay varios, es ambiguo y va al modelo.
+# - Si la intención no tiene con qué contestar (sin precio, sin horarios libres) también va al modelo.
+# stats() cuenta los turnos atendidos por intención y estima la latencia ahorrada contra el promedio de los turnos
+# que sí fueron a Gemini.
+
+CODE_PATTERN = re.compile(r"\b[A-Z]{2,5}-[A-Z0-9]{3,}\b", re.IGNORECASE)
+
+FILLER = {
+    "hola", "buenas", "buen", "dia", "tardes", "noches", "gracias", "porfa", "por", "favor", "y", "o", "el", "la", "los",
+    "las", "lo", "le", "me", "se", "de", "del", "en", "a", "al", "que", "cual", "cuales", "son", "es", "hay", "tiene",
+    "tienen", "sus", "su", "esa", "ese", "esta", "este", "propiedad", "depto", "departamento", "casa", "puedo", "podria",
+    "podemos", "pasas", "pasame", "decime", "info", "sobre", "para", "con", "mas", "necesito", "quiero", "saber",
+}
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+def words(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+(?:-[a-z0-9]+)?", normalize(text))
+
+@dataclass
+class Intent:
+    topic: str # clave de analytics.TOPIC_KEYWORDS
+    keywords: tuple # prefijos normalizados: los del tema + los propios del atajo
+    answer: Callable[["models.Property", Dict[str, Callable]], Optional[str]] # None: que conteste el modelo
+
+INTENTS: Dict[str, Intent] = {}
+
+def register(topic: str, extra_keywords: tuple = ()):
+    """Registra la plantilla de un tema. answer(prop, tools) recibe las tools del engine (BotEngine.tools)."""
+    if topic not in analytics.TOPIC_KEYWORDS:
+        raise ValueError(f"Unknown bot topic: {topic}")
+    def decorator(answer):
+        keywords = tuple(normalize(k) for k in analytics.TOPIC_KEYWORDS[topic] + tuple(extra_keywords))
+        INTENTS[topic] = Intent(topic, keywords, answer)
+        return answer
+    return decorator
+
+def _matches(word: str, keywords) -> bool:
+    return any(word.startswith(k) for k in keywords)
+
+def _topic_keywords(topic: str) -> tuple:
+    intent = INTENTS.get(topic)
+    return intent.keywords if intent else tuple(normalize(k) for k in analytics.TOPIC_KEYWORDS[topic])
+
+def classify(text: str) -> Optional[Intent]:
+    """Intención registrada del mensaje si es de alta confianza, o None."""
+    tokens = words(text)
+    if not tokens or len(tokens) > settings.bot_fast_path_max_words:
+        return None
+    topics = [topic for topic in analytics.TOPIC_KEYWORDS if any(_matches(t, _topic_keywords(topic)) for t in tokens)]
+    if len(topics) != 1 or topics[0] not in INTENTS:
+        return None
+    intent = INTENTS[topics[0]]
+    for token in tokens:
+        if token not in FILLER and not _matches(token, intent.keywords) and not CODE_PATTERN.fullmatch(token):
+            return None
+    return intent
+
+def context_property(db: Session, phone: str, text: str, tenant_id: Optional[int] = None) -> Optional[models.Property]:
+    """Propiedad de la que habla el mensaje: código en el texto o el único código del último mensaje que nombre alguno."""
+    codes = {c.upper() for c in CODE_PATTERN.findall(text)}
+    if not codes:
+        # La conversación es por (tenant, teléfono): el mismo número hablando con el bot de otra inmobiliaria no cuenta
+        query = db.query(models.ChatHistory.parts).filter(models.ChatHistory.sender_id == phone)
+        if tenant_id:
+            query = query.filter(models.ChatHistory.tenant_id == tenant_id)
+        rows = query.order_by(
+            models.ChatHistory.created_at.desc(), models.ChatHistory.id.desc()
+        ).limit(settings.bot_fast_path_context_messages).all()
+        for (parts,) in rows:
+            codes = {c.upper() for part in parts or [] if isinstance(part, str) for c in CODE_PATTERN.findall(part)}
+            if codes:
+                break
+    if len(codes) != 1:
+        return None
+    query = db.query(models.Property).filter(models.Property.code == codes.pop(), models.Property.status != "Deleted")
+    if tenant_id:
+        query = query.filter(models.Property.tenant_id == tenant_id)
+    return query.first()
+
+# --- Plantillas ---
+
+DAY_NAMES = {"Mon": "Lunes", "Tue": "Martes", "Wed": "Miércoles", "Thu": "Jueves", "Fri": "Viernes", "Sat": "Sábado", "Sun": "Domingo"}
+OPERATIONS = {"Sale": "en venta", "Rent": "en alquiler", "Temporary": "en alquiler temporario"}
+
+def _label(prop: models.Property) -> str:
+    return f"{prop.title} ({prop.code})" if prop.title else prop.code
+
+@register("Requisitos")
+def answer_requisites(prop, tools):
+    requisites = tools["get_property_requisites"](property_id=prop.id)
+    if not isinstance(requisites, str) or requisites.startswith("Propiedad no encontrada"):
+        return None
+    return f"{requisites}\n\n¿Querés que coordinemos una visita?"
+
+@register("Precios", extra_keywords=("sale", "cuesta", "piden"))
+def answer_price(prop, tools):
+    if not prop.price:
+        return None
+    price = f"{prop.currency or 'USD'} {prop.price:,.0f}" + (" por mes" if prop.operation == "Rent" else "")
+    operation = OPERATIONS.get(prop.operation)
+    return f"{_label(prop)} está {operation + ' ' if operation else ''}a {price}.\n\n¿Querés que coordinemos una visita?"
+
+@register("Ubicación", extra_keywords=("direccion", "queda", "barrio"))
+def answer_location(prop, tools):
+    if not prop.address:
+        return None
+    place = ", ".join(p for p in (prop.address, prop.neighborhood) if p)
+    maps = f"\n📍 https://www.google.com/maps/search/?api=1&query={prop.lat},{prop.lng}" if prop.lat and prop.lng else ""
+    return f"{_label(prop)} queda en {place}.{maps}\n\n¿Querés que coordinemos una visita?"
+
+@register("Agendar Visita", extra_keywords=("horario", "disponib", "cuando"))
+def answer_visit_slots(prop, tools):
+    result = tools["get_availability"](property_id=prop.id)
+    slots = result.get("available_slots") if isinstance(result, dict) else None
+    if not slots:
+        return None
+    by_day: Dict[tuple, List[str]] = {}
+    for slot in slots:
+        by_day.setdefault((slot["date"], slot["day"]), []).append(slot["start"])
+    lines = [
+        f"• {DAY_NAMES.get(day, day)} {date[8:10]}/{date[5:7]}: {', '.join(starts[:settings.bot_fast_path_slots_per_day])}"
+        for (date, day), starts in list(by_day.items())[:3]
+    ]
+    return f"Para visitar {_label(prop)} tengo estos horarios:\n" + "\n".join(lines) + "\n\n¿Cuál te queda mejor?"
+
+# --- Router ---
+
+_counters_lock = threading.Lock()
+_counters = {"turns": 0, "handled": 0, "fast_path_ms": 0.0, "llm_turns": 0, "llm_ms": 0.0}
+_by_intent: Dict[str, int] = {}
+_fallbacks: Dict[str, int] = {}
+
+def _record(outcome: str, elapsed_ms: float, handled: bool):
+    with _counters_lock:
+        _counters["turns"] += 1
+        if handled:
+            _counters["handled"] += 1
+            _counters["fast_path_ms"] += elapsed_ms
+            _by_intent[outcome] = _by_intent.get(outcome, 0) + 1
+        else:
+            _fallbacks[outcome] = _fallbacks.get(outcome, 0) + 1
+
+def answer(db: Session, phone: str, text: str, tools: Dict[str, Callable], tenant_id: Optional[int] = None) -> Optional[str]:
+    """Respuesta por plantilla si el mensaje es una consulta estructurada de alta confianza; None para ir al modelo."""
+    started = time.perf_counter()
+    intent = classify(text)
+    if intent is None:
+        _record("no_intent", 0.0, False)
+        return None
+    prop = context_property(db, phone, text, tenant_id)
+    if prop is None:
+        _record("no_property", 0.0, False)
+        return None
+    try:
+        reply = intent.answer(prop, tools)
+    except Exception as e:
+        logger.warning(f"Fast path {intent.topic} failed for {phone}: {e}")
+        reply = None
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    _record(intent.topic if reply else "no_answer", elapsed_ms, bool(reply))
+    return reply
+
+def record_llm_turn(elapsed_ms: float):
+    """Latencia de un turno que fue a Gemini (BotEngine.process_message): base para estimar lo ahorrado."""
+    with _counters_lock:
+        _counters["llm_turns"] += 1
+        _counters["llm_ms"] += elapsed_ms
+
+def clear_stats():
+    with _counters_lock:
+        for key in _counters:
+            _counters[key] = 0
+        _by_intent.clear()
+        _fallbacks.clear()
+
+def stats() -> dict:
+    with _counters_lock:
+        counters = dict(_counters)
+        by_intent, fallbacks = dict(_by_intent), dict(_fallbacks)
+    handled, llm_turns = counters["handled"], counters["llm_turns"]
+    avg_fast = counters["fast_path_ms"] / handled if handled else None
+    avg_llm = counters["llm_ms"] / llm_turns if llm_turns else None
+    return {
+        "turns": counters["turns"],
+        "handled": handled,
+        "handled_ratio": round(handled / counters["turns"], 3) if counters["turns"] else None,
+        "by_intent": by_intent,
+        "fallbacks": fallbacks,
+        "avg_fast_path_ms": round(avg_fast, 2) if avg_fast is not None else None,
+        "avg_llm_turn_ms": round(avg_llm, 2) if avg_llm is not None else None,
+        "saved_ms": round(handled * (avg_llm - avg_fast), 2) if avg_fast is not None and avg_llm is not None else None,
+        "enabled": settings.bot_fast_path_enabled,
+    }
@@ -0,0 +1,139 @@
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+from settings import settings
+
+logger = logging.getLogger("urbanocrm.bot_processor")
+
+# Procesador de conversaciones del bot (asyncio).
+#
+# - Orden estricto por conversación: una cola por (instance_name, phone) con un único consumidor, así dos mensajes
+#   del mismo teléfono nunca corren a la vez ni intercalan escrituras de ChatHistory.
+# - Muchos teléfonos en paralelo, con un tope global (bot_max_concurrency) de turnos en curso.
+# - El turno (BotEngine.process_message: Gemini con function calling + tools que van a la base) es bloqueante: corre en
+#   un pool de hilos propio del tamaño del tope, sin ocupar el threadpool de las rutas sync de FastAPI.
+# El consumidor de una conversación termina cuando su cola queda vacía: no quedan tareas por teléfonos inactivos.
+#
+# El orden por teléfono vale dentro de un proceso: las colas viven en memoria. La imagen corre un solo proceso de
+# uvicorn (Dockerfile) y es lo que se asume. Con varios workers web, dos webhooks del mismo remitente pueden caer en
+# procesos distintos: whatsapp_buffer garantiza que cada mensaje se procese una sola vez, pero no que las ráfagas de
+# un mismo teléfono no corran en paralelo.
+#
+# Los fallos se loguean en un done-callback del future: quien encola sin esperarlo (webhook) no los pierde.
+
+Key = Tuple[str, str] # (instance_name, phone)
+
+def run_turn(instance_name: str, phone: str, text: str) -> str:
+    """Turno real: engine de la instancia (bot_registry) y process_message, en un hilo del pool."""
+    import bot_engine # importa el SDK de Gemini: solo cuando hay mensajes que procesar
+    return bot_engine.get_engine(instance_name).process_message(phone, text)
+
+class ConversationProcessor:
+    def __init__(self, turn: Callable[[str, str, str], str] = run_turn, max_concurrency: Optional[int] = None):
+        self.turn = turn
+        self.max_concurrency = max_concurrency or settings.bot_max_concurrency
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="bot-turn")
+        self._queues: Dict[Key, asyncio.Queue] = {}
+        self._consumers: Dict[Key, asyncio.Task] = {}
+        self._counters = {"submitted": 0, "processed": 0, "failed": 0, "in_flight": 0, "max_in_flight": 0, "turn_ms": 0.0}
+
+    def submit(self, instance_name: str, phone: str, text: Optional[str], turn: Optional[Callable] = None) -> "asyncio.Future":
+        """
+        Encola el mensaje detrás de los pendientes del mismo teléfono. El future resuelve con la respuesta del bot.
+        `turn` reemplaza al del procesador para este mensaje (whatsapp_inbox: toma los mensajes del buffer).
+        """
+        key = (instance_name, phone)
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = asyncio.Queue()
+        future.add_done_callback(functools.partial(_log_failure, key))
+        queue.put_nowait((text, turn or self.turn, future))
+        self._counters["submitted"] += 1
+        if key not in self._consumers:
+            self._consumers[key] = asyncio.create_task(self._consume(key, queue), name=f"bot-conversation-{phone}")
+        return future
+
+    async def _consume(self, key: Key, queue: asyncio.Queue):
+        instance_name, phone = key
+        try:
+            while not queue.empty():
+                text, turn, future = queue.get_nowait()
+                try:
+                    reply = await self._run(turn, instance_name, phone, text)
+                except Exception as e:
+                    self._counters["failed"] += 1
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    self._counters["processed"] += 1
+                    if not future.done():
+                        future.set_result(reply)
+        finally:
+            # Sin await entre el último empty() y el pop: submit() no puede colarse en el medio
+            self._consumers.pop(key, None)
+            if queue.empty():
+                self._queues.pop(key, None)
+
+    async def _run(self, turn: Callable, instance_name: str, phone: str, text: Optional[str]):
+        async with self._slots:
+            self._counters["in_flight"] += 1
+            self._counters["max_in_flight"] = max(self._counters["max_in_flight"], self._counters["in_flight"])
+            started = time.perf_counter()
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor, turn, instance_name, phone, text)
+            finally:
+                self._counters["in_flight"] -= 1
+                self._counters["turn_ms"] += (time.perf_counter() - started) * 1000
+
+    async def drain(self):
+        """Espera a que terminen todas las conversaciones encoladas (incluidas las que se encolen mientras tanto)."""
+        while self._consumers:
+            await asyncio.gather(*list(self._consumers.values()), return_exceptions=True)
+
+    async def shutdown(self):
+        await self.drain()
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        counters = dict(self._counters)
+        done = counters["processed"] + counters["failed"]
+        return {
+            "submitted": counters["submitted"],
+            "processed": counters["processed"],
+            "failed": counters["failed"],
+            "in_flight": counters["in_flight"],
+            "max_in_flight": counters["max_in_flight"],
+            "max_concurrency": self.max_concurrency,
+            "active_conversations": len(self._consumers),
+            "queued": sum(q.qsize() for q in self._queues.values()),
+            "avg_turn_ms": round(counters["turn_ms"] / done, 2) if done else None,
+        }
+
+def _log_failure(key: Key, future: "asyncio.Future"):
+    """Done-callback de cada turno: loguea el error (y lo da por leído, aunque nadie haga await del future)."""
+    if not future.cancelled() and future.exception() is not None:
+        instance_name, phone = key
+        logger.error(f"Bot turn failed for {phone} ({instance_name}): {future.exception()}")
+
+_processor: Optional[ConversationProcessor] = None
+
+def get_processor() -> ConversationProcessor:
+    """Procesador del proceso (se crea en el primer uso, dentro del event loop de la app)."""
+    global _processor
+    if _processor is None:
+        _processor = ConversationProcessor()
+    return _processor
+
+async def shutdown():
+    """Lifespan de main.py: termina los turnos encolados antes de apagar."""
+    global _processor
+    if _processor is not None:
+        await _processor.shutdown()
+        _processor = None
@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from settings import settings
+
+# Registro de motores de bot por instance_name (un BotEngine por instancia de WhatsApp, vivo entre mensajes).
+#
+# Armar un BotEngine cuesta una consulta del Bot y del tenant y construir el modelo de Gemini con las declaraciones
+# de las tools y el system prompt; eso antes se pagaba en cada mensaje. Acá se arma una vez y se reusa hasta que:
+# - routers/bots.configure_bot cambia el prompt o la config (invalidate), o
+# - vence bot_engine_ttl_seconds (otros procesos, p. ej. worker.py, no ven la invalidación en memoria).
+# No importa bot_engine (ni el SDK de Gemini): el router invalida sin cargar el modelo.
+
+_engines = OrderedDict() # instance_name -> (expira_en, engine)
+_engines_lock = threading.Lock()
+_engine_counters = {"hits": 0, "misses": 0, "build_ms": 0.0, "turns": 0, "turn_setup_ms": 0.0}
+
+def get(instance_name: str, factory: Callable[[str], object]):
+    """
+    Engine cacheado de la instancia o uno nuevo con factory(instance_name). Los que no encontraron su Bot
+    (engine.bot es None) no se cachean: la instancia puede configurarse después.
+    """
+    with _engines_lock:
+        entry = _engines.get(instance_name)
+        if entry is not None and entry[0] >= time.monotonic():
+            _engines.move_to_end(instance_name)
+            _engine_counters["hits"] += 1
+            return entry[1]
+        _engines.pop(instance_name, None)
+        _engine_counters["misses"] += 1
+
+    started = time.perf_counter()
+    engine = factory(instance_name)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    with _engines_lock:
+        _engine_counters["build_ms"] += elapsed_ms
+        if getattr(engine, "bot", None) is not None:
+            _engines[instance_name] = (time.monotonic() + settings.bot_engine_ttl_seconds, engine)
+            _engines.move_to_end(instance_name)
+            while len(_engines) > settings.bot_engine_cache_size:
+                _engines.popitem(last=False)
+    return engine
+
+def invalidate(*instance_names: Optional[str]):
+    """Descarta el engine de `instance_names` (llamar después de cambiar system_prompt o config del Bot)."""
+    with _engines_lock:
+        for name in instance_names:
+            _engines.pop(name, None)
+
+def clear():
+    with _engines_lock:
+        _engines.clear()
+
+def record_turn_setup(elapsed_ms: float):
+    """Overhead por mensaje antes de llamar al modelo (sesión, guardar el mensaje, historial, start_chat)."""
+    with _engines_lock:
+        _engine_counters["turns"] += 1
+        _engine_counters["turn_setup_ms"] += elapsed_ms
+
+def stats() -> dict:
+    with _engines_lock:
+        counters = dict(_engine_counters)
+        builds = counters["misses"]
+        turns = counters["turns"]
+        return {
+            "hits": counters["hits"],
+            "misses": builds,
+            "entries": len(_engines),
+            "ttl_seconds": settings.bot_engine_ttl_seconds,
+            "avg_build_ms": round(counters["build_ms"] / builds, 2) if builds else None,
+            "turns": turns,
+            "avg_turn_setup_ms": round(counters["turn_setup_ms"] / turns, 2) if turns else None,
+        }
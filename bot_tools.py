@@ -0,0 +1,194 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from settings import settings
+import models
+
+logger = logging.getLogger("urbanocrm.bot_tools")
+
+# Ejecución de las tools del bot (function calling de Gemini).
+#
+# Cuando el modelo pide varias tools en una misma respuesta (search_properties + get_property_requisites de varias
+# propiedades, por ejemplo) las de lectura corren en paralelo, hasta bot_tool_parallelism a la vez; las que escriben
+# (schedule_visit, update_lead_preferences) corren después, en orden, con la sesión del turno.
+#
+# Las tools de lectura comparten por turno una sola sesión (TurnTools) en lugar de abrir y cerrar una cada una, y un
+# memo de propiedades y bots ya consultados (get_availability ya no vuelve a buscar el Bot del agente ni la propiedad
+# que trajo search_properties). Session no es thread-safe: el acceso a la sesión compartida va con lock, así que lo que
+# se solapa entre tools es lo que pasa fuera de la base (el embedding de la búsqueda, armar las respuestas).
+#
+# stats() lleva la latencia por tool y cuánto tiempo de pared ahorró correr los lotes en paralelo.
+
+READ_TOOLS = {"search_properties", "get_availability", "get_property_requisites"}
+
+_counters_lock = threading.Lock()
+_tool_counters = defaultdict(lambda: {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+_batch_counters = {"batches": 0, "parallel_batches": 0, "sequential_ms": 0.0, "wall_ms": 0.0}
+
+class TurnTools:
+    """Sesión de lectura y memo de un turno. La sesión se abre con la primera tool que la usa."""
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal):
+        self._session_factory = session_factory
+        self._db: Optional[Session] = None
+        self._lock = threading.RLock()
+        self.properties: Dict[int, Optional[models.Property]] = {}
+        self.agent_bots: Dict[int, Optional[models.Bot]] = {}
+        self.queries = 0
+
+    @contextmanager
+    def read(self):
+        """Sesión compartida del turno, de a una tool por vez."""
+        with self._lock:
+            if self._db is None:
+                self._db = self._session_factory()
+            yield self._db
+
+    def property(self, property_id: int) -> Optional[models.Property]:
+        property_id = int(property_id)
+        with self.read() as db:
+            if property_id not in self.properties:
+                self.queries += 1
+                self.properties[property_id] = db.get(models.Property, property_id)
+            return self.properties[property_id]
+
+    def remember_properties(self, properties: Sequence[models.Property]):
+        with self._lock:
+            for prop in properties:
+                self.properties.setdefault(prop.id, prop)
+
+    def agent_bot(self, user_id: Optional[int]) -> Optional[models.Bot]:
+        """Bot del agente asignado a una propiedad (el que tiene la agenda de visitas)."""
+        if not user_id:
+            return None
+        with self.read() as db:
+            if user_id not in self.agent_bots:
+                self.queries += 1
+                self.agent_bots[user_id] = db.query(models.Bot).filter(models.Bot.user_id == user_id).first()
+            return self.agent_bots[user_id]
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+_current_tools: ContextVar[Optional[TurnTools]] = ContextVar("bot_turn_tools", default=None)
+
+@contextmanager
+def open_turn(session_factory: Callable[[], Session] = SessionLocal):
+    """Estado compartido de las tools de lectura durante un turno (BotEngine.open_turn)."""
+    tools = TurnTools(session_factory)
+    token = _current_tools.set(tools)
+    try:
+        yield tools
+    finally:
+        _current_tools.reset(token)
+        tools.close()
+
+@contextmanager
+def turn_tools():
+    """Las tools de lectura usan el estado del turno; fuera de un turno (scripts) uno propio que se cierra al salir."""
+    tools = _current_tools.get()
+    if tools is not None:
+        yield tools
+        return
+    with open_turn() as tools:
+        yield tools
+
+@dataclass
+class ToolResult:
+    name: str
+    args: dict
+    result: Any = None
+    error: Optional[str] = None
+    elapsed_ms: float = 0.0
+
+def _call(name: str, function: Callable, args: dict) -> ToolResult:
+    started = time.perf_counter()
+    outcome = ToolResult(name=name, args=args)
+    try:
+        outcome.result = function(**args)
+    except Exception as e:
+        logger.error(f"Bot tool {name} failed: {e}")
+        outcome.error = str(e)
+        outcome.result = f"Error al ejecutar {name}."
+    outcome.elapsed_ms = (time.perf_counter() - started) * 1000
+    with _counters_lock:
+        counters = _tool_counters[name]
+        counters["calls"] += 1
+        counters["errors"] += outcome.error is not None
+        counters["total_ms"] += outcome.elapsed_ms
+        counters["max_ms"] = max(counters["max_ms"], outcome.elapsed_ms)
+    return outcome
+
+def execute(calls: Sequence[tuple], functions: Dict[str, Callable], parallelism: Optional[int] = None) -> List[ToolResult]:
+    """
+    Corre las llamadas [(name, args)] de una respuesta del modelo y devuelve los resultados en el mismo orden.
+    Lecturas en paralelo (con el contexto del turno en cada hilo), escrituras después y en orden.
+    """
+    parallelism = parallelism or settings.bot_tool_parallelism
+    started = time.perf_counter()
+    results: List[Optional[ToolResult]] = [None] * len(calls)
+    reads, writes = [], []
+    for index, (name, args) in enumerate(calls):
+        function = functions.get(name)
+        if function is None:
+            results[index] = ToolResult(name=name, args=args, result=f"Herramienta desconocida: {name}.", error="unknown tool")
+        elif name in READ_TOOLS:
+            reads.append((index, name, function, args))
+        else:
+            writes.append((index, name, function, args))
+
+    if len(reads) > 1 and parallelism > 1:
+        with ThreadPoolExecutor(max_workers=min(len(reads), parallelism), thread_name_prefix="bot-tool") as pool:
+            futures = [(index, pool.submit(copy_context().run, _call, name, function, args)) for index, name, function, args in reads]
+            for index, future in futures:
+                results[index] = future.result()
+    else:
+        for index, name, function, args in reads:
+            results[index] = _call(name, function, args)
+    for index, name, function, args in writes:
+        results[index] = _call(name, function, args)
+
+    wall_ms = (time.perf_counter() - started) * 1000
+    with _counters_lock:
+        _batch_counters["batches"] += 1
+        _batch_counters["parallel_batches"] += len(reads) > 1 and parallelism > 1
+        _batch_counters["sequential_ms"] += sum(r.elapsed_ms for r in results)
+        _batch_counters["wall_ms"] += wall_ms
+    return results
+
+def clear_stats():
+    with _counters_lock:
+        _tool_counters.clear()
+        for key in _batch_counters:
+            _batch_counters[key] = 0
+
+def stats() -> dict:
+    with _counters_lock:
+        tools = {
+            name: {
+                "calls": c["calls"],
+                "errors": c["errors"],
+                "avg_ms": round(c["total_ms"] / c["calls"], 2) if c["calls"] else None,
+                "max_ms": round(c["max_ms"], 2),
+            } for name, c in sorted(_tool_counters.items())
+        }
+        batches = dict(_batch_counters)
+    return {
+        "tools": tools,
+        "batches": batches["batches"],
+        "parallel_batches": batches["parallel_batches"],
+        "parallelism": settings.bot_tool_parallelism,
+        "saved_ms": round(batches["sequential_ms"] - batches["wall_ms"], 2),
+    }
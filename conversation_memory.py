@@ -0,0 +1,228 @@
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import String, cast, func
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from settings import settings
+import models
+
+logger = logging.getLogger("urbanocrm.conversation_memory")
+
+# Memoria de conversación del bot: resumen acumulado + turnos recientes dentro de un presupuesto de tokens.
+#
+# Antes BotEngine mandaba a start_chat los últimos 15 mensajes tal cual: el prompt (y la latencia de Gemini) crecía con
+# el largo de los mensajes y lo anterior se perdía sin aviso. Ahora:
+# - Los turnos recientes entran del más nuevo al más viejo mientras quepan en bot_memory_token_budget (tope
+#   bot_memory_max_turns), leídos con el índice (sender_id, created_at) de chat_history. Se leen a lo sumo
+#   bot_memory_max_turns + 1 filas: lo que queda afuera sin resumir solo se mide con un SUM(LENGTH(parts)).
+# - Lo que queda afuera se pliega en conversation_summaries.summary, que va primero en el historial.
+# - Todo va por (tenant_id, sender_id): el mismo cliente hablando con bots de dos inmobiliarias son dos conversaciones.
+# - El resumen se actualiza en el job "conversation_summary" (worker.py) cuando lo que quedó afuera sin resumir supera
+#   bot_memory_summary_trigger_tokens: la llamada a Gemini para resumir nunca está en el camino del mensaje. Cada job
+#   pliega hasta bot_memory_summary_max_rows mensajes (los más viejos) y encola otro si queda atraso.
+# Los tokens se estiman por largo (~4 caracteres por token): alcanza para el presupuesto y no cuesta una llamada.
+
+CHARS_PER_TOKEN = 4
+SUMMARY_PREFIX = "Resumen de la conversación anterior con este cliente:"
+SUMMARY_ACK = "Entendido, sigo la conversación teniendo en cuenta ese contexto."
+
+_counters = {"loads": 0, "prompt_tokens": 0, "summarized_loads": 0, "dropped_tokens": 0, "summaries": 0}
+_counters_lock = threading.Lock()
+
+def _count(**deltas):
+    with _counters_lock:
+        for key, delta in deltas.items():
+            _counters[key] += delta
+
+def estimate_tokens(text: Optional[str]) -> int:
+    if not text:
+        return 0
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def message_text(parts) -> str:
+    """Texto de los parts de un ChatHistory (lista de strings; los dicts de media cuentan por su texto, si tienen)."""
+    if isinstance(parts, str):
+        return parts
+    texts = []
+    for part in parts or []:
+        if isinstance(part, str):
+            texts.append(part)
+        elif isinstance(part, dict) and part.get("text"):
+            texts.append(part["text"])
+    return "\n".join(texts)
+
+@dataclass
+class Memory:
+    history: List[dict] = field(default_factory=list) # para start_chat: [{"role", "parts"}]
+    summary_id: Optional[int] = None
+    recent_turns: int = 0
+    prompt_tokens: int = 0 # resumen + turnos recientes
+    pending_tokens: int = 0 # turnos que quedaron afuera y todavía no están en el resumen
+
+    @property
+    def needs_summary(self) -> bool:
+        return self.pending_tokens >= settings.bot_memory_summary_trigger_tokens
+
+def _unsummarized(db: Session, tenant_id: Optional[int], sender_id: str, after_id: int, *columns, exclude=()):
+    """Mensajes del remitente con el tenant posteriores al resumen, sin los de `exclude` (los que entraron en el historial)."""
+    query = db.query(*(columns or (models.ChatHistory.id, models.ChatHistory.role, models.ChatHistory.parts))).filter(
+        models.ChatHistory.sender_id == sender_id,
+        models.ChatHistory.tenant_id == tenant_id,
+        models.ChatHistory.id > after_id
+    )
+    if exclude:
+        query = query.filter(models.ChatHistory.id.notin_([row.id for row in exclude]))
+    return query
+
+def _recent_rows(db: Session, tenant_id: Optional[int], sender_id: str, after_id: int):
+    """
+    Los bot_memory_max_turns + 1 mensajes no resumidos más nuevos, del más nuevo al más viejo
+    (ix_chat_history_sender_created). Uno más que el tope para saber si quedó algo afuera.
+    """
+    return _unsummarized(db, tenant_id, sender_id, after_id).order_by(
+        models.ChatHistory.created_at.desc(), models.ChatHistory.id.desc()
+    ).limit(settings.bot_memory_max_turns + 1).all()
+
+def _pending_tokens(db: Session, tenant_id: Optional[int], sender_id: str, after_id: int, recent) -> int:
+    """Tokens de lo no resumido que quedó fuera del historial, por el largo del JSON (sobreestima comillas y escapes)."""
+    length = _unsummarized(db, tenant_id, sender_id, after_id, func.sum(func.length(cast(models.ChatHistory.parts, String))), exclude=recent).scalar()
+    return ((length or 0) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def _split(rows, budget: int, max_turns: int):
+    """
+    Separa los mensajes (del más nuevo al más viejo) en los que entran en el presupuesto y el resto.
+    El historial de Gemini tiene que empezar por un mensaje del usuario: los del modelo que quedan primeros van al resto.
+    """
+    recent, older, used = [], [], 0
+    for row in rows:
+        tokens = estimate_tokens(message_text(row.parts))
+        if not older and len(recent) < max_turns and used + tokens <= budget:
+            recent.append(row)
+            used += tokens
+        else:
+            older.append(row)
+    while recent and recent[-1].role != "user":
+        older.insert(0, recent.pop())
+    used = sum(estimate_tokens(message_text(row.parts)) for row in recent)
+    return list(reversed(recent)), list(reversed(older)), used
+
+def _summary(db: Session, tenant_id: Optional[int], sender_id: str) -> Optional[models.ConversationSummary]:
+    return db.query(models.ConversationSummary).filter(
+        models.ConversationSummary.tenant_id == tenant_id,
+        models.ConversationSummary.sender_id == sender_id
+    ).first()
+
+def load(db: Session, sender_id: str, tenant_id: Optional[int] = None, budget: Optional[int] = None) -> Memory:
+    """Historial para start_chat: resumen (si hay) seguido de los turnos recientes que entran en el presupuesto."""
+    budget = budget or settings.bot_memory_token_budget
+    summary = _summary(db, tenant_id, sender_id)
+    summary_tokens = estimate_tokens(summary.summary) if summary and summary.summary else 0
+
+    after_id = summary.summarized_until_id if summary else 0
+    rows = _recent_rows(db, tenant_id, sender_id, after_id)
+    recent, older, used = _split(rows, max(budget - summary_tokens, 0), settings.bot_memory_max_turns)
+
+    memory = Memory(summary_id=summary.id if summary else None, recent_turns=len(recent))
+    if summary_tokens:
+        memory.history += [
+            {"role": "user", "parts": [f"{SUMMARY_PREFIX}\n{summary.summary}"]},
+            {"role": "model", "parts": [SUMMARY_ACK]},
+        ]
+    memory.history += [{"role": row.role, "parts": row.parts} for row in recent]
+    memory.prompt_tokens = summary_tokens + used
+    memory.pending_tokens = _pending_tokens(db, tenant_id, sender_id, after_id, recent) if older else 0
+
+    _count(loads=1, prompt_tokens=memory.prompt_tokens, summarized_loads=1 if summary_tokens else 0,
+           dropped_tokens=memory.pending_tokens)
+    return memory
+
+def schedule_summary(db: Session, sender_id: str, tenant_id: Optional[int] = None):
+    """Encola (sin duplicar) el job que pliega los turnos viejos en el resumen. Se persiste con el commit de `db`."""
+    import job_queue # job_queue importa este módulo (HANDLERS)
+    summary = _summary(db, tenant_id, sender_id)
+    if summary is None:
+        summary = models.ConversationSummary(sender_id=sender_id, tenant_id=tenant_id, summarized_until_id=0)
+        db.add(summary)
+        db.flush()
+    job_queue.enqueue(db, job_queue.CONVERSATION_SUMMARY, summary.id)
+
+def summarize_with_gemini(previous: Optional[str], messages: List[dict]) -> Optional[str]:
+    from routers import ai_service
+    if not ai_service.client:
+        return None
+    transcript = "\n".join(f"{'Cliente' if m['role'] == 'user' else 'Asistente'}: {message_text(m['parts'])}" for m in messages)
+    prompt = (
+        f"Resumí en español, en no más de {settings.bot_memory_summary_max_tokens * 3 // 4} palabras, la conversación entre un cliente y el "
+        "asistente de una inmobiliaria. Conservá datos concretos: nombre, presupuesto, zonas, tipo de propiedad, operación, "
+        "propiedades consultadas (códigos) y visitas agendadas o pendientes. Sin saludos ni relleno.\n\n"
+        f"Resumen previo:\n{previous or '(ninguno)'}\n\nMensajes nuevos:\n{transcript}"
+    )
+    response = ai_service.client.models.generate_content(model=os.getenv("CHATBOT_MODEL", "gemini-1.5-flash"), contents=prompt)
+    return (response.text or "").strip() or None
+
+def summarize(db: Session, summary: "models.ConversationSummary", summarizer=summarize_with_gemini) -> bool:
+    """
+    Pliega en el resumen los mensajes más viejos que ya no entran en el presupuesto, hasta bot_memory_summary_max_rows;
+    si queda atraso encola otro job. Devuelve False si no había nada que plegar. Lanza si el modelo no devuelve resumen
+    (el job se reintenta).
+    """
+    summary_tokens = estimate_tokens(summary.summary)
+    after_id = summary.summarized_until_id or 0
+    # Se deja lugar para el resumen nuevo: después de plegar, lo reciente tiene que seguir entrando en el presupuesto
+    budget = max(settings.bot_memory_token_budget - settings.bot_memory_summary_max_tokens, 0)
+    recent, older, _ = _split(_recent_rows(db, summary.tenant_id, summary.sender_id, after_id), budget, settings.bot_memory_max_turns)
+    if not older:
+        return False
+    limit = settings.bot_memory_summary_max_rows
+    older = _unsummarized(db, summary.tenant_id, summary.sender_id, after_id, exclude=recent).order_by(
+        models.ChatHistory.created_at, models.ChatHistory.id
+    ).limit(limit + 1).all()
+    backlog = len(older) > limit
+    older = older[:limit]
+
+    text = summarizer(summary.summary, [{"role": row.role, "parts": row.parts} for row in older])
+    if not text:
+        raise RuntimeError(f"Empty summary for conversation {summary.sender_id}")
+    summary.summary = text
+    summary.summarized_until_id = older[-1].id
+    summary.updated_at = datetime.now(timezone.utc)
+    if backlog:
+        import job_queue
+        job_queue.enqueue(db, job_queue.CONVERSATION_SUMMARY, summary.id)
+    _count(summaries=1)
+    logger.info(f"Conversation {summary.sender_id}: {len(older)} messages folded, summary {summary_tokens} -> {estimate_tokens(text)} tokens")
+    return True
+
+def summarize_conversation(summary_id: int):
+    """Job "conversation_summary" (worker.py)."""
+    db = SessionLocal()
+    try:
+        summary = db.query(models.ConversationSummary).filter(models.ConversationSummary.id == summary_id).first()
+        if not summary:
+            return
+        if summarize(db, summary):
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def stats() -> dict:
+    with _counters_lock:
+        counters = dict(_counters)
+    loads = counters["loads"]
+    return {
+        "loads": loads,
+        "avg_prompt_tokens": round(counters["prompt_tokens"] / loads, 1) if loads else None,
+        "with_summary": counters["summarized_loads"],
+        "avg_dropped_tokens": round(counters["dropped_tokens"] / loads, 1) if loads else None,
+        "summaries": counters["summaries"],
+        "token_budget": settings.bot_memory_token_budget,
+    }
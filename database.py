@@ -2,6 +2,8 @@ import os
 print("DEBUG: database.py - starting imports")
 import re
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, declarative_base
 from settings import settings
 
@@ -16,12 +18,19 @@ else:
     DATABASE_URL = raw_url
 
 # 3. Crear el motor síncrono
-# Agregamos pool_size y max_overflow para manejar mejor las conexiones en la nube
+# Pool dimensionado por settings: con el QueuePool(5+10) por defecto las ráfagas de WhatsApp agotaban conexiones
+is_sqlite = DATABASE_URL.startswith("sqlite")
+pool_kwargs = {} if is_sqlite else {
+    "pool_size": settings.db_pool_size,
+    "max_overflow": settings.db_max_overflow,
+    "pool_timeout": settings.db_pool_timeout_seconds,
+}
 engine = create_engine(
     DATABASE_URL, 
     pool_pre_ping=True,
-    pool_recycle=3600,
-    connect_args={"connect_timeout": 10} if not DATABASE_URL.startswith("sqlite") else {}
+    pool_recycle=settings.db_pool_recycle_seconds,
+    connect_args={"connect_timeout": 10} if not is_sqlite else {},
+    **pool_kwargs
 )
 
 # 4. Configuración de sesiones
@@ -35,4 +44,41 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# 6. Motor async (asyncpg) para las rutas `async def` de lectura: no ocupan un hilo del threadpool por request,
+# la concurrencia queda limitada por el pool de conexiones y no por los 40 hilos de anyio.
+def async_url(url: str):
+    """URL + connect_args para asyncpg: no acepta sslmode/channel_binding en la URL (libpq), ssl va como argumento."""
+    if url.startswith("sqlite"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1), {}
+    parsed = make_url(re.sub(r'^.*?://', 'postgresql+asyncpg://', url))
+    query = dict(parsed.query)
+    sslmode = query.pop("sslmode", None)
+    query.pop("channel_binding", None)
+    connect_args = {"timeout": 10}
+    if sslmode and sslmode != "disable":
+        connect_args["ssl"] = sslmode
+    return parsed.set(query=query), connect_args
+
+# vector viaja en formato texto ('[...]'): es lo que produce/consume pgvector.sqlalchemy.Vector, así que no se
+# registra el codec binario de pgvector.asyncpg
+ASYNC_DATABASE_URL, async_connect_args = async_url(raw_url)
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_pre_ping=True,
+    pool_recycle=settings.db_pool_recycle_seconds,
+    connect_args=async_connect_args,
+    **({} if is_sqlite else {
+        "pool_size": settings.async_db_pool_size,
+        "max_overflow": settings.async_db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout_seconds,
+    })
+)
+
+# expire_on_commit=False: en async no hay lazy load al serializar la respuesta después del commit
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
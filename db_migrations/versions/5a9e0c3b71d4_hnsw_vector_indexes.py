@@ -0,0 +1,44 @@
+"""HNSW vector indexes
+
+Revision ID: 5a9e0c3b71d4
+Revises: 8c41d2a7e5b3
+Create Date: 2026-10-18 12:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '5a9e0c3b71d4'
+down_revision: Union[str, None] = '8c41d2a7e5b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+VECTOR_INDEXES = [
+    ('ix_properties_embedding_descripcion_hnsw', 'properties', 'embedding_descripcion'),
+    ('ix_developments_embedding_proyecto_hnsw', 'developments', 'embedding_proyecto'),
+    ('ix_contacts_embedding_preferences_hnsw', 'contacts', 'embedding_preferences'),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY para no bloquear escrituras mientras se construye el grafo HNSW
+    with op.get_context().autocommit_block():
+        for name, table, column in VECTOR_INDEXES:
+            op.create_index(
+                name, table, [column], unique=False,
+                postgresql_using='hnsw',
+                postgresql_with={'m': 16, 'ef_construction': 64},
+                postgresql_ops={column: 'vector_cosine_ops'},
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, column in VECTOR_INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
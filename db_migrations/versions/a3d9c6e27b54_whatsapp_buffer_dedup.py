@@ -0,0 +1,35 @@
+"""Provider message id and indexes for the WhatsApp inbound buffer
+
+Revision ID: a3d9c6e27b54
+Revises: f4b8e2a61c07
+Create Date: 2026-10-19 03:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3d9c6e27b54'
+down_revision: Union[str, None] = 'f4b8e2a61c07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('whatsapp_buffer', sa.Column('provider_message_id', sa.String(length=255), nullable=True))
+    with op.get_context().autocommit_block():
+        op.create_index('ux_whatsapp_buffer_instance_message', 'whatsapp_buffer', ['instance', 'provider_message_id'],
+                        unique=True, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_whatsapp_buffer_instance_sender_status', 'whatsapp_buffer', ['instance', 'sender_id', 'status'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_whatsapp_buffer_instance_sender_status', table_name='whatsapp_buffer', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ux_whatsapp_buffer_instance_message', table_name='whatsapp_buffer', postgresql_concurrently=True, if_exists=True)
+    op.drop_column('whatsapp_buffer', 'provider_message_id')
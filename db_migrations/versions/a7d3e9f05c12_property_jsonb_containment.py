@@ -0,0 +1,46 @@
+"""JSONB amenities and portals with GIN jsonb_path_ops indexes
+
+Revision ID: a7d3e9f05c12
+Revises: f2a6c81d3b57
+Create Date: 2026-10-18 19:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d3e9f05c12'
+down_revision: Union[str, None] = 'f2a6c81d3b57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = ('attributes', 'published_on_portals')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for column in COLUMNS:
+        op.alter_column('properties', column, type_=postgresql.JSONB(), postgresql_using=f'{column}::jsonb')
+    # El filtro @> es sensible a mayúsculas: portales en minúscula (como los valida el modelo)
+    op.execute(
+        "UPDATE properties SET published_on_portals = (SELECT coalesce(jsonb_agg(lower(p)), '[]'::jsonb) "
+        "FROM jsonb_array_elements_text(published_on_portals) p) "
+        "WHERE jsonb_typeof(published_on_portals) = 'array' AND published_on_portals::text <> lower(published_on_portals::text)"
+    )
+    with op.get_context().autocommit_block():
+        for column in COLUMNS:
+            op.create_index(f'ix_properties_{column}_gin', 'properties', [column], unique=False,
+                            postgresql_using='gin', postgresql_ops={column: 'jsonb_path_ops'},
+                            postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for column in COLUMNS:
+            op.drop_index(f'ix_properties_{column}_gin', table_name='properties', postgresql_concurrently=True, if_exists=True)
+    for column in COLUMNS:
+        op.alter_column('properties', column, type_=sa.JSON(), postgresql_using=f'{column}::json')
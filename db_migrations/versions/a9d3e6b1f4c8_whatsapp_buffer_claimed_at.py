@@ -0,0 +1,27 @@
+"""WhatsApp buffer rows record when a turn claimed them
+
+Revision ID: a9d3e6b1f4c8
+Revises: c8a4d1f6e3b2
+Create Date: 2026-10-21 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9d3e6b1f4c8'
+down_revision: Union[str, None] = 'c8a4d1f6e3b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('whatsapp_buffer', sa.Column('claimed_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('whatsapp_buffer', 'claimed_at')
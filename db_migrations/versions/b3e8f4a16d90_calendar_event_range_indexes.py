@@ -0,0 +1,33 @@
+"""Range indexes on calendar_events for the availability engine
+
+Revision ID: b3e8f4a16d90
+Revises: a7d3e9f05c12
+Create Date: 2026-10-18 20:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3e8f4a16d90'
+down_revision: Union[str, None] = 'a7d3e9f05c12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index('ix_calendar_events_property_start', 'calendar_events', ['property_id', 'start_time'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_calendar_events_agent_start', 'calendar_events', ['agent_id', 'start_time'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_calendar_events_agent_start', table_name='calendar_events', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_calendar_events_property_start', table_name='calendar_events', postgresql_concurrently=True, if_exists=True)
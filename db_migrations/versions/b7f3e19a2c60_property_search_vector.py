@@ -0,0 +1,39 @@
+"""Property full-text search vector
+
+Revision ID: b7f3e19a2c60
+Revises: 5a9e0c3b71d4
+Create Date: 2026-10-18 14:05:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7f3e19a2c60'
+down_revision: Union[str, None] = '5a9e0c3b71d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('spanish'::regconfig, coalesce(code, '') || ' ' || coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('spanish'::regconfig, coalesce(address, '') || ' ' || coalesce(neighborhood, '') || ' ' || coalesce(city, '')), 'B') || "
+    "setweight(to_tsvector('spanish'::regconfig, coalesce(search_content, '')), 'C')"
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('properties', sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed(SEARCH_VECTOR_SQL, persisted=True), nullable=True))
+    with op.get_context().autocommit_block():
+        op.create_index('ix_properties_search_vector', 'properties', ['search_vector'], unique=False,
+                        postgresql_using='gin', postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_properties_search_vector', table_name='properties', postgresql_concurrently=True, if_exists=True)
+    op.drop_column('properties', 'search_vector')
@@ -0,0 +1,29 @@
+"""Conversation summaries are unique per tenant and sender
+
+Revision ID: c8a4d1f6e3b2
+Revises: b5e2f7a91c36
+Create Date: 2026-10-20 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'c8a4d1f6e3b2'
+down_revision: Union[str, None] = 'b5e2f7a91c36'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.drop_constraint('conversation_summaries_sender_id_key', 'conversation_summaries', type_='unique')
+    op.create_index('uq_conversation_summaries_tenant_sender', 'conversation_summaries', ['tenant_id', 'sender_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_conversation_summaries_tenant_sender', table_name='conversation_summaries')
+    op.create_unique_constraint('conversation_summaries_sender_id_key', 'conversation_summaries', ['sender_id'])
@@ -0,0 +1,43 @@
+"""Tenant on chat_history for SQL-side bot analytics
+
+Revision ID: c9f1a2b7e4d3
+Revises: b3e8f4a16d90
+Create Date: 2026-10-18 21:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'c9f1a2b7e4d3'
+down_revision: Union[str, None] = 'b3e8f4a16d90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Igual que backfill_chat_history_tenant.py: sufijo de 8 dígitos (phones.PHONE_SUFFIX_DIGITS) que coincide con
+# contactos de un solo tenant
+BACKFILL_SQL = """
+    UPDATE chat_history h SET tenant_id = m.tenant_id
+    FROM (SELECT right(phone_normalized, 8) AS suffix, min(tenant_id) AS tenant_id FROM contacts
+          WHERE phone_normalized IS NOT NULL GROUP BY 1 HAVING count(DISTINCT tenant_id) = 1) m
+    WHERE h.tenant_id IS NULL
+      AND right(regexp_replace(split_part(split_part(h.sender_id, '@', 1), ':', 1), '[^0-9]', '', 'g'), 8) = m.suffix
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('chat_history', sa.Column('tenant_id', sa.Integer(), sa.ForeignKey('tenants.id'), nullable=True))
+    op.execute(BACKFILL_SQL)
+    with op.get_context().autocommit_block():
+        op.create_index('ix_chat_history_tenant_created', 'chat_history', ['tenant_id', 'created_at'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_chat_history_tenant_created', table_name='chat_history', postgresql_concurrently=True, if_exists=True)
+    op.drop_column('chat_history', 'tenant_id')
@@ -0,0 +1,44 @@
+"""pg_trgm indexes for type-ahead search
+
+Revision ID: d41c8a6f0e27
+Revises: b7f3e19a2c60
+Create Date: 2026-10-18 15:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41c8a6f0e27'
+down_revision: Union[str, None] = 'b7f3e19a2c60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TRGM_COLUMNS = {
+    'contacts': ['name', 'email', 'phone'],
+    'properties': ['address', 'title', 'code'],
+    'developments': ['name', 'address', 'code'],
+    'users': ['first_name', 'last_name', 'email'],
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    with op.get_context().autocommit_block():
+        for table, columns in TRGM_COLUMNS.items():
+            for column in columns:
+                op.create_index(
+                    f'ix_{table}_{column}_trgm', table, [column], unique=False,
+                    postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'},
+                    postgresql_concurrently=True, if_not_exists=True,
+                )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for table, columns in TRGM_COLUMNS.items():
+            for column in columns:
+                op.drop_index(f'ix_{table}_{column}_trgm', table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,73 @@
+"""Incremental rollups for the opportunities funnel
+
+Revision ID: d6a4f0c83e15
+Revises: c9f1a2b7e4d3
+Create Date: 2026-10-18 23:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'd6a4f0c83e15'
+down_revision: Union[str, None] = 'c9f1a2b7e4d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Los rollups arrancan vacíos: los datos previos se cargan con backfill_funnel_rollups.py (funnel.rebuild)
+
+def _key_columns(with_day: bool = True):
+    columns = [
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('tenant_id', sa.Integer(), nullable=False),
+        sa.Column('pipeline_id', sa.Integer(), nullable=False),
+    ]
+    if with_day:
+        columns.append(sa.Column('day', sa.Date(), nullable=False))
+    return columns + [
+        sa.Column('stage_id', sa.Integer(), nullable=False),
+        sa.Column('agent_id', sa.Integer(), nullable=False, server_default='0'),
+    ]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('deals', sa.Column('stage_entered_at', sa.DateTime(), nullable=True))
+    op.create_table('deal_funnel_daily',
+    *_key_columns(),
+    sa.Column('entered', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('entered_value', sa.Float(), nullable=False, server_default='0'),
+    sa.Column('advanced', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('won', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('won_value', sa.Float(), nullable=False, server_default='0'),
+    sa.Column('lost', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('lost_value', sa.Float(), nullable=False, server_default='0'),
+    sa.Column('exits', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('seconds_in_stage', sa.Float(), nullable=False, server_default='0'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('tenant_id', 'pipeline_id', 'day', 'stage_id', 'agent_id', name='uq_deal_funnel_daily_key')
+    )
+    op.create_table('deal_stage_duration_daily',
+    *_key_columns(),
+    sa.Column('bucket', sa.Integer(), nullable=False),
+    sa.Column('deals', sa.Integer(), nullable=False, server_default='0'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('tenant_id', 'pipeline_id', 'day', 'stage_id', 'agent_id', 'bucket', name='uq_deal_stage_duration_daily_key')
+    )
+    op.create_table('deal_stage_totals',
+    *_key_columns(with_day=False),
+    sa.Column('open_deals', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('open_value', sa.Float(), nullable=False, server_default='0'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('tenant_id', 'pipeline_id', 'stage_id', 'agent_id', name='uq_deal_stage_totals_key')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('deal_stage_totals')
+    op.drop_table('deal_stage_duration_daily')
+    op.drop_table('deal_funnel_daily')
+    op.drop_column('deals', 'stage_entered_at')
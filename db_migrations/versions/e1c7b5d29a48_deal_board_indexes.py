@@ -0,0 +1,36 @@
+"""Indexes for the deal board and per-deal comments / history
+
+Revision ID: e1c7b5d29a48
+Revises: d6a4f0c83e15
+Create Date: 2026-10-19 00:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1c7b5d29a48'
+down_revision: Union[str, None] = 'd6a4f0c83e15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index('ix_deals_tenant_stage_created', 'deals', ['tenant_id', 'pipeline_stage_id', 'created_at', 'id'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_deal_comments_deal_created', 'deal_comments', ['deal_id', 'created_at'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_deal_history_deal_created', 'deal_history', ['deal_id', 'created_at'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_deal_history_deal_created', table_name='deal_history', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_deal_comments_deal_created', table_name='deal_comments', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_deals_tenant_stage_created', table_name='deals', postgresql_concurrently=True, if_exists=True)
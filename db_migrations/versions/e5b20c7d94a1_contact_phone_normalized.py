@@ -0,0 +1,49 @@
+"""Normalized contact phone with reversed-suffix index
+
+Revision ID: e5b20c7d94a1
+Revises: d41c8a6f0e27
+Create Date: 2026-10-18 16:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b20c7d94a1'
+down_revision: Union[str, None] = 'd41c8a6f0e27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Igual que phones.NORMALIZE_SQL (copiado: las migraciones no importan código de la app)
+NORMALIZE_SQL = "NULLIF(regexp_replace(regexp_replace(split_part(split_part(phone, '@', 1), ':', 1), '[^0-9]', '', 'g'), '^00', ''), '')"
+BACKFILL_BATCH = 10000
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('contacts', sa.Column('phone_normalized', sa.String(), nullable=True))
+    with op.get_context().autocommit_block():
+        # Backfill por rangos de id para no sostener locks sobre toda la tabla. Los teléfonos sin dígitos útiles
+        # quedan en NULL, así que no alcanza con repetir hasta que no queden filas con phone_normalized IS NULL
+        last_id = op.get_bind().execute(sa.text("SELECT coalesce(max(id), 0) FROM contacts")).scalar()
+        for start in range(0, last_id, BACKFILL_BATCH):
+            op.get_bind().execute(sa.text(
+                f"UPDATE contacts SET phone_normalized = {NORMALIZE_SQL} "
+                "WHERE phone_normalized IS NULL AND phone ~ '[0-9]' AND id > :start AND id <= :end"
+            ), {"start": start, "end": start + BACKFILL_BATCH})
+        op.create_index('ix_contacts_tenant_phone_normalized', 'contacts', ['tenant_id', 'phone_normalized'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_contacts_phone_reversed "
+            "ON contacts (tenant_id, reverse(phone_normalized) text_pattern_ops)"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_contacts_phone_reversed', table_name='contacts', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_contacts_tenant_phone_normalized', table_name='contacts', postgresql_concurrently=True, if_exists=True)
+    op.drop_column('contacts', 'phone_normalized')
@@ -0,0 +1,29 @@
+"""Per-tenant inventory version for the portal XML feed
+
+Revision ID: f2a6c81d3b57
+Revises: e5b20c7d94a1
+Create Date: 2026-10-18 18:05:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a6c81d3b57'
+down_revision: Union[str, None] = 'e5b20c7d94a1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('tenants', sa.Column('inventory_version', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('tenants', sa.Column('inventory_updated_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('tenants', 'inventory_updated_at')
+    op.drop_column('tenants', 'inventory_version')
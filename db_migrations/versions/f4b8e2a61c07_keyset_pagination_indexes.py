@@ -0,0 +1,39 @@
+"""Indexes for keyset (cursor) pagination of list endpoints
+
+Revision ID: f4b8e2a61c07
+Revises: e1c7b5d29a48
+Create Date: 2026-10-19 01:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4b8e2a61c07'
+down_revision: Union[str, None] = 'e1c7b5d29a48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ('ix_contacts_tenant_id_id', 'contacts', ['tenant_id', 'id']),
+    ('ix_properties_tenant_id_id', 'properties', ['tenant_id', 'id']),
+    ('ix_developments_tenant_id_id', 'developments', ['tenant_id', 'id']),
+    ('ix_contact_interactions_contact_date', 'contact_interactions', ['contact_id', 'date', 'id']),
+    ('ix_monitoring_logs_user_timestamp', 'monitoring_logs', ['user_id', 'timestamp', 'id']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,257 @@
+import datetime
+import hashlib
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import SessionLocal
+from settings import settings
+import models
+from routers import ai_service
+
+logger = logging.getLogger("urbanocrm.embedding_cache")
+
+# Cache de embeddings por contenido: (modelo, task_type, dimensiones, sha256(texto)) -> vector.
+# Orden de consulta: LRU en memoria -> tabla embedding_cache -> Gemini.
+
+_lru = OrderedDict()
+_lock = threading.Lock()
+_counters = {"memory_hits": 0, "db_hits": 0, "misses": 0, "saved_seconds": 0.0}
+_avg_miss_latency = 0.0 # segundos por texto embebido (media móvil de las llamadas a Gemini)
+
+def cache_key(text: str, task_type: str) -> tuple:
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return (ai_service.EMBEDDING_MODEL, task_type.lower(), ai_service.EMBEDDING_DIMENSIONS, digest)
+
+def _lru_get(key):
+    with _lock:
+        vec = _lru.get(key)
+        if vec is not None:
+            _lru.move_to_end(key)
+        return vec
+
+def _lru_put(key, vec):
+    with _lock:
+        _lru[key] = vec
+        _lru.move_to_end(key)
+        while len(_lru) > settings.embedding_cache_size:
+            _lru.popitem(last=False)
+
+def _record_hits(kind: str, count: int):
+    with _lock:
+        _counters[kind] += count
+        _counters["saved_seconds"] += count * _avg_miss_latency
+
+def _record_misses(count: int, elapsed: float):
+    global _avg_miss_latency
+    with _lock:
+        _counters["misses"] += count
+        per_text = elapsed / count
+        _avg_miss_latency = per_text if not _avg_miss_latency else 0.8 * _avg_miss_latency + 0.2 * per_text
+
+def _db_lookup(task_type: str, hashes: List[str], max_age_seconds: Optional[int] = None) -> dict:
+    try:
+        with SessionLocal() as db:
+            query = db.query(models.EmbeddingCache.content_hash, models.EmbeddingCache.embedding).filter(
+                models.EmbeddingCache.model == ai_service.EMBEDDING_MODEL,
+                models.EmbeddingCache.task_type == task_type.lower(),
+                models.EmbeddingCache.dimensions == ai_service.EMBEDDING_DIMENSIONS,
+                models.EmbeddingCache.content_hash.in_(hashes)
+            )
+            if max_age_seconds is not None:
+                oldest = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=max_age_seconds)
+                query = query.filter(models.EmbeddingCache.created_at >= oldest)
+            rows = query.all()
+        return {h: [float(x) for x in vec] for h, vec in rows if vec is not None}
+    except Exception as e:
+        logger.warning(f"Embedding cache lookup failed: {e}")
+        return {}
+
+def _db_store(entries: List[dict], refresh: bool = False):
+    """Guarda los vectores nuevos; con refresh pisa el vector y created_at de los que ya estaban (vencidos por TTL)."""
+    try:
+        with SessionLocal() as db:
+            dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+            stmt = dialect.insert(models.EmbeddingCache).values(entries)
+            index_elements = ["model", "task_type", "dimensions", "content_hash"]
+            if refresh:
+                stmt = stmt.on_conflict_do_update(index_elements=index_elements, set_={
+                    "embedding": stmt.excluded.embedding, "created_at": stmt.excluded.created_at})
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=index_elements)
+            db.execute(stmt)
+            db.commit()
+    except Exception as e:
+        logger.warning(f"Embedding cache store failed: {e}")
+
+def get_embeddings(texts: List[str], task_type: str = "retrieval_document") -> List[Optional[List[float]]]:
+    """
+    Igual que ai_service.get_embeddings pero sólo llama a Gemini para los textos
+    cuyo hash no está en el cache. Los textos repetidos dentro del mismo lote se embeben una vez.
+    """
+    vectors = [None] * len(texts)
+    pending = OrderedDict() # key -> índices en `texts`
+
+    for i, text in enumerate(texts):
+        if not text:
+            continue
+        key = cache_key(text, task_type)
+        vec = _lru_get(key)
+        if vec is not None:
+            vectors[i] = vec
+            _record_hits("memory_hits", 1)
+        else:
+            pending.setdefault(key, []).append(i)
+
+    if pending:
+        found = _db_lookup(task_type, [k[3] for k in pending])
+        for key in [k for k in pending if k[3] in found]:
+            vec = found[key[3]]
+            _lru_put(key, vec)
+            for i in pending.pop(key):
+                vectors[i] = vec
+            _record_hits("db_hits", 1)
+
+    if pending:
+        keys = list(pending)
+        started = time.perf_counter()
+        fresh = ai_service.get_embeddings([texts[pending[k][0]] for k in keys], task_type=task_type)
+        _record_misses(len(keys), time.perf_counter() - started)
+
+        to_store = []
+        for key, vec in zip(keys, fresh):
+            if not vec:
+                continue
+            vec = list(vec)
+            _lru_put(key, vec)
+            for i in pending[key]:
+                vectors[i] = vec
+            model, task, dims, digest = key
+            to_store.append({"model": model, "task_type": task, "dimensions": dims, "content_hash": digest, "embedding": vec})
+        if to_store:
+            _db_store(to_store)
+
+    return vectors
+
+def get_embedding(text: str, task_type: str = "retrieval_query") -> Optional[List[float]]:
+    """Versión cacheada de ai_service.get_embedding."""
+    if not text:
+        return None
+    return get_embeddings([text], task_type=task_type)[0]
+
+def stats() -> dict:
+    with _lock:
+        hits = _counters["memory_hits"] + _counters["db_hits"]
+        total = hits + _counters["misses"]
+        return {
+            "memory_hits": _counters["memory_hits"],
+            "db_hits": _counters["db_hits"],
+            "misses": _counters["misses"],
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "saved_api_calls": hits,
+            "saved_seconds": round(_counters["saved_seconds"], 3),
+            "avg_miss_latency_ms": round(_avg_miss_latency * 1000, 1),
+            "memory_entries": len(_lru),
+        }
+
+def clear_memory():
+    with _lock:
+        _lru.clear()
+        _query_lru.clear()
+
+# --- Cache de embeddings de búsquedas (bot search_properties, /ai-matching/match, listado del CRM) ---
+# Clave = texto normalizado, así "Depto 2 ambientes, Pichincha!" y "depto 2 ambientes pichincha" comparten vector;
+# lo que se embebe es el texto original de la primera búsqueda (sin tildes "jardin" no es la misma palabra).
+# Capa por proceso con TTL y tamaño máximo; con query_embedding_cache_shared los misses se buscan
+# en la tabla embedding_cache antes de llamar a Gemini, así los workers de uvicorn comparten hits. El TTL vale
+# también ahí (created_at), y un vector vencido se reemplaza al volver a embeberlo.
+# Las claves llevan el prefijo QUERY_KEY_PREFIX: el vector no es el del texto normalizado en sí, no tiene que
+# servirle a get_embedding() con ese mismo texto.
+
+QUERY_KEY_PREFIX = "query:"
+
+_query_lru = OrderedDict() # key -> (expira_en, vector)
+_query_counters = {"hits": 0, "shared_hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+_NON_WORD = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+def normalize_query(text: str) -> str:
+    """Minúsculas, sin tildes ni puntuación, espacios colapsados."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+    return _SPACES.sub(" ", _NON_WORD.sub(" ", text)).strip()
+
+def _query_get(key):
+    with _lock:
+        entry = _query_lru.get(key)
+        if entry is None:
+            return None
+        expires_at, vec = entry
+        if expires_at < time.monotonic():
+            del _query_lru[key]
+            _query_counters["expired"] += 1
+            return None
+        _query_lru.move_to_end(key)
+        return vec
+
+def _query_put(key, vec):
+    with _lock:
+        _query_lru[key] = (time.monotonic() + settings.query_embedding_cache_ttl_seconds, vec)
+        _query_lru.move_to_end(key)
+        while len(_query_lru) > settings.query_embedding_cache_size:
+            _query_lru.popitem(last=False)
+            _query_counters["evictions"] += 1
+
+def _query_count(kind: str):
+    with _lock:
+        _query_counters[kind] += 1
+
+def get_query_embedding(query: str) -> Optional[List[float]]:
+    """Embedding (retrieval_query) de una búsqueda de usuario, cacheado por texto normalizado."""
+    normalized = normalize_query(query)
+    if not normalized:
+        return None
+    key = cache_key(QUERY_KEY_PREFIX + normalized, "retrieval_query")
+
+    vec = _query_get(key)
+    if vec is not None:
+        _query_count("hits")
+        return vec
+
+    if settings.query_embedding_cache_shared:
+        vec = _db_lookup("retrieval_query", [key[3]], settings.query_embedding_cache_ttl_seconds).get(key[3])
+        if vec is not None:
+            _query_count("shared_hits")
+            _query_put(key, vec)
+            return vec
+
+    _query_count("misses")
+    vec = ai_service.get_embedding(query.strip(), task_type="retrieval_query")
+    if not vec:
+        return None
+    vec = list(vec)
+    _query_put(key, vec)
+    if settings.query_embedding_cache_shared:
+        model, task, dims, digest = key
+        _db_store([{"model": model, "task_type": task, "dimensions": dims, "content_hash": digest, "embedding": vec,
+                    "created_at": datetime.datetime.now(datetime.timezone.utc)}], refresh=True)
+    return vec
+
+def query_stats() -> dict:
+    with _lock:
+        hits = _query_counters["hits"] + _query_counters["shared_hits"]
+        total = hits + _query_counters["misses"]
+        return {
+            **_query_counters,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "entries": len(_query_lru),
+            "max_entries": settings.query_embedding_cache_size,
+            "ttl_seconds": settings.query_embedding_cache_ttl_seconds,
+            "shared": settings.query_embedding_cache_shared,
+        }
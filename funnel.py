@@ -0,0 +1,314 @@
+import bisect
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from typing import Dict, Optional
+
+from sqlalchemy import bindparam, delete, event, func, inspect, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+import models
+
+# Analítica del embudo de oportunidades (GET /api/opportunities/analytics/funnel) sobre rollups incrementales.
+#
+# Un listener before_flush mira cada Deal nuevo / editado / borrado y suma deltas en la misma transacción:
+# - deal_funnel_daily: entradas a la etapa (alta o movida), avances, ganados / perdidos con su valor y el tiempo en
+#   etapa de los deals que salieron ese día, por (tenant, pipeline, día, etapa, agente).
+# - deal_stage_duration_daily: el mismo tiempo en etapa como histograma (DURATION_BOUNDS) para estimar percentiles.
+# - deal_stage_totals: deals abiertos y su valor por etapa y agente (la foto actual del pipeline).
+# Cada fila es un INSERT ... ON CONFLICT DO UPDATE SET x = x + excluded.x, así que el dashboard lee unas pocas filas
+# por índice en vez de recorrer deals + deal_history. Los UPDATE masivos de Core no pasan por acá; rebuild() recalcula
+# todo desde la historia (backfill inicial: backfill_funnel_rollups.py).
+
+CLOSED = ("WON", "LOST")
+UNASSIGNED = 0 # agent_id de los deals sin agente en los rollups
+# Bordes (segundos) del histograma de tiempo en etapa: 1 h * √2^k hasta ~1 año. Bucket 0 = menos de una hora; el
+# percentil se interpola dentro del bucket
+DURATION_BOUNDS = [3600 * 2 ** (k / 2) for k in range(27)]
+PERCENTILES = (50, 75, 90)
+
+def utc_naive(moment: Optional[datetime]) -> Optional[datetime]:
+    """Las columnas DateTime guardan UTC sin zona: normaliza para poder restar."""
+    if moment is not None and moment.tzinfo:
+        return moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+def duration_bucket(seconds: float) -> int:
+    return bisect.bisect_right(DURATION_BOUNDS, seconds)
+
+def histogram_percentile(counts: Dict[int, int], p: float) -> Optional[float]:
+    """Percentil p (segundos) de un histograma {bucket: deals}, interpolando linealmente dentro del bucket."""
+    total = sum(counts.values())
+    if not total:
+        return None
+    rank, seen = total * p / 100, 0
+    for bucket in sorted(counts):
+        deals = counts[bucket]
+        if deals and seen + deals >= rank:
+            low = DURATION_BOUNDS[bucket - 1] if bucket else 0.0
+            high = DURATION_BOUNDS[bucket] if bucket < len(DURATION_BOUNDS) else low
+            return low + (high - low) * (rank - seen) / deals
+        seen += deals
+    return None
+
+# --- Escritura ---
+
+class Rollup:
+    """Deltas agrupados por (tabla, clave); apply() hace un upsert por fila."""
+
+    def __init__(self):
+        self.rows = defaultdict(lambda: defaultdict(int))
+
+    def add(self, model, key: Optional[dict], **deltas):
+        if key is None:
+            return
+        row = self.rows[(model, tuple(sorted(key.items())))]
+        for column, delta in deltas.items():
+            row[column] += delta
+
+    def apply(self, connection):
+        insert = postgresql.insert if connection.dialect.name == "postgresql" else sqlite.insert
+        for (model, key), deltas in self.rows.items():
+            table = model.__table__
+            stmt = insert(table).values(**dict(key), **deltas)
+            connection.execute(stmt.on_conflict_do_update(
+                index_elements=[column for column, _ in key],
+                set_={column: table.c[column] + stmt.excluded[column] for column in deltas},
+            ))
+
+def _key(snapshot: dict, pipelines: Dict[int, int], day: Optional[date] = None) -> Optional[dict]:
+    pipeline_id = pipelines.get(snapshot["stage_id"])
+    if snapshot["tenant_id"] is None or pipeline_id is None:
+        return None
+    key = {"tenant_id": snapshot["tenant_id"], "pipeline_id": pipeline_id, "stage_id": snapshot["stage_id"], "agent_id": snapshot["agent_id"]}
+    if day is not None:
+        key["day"] = day
+    return key
+
+def _entered(rollup: Rollup, snapshot: dict, pipelines, day: date):
+    rollup.add(models.DealFunnelDaily, _key(snapshot, pipelines, day), entered=1, entered_value=snapshot["value"])
+
+def _exited(rollup: Rollup, snapshot: dict, pipelines, day: date, seconds: Optional[float], **counts):
+    """Salida de la etapa de `snapshot` (movida o cierre) con el tiempo que pasó en ella."""
+    key = _key(snapshot, pipelines, day)
+    if seconds is not None and seconds >= 0:
+        counts.update(exits=1, seconds_in_stage=seconds)
+        if key is not None:
+            rollup.add(models.DealStageDurationDaily, {**key, "bucket": duration_bucket(seconds)}, deals=1)
+    rollup.add(models.DealFunnelDaily, key, **counts)
+
+def _closed(rollup: Rollup, snapshot: dict, pipelines, day: date, seconds: Optional[float]):
+    status = snapshot["status"].lower()
+    _exited(rollup, snapshot, pipelines, day, seconds, **{status: 1, f"{status}_value": snapshot["value"]})
+
+def _open_totals(rollup: Rollup, snapshot: Optional[dict], pipelines, sign: int):
+    if snapshot and snapshot["status"] == "OPEN":
+        rollup.add(models.DealStageTotals, _key(snapshot, pipelines), open_deals=sign, open_value=sign * snapshot["value"])
+
+def _previous(state, key: str):
+    history = state.attrs[key].history
+    if history.has_changes():
+        return history.deleted[0] if history.deleted else None
+    return state.attrs[key].value
+
+def _snapshot(state, previous: bool) -> dict:
+    get = (lambda key: _previous(state, key)) if previous else (lambda key: getattr(state.obj(), key))
+    return {
+        "tenant_id": get("tenant_id"),
+        "stage_id": get("pipeline_stage_id"),
+        "agent_id": get("assigned_agent_id") or UNASSIGNED,
+        "status": (get("status") or "OPEN").upper(),
+        "value": get("value") or 0.0,
+    }
+
+def _stage_pipelines(connection, stage_ids) -> Dict[int, int]:
+    stage_ids = {s for s in stage_ids if s is not None}
+    if not stage_ids:
+        return {}
+    stages = models.PipelineStage.__table__
+    return dict(connection.execute(select(stages.c.id, stages.c.pipeline_id).where(stages.c.id.in_(stage_ids))).all())
+
+def record(rollup: Rollup, deal, before: Optional[dict], after: Optional[dict], pipelines, now: datetime):
+    """Deltas de un cambio del deal (before None = alta, after None = baja). Actualiza deal.stage_entered_at."""
+    _open_totals(rollup, before, pipelines, -1)
+    _open_totals(rollup, after, pipelines, 1)
+    if after is None:
+        # Borrado: la historia del embudo queda, solo sale de la foto
+        return
+    if before is None:
+        at = utc_naive(deal.created_at) or now
+        deal.stage_entered_at = deal.stage_entered_at or at
+        _entered(rollup, after, pipelines, at.date())
+        if after["status"] in CLOSED:
+            _closed(rollup, after, pipelines, at.date(), None)
+        return
+
+    entered_at = utc_naive(deal.stage_entered_at) or utc_naive(deal.created_at)
+    if before["stage_id"] != after["stage_id"] and after["stage_id"] is not None:
+        seconds = (now - entered_at).total_seconds() if entered_at else None
+        _exited(rollup, before, pipelines, now.date(), seconds, advanced=1)
+        _entered(rollup, after, pipelines, now.date())
+        deal.stage_entered_at = entered_at = now
+    if after["status"] in CLOSED and before["status"] not in CLOSED:
+        _closed(rollup, after, pipelines, now.date(), (now - entered_at).total_seconds() if entered_at else None)
+
+@event.listens_for(Session, "before_flush")
+def track_deal_changes(session, flush_context, instances):
+    changes = []
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, models.Deal):
+            continue
+        state = inspect(obj)
+        before = None if obj in session.new else _snapshot(state, previous=True)
+        after = None if obj in session.deleted else _snapshot(state, previous=False)
+        if before != after:
+            changes.append((obj, before, after))
+    if not changes:
+        return
+
+    connection = session.connection()
+    pipelines = _stage_pipelines(connection, [s["stage_id"] for _, before, after in changes for s in (before, after) if s])
+    now = utc_naive(datetime.now(timezone.utc))
+    rollup = Rollup()
+    for deal, before, after in changes:
+        record(rollup, deal, before, after, pipelines, now)
+    rollup.apply(connection)
+
+def rebuild(db: Session, tenant_id: Optional[int] = None, chunk_size: int = 500) -> int:
+    """
+    Recalcula los rollups (del tenant o de todos) reproduciendo deals + deal_history, y completa stage_entered_at.
+    Las altas salen de created_at y los cierres de updated_at (no hay historia de cierres); el agente es el actual.
+    Hace commit. Devuelve los deals procesados.
+    """
+    Deal, History = models.Deal.__table__, models.DealHistory.__table__
+    for model in (models.DealFunnelDaily, models.DealStageDurationDaily, models.DealStageTotals):
+        clear = delete(model)
+        db.execute(clear.where(model.tenant_id == tenant_id) if tenant_id else clear)
+
+    pipelines = dict(db.execute(select(models.PipelineStage.id, models.PipelineStage.pipeline_id)).all())
+    rollup, processed = Rollup(), 0
+    deals = select(Deal.c.id, Deal.c.tenant_id, Deal.c.pipeline_stage_id, Deal.c.assigned_agent_id, Deal.c.status,
+                   Deal.c.value, Deal.c.created_at, Deal.c.updated_at).order_by(Deal.c.id)
+    if tenant_id:
+        deals = deals.where(Deal.c.tenant_id == tenant_id)
+    for chunk in db.execute(deals.execution_options(yield_per=chunk_size)).partitions():
+        moves = defaultdict(list)
+        for deal_id, from_stage, to_stage, at in db.execute(
+            select(History.c.deal_id, History.c.from_stage_id, History.c.to_stage_id, History.c.created_at)
+            .where(History.c.deal_id.in_([d.id for d in chunk])).order_by(History.c.deal_id, History.c.created_at, History.c.id)
+        ):
+            moves[deal_id].append((from_stage, to_stage, utc_naive(at)))
+
+        entered = []
+        for d in chunk:
+            history = moves[d.id]
+            snapshot = {"tenant_id": d.tenant_id, "agent_id": d.assigned_agent_id or UNASSIGNED,
+                        "status": (d.status or "OPEN").upper(), "value": d.value or 0.0}
+            stage = history[0][0] if history and history[0][0] else d.pipeline_stage_id
+            entered_at = utc_naive(d.created_at)
+            if entered_at is not None:
+                _entered(rollup, {**snapshot, "stage_id": stage}, pipelines, entered_at.date())
+            for from_stage, to_stage, at in history:
+                if to_stage is None or to_stage == stage or at is None:
+                    continue
+                seconds = (at - entered_at).total_seconds() if entered_at else None
+                _exited(rollup, {**snapshot, "stage_id": stage}, pipelines, at.date(), seconds, advanced=1)
+                _entered(rollup, {**snapshot, "stage_id": to_stage}, pipelines, at.date())
+                stage, entered_at = to_stage, at
+            current = {**snapshot, "stage_id": d.pipeline_stage_id}
+            closed_at = utc_naive(d.updated_at)
+            if snapshot["status"] in CLOSED and closed_at is not None:
+                _closed(rollup, current, pipelines, closed_at.date(),
+                        (closed_at - entered_at).total_seconds() if entered_at else None)
+            _open_totals(rollup, current, pipelines, 1)
+            entered.append({"deal_id": d.id, "entered_at": entered_at})
+        processed += len(chunk)
+        if entered:
+            db.execute(update(Deal).where(Deal.c.id == bindparam("deal_id")).values(stage_entered_at=bindparam("entered_at")), entered)
+
+    rollup.apply(db.connection())
+    db.commit()
+    return processed
+
+# --- Lectura ---
+
+def _hours(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds / 3600, 1) if seconds is not None else None
+
+def funnel_report(db: Session, tenant_id: int, pipeline_id: int, start: date, end: date, agent_id: Optional[int] = None) -> dict:
+    """
+    Embudo del pipeline entre start y end (días UTC, inclusive), opcionalmente de un agente (0 = sin asignar).
+    Por etapa: entradas, avances, ganados / perdidos, conversión a la etapa siguiente, tiempo en etapa (promedio y
+    percentiles, en horas) y la foto actual de deals abiertos. LookupError si el pipeline no es del tenant.
+    """
+    stages = db.execute(
+        select(models.PipelineStage.id, models.PipelineStage.name, models.PipelineStage.order)
+        .join(models.Pipeline).where(models.Pipeline.id == pipeline_id, models.Pipeline.tenant_id == tenant_id)
+        .order_by(models.PipelineStage.order, models.PipelineStage.id)
+    ).all()
+    if not stages:
+        raise LookupError("Pipeline not found")
+
+    def scoped(model, by_day=True):
+        conditions = [model.tenant_id == tenant_id, model.pipeline_id == pipeline_id]
+        if by_day:
+            conditions += [model.day >= start, model.day <= end]
+        if agent_id is not None:
+            conditions.append(model.agent_id == agent_id)
+        return conditions
+
+    Daily, Durations, Totals = models.DealFunnelDaily, models.DealStageDurationDaily, models.DealStageTotals
+    counters = ("entered", "entered_value", "advanced", "won", "won_value", "lost", "lost_value", "exits", "seconds_in_stage")
+    events = {row[0]: dict(zip(counters, row[1:])) for row in db.execute(
+        select(Daily.stage_id, *(func.sum(getattr(Daily, c)) for c in counters)).where(*scoped(Daily)).group_by(Daily.stage_id)
+    )}
+    histograms = defaultdict(dict)
+    for stage_id, bucket, deals in db.execute(
+        select(Durations.stage_id, Durations.bucket, func.sum(Durations.deals))
+        .where(*scoped(Durations)).group_by(Durations.stage_id, Durations.bucket)
+    ):
+        histograms[stage_id][bucket] = deals
+    totals = {stage_id: (deals, value) for stage_id, deals, value in db.execute(
+        select(Totals.stage_id, func.sum(Totals.open_deals), func.sum(Totals.open_value))
+        .where(*scoped(Totals, by_day=False)).group_by(Totals.stage_id)
+    )}
+
+    result = []
+    for i, (stage_id, name, order) in enumerate(stages):
+        row = {c: events.get(stage_id, {}).get(c) or 0 for c in counters}
+        exits, seconds = row.pop("exits"), row.pop("seconds_in_stage")
+        following = (events.get(stages[i + 1][0], {}).get("entered") or 0) if i + 1 < len(stages) else None
+        open_deals, open_value = totals.get(stage_id, (0, 0.0))
+        result.append({
+            "stage_id": stage_id,
+            "name": name,
+            "order": order,
+            **row,
+            "conversion_rate": round(following / row["entered"], 3) if following is not None and row["entered"] else None,
+            "open_deals": open_deals or 0,
+            "open_value": open_value or 0.0,
+            "time_in_stage_hours": {
+                "deals": exits,
+                "avg": _hours(seconds / exits) if exits else None,
+                **{f"p{p}": _hours(histogram_percentile(histograms[stage_id], p)) for p in PERCENTILES},
+            },
+        })
+
+    won, lost = sum(s["won"] for s in result), sum(s["lost"] for s in result)
+    return {
+        "pipeline_id": pipeline_id,
+        "agent_id": agent_id,
+        "date_from": start.isoformat(),
+        "date_to": end.isoformat(),
+        "stages": result,
+        "totals": {
+            "entered": result[0]["entered"],
+            "won": won,
+            "won_value": sum(s["won_value"] for s in result),
+            "lost": lost,
+            "lost_value": sum(s["lost_value"] for s in result),
+            "win_rate": round(won / (won + lost), 3) if won + lost else None,
+            "open_deals": sum(s["open_deals"] for s in result),
+            "open_value": sum(s["open_value"] for s in result),
+        },
+    }
@@ -0,0 +1,175 @@
+import logging
+import random
+import threading
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import or_, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import SessionLocal
+from settings import settings
+import models
+import background_tasks
+import conversation_memory
+
+logger = logging.getLogger("urbanocrm.jobs")
+
+# Cola de trabajos persistente (tabla jobs). Los endpoints encolan dentro de su propia
+# transacción y worker.py consume con SELECT ... FOR UPDATE SKIP LOCKED.
+
+PROPERTY_AI_SYNC = "property_ai_sync"
+DEVELOPMENT_AI_SYNC = "development_ai_sync"
+CONTACT_PREFERENCES_EMBEDDING = "contact_preferences_embedding"
+CONVERSATION_SUMMARY = "conversation_summary" # entity_id: conversation_summaries.id
+
+HANDLERS = {
+    PROPERTY_AI_SYNC: background_tasks.background_sync_property_ai,
+    DEVELOPMENT_AI_SYNC: background_tasks.background_sync_development_ai,
+    CONTACT_PREFERENCES_EMBEDDING: background_tasks.background_sync_contact_preferences,
+    CONVERSATION_SUMMARY: conversation_memory.summarize_conversation,
+}
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def enqueue(db: Session, kind: str, entity_id: int):
+    """
+    Agrega un job a la sesión del request (se persiste con su commit).
+    Si ya hay uno pendiente para la misma entidad no se duplica.
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    now = _now()
+    stmt = dialect.insert(models.Job).values(
+        kind=kind, entity_id=entity_id, status="pending", attempts=0,
+        max_attempts=settings.job_max_attempts, run_after=now, created_at=now, updated_at=now
+    ).on_conflict_do_nothing(
+        index_elements=["kind", "entity_id"],
+        index_where=models.Job.status == "pending"
+    )
+    db.execute(stmt)
+
+def claim_next_job():
+    """
+    Toma el próximo job vencido (o uno 'running' cuyo worker murió) y lo marca como running.
+    Devuelve (id, kind, entity_id) o None.
+    """
+    now = _now()
+    stale = now - timedelta(seconds=settings.job_lock_timeout_seconds)
+    with SessionLocal() as db:
+        # Un job que mata al worker queda 'running' con el lock vencido: sin intentos restantes no se vuelve a tomar
+        dead = db.query(models.Job).filter(
+            models.Job.status == "running",
+            models.Job.locked_at < stale,
+            models.Job.attempts >= models.Job.max_attempts
+        ).update({"status": "failed", "locked_at": None, "last_error": "Lock vencido sin intentos restantes"}, synchronize_session=False)
+        if dead:
+            logger.error(f"[Jobs] {dead} jobs fallaron definitivamente: el worker murió en el último intento")
+        job = db.query(models.Job).filter(or_(
+            and_(models.Job.status == "pending", models.Job.run_after <= now),
+            and_(models.Job.status == "running", models.Job.locked_at < stale)
+        )).order_by(models.Job.run_after, models.Job.id).with_for_update(skip_locked=True).first()
+        if not job:
+            return None
+        job.status = "running"
+        job.locked_at = now
+        job.attempts = (job.attempts or 0) + 1
+        claimed = (job.id, job.kind, job.entity_id)
+        db.commit()
+        return claimed
+
+def _finish_job(job_id: int, error: Exception = None):
+    with SessionLocal() as db:
+        job = db.query(models.Job).filter(models.Job.id == job_id).first()
+        if not job:
+            return
+        job.locked_at = None
+        if error is None:
+            job.status = "done"
+            job.last_error = None
+        else:
+            job.last_error = str(error)[:2000]
+            newer = db.query(models.Job.id).filter(
+                models.Job.kind == job.kind,
+                models.Job.entity_id == job.entity_id,
+                models.Job.status == "pending"
+            ).first()
+            if newer:
+                # Ya hay un job más nuevo para la misma entidad: ese rehace el trabajo
+                job.status = "superseded"
+            elif job.attempts >= job.max_attempts:
+                job.status = "failed"
+                logger.error(f"[Jobs] {job.kind}#{job.entity_id} falló definitivamente tras {job.attempts} intentos: {error}")
+            else:
+                # Backoff exponencial con jitter: base, 2*base, 4*base, ...
+                delay = settings.job_retry_base_seconds * (2 ** (job.attempts - 1))
+                job.status = "pending"
+                job.run_after = _now() + timedelta(seconds=delay * random.uniform(1.0, 1.25))
+                logger.warning(f"[Jobs] {job.kind}#{job.entity_id} reintento {job.attempts}/{job.max_attempts} en ~{delay}s: {error}")
+        try:
+            db.commit()
+        except IntegrityError:
+            # enqueue insertó un pendiente para la misma entidad después del chequeo de `newer`: ese rehace el trabajo
+            db.rollback()
+            db.query(models.Job).filter(models.Job.id == job_id).update(
+                {"status": "superseded", "locked_at": None, "last_error": str(error)[:2000]}, synchronize_session=False
+            )
+            db.commit()
+
+def process_next_job() -> bool:
+    """Ejecuta un job. Devuelve False si no había trabajo pendiente."""
+    claimed = claim_next_job()
+    if not claimed:
+        return False
+    job_id, kind, entity_id = claimed
+    try:
+        HANDLERS[kind](entity_id)
+    except Exception as e:
+        _finish_job(job_id, e)
+    else:
+        _finish_job(job_id)
+    return True
+
+def run_consumer(stop_event: threading.Event, poll_interval: float = None):
+    """Loop de un consumidor: procesa jobs mientras haya, si no espera `poll_interval`."""
+    poll_interval = poll_interval or settings.job_poll_interval_seconds
+    while not stop_event.is_set():
+        try:
+            if not process_next_job():
+                stop_event.wait(poll_interval)
+        except Exception as e:
+            logger.error(f"[Jobs] Error en consumidor: {e}")
+            stop_event.wait(poll_interval)
+
+# Consumidores dentro del proceso web (lifespan de main.py): la imagen solo arranca uvicorn, así que sin esto nadie
+# procesaría la cola. Con worker.py corriendo aparte, job_embedded_consumers = 0.
+_embedded = None # (stop_event, threads)
+
+def start_embedded_consumers(count: int = None):
+    global _embedded
+    count = settings.job_embedded_consumers if count is None else count
+    if count <= 0 or _embedded is not None:
+        return
+    stop_event = threading.Event()
+    threads = [
+        threading.Thread(target=run_consumer, args=(stop_event,), name=f"job-consumer-{i}", daemon=True)
+        for i in range(count)
+    ]
+    for t in threads:
+        t.start()
+    _embedded = (stop_event, threads)
+    logger.info(f"[Jobs] {count} consumidores embebidos en el proceso web ({', '.join(HANDLERS)}).")
+
+def stop_embedded_consumers(timeout: float = 30.0):
+    """Deja terminar los jobs en curso (hasta `timeout` por hilo); los que no terminan se reclaman por lock vencido."""
+    global _embedded
+    if _embedded is None:
+        return
+    stop_event, threads = _embedded
+    _embedded = None
+    stop_event.set()
+    for t in threads:
+        t.join(timeout)
@@ -3,12 +3,14 @@ print("DEBUG: main.py - imports 1")
 from fastapi import FastAPI, BackgroundTasks
 print("DEBUG: main.py - imports 2")
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 print("DEBUG: main.py - imports 3")
 from contextlib import asynccontextmanager
 print("DEBUG: main.py - imports 4")
 import logging
 print("DEBUG: main.py - imports 5")
 import asyncio
+import anyio
 print("DEBUG: main.py - imports 6")
 from dotenv import load_dotenv
 print("DEBUG: main.py - imports 7")
@@ -19,13 +21,19 @@ print("DEBUG: main.py - imports 9")
 import uuid
 print("DEBUG: main.py - imports 10")
 from database import engine, Base, SessionLocal
+from settings import settings
 import models
+import pagination
+import bot_processor
+import whatsapp_inbox
+import job_queue
 
 from socket_manager import sio, send_notification
 import socketio
 
 # Importación de Routers
-from routers import auth, users, properties, developments, contacts, branches, config, media, google, calendars, team, import_data, whatsapp, monitoring, ai_matching, ai_service, bots, opportunities, feed
+from routers import auth, users, properties, developments, contacts, branches, config, media, google, calendars, team, import_data, whatsapp, monitoring, ai_matching, ai_service, bots, opportunities, feed, suggest
+from background_tasks import run_embedding_backfill
 
 import logging
 from logging.handlers import RotatingFileHandler
@@ -60,41 +68,21 @@ async def backfill_embeddings():
     """Tarea para rellenar embeddings faltantes en el arranque."""
     await asyncio.sleep(5) # Esperar a que la DB esté lista
     logger.info("AI: Starting backfill check for null embeddings...")
-    with SessionLocal() as db:
-        # Propiedades
-        props = db.query(models.Property).filter(models.Property.embedding_descripcion == None).all()
-        if props:
-            logger.info(f"AI: Found {len(props)} properties without embeddings. Syncing...")
-            for p in props:
-                ctx = ai_service.generate_property_context_string(p)
-                vec = ai_service.get_embedding(ctx)
-                if vec:
-                    p.embedding_descripcion = vec
-                    db.commit()
-        
-        # Emprendimientos
-        devs = db.query(models.Development).filter(models.Development.embedding_proyecto == None).all()
-        if devs:
-            logger.info(f"AI: Found {len(devs)} developments without embeddings. Syncing...")
-            for d in devs:
-                ctx = ai_service.generate_development_context_string(d)
-                vec = ai_service.get_embedding(ctx)
-                if vec:
-                    d.embedding_proyecto = vec
-                    db.commit()
-    logger.info("AI: Backfill check completed.")
+    result = await asyncio.to_thread(run_embedding_backfill)
+    logger.info(f"AI: Backfill check completed. {result}")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     def db_setup():
         with SessionLocal() as db:
-            try:
-                # 1. Extensiones (solo si no están)
-                db.execute(text("CREATE EXTENSION IF NOT EXISTS vector;"))
-                db.commit()
-            except Exception as e:
-                logger.warning(f"Could not enable pgvector: {e}")
-                db.rollback()
+            # 1. Extensiones (solo si no están): pgvector y pg_trgm (type-ahead)
+            for extension in ("vector", "pg_trgm"):
+                try:
+                    db.execute(text(f"CREATE EXTENSION IF NOT EXISTS {extension};"))
+                    db.commit()
+                except Exception as e:
+                    logger.warning(f"Could not enable {extension}: {e}")
+                    db.rollback()
 
             # 2. Verificar si necesitamos correr migraciones pesadas
             # Si ya tenemos la tabla system_configs, asumimos que la estructura base está ok
@@ -126,6 +114,50 @@ async def lifespan(app: FastAPI):
                 "ALTER TABLE contacts ADD COLUMN IF NOT EXISTS drip_campaign_active BOOLEAN DEFAULT FALSE;",
                 "ALTER TABLE contacts ADD COLUMN IF NOT EXISTS embedding_preferences vector(768);",
                 "CREATE TABLE IF NOT EXISTS bots (id SERIAL PRIMARY KEY, user_id INTEGER, platform VARCHAR, instance_name VARCHAR, system_prompt TEXT, business_hours JSONB, tags JSONB, config JSONB, status VARCHAR, is_active BOOLEAN, created_at TIMESTAMP, updated_at TIMESTAMP);",
+                "CREATE TABLE IF NOT EXISTS embedding_cache (id SERIAL PRIMARY KEY, model VARCHAR NOT NULL, task_type VARCHAR NOT NULL, dimensions INTEGER NOT NULL, content_hash VARCHAR(64) NOT NULL, embedding vector(768) NOT NULL, created_at TIMESTAMP, CONSTRAINT uq_embedding_cache_key UNIQUE (model, task_type, dimensions, content_hash));",
+                "CREATE TABLE IF NOT EXISTS jobs (id SERIAL PRIMARY KEY, kind VARCHAR NOT NULL, entity_id INTEGER NOT NULL, status VARCHAR DEFAULT 'pending', attempts INTEGER DEFAULT 0, max_attempts INTEGER DEFAULT 5, run_after TIMESTAMP, locked_at TIMESTAMP, last_error TEXT, created_at TIMESTAMP, updated_at TIMESTAMP);",
+                "CREATE UNIQUE INDEX IF NOT EXISTS uq_jobs_pending_entity ON jobs (kind, entity_id) WHERE status = 'pending';",
+                "CREATE INDEX IF NOT EXISTS ix_jobs_status_run_after ON jobs (status, run_after);",
+                # Búsqueda de texto (search.py): tsvector generado sobre los campos visibles + search_content
+                "ALTER TABLE properties ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+                "setweight(to_tsvector('spanish'::regconfig, coalesce(code, '') || ' ' || coalesce(title, '')), 'A') || "
+                "setweight(to_tsvector('spanish'::regconfig, coalesce(address, '') || ' ' || coalesce(neighborhood, '') || ' ' || coalesce(city, '')), 'B') || "
+                "setweight(to_tsvector('spanish'::regconfig, coalesce(search_content, '')), 'C')) STORED;",
+                # Teléfono normalizado (phones.py). Las filas previas se normalizan con backfill_contact_phones.py
+                "ALTER TABLE contacts ADD COLUMN IF NOT EXISTS phone_normalized VARCHAR;",
+                "CREATE INDEX IF NOT EXISTS ix_contacts_tenant_phone_normalized ON contacts (tenant_id, phone_normalized);",
+                # Versión de inventario por tenant (ETag / cache del feed XML, ver models.bump_inventory_version)
+                "ALTER TABLE tenants ADD COLUMN IF NOT EXISTS inventory_version INTEGER NOT NULL DEFAULT 0;",
+                "ALTER TABLE tenants ADD COLUMN IF NOT EXISTS inventory_updated_at TIMESTAMP WITH TIME ZONE;",
+                # Amenities y portales como JSONB (filtros @> con GIN jsonb_path_ops, ver search.json_contains). Los portales
+                # previos se pasan a minúscula con backfill_property_portals.py
+                *[f"""DO $$ BEGIN
+                    IF (SELECT data_type FROM information_schema.columns WHERE table_name = 'properties' AND column_name = '{column}') = 'json' THEN
+                        ALTER TABLE properties ALTER COLUMN {column} TYPE jsonb USING {column}::jsonb;
+                    END IF;
+                END $$;""" for column in ("attributes", "published_on_portals")],
+                # Historial del bot por tenant (analytics.py). Los mensajes previos se asignan con backfill_chat_history_tenant.py
+                "ALTER TABLE chat_history ADD COLUMN IF NOT EXISTS tenant_id INTEGER REFERENCES tenants(id);",
+                "CREATE INDEX IF NOT EXISTS ix_chat_history_tenant_created ON chat_history (tenant_id, created_at);",
+                # Rollups del embudo (funnel.py). Los datos previos se cargan con backfill_funnel_rollups.py
+                "ALTER TABLE deals ADD COLUMN IF NOT EXISTS stage_entered_at TIMESTAMP;",
+                "CREATE TABLE IF NOT EXISTS deal_funnel_daily (id SERIAL PRIMARY KEY, tenant_id INTEGER NOT NULL, pipeline_id INTEGER NOT NULL, day DATE NOT NULL, stage_id INTEGER NOT NULL, agent_id INTEGER NOT NULL DEFAULT 0, "
+                "entered INTEGER NOT NULL DEFAULT 0, entered_value FLOAT NOT NULL DEFAULT 0, advanced INTEGER NOT NULL DEFAULT 0, won INTEGER NOT NULL DEFAULT 0, won_value FLOAT NOT NULL DEFAULT 0, "
+                "lost INTEGER NOT NULL DEFAULT 0, lost_value FLOAT NOT NULL DEFAULT 0, exits INTEGER NOT NULL DEFAULT 0, seconds_in_stage FLOAT NOT NULL DEFAULT 0, "
+                "CONSTRAINT uq_deal_funnel_daily_key UNIQUE (tenant_id, pipeline_id, day, stage_id, agent_id));",
+                "CREATE TABLE IF NOT EXISTS deal_stage_duration_daily (id SERIAL PRIMARY KEY, tenant_id INTEGER NOT NULL, pipeline_id INTEGER NOT NULL, day DATE NOT NULL, stage_id INTEGER NOT NULL, agent_id INTEGER NOT NULL DEFAULT 0, "
+                "bucket INTEGER NOT NULL, deals INTEGER NOT NULL DEFAULT 0, CONSTRAINT uq_deal_stage_duration_daily_key UNIQUE (tenant_id, pipeline_id, day, stage_id, agent_id, bucket));",
+                "CREATE TABLE IF NOT EXISTS deal_stage_totals (id SERIAL PRIMARY KEY, tenant_id INTEGER NOT NULL, pipeline_id INTEGER NOT NULL, stage_id INTEGER NOT NULL, agent_id INTEGER NOT NULL DEFAULT 0, "
+                "open_deals INTEGER NOT NULL DEFAULT 0, open_value FLOAT NOT NULL DEFAULT 0, CONSTRAINT uq_deal_stage_totals_key UNIQUE (tenant_id, pipeline_id, stage_id, agent_id));",
+                # Webhook de WhatsApp (whatsapp_inbox.py): id del mensaje del proveedor para descartar reintentos
+                "ALTER TABLE whatsapp_buffer ADD COLUMN IF NOT EXISTS provider_message_id VARCHAR(255);",
+                # Momento en que un turno tomó el mensaje: recover() mide el timeout desde ahí, no desde la llegada
+                "ALTER TABLE whatsapp_buffer ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP;",
+                # Resumen acumulado por conversación del bot (conversation_memory.py)
+                "CREATE TABLE IF NOT EXISTS conversation_summaries (id SERIAL PRIMARY KEY, tenant_id INTEGER REFERENCES tenants(id), sender_id VARCHAR NOT NULL, "
+                "summary TEXT, summarized_until_id INTEGER NOT NULL DEFAULT 0, updated_at TIMESTAMP);",
+                "ALTER TABLE conversation_summaries DROP CONSTRAINT IF EXISTS conversation_summaries_sender_id_key;",
+                "CREATE UNIQUE INDEX IF NOT EXISTS uq_conversation_summaries_tenant_sender ON conversation_summaries (tenant_id, sender_id);",
             ]
             
             for cmd in migration_commands:
@@ -136,6 +168,57 @@ async def lifespan(app: FastAPI):
                 except Exception as e:
                     db.rollback()
 
+            # 3b. Índices pesados: ANN (pgvector HNSW, coseno) y GIN de texto.
+            # CONCURRENTLY no bloquea escrituras pero no puede correr en una transacción
+            concurrent_index_commands = [
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_properties_embedding_descripcion_hnsw ON properties USING hnsw (embedding_descripcion vector_cosine_ops) WITH (m = 16, ef_construction = 64);",
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_developments_embedding_proyecto_hnsw ON developments USING hnsw (embedding_proyecto vector_cosine_ops) WITH (m = 16, ef_construction = 64);",
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_contacts_embedding_preferences_hnsw ON contacts USING hnsw (embedding_preferences vector_cosine_ops) WITH (m = 16, ef_construction = 64);",
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_properties_search_vector ON properties USING gin (search_vector);",
+                # pg_trgm para ILIKE '%x%' de los listados y /api/search/suggest
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_contacts_name_trgm ON contacts USING gin (name gin_trgm_ops);",
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_contacts_email_trgm ON contacts USING gin (email gin_trgm_ops);",
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_contacts_phone_trgm ON contacts USING gin (phone gin_trgm_ops);",
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_properties_address_trgm ON properties USING gin (address gin_trgm_ops);",
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_properties_title_trgm ON properties USING gin (title gin_trgm_ops);",
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_properties_code_trgm ON properties USING gin (code gin_trgm_ops);",
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_developments_name_trgm ON developments USING gin (name gin_trgm_ops);",
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_developments_address_trgm ON developments USING gin (address gin_trgm_ops);",
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_developments_code_trgm ON developments USING gin (code gin_trgm_ops);",
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_first_name_trgm ON users USING gin (first_name gin_trgm_ops);",
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_last_name_trgm ON users USING gin (last_name gin_trgm_ops);",
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_email_trgm ON users USING gin (email gin_trgm_ops);",
+                # Búsqueda por sufijo de teléfono: reverse(phone_normalized) LIKE 'xifus%'
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_contacts_phone_reversed ON contacts (tenant_id, reverse(phone_normalized) text_pattern_ops);",
+                # Contención JSONB (@>) de amenities y portales
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_properties_attributes_gin ON properties USING gin (attributes jsonb_path_ops);",
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_properties_published_on_portals_gin ON properties USING gin (published_on_portals jsonb_path_ops);",
+                # Rango de eventos por propiedad / agente (availability.py)
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_calendar_events_property_start ON calendar_events (property_id, start_time);",
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_calendar_events_agent_start ON calendar_events (agent_id, start_time);",
+                # Tablero de oportunidades (keyset por etapa) y comentarios / historia por deal
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_deals_tenant_stage_created ON deals (tenant_id, pipeline_stage_id, created_at, id);",
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_deal_comments_deal_created ON deal_comments (deal_id, created_at);",
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_deal_history_deal_created ON deal_history (deal_id, created_at);",
+                # Paginación keyset de los listados (pagination.py): (filtro, clave de orden, id)
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_contacts_tenant_id_id ON contacts (tenant_id, id);",
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_properties_tenant_id_id ON properties (tenant_id, id);",
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_developments_tenant_id_id ON developments (tenant_id, id);",
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_contact_interactions_contact_date ON contact_interactions (contact_id, date, id);",
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_monitoring_logs_user_timestamp ON monitoring_logs (user_id, timestamp, id);",
+                # Buffer del webhook de WhatsApp: dedup por id del proveedor y pendientes por remitente
+                "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ux_whatsapp_buffer_instance_message ON whatsapp_buffer (instance, provider_message_id);",
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_whatsapp_buffer_instance_sender_status ON whatsapp_buffer (instance, sender_id, status);",
+                # Historial reciente por conversación (conversation_memory.py)
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chat_history_sender_created ON chat_history (sender_id, created_at);",
+            ]
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                for cmd in concurrent_index_commands:
+                    try:
+                        conn.execute(text(cmd))
+                    except Exception as e:
+                        logger.warning(f"Could not create index: {e}")
+
             # 4. Generar datos faltantes (Solo si es necesario)
             try:
                 # User Tokens
@@ -161,8 +244,16 @@ async def lifespan(app: FastAPI):
                 logger.error(f"Error data sync: {e}")
                 db.rollback()
                     
+    # Hilos para rutas/dependencias sync (las lecturas pesadas ya son async y no ocupan hilo, ver database.py)
+    anyio.to_thread.current_default_thread_limiter().total_tokens = settings.threadpool_size
     await asyncio.to_thread(db_setup)
+    await whatsapp_inbox.start()
+    # Cola de jobs (sync IA, resúmenes de conversación): consumidores en este proceso salvo que corra worker.py aparte
+    job_queue.start_embedded_consumers()
     yield
+    await asyncio.to_thread(job_queue.stop_embedded_consumers)
+    await whatsapp_inbox.shutdown()
+    await bot_processor.shutdown()
 
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
@@ -185,7 +276,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[pagination.NEXT_CURSOR_HEADER], # el front lee el cursor de la página siguiente
 )
+# Los listados JSON (propiedades con galería, contactos) son muy repetitivos y gzip los achica mucho; ver bench_list_payloads.py
+app.add_middleware(GZipMiddleware, minimum_size=settings.gzip_minimum_size, compresslevel=settings.gzip_compresslevel)
 
 app.include_router(auth.router, prefix="/api/auth", tags=["Autenticación"])
 app.include_router(users.router, prefix="/api/users", tags=["Usuarios"])
@@ -205,6 +299,7 @@ app.include_router(ai_matching.router, prefix="/api/ai-matching", tags=["AI Inte
 app.include_router(bots.router, prefix="/api/bots", tags=["Bot Mastery"])
 app.include_router(opportunities.router, prefix="/api/opportunities", tags=["Oportunidades"])
 app.include_router(feed.router, prefix="/api/feeds", tags=["Sindicación Portales"])
+app.include_router(suggest.router, prefix="/api/search", tags=["Búsqueda"])
 
 @app.get("/")
 async def root():
@@ -1,19 +1,46 @@
 
-from sqlalchemy import Column, Integer, String, Boolean, Text, Float, ForeignKey, JSON, DateTime
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Boolean, Text, Float, ForeignKey, JSON, Date, DateTime, UniqueConstraint, Index, text
+from sqlalchemy import event, inspect, update
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import relationship, validates, deferred, Session
 from database import Base
 import datetime
 from pgvector.sqlalchemy import Vector
+import phones
+
+# Arrays JSON filtrables con @> (search.json_contains): JSONB en Postgres, JSON en SQLite (tests)
+JSONB_ARRAY = JSON().with_variant(JSONB(), "postgresql")
+
+def jsonb_path_index(name: str, column: str) -> Index:
+    """Índice GIN jsonb_path_ops: solo sirve para @> pero es más chico y rápido que el jsonb_ops por defecto."""
+    return Index(name, column, postgresql_using="gin", postgresql_ops={column: "jsonb_path_ops"})
+
+def trgm_index(name: str, column: str) -> Index:
+    """Índice GIN pg_trgm: acelera ILIKE '%x%' y similarity() del type-ahead (ver search.suggest)."""
+    return Index(name, column, postgresql_using="gin", postgresql_ops={column: "gin_trgm_ops"})
+
+# Columnas pesadas (vectores de 768 floats, texto armado para la IA, metadata cruda de importación) que ninguna
+# respuesta de la API devuelve: se declaran con deferred() y no viajan en los SELECT de la entidad. Quien las lee
+# las pide explícitamente (load_only/undefer o un select de la columna); en una sesión async el acceso lazy falla.
 
 class Tenant(Base):
     __tablename__ = "tenants"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
     domain = Column(String)
+    # Versión del inventario: sube con cada alta/cambio/baja de una propiedad del tenant (ver bump_inventory_version).
+    # El feed XML la usa como ETag / Last-Modified y como clave de su cache
+    inventory_version = Column(Integer, default=0, nullable=False)
+    inventory_updated_at = Column(DateTime(timezone=True), nullable=True)
 
 class User(Base):
     __tablename__ = "users"
-    __table_args__ = {'extend_existing': True} 
+    __table_args__ = (
+        trgm_index("ix_users_first_name_trgm", "first_name"),
+        trgm_index("ix_users_last_name_trgm", "last_name"),
+        trgm_index("ix_users_email_trgm", "email"),
+        {'extend_existing': True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True)
@@ -60,6 +87,7 @@ class User(Base):
 
 class MonitoringLog(Base):
     __tablename__ = "monitoring_logs"
+    __table_args__ = (Index("ix_monitoring_logs_user_timestamp", "user_id", "timestamp", "id"),)
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     app_name = Column(String)
@@ -92,6 +120,11 @@ class ActivityLog(Base):
 
 class CalendarEvent(Base):
     __tablename__ = "calendar_events"
+    __table_args__ = (
+        # Consulta por rango de availability.events_query (cupo por propiedad / agenda del agente)
+        Index("ix_calendar_events_property_start", "property_id", "start_time"),
+        Index("ix_calendar_events_agent_start", "agent_id", "start_time"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=True)
     title = Column(String)
@@ -121,6 +154,7 @@ class CalendarEvent(Base):
 
 class ContactInteraction(Base):
     __tablename__ = "contact_interactions"
+    __table_args__ = (Index("ix_contact_interactions_contact_date", "contact_id", "date", "id"),)
     id = Column(Integer, primary_key=True, index=True)
     contact_id = Column(Integer, ForeignKey("contacts.id"))
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
@@ -132,11 +166,26 @@ class ContactInteraction(Base):
 
 class Contact(Base):
     __tablename__ = "contacts"
+    __table_args__ = (
+        # ANN (pgvector HNSW, distancia coseno) para Reverse Matching. Ver vector_search.py
+        Index("ix_contacts_embedding_preferences_hnsw", "embedding_preferences", postgresql_using="hnsw",
+              postgresql_with={"m": 16, "ef_construction": 64},
+              postgresql_ops={"embedding_preferences": "vector_cosine_ops"}),
+        trgm_index("ix_contacts_name_trgm", "name"),
+        trgm_index("ix_contacts_email_trgm", "email"),
+        trgm_index("ix_contacts_phone_trgm", "phone"),
+        # Duplicados por teléfono (igualdad). El índice por sufijo, (tenant_id, reverse(phone_normalized)
+        # text_pattern_ops), se crea en main.py / alembic: SQLite (tests) no tiene reverse(). Ver phones.py
+        Index("ix_contacts_tenant_phone_normalized", "tenant_id", "phone_normalized"),
+        # Listado paginado por cursor (pagination.py): id desc dentro del tenant
+        Index("ix_contacts_tenant_id_id", "tenant_id", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=True)
     name = Column(String)
     email = Column(String, nullable=True)
     phone = Column(String, nullable=True)
+    phone_normalized = Column(String, nullable=True) # solo dígitos, se completa al asignar phone
     status = Column(String, default="WARM") # COLD, WARM, HOT
     type = Column(String, default="CLIENT") # CLIENT, OWNER, BROKER
     source = Column(String, nullable=True)
@@ -148,11 +197,28 @@ class Contact(Base):
     created_by_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.datetime.now(datetime.timezone.utc))
     
-    # IA Column
-    embedding_preferences = Column(Vector(768), nullable=True)
+    # IA Column (diferida, ver nota de columnas pesadas arriba)
+    embedding_preferences = deferred(Column(Vector(768), nullable=True))
+
+    @validates("phone")
+    def _set_phone_normalized(self, key, value):
+        self.phone_normalized = phones.normalize_phone(value)
+        return value
 
 class Property(Base):
     __tablename__ = "properties"
+    __table_args__ = (
+        # ANN (pgvector HNSW, distancia coseno) para búsqueda semántica. Ver vector_search.py
+        Index("ix_properties_embedding_descripcion_hnsw", "embedding_descripcion", postgresql_using="hnsw",
+              postgresql_with={"m": 16, "ef_construction": 64},
+              postgresql_ops={"embedding_descripcion": "vector_cosine_ops"}),
+        trgm_index("ix_properties_address_trgm", "address"),
+        trgm_index("ix_properties_title_trgm", "title"),
+        trgm_index("ix_properties_code_trgm", "code"),
+        jsonb_path_index("ix_properties_attributes_gin", "attributes"),
+        jsonb_path_index("ix_properties_published_on_portals_gin", "published_on_portals"),
+        Index("ix_properties_tenant_id_id", "tenant_id", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=True)
     code = Column(String, unique=True, index=True)
@@ -198,7 +264,7 @@ class Property(Base):
     surface_uncovered = Column(Float, default=0)
     surface = Column(Float, default=0) # Total surface
     
-    attributes = Column(JSON, default=[])
+    attributes = Column(JSONB_ARRAY, default=[]) # amenities: ["pool", "pets", ...]
     image = Column(Text, nullable=True)
     thumbnail_url = Column(Text, nullable=True)
     gallery = Column(JSON, default=[])
@@ -208,12 +274,12 @@ class Property(Base):
     description = Column(Text, nullable=True)
     virtual_tour_url = Column(String, nullable=True)
     video_url = Column(String, nullable=True)
-    published_on_portals = Column(JSON, default=[])
+    published_on_portals = Column(JSONB_ARRAY, default=[])
     
-    # IA Columns (768 dimensions for Gemini Text Embedding 004)
-    embedding_descripcion = Column(Vector(768), nullable=True)
-    prop_metadata = Column("metadata", JSON, default={})
-    search_content = Column(Text, nullable=True)
+    # IA Columns (768 dimensions for Gemini Text Embedding 004), diferidas: ver nota de columnas pesadas arriba
+    embedding_descripcion = deferred(Column(Vector(768), nullable=True))
+    prop_metadata = deferred(Column("metadata", JSON, default={}))
+    search_content = deferred(Column(Text, nullable=True))
     
     # Management
     owner_name = Column(String, nullable=True)
@@ -238,8 +304,23 @@ class Property(Base):
     
     status = Column(String, default="Active")
 
+    @validates("published_on_portals")
+    def _lower_portals(self, key, value):
+        # El feed filtra con @> (sensible a mayúsculas): se guardan en minúscula, como llegan en la URL del feed
+        return [p.lower() if isinstance(p, str) else p for p in value] if isinstance(value, list) else value
+
 class Development(Base):
     __tablename__ = "developments"
+    __table_args__ = (
+        # ANN (pgvector HNSW, distancia coseno) para búsqueda semántica. Ver vector_search.py
+        Index("ix_developments_embedding_proyecto_hnsw", "embedding_proyecto", postgresql_using="hnsw",
+              postgresql_with={"m": 16, "ef_construction": 64},
+              postgresql_ops={"embedding_proyecto": "vector_cosine_ops"}),
+        trgm_index("ix_developments_name_trgm", "name"),
+        trgm_index("ix_developments_address_trgm", "address"),
+        trgm_index("ix_developments_code_trgm", "code"),
+        Index("ix_developments_tenant_id_id", "tenant_id", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=True)
     code = Column(String, unique=True, index=True)
@@ -259,8 +340,8 @@ class Development(Base):
     virtual_tour_url = Column(String, nullable=True)
     video_url = Column(String, nullable=True)
     
-    # IA Column
-    embedding_proyecto = Column(Vector(768), nullable=True)
+    # IA Column (diferida, ver nota de columnas pesadas arriba)
+    embedding_proyecto = deferred(Column(Vector(768), nullable=True))
 
 class Typology(Base):
     __tablename__ = "typologies"
@@ -334,14 +415,22 @@ class Bot(Base):
 
 class WhatsappBuffer(Base):
     __tablename__ = "whatsapp_buffer"
+    __table_args__ = (
+        # Dedup de reintentos del proveedor (whatsapp_inbox.store: INSERT ... ON CONFLICT DO NOTHING)
+        Index("ux_whatsapp_buffer_instance_message", "instance", "provider_message_id", unique=True),
+        # Mensajes pendientes de un remitente (whatsapp_inbox.claim)
+        Index("ix_whatsapp_buffer_instance_sender_status", "instance", "sender_id", "status"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     sender_id = Column(String(255), nullable=False)
     message_content = Column(Text, nullable=True)
-    status = Column(String(50), default='pending')
+    status = Column(String(50), default='pending') # pending, processing, done, failed
     received_at = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
     instance = Column(String(250), nullable=True)
     file_url = Column(String(250), nullable=True)
+    provider_message_id = Column(String(255), nullable=True) # key.id (Evolution) / messages[].id (Cloud API)
+    claimed_at = Column(DateTime, nullable=True) # paso a processing (whatsapp_inbox.claim / recover)
 
 
 
@@ -354,7 +443,14 @@ class BotConversation(Base):
 
 class ChatHistory(Base):
     __tablename__ = "chat_history"
+    __table_args__ = (
+        # Analytics del bot por tenant y rango de fechas (analytics.py)
+        Index("ix_chat_history_tenant_created", "tenant_id", "created_at"),
+        # Historial reciente de una conversación (conversation_memory.py)
+        Index("ix_chat_history_sender_created", "sender_id", "created_at"),
+    )
     id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=True) # tenant del dueño del bot
     sender_id = Column(String, index=True)
     role = Column(String)
     parts = Column(JSON)
@@ -362,6 +458,20 @@ class ChatHistory(Base):
     media_type = Column(String, nullable=True)
     created_at = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
 
+class ConversationSummary(Base):
+    """Resumen acumulado de una conversación del bot: lo que ya no entra en el presupuesto de tokens del historial."""
+    __tablename__ = "conversation_summaries"
+    __table_args__ = (
+        # Un resumen por conversación con cada inmobiliaria: el mismo cliente puede hablar con bots de varios tenants
+        Index("uq_conversation_summaries_tenant_sender", "tenant_id", "sender_id", unique=True),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=True)
+    sender_id = Column(String, nullable=False)
+    summary = Column(Text, nullable=True)
+    summarized_until_id = Column(Integer, nullable=False, default=0) # último chat_history.id incluido en el resumen
+    updated_at = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
+
 class Pipeline(Base):
     __tablename__ = "pipelines"
     id = Column(Integer, primary_key=True, index=True)
@@ -385,6 +495,10 @@ class PipelineStage(Base):
 
 class Deal(Base):
     __tablename__ = "deals"
+    __table_args__ = (
+        # Columnas del tablero: filtro por etapa y keyset sobre (created_at, id)
+        Index("ix_deals_tenant_stage_created", "tenant_id", "pipeline_stage_id", "created_at", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=True)
     title = Column(String)
@@ -401,6 +515,8 @@ class Deal(Base):
     requirements = Column(Text, nullable=True) # Lo que busca el cliente
     
     close_date = Column(DateTime, nullable=True)
+    # Entrada a la etapa actual (UTC): la mantiene funnel.py para el tiempo en etapa
+    stage_entered_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
     updated_at = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc), onupdate=lambda: datetime.datetime.now(datetime.timezone.utc))
 
@@ -413,6 +529,7 @@ class Deal(Base):
 
 class DealComment(Base):
     __tablename__ = "deal_comments"
+    __table_args__ = (Index("ix_deal_comments_deal_created", "deal_id", "created_at"),)
     id = Column(Integer, primary_key=True, index=True)
     deal_id = Column(Integer, ForeignKey("deals.id", ondelete="CASCADE"))
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -424,6 +541,7 @@ class DealComment(Base):
 
 class DealHistory(Base):
     __tablename__ = "deal_history"
+    __table_args__ = (Index("ix_deal_history_deal_created", "deal_id", "created_at"),)
     id = Column(Integer, primary_key=True, index=True)
     deal_id = Column(Integer, ForeignKey("deals.id", ondelete="CASCADE"))
     from_stage_id = Column(Integer, ForeignKey("pipeline_stages.id"), nullable=True)
@@ -435,3 +553,109 @@ class DealHistory(Base):
     from_stage = relationship("PipelineStage", foreign_keys=[from_stage_id])
     to_stage = relationship("PipelineStage", foreign_keys=[to_stage_id])
     user = relationship("User")
+
+# --- Rollups del embudo (funnel.py) ---
+# Contadores que se incrementan en la misma transacción que mueve / cierra el deal. Sin FKs: agent_id = 0 es "sin
+# asignar" (un NULL no chocaría en el ON CONFLICT) y las filas sobreviven al borrado del deal / usuario.
+
+class DealFunnelDaily(Base):
+    """Eventos del embudo por (tenant, pipeline, día, etapa, agente)."""
+    __tablename__ = "deal_funnel_daily"
+    __table_args__ = (UniqueConstraint("tenant_id", "pipeline_id", "day", "stage_id", "agent_id", name="uq_deal_funnel_daily_key"),)
+    id = Column(Integer, primary_key=True)
+    tenant_id = Column(Integer, nullable=False)
+    pipeline_id = Column(Integer, nullable=False)
+    day = Column(Date, nullable=False)
+    stage_id = Column(Integer, nullable=False)
+    agent_id = Column(Integer, nullable=False, default=0)
+    entered = Column(Integer, nullable=False, default=0) # altas en la etapa + movidas hacia ella
+    entered_value = Column(Float, nullable=False, default=0.0)
+    advanced = Column(Integer, nullable=False, default=0) # movidas desde la etapa a otra
+    won = Column(Integer, nullable=False, default=0)
+    won_value = Column(Float, nullable=False, default=0.0)
+    lost = Column(Integer, nullable=False, default=0)
+    lost_value = Column(Float, nullable=False, default=0.0)
+    # Tiempo en la etapa de los deals que salieron de ella ese día (movida o cierre)
+    exits = Column(Integer, nullable=False, default=0)
+    seconds_in_stage = Column(Float, nullable=False, default=0.0)
+
+class DealStageDurationDaily(Base):
+    """Histograma del tiempo en etapa (buckets de funnel.DURATION_BOUNDS) por (tenant, pipeline, día, etapa, agente)."""
+    __tablename__ = "deal_stage_duration_daily"
+    __table_args__ = (UniqueConstraint("tenant_id", "pipeline_id", "day", "stage_id", "agent_id", "bucket", name="uq_deal_stage_duration_daily_key"),)
+    id = Column(Integer, primary_key=True)
+    tenant_id = Column(Integer, nullable=False)
+    pipeline_id = Column(Integer, nullable=False)
+    day = Column(Date, nullable=False)
+    stage_id = Column(Integer, nullable=False)
+    agent_id = Column(Integer, nullable=False, default=0)
+    bucket = Column(Integer, nullable=False)
+    deals = Column(Integer, nullable=False, default=0)
+
+class DealStageTotals(Base):
+    """Deals abiertos y su valor por (tenant, pipeline, etapa, agente): la foto actual del pipeline."""
+    __tablename__ = "deal_stage_totals"
+    __table_args__ = (UniqueConstraint("tenant_id", "pipeline_id", "stage_id", "agent_id", name="uq_deal_stage_totals_key"),)
+    id = Column(Integer, primary_key=True)
+    tenant_id = Column(Integer, nullable=False)
+    pipeline_id = Column(Integer, nullable=False)
+    stage_id = Column(Integer, nullable=False)
+    agent_id = Column(Integer, nullable=False, default=0)
+    open_deals = Column(Integer, nullable=False, default=0)
+    open_value = Column(Float, nullable=False, default=0.0)
+
+class EmbeddingCache(Base):
+    __tablename__ = "embedding_cache"
+    __table_args__ = (UniqueConstraint("model", "task_type", "dimensions", "content_hash", name="uq_embedding_cache_key"),)
+    id = Column(Integer, primary_key=True, index=True)
+    model = Column(String, nullable=False)
+    task_type = Column(String, nullable=False)
+    dimensions = Column(Integer, nullable=False)
+    content_hash = Column(String(64), nullable=False) # sha256 del texto embebido
+    embedding = Column(Vector(768), nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
+
+class Job(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # Dedup: como máximo un job pendiente por (kind, entity_id)
+        Index("uq_jobs_pending_entity", "kind", "entity_id", unique=True,
+              postgresql_where=text("status = 'pending'"), sqlite_where=text("status = 'pending'")),
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False) # property_ai_sync, development_ai_sync, contact_preferences_embedding
+    entity_id = Column(Integer, nullable=False)
+    status = Column(String, default="pending") # pending, running, done, failed, superseded
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=5)
+    run_after = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None))
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
+    updated_at = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc), onupdate=lambda: datetime.datetime.now(datetime.timezone.utc))
+
+# Columnas de IA que reescribe el worker: no cambian lo que ve un portal, no invalidan el feed
+INVENTORY_IGNORED_COLUMNS = {"embedding_descripcion", "search_content"}
+
+@event.listens_for(Session, "after_flush")
+def bump_inventory_version(session, flush_context):
+    """Sube tenants.inventory_version (en la misma transacción) por cada tenant con propiedades nuevas, editadas o
+    borradas en este flush. Los UPDATE masivos de Core (backfill de embeddings) no pasan por acá."""
+    tenant_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, Property):
+            continue
+        state = inspect(obj)
+        if obj in session.dirty and not any(
+            attr.history.has_changes() for attr in state.attrs if attr.key not in INVENTORY_IGNORED_COLUMNS
+        ):
+            continue
+        # Si cambió de tenant, también cambia el inventario del tenant anterior
+        tenant_ids.update(t for t in state.attrs.tenant_id.history.sum() if t is not None)
+    if tenant_ids:
+        tenants = Tenant.__table__
+        session.connection().execute(update(tenants).where(tenants.c.id.in_(tenant_ids)).values(
+            inventory_version=tenants.c.inventory_version + 1,
+            inventory_updated_at=datetime.datetime.now(datetime.timezone.utc)
+        ))
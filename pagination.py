@@ -0,0 +1,96 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy import DateTime, and_, literal, or_, tuple_
+
+from settings import settings
+
+# Paginación keyset: en vez de OFFSET, cada página arranca después de la clave de orden (sort key, id) de la última
+# fila de la anterior, así que una página profunda cuesta lo mismo que la primera si hay índice sobre esa clave.
+# El cursor es opaco para el cliente: base64 del JSON con los valores de la clave (datetimes en ISO).
+#
+# Los listados que devuelven un array JSON mandan el cursor de la página siguiente en el header X-Next-Cursor (sin
+# header = última página) y reciben ?cursor=...; las respuestas con envoltorio (tablero) lo llevan como next_cursor.
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(*values: Any) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, columns: Sequence) -> List[Any]:
+    """Valores del cursor con el tipo de cada columna de la clave. ValueError si está mal formado."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("cursor length")
+        return [
+            datetime.fromisoformat(v) if v is not None and isinstance(c.type, DateTime) else v
+            for c, v in zip(columns, values)
+        ]
+    except (ValueError, TypeError, binascii.Error) as e:
+        raise ValueError("Invalid cursor") from e
+
+def after(columns: Sequence, values: Sequence, descending: bool = True):
+    """
+    Condición "viene después de `values`" para ORDER BY columns (todas DESC o todas ASC), como row value.
+    La primera clave puede ser NULL (fechas de filas viejas): esas filas van primero en DESC y últimas en ASC, como en
+    un índice de Postgres, y el row value con NULL no las excluye ni corta el recorrido.
+    """
+    first, rest = columns[0], columns[1:]
+    if values[0] is None:
+        if not rest:
+            return first.is_not(None) if descending else literal(False)
+        # Entre las de clave NULL por el resto de la clave; después, todas las que la tienen
+        remaining = and_(first.is_(None), after(rest, values[1:], descending))
+        return or_(remaining, first.is_not(None)) if descending else remaining
+    key = tuple_(*columns)
+    bound = tuple_(*(literal(v, c.type) for c, v in zip(columns, values)))
+    if descending:
+        return key < bound
+    return or_(key > bound, first.is_(None)) if rest else key > bound
+
+def order_by(columns: Sequence, descending: bool = True) -> list:
+    """ORDER BY de la clave con los NULL donde los deja after() (el orden de un índice btree de Postgres)."""
+    return [c.desc().nulls_first() if descending else c.asc().nulls_last() for c in columns]
+
+UNBOUNDED = 0 # page_size(unpaged=UNBOUNDED): el endpoint no tenía tope
+
+def page_size(limit: Optional[int], cursor: Optional[str] = None, unpaged: Optional[int] = None) -> Optional[int]:
+    """
+    Tamaño de página acotado a [1, page_size_max]; sin limit, page_size_default.
+    `unpaged` es lo que devolvía el endpoint antes del cursor: sin limit ni cursor (clientes que no leen X-Next-Cursor)
+    se devuelve eso y no se pierden filas. None = sin LIMIT (unpaged=UNBOUNDED).
+    """
+    if limit is None and not cursor and unpaged is not None:
+        return unpaged or None
+    return max(1, min(limit or settings.page_size_default, settings.page_size_max))
+
+def keyset(query, columns: Sequence, cursor: Optional[str], limit: Optional[int], descending: bool = True):
+    """
+    Aplica el cursor, ORDER BY columns y LIMIT limit + 1 (la fila extra dice si hay otra página, sin COUNT) a un
+    Select o Query. Un cursor mal formado es un 400. limit None: sin LIMIT.
+    """
+    if cursor:
+        try:
+            query = query.where(after(columns, decode_cursor(cursor, columns), descending))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    query = query.order_by(*order_by(columns, descending))
+    return query if limit is None else query.limit(limit + 1)
+
+def split_page(rows: Sequence, columns: Sequence, limit: Optional[int]) -> Tuple[list, Optional[str]]:
+    """(filas de la página, cursor de la siguiente o None) a partir de las limit + 1 filas de keyset()."""
+    rows = list(rows)
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    last = rows[limit - 1]
+    return rows[:limit], encode_cursor(*(getattr(last, c.key) for c in columns))
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]):
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
@@ -0,0 +1,48 @@
+import re
+from typing import Iterable, Optional
+
+from sqlalchemy import func, or_
+
+# Teléfonos de contactos: la misma persona llega como "+54 9 341 555-1234" (CRM), "5493415551234" (import de
+# Google) o "5493415551234@s.whatsapp.net" (bot). contacts.phone_normalized guarda solo los dígitos (E.164 sin '+',
+# o el número local tal como vino si no trae código de país) y se completa al escribir (ver models.Contact).
+#
+# Para cruzar números con y sin prefijo internacional o de larga distancia (549 / 0) se compara por sufijo: los últimos PHONE_SUFFIX_DIGITS
+# dígitos. LIKE '%sufijo' no usa índices, así que en Postgres se busca reverse(phone_normalized) LIKE 'xifus%'
+# sobre el índice ix_contacts_phone_reversed (text_pattern_ops). Fuera de Postgres, LIKE '%sufijo'.
+
+PHONE_SUFFIX_DIGITS = 8
+_NON_DIGITS = re.compile(r"\D")
+
+# Mismo criterio que normalize_phone() para el backfill en SQL (main.py / alembic): sin el ":device@dominio" del jid
+NORMALIZE_SQL = "NULLIF(regexp_replace(regexp_replace(split_part(split_part(phone, '@', 1), ':', 1), '[^0-9]', '', 'g'), '^00', ''), '')"
+
+def normalize_phone(raw: Optional[str]) -> Optional[str]:
+    """'+54 9 (341) 555-1234' -> '5493415551234'; '5493415551234:7@s.whatsapp.net' -> '5493415551234'. None si no hay dígitos."""
+    if not raw:
+        return None
+    raw = raw.split("@", 1)[0].split(":", 1)[0]
+    digits = _NON_DIGITS.sub("", raw)
+    if digits.startswith("00"):
+        digits = digits[2:]
+    return digits or None
+
+def phone_suffix(raw: Optional[str]) -> Optional[str]:
+    """Últimos PHONE_SUFFIX_DIGITS dígitos (o el número entero si es más corto)."""
+    digits = normalize_phone(raw)
+    return digits[-PHONE_SUFFIX_DIGITS:] if digits else None
+
+def suffix_condition(column, suffix: str, dialect: str):
+    """`column` termina en `suffix` (solo dígitos, sin comodines)."""
+    if dialect == "postgresql":
+        return func.reverse(column).like(suffix[::-1] + "%")
+    return column.like("%" + suffix)
+
+def match_condition(column, raw: Optional[str], dialect: str):
+    """Condición para encontrar el contacto de `raw` sin importar el formato. None si `raw` no tiene dígitos."""
+    suffix = phone_suffix(raw)
+    return suffix_condition(column, suffix, dialect) if suffix else None
+
+def suffixes_condition(column, suffixes: Iterable[str], dialect: str):
+    """OR de sufijos: una sola consulta para varios teléfonos (en Postgres, BitmapOr sobre el índice)."""
+    return or_(*(suffix_condition(column, s, dialect) for s in suffixes))
@@ -1,3 +1,4 @@
 
-# Este archivo permite importar los routers como módulos
-from . import auth, users, properties, developments, contacts, branches, config, media, google, calendars, team, import_data, whatsapp, monitoring, ai_matching, ai_service, bots
+# Este archivo permite importar los routers como módulos (from routers import bots, ...).
+# No se importan aquí de forma eager: background_tasks y los workers importan routers.ai_service
+# sin arrastrar todos los routers (y sus dependencias circulares).
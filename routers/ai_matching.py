@@ -1,35 +1,23 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks
-from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy.orm import Session, load_only
+from sqlalchemy import literal
 from typing import List, Dict, Any
-from database import get_db, SessionLocal
-from auth import get_current_user_email
-from . import ai_service
+from database import get_db
+from auth import Principal, get_current_principal, get_current_user_email
+from background_tasks import run_embedding_backfill
+import embedding_cache
+import vector_search
+import search
 import models
 import logging
+import asyncio
 
 router = APIRouter()
 logger = logging.getLogger("urbanocrm.ai")
 
 async def run_backfill():
-    with SessionLocal() as db:
-        # Props
-        props = db.query(models.Property).filter(models.Property.embedding_descripcion == None).all()
-        for p in props:
-            ctx = ai_service.generate_property_context_string(p)
-            vec = ai_service.get_embedding(ctx)
-            if vec:
-                p.embedding_descripcion = vec
-                db.commit()
-        # Devs
-        devs = db.query(models.Development).filter(models.Development.embedding_proyecto == None).all()
-        for d in devs:
-            ctx = ai_service.generate_development_context_string(d)
-            vec = ai_service.get_embedding(ctx)
-            if vec:
-                d.embedding_proyecto = vec
-                db.commit()
-    logger.info("AI: Manual backfill completed.")
+    result = await asyncio.to_thread(run_embedding_backfill)
+    logger.info(f"AI: Manual backfill completed. {result}")
 
 @router.post("/backfill")
 async def trigger_backfill(background_tasks: BackgroundTasks, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
@@ -37,44 +25,52 @@ async def trigger_backfill(background_tasks: BackgroundTasks, db: Session = Depe
     background_tasks.add_task(run_backfill)
     return {"status": "processing", "message": "Backfill task started in background."}
 
+@router.get("/cache-stats")
+def get_embedding_cache_stats(email: str = Depends(get_current_user_email)):
+    """Contadores del cache de embeddings por contenido y del cache de búsquedas (hit rate, latencia ahorrada)."""
+    return {**embedding_cache.stats(), "query_cache": embedding_cache.query_stats()}
+
 @router.get("/match")
-def match_lead_interest(query: str = Query(..., min_length=3), db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
+def match_lead_interest(query: str = Query(..., min_length=3), db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     """
     Búsqueda semántica usando similitud de coseno en pgvector.
     """
-    user = db.query(models.User).filter(models.User.email == email).first()
-    query_vector = ai_service.get_embedding(query)
+    query_vector = embedding_cache.get_query_embedding(query)
     if not query_vector:
         raise HTTPException(500, "Error generating query embedding")
 
-    # Búsqueda en Propiedades (Similaridad de Coseno: 1 - Distancia)
-    props_sql = text("""
-        SELECT id, address, price, currency, thumbnail_url, 'PROPERTY' as type, code, city, neighborhood,
-        operation, description,
-        (1 - (embedding_descripcion <=> :vec)) as score
-        FROM properties
-        WHERE embedding_descripcion IS NOT NULL AND tenant_id = :tenant_id
-        ORDER BY score DESC
-        LIMIT 6
-    """)
+    # Propiedades: búsqueda híbrida (texto + vector, RRF) igual que el listado y el bot. Score = similitud coseno
+    props_results = search.search_properties(
+        db, query, search.property_filters(tenant_id=user.tenant_id), limit=6, query_vector=query_vector,
+        options=(load_only(
+            models.Property.id, models.Property.address, models.Property.price, models.Property.currency,
+            models.Property.thumbnail_url, models.Property.code, models.Property.city, models.Property.neighborhood,
+            models.Property.operation, models.Property.description, models.Property.embedding_descripcion
+        ),)
+    )
     
-    # Búsqueda en Emprendimientos
-    devs_sql = text("""
-        SELECT id, name as address, 0 as price, 'USD' as currency, thumbnail_url, 'DEVELOPMENT' as type, code, address as city, '' as neighborhood,
-        'Sale' as operation, description,
-        (1 - (embedding_proyecto <=> :vec)) as score
-        FROM developments
-        WHERE embedding_proyecto IS NOT NULL AND tenant_id = :tenant_id
-        ORDER BY score DESC
-        LIMIT 6
-    """)
-
-    props_results = db.execute(props_sql, {"vec": str(query_vector), "tenant_id": user.tenant_id}).fetchall()
-    devs_results = db.execute(devs_sql, {"vec": str(query_vector), "tenant_id": user.tenant_id}).fetchall()
+    # Búsqueda ANN en Emprendimientos
+    devs_results = vector_search.nearest(
+        db, models.Development.embedding_proyecto, query_vector,
+        models.Development.id, models.Development.name.label("address"), literal(0).label("price"),
+        literal("USD").label("currency"), models.Development.thumbnail_url, literal("DEVELOPMENT").label("type"),
+        models.Development.code, models.Development.address.label("city"), literal("").label("neighborhood"),
+        literal("Sale").label("operation"), models.Development.description,
+        tenant_id=user.tenant_id, limit=6
+    )
 
     combined = []
-    for r in props_results: combined.append(dict(r._mapping))
-    for r in devs_results: combined.append(dict(r._mapping))
+    for p, _ in props_results:
+        combined.append({
+            "id": p.id, "address": p.address, "price": p.price, "currency": p.currency, "thumbnail_url": p.thumbnail_url,
+            "type": "PROPERTY", "code": p.code, "city": p.city, "neighborhood": p.neighborhood,
+            "operation": p.operation, "description": p.description,
+            "score": vector_search.cosine_similarity(p.embedding_descripcion, query_vector),
+        })
+    for r in devs_results:
+        row = dict(r._mapping)
+        row["score"] = vector_search.score(row.pop("distance"))
+        combined.append(row)
     
     # Ordenar por score descendente y tomar los mejores
     final_matches = sorted(combined, key=lambda x: x['score'], reverse=True)[:6]
@@ -85,35 +81,33 @@ def match_lead_interest(query: str = Query(..., min_length=3), db: Session = Dep
     }
 
 @router.get("/reverse-match")
-def match_property_to_leads(entity_id: int, entity_type: str = "PROPERTY", db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
+def match_property_to_leads(entity_id: int, entity_type: str = "PROPERTY", db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     """
     Busca contactos (Leads) cuyos 'embedding_preferences' coincidan de manera inversa 
     con el embedding de esta propiedad/emprendimiento.
     """
-    user = db.query(models.User).filter(models.User.email == email).first()
+    # Solo la columna del vector (diferida en el modelo): cargar la entidad y después el embedding serían dos consultas
     if entity_type == "PROPERTY":
-        entity = db.query(models.Property).filter(models.Property.id == entity_id, models.Property.tenant_id == user.tenant_id).first()
-        vec = entity.embedding_descripcion if entity else None
+        vec = db.query(models.Property.embedding_descripcion).filter(models.Property.id == entity_id, models.Property.tenant_id == user.tenant_id).scalar()
     elif entity_type == "DEVELOPMENT":
-        entity = db.query(models.Development).filter(models.Development.id == entity_id, models.Development.tenant_id == user.tenant_id).first()
-        vec = entity.embedding_proyecto if entity else None
+        vec = db.query(models.Development.embedding_proyecto).filter(models.Development.id == entity_id, models.Development.tenant_id == user.tenant_id).scalar()
     else:
         raise HTTPException(400, "Invalid entity_type")
 
-    if not vec:
+    if vec is None:
         raise HTTPException(404, "Entity missing vector embedding. Cannot reverse match yet.")
 
-    sql = text("""
-        SELECT id, name, phone, email, notes, lead_score, status,
-        (1 - (embedding_preferences <=> :vec)) as score
-        FROM contacts
-        WHERE embedding_preferences IS NOT NULL AND tenant_id = :tenant_id
-        ORDER BY score DESC
-        LIMIT 10
-    """)
-    
-    results = db.execute(sql, {"vec": str(vec), "tenant_id": user.tenant_id}).fetchall()
-    matches = [dict(r._mapping) for r in results]
+    results = vector_search.nearest(
+        db, models.Contact.embedding_preferences, vec,
+        models.Contact.id, models.Contact.name, models.Contact.phone, models.Contact.email,
+        models.Contact.notes, models.Contact.lead_score, models.Contact.status,
+        tenant_id=user.tenant_id, limit=10
+    )
+    matches = []
+    for r in results:
+        row = dict(r._mapping)
+        row["score"] = vector_search.score(row.pop("distance"))
+        matches.append(row)
     
     return {
         "entity_id": entity_id,
@@ -127,9 +121,8 @@ async def send_recommendation_whatsapp(
     entity_id: int, 
     entity_type: str, 
     db: Session = Depends(get_db),
-    email: str = Depends(get_current_user_email)
+    user: Principal = Depends(get_current_principal)
 ):
-    user = db.query(models.User).filter(models.User.email == email).first()
     contact = db.query(models.Contact).filter(models.Contact.id == contact_id, models.Contact.tenant_id == user.tenant_id).first()
     if not contact: raise HTTPException(404, "Contacto no encontrado")
     
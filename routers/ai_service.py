@@ -1,11 +1,18 @@
 
 import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from google import genai
-from typing import List
+from typing import List, Optional
 import logging
+from settings import settings
 
 logger = logging.getLogger("urbanocrm.ai_service")
 
+EMBEDDING_MODEL = "models/gemini-embedding-001"
+EMBEDDING_DIMENSIONS = 768
+
 # Configurar API Key de Gemini
 API_KEY = os.getenv("API_KEY")
 client = None
@@ -15,6 +22,34 @@ if API_KEY:
     except Exception as e:
         logger.error(f"Failed to initialize Gemini client: {e}")
 
+class TokenBucket:
+    """
+    Rate limiter token-bucket (thread-safe) para las llamadas salientes a Gemini.
+    `rate_per_minute` tokens se reponen de forma continua; cada texto embebido consume uno (un batch de N textos, N),
+    igual que la cuota de Gemini, que cuenta los contenidos de batchEmbedContents por separado.
+    """
+    def __init__(self, rate_per_minute: int):
+        self.capacity = max(1, rate_per_minute)
+        self.tokens = float(self.capacity)
+        self.fill_rate = self.capacity / 60.0
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, cost: int = 1):
+        cost = min(max(1, cost), self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.fill_rate)
+                self.updated_at = now
+                if self.tokens >= cost:
+                    self.tokens -= cost
+                    return
+                wait = (cost - self.tokens) / self.fill_rate
+            time.sleep(wait)
+
+rate_limiter = TokenBucket(settings.embedding_texts_per_minute)
+
 def generate_property_context_string(prop) -> str:
     """
     Genera el string de contexto para una propiedad según requerimiento.
@@ -50,13 +85,14 @@ def get_embedding(text: str, task_type: str = "retrieval_query") -> List[float]:
         return None
     
     try:
+        rate_limiter.acquire()
         # Using google-genai Client API
         result = client.models.embed_content(
-            model="models/gemini-embedding-001", # You can update to text-embedding-004 if desired
+            model=EMBEDDING_MODEL, # You can update to text-embedding-004 if desired
             contents=text,
             config={
                 "task_type": task_type.upper(), 
-                "output_dimensionality": 768
+                "output_dimensionality": EMBEDDING_DIMENSIONS
             }
         )
         # Returns EmbedContentResponse
@@ -64,3 +100,46 @@ def get_embedding(text: str, task_type: str = "retrieval_query") -> List[float]:
     except Exception as e:
         logger.error(f"AI ERROR: Failed to get embedding from Gemini: {e}")
         return None
+
+
+def _embed_batch(texts: List[str], task_type: str) -> List[Optional[List[float]]]:
+    """Un único request batchEmbedContents para hasta `embedding_batch_size` textos."""
+    try:
+        rate_limiter.acquire(len(texts))
+        result = client.models.embed_content(
+            model=EMBEDDING_MODEL,
+            contents=texts,
+            config={
+                "task_type": task_type.upper(),
+                "output_dimensionality": EMBEDDING_DIMENSIONS
+            }
+        )
+        return [e.values for e in result.embeddings]
+    except Exception as e:
+        logger.error(f"AI ERROR: Failed to get batch of {len(texts)} embeddings from Gemini: {e}")
+        return [None] * len(texts)
+
+def get_embeddings(texts: List[str], task_type: str = "retrieval_document", batch_size: int = None, concurrency: int = None) -> List[Optional[List[float]]]:
+    """
+    Versión batch de get_embedding: agrupa los textos en requests de `batch_size`,
+    ejecuta hasta `concurrency` requests en paralelo y respeta el rate limit global.
+    Devuelve una lista alineada con `texts` (None donde el texto está vacío o el batch falló).
+    """
+    vectors = [None] * len(texts)
+    if not client or not texts:
+        return vectors
+
+    batch_size = batch_size or settings.embedding_batch_size
+    concurrency = concurrency or settings.embedding_concurrency
+
+    pending = [i for i, t in enumerate(texts) if t]
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+
+    def run(indexes):
+        return indexes, _embed_batch([texts[i] for i in indexes], task_type)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(batches) or 1))) as pool:
+        for indexes, batch_vectors in pool.map(run, batches):
+            for i, vec in zip(indexes, batch_vectors):
+                vectors[i] = vec
+    return vectors
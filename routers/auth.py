@@ -4,7 +4,7 @@ from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 import models, schemas
 from database import get_db
-from auth import create_access_token, verify_password, get_password_hash
+from auth import create_access_token, verify_password, get_password_hash, invalidate_principal
 
 router = APIRouter()
 
@@ -107,6 +107,7 @@ def register(user_data: schemas.UserCreate, db: Session = Depends(get_db)):
     )
     db.add(new_user)
     db.commit()
+    invalidate_principal(new_user.email)
     return {"message": "Usuario creado exitosamente"}
 
 @router.post("/register-invited")
@@ -4,11 +4,20 @@ import requests
 import logging
 import uuid
 from fastapi import APIRouter, Depends, HTTPException, Body
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from database import get_db
-from auth import get_current_user_email
+from database import get_db, get_async_db
+from auth import Principal, get_current_principal, get_current_user_email
 import models
 import schemas
+import search
+import phones
+import availability
+import analytics
+import bot_registry
+import bot_intents
+import bot_tools
+import conversation_memory
 
 router = APIRouter()
 logger = logging.getLogger("urbanocrm.bots")
@@ -50,8 +59,7 @@ def call_evolution(method: str, endpoint: str, data: dict = None):
         return None
 
 @router.get("/", response_model=schemas.BotResponse)
-def get_bot_config(platform: str, email: str = Depends(get_current_user_email), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == email).first()
+def get_bot_config(platform: str, user: Principal = Depends(get_current_principal), db: Session = Depends(get_db)):
     bot = db.query(models.Bot).filter(models.Bot.user_id == user.id, models.Bot.platform == platform).first()
     
     if not bot:
@@ -99,8 +107,7 @@ def get_bot_config(platform: str, email: str = Depends(get_current_user_email),
     return bot_dict
 
 @router.post("/configure")
-def configure_bot(config: schemas.BotCreate, email: str = Depends(get_current_user_email), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == email).first()
+def configure_bot(config: schemas.BotCreate, user: Principal = Depends(get_current_principal), db: Session = Depends(get_db)):
     bot = db.query(models.Bot).filter(models.Bot.user_id == user.id, models.Bot.platform == config.platform).first()
     
     if not bot:
@@ -120,11 +127,19 @@ def configure_bot(config: schemas.BotCreate, email: str = Depends(get_current_us
         bot.config = config.config
     
     db.commit()
+    # El engine en memoria de la instancia tiene el prompt viejo: se rearma en el próximo mensaje
+    bot_registry.invalidate(bot.instance_name)
     return {"status": "ok", "message": "Configuración guardada"}
 
+@router.get("/engine-stats")
+def get_engine_stats(email: str = Depends(get_current_user_email)):
+    """Registro de motores del bot (hits / armados, overhead por mensaje), memoria de conversación, latencia por tool
+    y turnos resueltos por el atajo sin Gemini."""
+    return {**bot_registry.stats(), "memory": conversation_memory.stats(), "tools": bot_tools.stats(),
+            "fast_path": bot_intents.stats()}
+
 @router.post("/connect")
-def connect_bot(request: schemas.BotConnectRequest, email: str = Depends(get_current_user_email), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == email).first()
+def connect_bot(request: schemas.BotConnectRequest, user: Principal = Depends(get_current_principal), db: Session = Depends(get_db)):
     bot = db.query(models.Bot).filter(models.Bot.user_id == user.id, models.Bot.platform == request.platform).first()
     
     if not bot:
@@ -146,15 +161,16 @@ def connect_bot(request: schemas.BotConnectRequest, email: str = Depends(get_cur
     return {"qrCode": None, "instanceName": instance_name, "status": bot.status}
 
 @router.post("/disconnect")
-def disconnect_bot(request: schemas.BotConnectRequest, email: str = Depends(get_current_user_email), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == email).first()
+def disconnect_bot(request: schemas.BotConnectRequest, user: Principal = Depends(get_current_principal), db: Session = Depends(get_db)):
     bot = db.query(models.Bot).filter(models.Bot.user_id == user.id, models.Bot.platform == request.platform).first()
     
     bot.status = "disconnected"
     bot.qrCode = None
     if bot.config and "official_whatsapp" in bot.config:
-        del bot.config["official_whatsapp"]
+        # Dict nuevo: la columna JSON no detecta cambios in-place y las credenciales quedaban guardadas
+        bot.config = {k: v for k, v in bot.config.items() if k != "official_whatsapp"}
     db.commit()
+    bot_registry.invalidate(bot.instance_name)
     
     return {"status": "ok", "message": "Instancia desconectada y credenciales removidas."}
 
@@ -164,52 +180,40 @@ def disconnect_bot(request: schemas.BotConnectRequest, email: str = Depends(get_
 def bot_search_properties(filters: dict = Body(...), db: Session = Depends(get_db)):
     """
     Búsqueda simplificada para Bots/IA.
-    Recibe filtros (operation, type, budget, zone, rooms) y devuelve un resumen.
+    Recibe filtros (operation, type, budget, zone, rooms, amenities) y opcionalmente `query` (texto libre), y devuelve un resumen.
     """
-    query = db.query(models.Property).filter(models.Property.status == "Active")
-
     # Si pasamos el email/tenant_id en el token del bot (Ideal)
     # Por ahora tomamos el tenant_id del bot instance, pero el endpoint "rag-search" no recibe instancia por default
     # Vamos a obtener la info del bot que invoca (quizas requiera refactor param)
     # Asumimos que RAG-SEARCH debe aislar obligatoriamente:
     tenant_id = filters.get("tenant_id")
-    if tenant_id:
-        query = query.filter(models.Property.tenant_id == tenant_id)
-
-    # 1. Filtros Básicos
-    if filters.get("operation"):
-        # Mapping simple: "venta" -> "Sale", "alquiler" -> "Rent"
-        op = filters["operation"].lower()
-        if "venta" in op or "buy" in op: query = query.filter(models.Property.operation == "Sale")
-        elif "alquil" in op or "rent" in op: query = query.filter(models.Property.operation == "Rent")
-    
-    if filters.get("type"):
-        # Búsqueda inexacta: "casa" in "House", "depto" in "Apartment"
-        t = filters["type"].lower()
-        if "casa" in t: query = query.filter(models.Property.type == "House")
-        elif "depto" in t or "departamento" in t: query = query.filter(models.Property.type == "Apartment")
-        elif "ph" in t: query = query.filter(models.Property.type == "PH")
-        elif "terreno" in t or "lote" in t: query = query.filter(models.Property.type == "Land")
-
-    if filters.get("rooms"):
-        try:
-            r = int(filters["rooms"])
-            query = query.filter(models.Property.rooms >= r)
-        except: pass
-
-    if filters.get("price_min"):
-        query = query.filter(models.Property.price >= float(filters["price_min"]))
-    
-    if filters.get("price_max"):
-        query = query.filter(models.Property.price <= float(filters["price_max"]))
 
-    if filters.get("neighborhood"):
-        # Búsqueda Case-Insensitive en Postgres
-        n = f"%{filters['neighborhood']}%"
-        query = query.filter(models.Property.neighborhood.ilike(n))
+    rooms = None
+    try:
+        rooms = int(filters["rooms"]) if filters.get("rooms") else None
+    except (TypeError, ValueError): pass
+
+    # amenities: lista o "pool,pets"
+    amenities = filters.get("amenities") or None
+    if isinstance(amenities, str):
+        amenities = [a.strip() for a in amenities.split(",")]
+
+    # Mapping "venta" -> "Sale", "depto" -> "Apartment", etc. (compartido con bot_engine)
+    conditions = search.property_filters(
+        tenant_id=tenant_id or None,
+        status="Active",
+        operation=search.normalize_operation(filters.get("operation")),
+        property_type=search.normalize_property_type(filters.get("type")),
+        min_price=float(filters["price_min"]) if filters.get("price_min") else None,
+        max_price=float(filters["price_max"]) if filters.get("price_max") else None,
+        min_rooms=rooms,
+        neighborhood=filters.get("neighborhood"),
+        amenities=amenities,
+        dialect=db.get_bind().dialect.name,
+    )
 
     # Limitar resultados para no saturar el contexto de la IA
-    results = query.limit(5).all()
+    results = [p for p, _ in search.search_properties(db, filters.get("query"), conditions, limit=5)]
     
     # Formatear salida "light" para LLM
     output = []
@@ -227,133 +231,19 @@ def bot_search_properties(filters: dict = Body(...), db: Session = Depends(get_d
     return output
 
 @router.get("/{instance_name}/availability")
-def check_bot_availability(instance_name: str, date: str = None, days: int = 3, property_id: int = None, db: Session = Depends(get_db)):
+async def check_bot_availability(instance_name: str, date: str = None, days: int = 3, property_id: int = None, step: int = None, db: AsyncSession = Depends(get_async_db)):
     """
     Endpoint público (o protegido por token estático) para consultar agenda.
-    Devuelve slots libres.
-    - Si se especifica property_id: Usa los horarios y límites de esa propiedad.
+    Devuelve slots libres (con el cupo que les queda).
+    - Si se especifica property_id: Usa los horarios, duración de visita y cupo de esa propiedad.
     - Si no: Usa los horarios generales del Bot.
+    - step: minutos entre el inicio de un slot y el siguiente (default: la duración de la visita).
     """
-    bot = db.query(models.Bot).filter(models.Bot.instance_name == instance_name).first()
-    if not bot: raise HTTPException(404, "Bot instance not found")
-
-    user = db.query(models.User).filter(models.User.id == bot.user_id).first()
-    user_id = bot.user_id # El agente dueño del bot
-    
-    # Si hay propiedad, cargamos su config
-    prop_config = None
-    if property_id:
-        prop = db.query(models.Property).filter(
-            models.Property.id == property_id,
-            models.Property.tenant_id == user.tenant_id
-        ).first()
-        if not prop or prop.status == "Deleted": raise HTTPException(404, "Property not found of not enabled.")
-        prop_config = prop
-    
-    # Fecha base (hoy o la solicitada)
-    from datetime import datetime, timedelta
-    start_date = datetime.strptime(date, "%Y-%m-%d") if date else datetime.now()
-    
-    available_slots = []
-    
-    # Analizar próximos N días
-    for i in range(days):
-        current_day = start_date + timedelta(days=i)
-        day_str = current_day.strftime("%a") # Mon, Tue...
-        date_str = current_day.strftime("%Y-%m-%d")
-
-        # 1. Determinar Configuración de Horario (Propiedad vs Bot)
-        if prop_config:
-            # Usar configuración de la propiedad si existe para ese día
-            # La estructura es { "Mon": { "enabled": true, "start": "09:00", "end": "10:00" } }
-            schedule = prop_config.visit_availability.get(day_str)
-            if not schedule: schedule = {"enabled": False} # Default closed per property logic if missing
-        else:
-            # Fallback a horario del bot
-            schedule = bot.business_hours.get(day_str)
-
-        if not schedule or not schedule.get("enabled"):
-            continue # Día no laboral / no disponible
-
-        try:
-            work_start = datetime.strptime(f"{date_str} {schedule['start']}", "%Y-%m-%d %H:%M")
-            work_end = datetime.strptime(f"{date_str} {schedule['end']}", "%Y-%m-%d %H:%M")
-        except ValueError:
-            continue # Error en formato de hora
-
-        # 2. Buscar eventos RELEVANTES:
-        # - El bot es "General", no debe bloquearse por la agenda personal de un agente.
-        # - Solo nos importa la Ocupación de la Propiedad (Concurrencia).
-        
-        query_filters = [
-            models.CalendarEvent.start_time >= work_start,
-            models.CalendarEvent.start_time < work_end,
-            models.CalendarEvent.status != "CANCELLED"
-        ]
-        
-        # Filtro principal: SOLO Propiedad
-        # Si no hay propiedad configurada, no podemos validar cupo, asi que asumimos libre (o logica default futura)
-        if property_id:
-             query_filters.append(models.CalendarEvent.property_id == prop_config.id)
-        else:
-             # Si es una consulta génerica sin propiedad, ahi SI miramos el calendario del agente por defecto?
-             # El usuario pidió: "calendario general... dentista no deberia bloquear"
-             # Por seguridad, si no es propiedad específica, no bloqueamos nada (Open Calendar) o mantenemos agente
-             # Decisión: Si no hay propiedad, mantenemos comportamiento previo (agente), si hay propiedad, SOLO propiedad.
-             query_filters.append(models.CalendarEvent.agent_id == user_id)
-
-        events = db.query(models.CalendarEvent).filter(*query_filters).all()
-
-        # 3. Calcular huecos (bloques de 30 min o visit_duration)
-        slot_duration_minutes = prop_config.visit_duration if prop_config else 30
-        
-        curr_slot = work_start
-        while curr_slot + timedelta(minutes=slot_duration_minutes) <= work_end:
-            slot_end = curr_slot + timedelta(minutes=slot_duration_minutes)
-            
-            # Verificar colisión
-            # Lógica:
-            # - Si NO es propiedad: cualquier evento bloquea.
-            # - Si ES propiedad:
-            #    - Eventos de OTRA cosa bloquean.
-            #    - Eventos de ESTA propiedad cuentan para el cupo (max_simultaneous).
-            
-            is_blocked = False
-            simultaneous_count = 0
-            
-            for e in events:
-                # Si hay solapamiento de tiempo
-                if not (slot_end <= e.start_time or curr_slot >= e.end_time):
-                    if prop_config:
-                        # Solo contamos eventos de ESTA propiedad
-                        if e.property_id == prop_config.id:
-                            simultaneous_count += 1
-                        # Ignoramos eventos personales u otras propiedades
-                    else:
-                        is_blocked = True
-                        break
-            
-            # Validar cupo si es propiedad
-            if prop_config:
-                if simultaneous_count >= prop_config.max_simultaneous_visits:
-                    is_blocked = True
-                else: 
-                    # IMPORTANTE: Si no se alcanzó el cupo, está LIBRE, sin importar eventos personales
-                    is_blocked = False
-            
-            if not is_blocked:
-                available_slots.append({
-                    "date": date_str,
-                    "day": day_str,
-                    "start": curr_slot.strftime("%H:%M"),
-                    "end": slot_end.strftime("%H:%M")
-                })
-            
-            curr_slot = slot_end # Avanzar al siguiente bloque contiguous
-            # Ojo: si queremos slots cada 30 min pero visitas de 60, el step debería ser 30 o 60?
-            # Por simplicidad, step = duration.
-
-    return {"available_slots": available_slots}
+    # Una consulta por rango + sweep-line, mismo motor que la tool del bot (ver availability.py)
+    try:
+        return await db.run_sync(lambda session: availability.bot_availability(session, instance_name, date, days, property_id, step))
+    except LookupError as e:
+        raise HTTPException(404, str(e))
 
 
 @router.get("/{instance_name}/public-config")
@@ -374,38 +264,35 @@ def get_bot_public_config(instance_name: str, db: Session = Depends(get_db)):
     }
 
 @router.get("/conversations/list")
-def get_bot_conversations(skip: int = 0, limit: int = 20, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
+def get_bot_conversations(skip: int = 0, limit: int = 20, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     """
     Lista las conversaciones activas del bot.
     """
-    user = db.query(models.User).filter(models.User.email == email).first()
     # Idealmente filtrar por bot/tenant, por simplicidad:
     convs = db.query(models.BotConversation).order_by(models.BotConversation.last_message_at.desc()).offset(skip).limit(limit).all()
-    
-    result = []
-    from sqlalchemy import func
-    for c in convs:
-        c_dict = {
-            "phone": c.phone,
-            "last_message_at": c.last_message_at,
-            "last_sender": c.last_sender,
-            "followup_sent": c.followup_sent,
-            "contact_name": None
-        }
-        
-        raw_phone = c.phone.replace('@s.whatsapp.net', '')
-        if raw_phone:
-            search_suffix = raw_phone[-8:] if len(raw_phone) >= 8 else raw_phone
-            contact = db.query(models.Contact).filter(
-                models.Contact.tenant_id == user.tenant_id,
-                func.regexp_replace(models.Contact.phone, '[^0-9]', '', 'g').ilike(f"%{search_suffix}")
-            ).first()
-            if contact:
-                c_dict["contact_name"] = contact.name
-        
-        result.append(c_dict)
-        
-    return result
+
+    # Nombres de contacto en una sola consulta (antes: una por conversación), por sufijo del teléfono normalizado
+    suffixes = {c.phone: phones.phone_suffix(c.phone) for c in convs}
+    names = {}
+    wanted = {s for s in suffixes.values() if s}
+    if wanted:
+        dialect = db.get_bind().dialect.name
+        contacts = db.query(models.Contact.name, models.Contact.phone_normalized).filter(
+            models.Contact.tenant_id == user.tenant_id,
+            phones.suffixes_condition(models.Contact.phone_normalized, wanted, dialect)
+        ).order_by(models.Contact.id).all()
+        for name, normalized in contacts:
+            for suffix in wanted:
+                if normalized.endswith(suffix):
+                    names.setdefault(suffix, name)
+
+    return [{
+        "phone": c.phone,
+        "last_message_at": c.last_message_at,
+        "last_sender": c.last_sender,
+        "followup_sent": c.followup_sent,
+        "contact_name": names.get(suffixes[c.phone])
+    } for c in convs]
 
 @router.get("/conversations/{phone}/messages")
 def get_conversation_messages(phone: str, limit: int = 50, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
@@ -417,12 +304,8 @@ def get_conversation_messages(phone: str, limit: int = 50, db: Session = Depends
 
 
 @router.get('/analytics')
-def get_bot_analytics(period: str = '7D', db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
-    
+def get_bot_analytics(period: str = '7D', db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     from datetime import datetime, timedelta, timezone
-    from sqlalchemy import func
-    import json
     import math
     
     now = datetime.now(timezone.utc)
@@ -436,21 +319,16 @@ def get_bot_analytics(period: str = '7D', db: Session = Depends(get_db), email:
         start_date = now - timedelta(days=7)
         
     start_date_naive = start_date.replace(tzinfo=None)
+    now_naive = now.replace(tzinfo=None)
+    tenant_id = user.tenant_id
 
-    # 1. Active Conversations
-    total_convs = db.query(models.BotConversation).filter(models.BotConversation.last_message_at >= start_date_naive).count()
+    # Todo se agrega en SQL (analytics.py): la memoria no crece con el largo del período
+    # 1. Active Conversations (remitentes con mensajes del tenant en el período)
+    total_convs = analytics.active_conversations(db, tenant_id, start_date_naive, now_naive)
     
     # 2. Hot Leads
-    hot_leads = db.query(models.Contact).filter(
-        models.Contact.tenant_id == user.tenant_id, 
-        models.Contact.status == 'HOT',
-        models.Contact.created_at >= start_date_naive
-    ).count()
-
-    total_leads_in_period = db.query(models.Contact).filter(
-        models.Contact.tenant_id == user.tenant_id,
-        models.Contact.created_at >= start_date_naive
-    ).count()
+    leads = analytics.lead_counts(db, tenant_id, start_date_naive)
+    hot_leads, total_leads_in_period = leads["hot"], leads["total"]
     
     conversion_rate = f"{(hot_leads / total_leads_in_period * 100) if total_leads_in_period > 0 else 0:.1f}%"
     
@@ -461,23 +339,9 @@ def get_bot_analytics(period: str = '7D', db: Session = Depends(get_db), email:
     else:
         prev_start_date_naive = (start_date - length).replace(tzinfo=None)
         
-    prev_total_convs = db.query(models.BotConversation).filter(
-        models.BotConversation.last_message_at >= prev_start_date_naive,
-        models.BotConversation.last_message_at < start_date_naive
-    ).count()
-
-    prev_hot_leads = db.query(models.Contact).filter(
-        models.Contact.tenant_id == user.tenant_id, 
-        models.Contact.status == 'HOT',
-        models.Contact.created_at >= prev_start_date_naive,
-        models.Contact.created_at < start_date_naive
-    ).count()
-    
-    prev_total_leads = db.query(models.Contact).filter(
-        models.Contact.tenant_id == user.tenant_id,
-        models.Contact.created_at >= prev_start_date_naive,
-        models.Contact.created_at < start_date_naive
-    ).count()
+    prev_total_convs = analytics.active_conversations(db, tenant_id, prev_start_date_naive, start_date_naive)
+    prev_leads = analytics.lead_counts(db, tenant_id, prev_start_date_naive, start_date_naive)
+    prev_hot_leads, prev_total_leads = prev_leads["hot"], prev_leads["total"]
     
     prev_conv_rate = (prev_hot_leads / prev_total_leads * 100) if prev_total_leads > 0 else 0
     curr_conv_rate_num = (hot_leads / total_leads_in_period * 100) if total_leads_in_period > 0 else 0
@@ -490,14 +354,8 @@ def get_bot_analytics(period: str = '7D', db: Session = Depends(get_db), email:
         return {"value": val_str, "isUp": diff >= 0}
     
     # 3. Sentiment Data
-    sentiments = db.query(models.Contact.lead_sentiment, func.count(models.Contact.id)).filter(
-        models.Contact.tenant_id == user.tenant_id,
-        models.Contact.created_at >= start_date_naive
-    ).group_by(models.Contact.lead_sentiment).all()
-    
     sentiment_map = {"POSITIVO": 0, "NEUTRO": 0, "NEUTRAL": 0, "NEGATIVO": 0}
-    for s, count in sentiments:
-        if s: sentiment_map[s.upper()] = count
+    sentiment_map.update(analytics.sentiment_counts(db, tenant_id, start_date_naive))
     
     total_sents = sum(sentiment_map.values())
     def get_perc(val): return int(val/total_sents*100) if total_sents > 0 else 0
@@ -509,75 +367,24 @@ def get_bot_analytics(period: str = '7D', db: Session = Depends(get_db), email:
     ]
 
     # 4. Activity Data & Response time
-    activity_data = []
-    days_to_gen = (now - start_date).days
-    
-    messages = db.query(models.ChatHistory).filter(models.ChatHistory.created_at >= start_date_naive).order_by(models.ChatHistory.sender_id, models.ChatHistory.created_at).all()
-    
-    avg_response_time = "1.3s"
-    rt_count = 0
-    rt_total = 0
-    last_u_time = None
-    last_s_id = None
-    
-    for m in messages:
-        if m.sender_id != last_s_id:
-            last_u_time = None
-            last_s_id = m.sender_id
-            
-        role = str(m.role).lower() if m.role else ''
-        if role == 'user':
-            last_u_time = m.created_at
-        elif role in ['model', 'assistant', 'bot'] and last_u_time:
-            diff = (m.created_at - last_u_time).total_seconds()
-            if 0 <= diff < 300: # 5 minutes max to be considered a direct response
-                rt_total += diff
-                rt_count += 1
-            last_u_time = None
-            
-    if rt_count > 0:
-        avg_rt = rt_total / rt_count
-        avg_response_time = f"{avg_rt:.1f}s"
-    else:
-        avg_response_time = "0.0s"
-    
-    def to_utc(dt):
-        return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+    avg_rt = analytics.response_time(db, tenant_id, start_date_naive, now_naive)
+    avg_response_time = f"{avg_rt:.1f}s" if avg_rt is not None else "0.0s"
 
+    days_to_gen = (now - start_date).days
     if days_to_gen <= 1:
-        slots = 8
-        step_hours = 24 / slots
-        for i in range(slots):
-            slot_start = start_date + timedelta(hours=i*step_hours)
-            slot_end = start_date + timedelta(hours=(i+1)*step_hours)
-            msgs_in_slot = [m for m in messages if slot_start <= to_utc(m.created_at) < slot_end]
-            activity_data.append({
-                'time': slot_end.strftime('%H:%M'),
-                'messages': len(msgs_in_slot),
-                'conversions': math.ceil(len(msgs_in_slot) * 0.05)
-            })
+        slots, label = 8, '%H:%M'
     else:
-        slots = min(days_to_gen, 7)
-        step_days = days_to_gen / slots
-        for i in range(slots):
-            slot_start = start_date + timedelta(days=i*step_days)
-            slot_end = start_date + timedelta(days=(i+1)*step_days)
-            msgs_in_slot = [m for m in messages if slot_start <= to_utc(m.created_at) < slot_end]
-            activity_data.append({
-                'time': slot_end.strftime('%d/%m'),
-                'messages': len(msgs_in_slot),
-                'conversions': math.ceil(len(msgs_in_slot) * 0.05)
-            })
+        slots, label = min(days_to_gen, 7), '%d/%m'
+    step = (now - start_date) / slots
+    counts = analytics.activity_buckets(db, tenant_id, start_date_naive, now_naive, slots)
+    activity_data = [{
+        'time': (start_date + step * (i + 1)).strftime(label),
+        'messages': count,
+        'conversions': math.ceil(count * 0.05)
+    } for i, count in enumerate(counts)]
 
     # 5. Topic Data
-    topic_counts = {'Precios': 0, 'Agendar Visita': 0, 'Financiación': 0, 'Ubicación': 0, 'Requisitos': 0}
-    for m in messages:
-        text = str(m.parts).lower()
-        if 'precio' in text or 'cuanto' in text or 'cuánto' in text or 'valor' in text: topic_counts['Precios'] += 1
-        if 'visita' in text or 'ver' in text or 'mostrar' in text or 'agendar' in text: topic_counts['Agendar Visita'] += 1
-        if 'financia' in text or 'cuota' in text or 'credito' in text or 'crédito' in text: topic_counts['Financiación'] += 1
-        if 'ubicacion' in text or 'ubicación' in text or 'dónde' in text or 'donde' in text or 'zona' in text: topic_counts['Ubicación'] += 1
-        if 'requisit' in text or 'garant' in text or 'recibo' in text: topic_counts['Requisitos'] += 1
+    topic_counts = analytics.topic_counts(db, tenant_id, start_date_naive, now_naive)
         
     topic_data = [{'name': k, 'count': v} for k, v in topic_counts.items() if v > 0]
     if not topic_data:
@@ -4,18 +4,16 @@ from sqlalchemy.orm import Session
 from typing import List
 import models, schemas
 from database import get_db
-from auth import get_current_user_email
+from auth import Principal, get_current_principal
 
 router = APIRouter()
 
 @router.get("", response_model=List[schemas.BranchResponse])
-def list_branches(db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
+def list_branches(db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     return db.query(models.Branch).filter(models.Branch.tenant_id == user.tenant_id).all()
 
 @router.post("", response_model=schemas.BranchResponse)
-def create_branch(branch: schemas.BranchCreate, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
+def create_branch(branch: schemas.BranchCreate, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     db_branch = models.Branch(**branch.dict(), tenant_id=user.tenant_id)
     db.add(db_branch)
     db.commit()
@@ -23,8 +21,7 @@ def create_branch(branch: schemas.BranchCreate, db: Session = Depends(get_db), e
     return db_branch
 
 @router.put("/{id}", response_model=schemas.BranchResponse)
-def update_branch(id: int, branch: schemas.BranchCreate, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
+def update_branch(id: int, branch: schemas.BranchCreate, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     db_branch = db.query(models.Branch).filter(models.Branch.id == id, models.Branch.tenant_id == user.tenant_id).first()
     if not db_branch: raise HTTPException(404)
     for k, v in branch.dict().items(): setattr(db_branch, k, v)
@@ -33,8 +30,7 @@ def update_branch(id: int, branch: schemas.BranchCreate, db: Session = Depends(g
     return db_branch
 
 @router.delete("/{id}")
-def delete_branch(id: int, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
+def delete_branch(id: int, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     db_branch = db.query(models.Branch).filter(models.Branch.id == id, models.Branch.tenant_id == user.tenant_id).first()
     if not db_branch: raise HTTPException(404)
     db.delete(db_branch)
@@ -3,7 +3,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
 from database import get_db
-from auth import get_current_user_email
+from auth import Principal, get_current_principal
 import models, schemas
 
 from routers.google import get_valid_google_token
@@ -14,15 +14,13 @@ from datetime import datetime, timezone
 router = APIRouter()
 
 @router.get("/events", response_model=List[schemas.EventResponse])
-def list_events(db: Session = Depends(get_db), current_email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == current_email).first()
+def list_events(db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     if user.role in ["SUPER_ADMIN", "BROKER_ADMIN"]: 
         return db.query(models.CalendarEvent).filter(models.CalendarEvent.status != 'CANCELLED', models.CalendarEvent.tenant_id == user.tenant_id).all()
     return db.query(models.CalendarEvent).filter(models.CalendarEvent.agent_id == user.id, models.CalendarEvent.status != 'CANCELLED').all()
 
 @router.post("/events", response_model=schemas.EventResponse)
-def create_event(data: schemas.EventCreate, db: Session = Depends(get_db), current_email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == current_email).first()
+def create_event(data: schemas.EventCreate, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     db_event = models.CalendarEvent(**data.dict(), agent_id=user.id, tenant_id=user.tenant_id)
     db.add(db_event)
     db.add(models.ActivityLog(user_id=user.id, action="CREATE", entity_type="EVENT", entity_id=None, description=f"Agendó: {db_event.title}"))
@@ -39,7 +37,8 @@ def create_event(data: schemas.EventCreate, db: Session = Depends(get_db), curre
     
     # INTENTO SYNC GOOGLE
     try:
-        token = get_valid_google_token(user, db)
+        # La fila completa (tokens de Google) solo hace falta para sincronizar
+        token = get_valid_google_token(db.get(models.User, user.id), db)
         if token:
             print(f"Syncing event {db_event.id} to Google Calendar...")
             google_body = {
@@ -73,17 +72,15 @@ def create_event(data: schemas.EventCreate, db: Session = Depends(get_db), curre
     return db_event
 
 @router.delete("/events/{id}")
-def delete_event(id: int, db: Session = Depends(get_db), current_email: str = Depends(get_current_user_email)):
-    # Necesitamos current_email para obtener el usuario y su token para borrar en Google
-    user = db.query(models.User).filter(models.User.email == current_email).first()
-    
+def delete_event(id: int, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     event = db.query(models.CalendarEvent).filter(models.CalendarEvent.id == id, models.CalendarEvent.tenant_id == user.tenant_id).first()
     if not event: raise HTTPException(404)
     
     # INTENTO DELETE GOOGLE
     if event.google_event_id:
         try:
-            token = get_valid_google_token(user, db)
+            # Necesitamos la fila del usuario para su token de Google
+            token = get_valid_google_token(db.get(models.User, user.id), db)
             if token:
                 requests.delete(
                     f"https://www.googleapis.com/calendar/v3/calendars/primary/events/{event.google_event_id}",
@@ -97,8 +94,7 @@ def delete_event(id: int, db: Session = Depends(get_db), current_email: str = De
     return {"status": "ok"}
 
 @router.put("/events/{id}", response_model=schemas.EventResponse)
-def update_event(id: int, data: schemas.EventCreate, db: Session = Depends(get_db), current_email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == current_email).first()
+def update_event(id: int, data: schemas.EventCreate, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     event = db.query(models.CalendarEvent).filter(models.CalendarEvent.id == id, models.CalendarEvent.tenant_id == user.tenant_id).first()
     
     if not event:
@@ -5,7 +5,7 @@ from sqlalchemy.orm import Session
 import models, schemas
 from database import get_db
 
-from auth import get_current_user_email
+from auth import Principal, get_current_principal, get_current_user_email
 
 router = APIRouter()
 
@@ -38,17 +38,15 @@ def get_maps_key(db: Session = Depends(get_db)):
 
 # CONFIGURACIÓN ADMIN (Para el Super Admin)
 @router.get("/admin/config/google_maps_key")
-def get_admin_maps_key(db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
+def get_admin_maps_key(db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     # Simple auth check
-    user = db.query(models.User).filter(models.User.email == email).first()
     if user.role != "BROKER_ADMIN" and user.role != "SUPERADMIN":
          raise HTTPException(status_code=403, detail="Forbidden")
     cfg = db.query(models.SystemConfig).filter(models.SystemConfig.key == "google_maps_key").first()
     return {"value": cfg.value if cfg else ""}
 
 @router.put("/admin/config/google_maps_key")
-def set_admin_maps_key(data: schemas.ConfigUpdate, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
+def set_admin_maps_key(data: schemas.ConfigUpdate, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     if user.role != "BROKER_ADMIN" and user.role != "SUPERADMIN":
          raise HTTPException(status_code=403, detail="Forbidden")
     cfg = db.query(models.SystemConfig).filter(models.SystemConfig.key == "google_maps_key").first()
@@ -1,39 +1,56 @@
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Dict
 import models, schemas
-from database import get_db
-from auth import get_current_user_email
+import phones
+import pagination
+import serialization
+from database import get_db, get_async_db
+from auth import Principal, get_current_principal
 
 router = APIRouter()
 
+CONTACT_ORDER = (models.Contact.id,)
+INTERACTION_ORDER = (models.ContactInteraction.date, models.ContactInteraction.id)
+
 @router.get("", response_model=List[schemas.ContactResponse])
-def list_contacts(search: str = None, limit: int = 1000, offset: int = 0, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
-    query = db.query(models.Contact).filter(models.Contact.tenant_id == user.tenant_id)
+async def list_contacts(response: Response, search: str = None, cursor: str = None, limit: int = None, fields: str = None, db: AsyncSession = Depends(get_async_db), user: Principal = Depends(get_current_principal)):
+    """Más nuevos primero, paginado por cursor (header X-Next-Cursor, ver pagination.py). ?fields= recorta columnas."""
+    limit = pagination.page_size(limit, cursor, unpaged=1000)
+    names = serialization.parse_fields(fields, schemas.ContactResponse, models.Contact)
+    query = select(models.Contact).where(models.Contact.tenant_id == user.tenant_id)
+    if names:
+        query = query.options(serialization.load_fields(models.Contact, names))
     
     if search:
         search_term = f"%{search}%"
-        query = query.filter(
+        query = query.where(
             (models.Contact.name.ilike(search_term)) | 
             (models.Contact.email.ilike(search_term)) |
             (models.Contact.phone.ilike(search_term))
         )
         
-    return query.order_by(models.Contact.id.desc()).limit(limit).offset(offset).all()
+    contacts, next_cursor = pagination.split_page(
+        (await db.scalars(pagination.keyset(query, CONTACT_ORDER, cursor, limit))).all(), CONTACT_ORDER, limit
+    )
+    pagination.set_next_cursor(response, next_cursor)
+    if names:
+        return serialization.sparse_response(contacts, schemas.ContactResponse, names, response)
+    return contacts
 
 @router.post("", response_model=schemas.ContactResponse)
-def create_contact(contact: schemas.ContactCreate, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
-    
+def create_contact(contact: schemas.ContactCreate, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     # Check duplicates
     from sqlalchemy import or_
     filters = []
     if contact.email:
         filters.append(models.Contact.email == contact.email)
-    if contact.phone:
-        filters.append(models.Contact.phone == contact.phone)
+    phone_normalized = phones.normalize_phone(contact.phone)
+    if phone_normalized:
+        filters.append(models.Contact.phone_normalized == phone_normalized)
         
     if filters:
         existing = db.query(models.Contact).filter(
@@ -45,7 +62,7 @@ def create_contact(contact: schemas.ContactCreate, db: Session = Depends(get_db)
             msg = "Contact already exists"
             if contact.email and existing.email == contact.email:
                 msg = "Email already registered"
-            elif contact.phone and existing.phone == contact.phone:
+            elif phone_normalized and existing.phone_normalized == phone_normalized:
                 msg = "Phone already registered"
             raise HTTPException(status_code=400, detail=msg)
 
@@ -65,15 +82,15 @@ def create_contact(contact: schemas.ContactCreate, db: Session = Depends(get_db)
     return db_contact
 
 @router.get("/{id}", response_model=schemas.ContactResponse)
-def get_contact(id: int, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
-    contact = db.query(models.Contact).filter(models.Contact.id == id, models.Contact.tenant_id == user.tenant_id).first()
+async def get_contact(id: int, db: AsyncSession = Depends(get_async_db), user: Principal = Depends(get_current_principal)):
+    contact = await db.scalar(select(models.Contact).where(
+        models.Contact.id == id, models.Contact.tenant_id == user.tenant_id
+    ))
     if not contact: raise HTTPException(404)
     return contact
 
 @router.put("/{id}", response_model=schemas.ContactResponse)
-def update_contact(id: int, data: schemas.ContactCreate, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
+def update_contact(id: int, data: schemas.ContactCreate, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     contact = db.query(models.Contact).filter(models.Contact.id == id, models.Contact.tenant_id == user.tenant_id).first()
     old_data = {k: getattr(contact, k) for k in data.dict(exclude_unset=True).keys()}
     for k, v in data.dict(exclude_unset=True).items(): 
@@ -95,14 +112,11 @@ def update_contact(id: int, data: schemas.ContactCreate, db: Session = Depends(g
     return contact
 
 @router.delete("/{id}", status_code=204)
-def delete_contact(id: int, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
+def delete_contact(id: int, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     contact = db.query(models.Contact).filter(models.Contact.id == id, models.Contact.tenant_id == user.tenant_id).first()
     if not contact:
         raise HTTPException(status_code=404, detail="Contact not found")
     
-    user = db.query(models.User).filter(models.User.email == email).first()
-    
     # Log deletion
     db.add(models.ActivityLog(
         user_id=user.id, 
@@ -117,19 +131,20 @@ def delete_contact(id: int, db: Session = Depends(get_db), email: str = Depends(
     return None
 
 @router.get("/{id}/interactions", response_model=List[schemas.InteractionResponse])
-def list_interactions(id: int, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
-    contact = db.query(models.Contact).filter(models.Contact.id == id, models.Contact.tenant_id == user.tenant_id).first()
-    if not contact: raise HTTPException(404, "Contact not found")
+async def list_interactions(id: int, response: Response, cursor: str = None, limit: int = None, db: AsyncSession = Depends(get_async_db), user: Principal = Depends(get_current_principal)):
+    contact_id = await db.scalar(select(models.Contact.id).where(models.Contact.id == id, models.Contact.tenant_id == user.tenant_id))
+    if not contact_id: raise HTTPException(404, "Contact not found")
     
-    return db.query(models.ContactInteraction).join(models.Contact).filter(
-        models.ContactInteraction.contact_id == id,
-        models.Contact.tenant_id == user.tenant_id
-    ).order_by(models.ContactInteraction.date.desc()).all()
+    limit = pagination.page_size(limit, cursor, unpaged=pagination.UNBOUNDED)
+    query = select(models.ContactInteraction).where(models.ContactInteraction.contact_id == id)
+    interactions, next_cursor = pagination.split_page(
+        (await db.scalars(pagination.keyset(query, INTERACTION_ORDER, cursor, limit))).all(), INTERACTION_ORDER, limit
+    )
+    pagination.set_next_cursor(response, next_cursor)
+    return interactions
 
 @router.post("/{id}/interactions", response_model=schemas.InteractionResponse)
-def create_interaction(id: int, interaction: schemas.InteractionCreate, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
+def create_interaction(id: int, interaction: schemas.InteractionCreate, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     contact = db.query(models.Contact).filter(models.Contact.id == id, models.Contact.tenant_id == user.tenant_id).first()
     if not contact: raise HTTPException(404, "Contact not found")
     
@@ -151,8 +166,7 @@ def create_interaction(id: int, interaction: schemas.InteractionCreate, db: Sess
     return db_interaction
 
 @router.post("/{id}/reminders", response_model=schemas.EventResponse)
-def create_reminder(id: int, event: schemas.EventCreate, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
+def create_reminder(id: int, event: schemas.EventCreate, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     contact = db.query(models.Contact).filter(models.Contact.id == id, models.Contact.tenant_id == user.tenant_id).first()
     if not contact: raise HTTPException(404, "Contact not found")
     
@@ -172,12 +186,11 @@ def create_reminder(id: int, event: schemas.EventCreate, db: Session = Depends(g
     return db_event
 
 @router.post("/import/google", response_model=Dict)
-def import_contacts_from_google(db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
+def import_contacts_from_google(db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     from .google import get_valid_google_token
     import requests
     
-    user = db.query(models.User).filter(models.User.email == email).first()
-    token = get_valid_google_token(user, db)
+    token = get_valid_google_token(db.get(models.User, user.id), db)
     
     if not token:
         raise HTTPException(400, "Google account not connected or token invalid")
@@ -225,7 +238,7 @@ def import_contacts_from_google(db: Session = Depends(get_db), email: str = Depe
             if contact_email:
                 existing = db.query(models.Contact).filter(models.Contact.tenant_id == user.tenant_id, models.Contact.email == contact_email).first()
             if not existing and contact_phone:
-                existing = db.query(models.Contact).filter(models.Contact.tenant_id == user.tenant_id, models.Contact.phone == contact_phone).first()
+                existing = db.query(models.Contact).filter(models.Contact.tenant_id == user.tenant_id, models.Contact.phone_normalized == phones.normalize_phone(contact_phone)).first()
                 
             if existing:
                 skipped_count += 1
@@ -1,29 +1,27 @@
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 from typing import List
 from database import get_db
-from auth import get_current_user_email
+from auth import Principal, get_current_principal
 import models, schemas
 import uuid
-from . import ai_service
+import job_queue
+import pagination
+import serialization
 
 router = APIRouter()
 
-def sync_development_ai(db: Session, dev: models.Development):
-    """
-    Genera el string de contexto y obtiene el embedding de Gemini para proyectos.
-    """
-    context_str = ai_service.generate_development_context_string(dev)
-    vector = ai_service.get_embedding(context_str)
-    if vector:
-        dev.embedding_proyecto = vector
-        db.commit()
+DEVELOPMENT_ORDER = (models.Development.id,)
 
 @router.get("", response_model=List[schemas.DevelopmentResponse])
-def list_developments(search: str = None, limit: int = 1000, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
+def list_developments(response: Response, search: str = None, cursor: str = None, limit: int = None, fields: str = None, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
+    """Más nuevos primero, paginado por cursor (header X-Next-Cursor, ver pagination.py). ?fields= recorta columnas."""
+    limit = pagination.page_size(limit, cursor, unpaged=1000)
+    names = serialization.parse_fields(fields, schemas.DevelopmentResponse, models.Development)
     query = db.query(models.Development).filter(models.Development.tenant_id == user.tenant_id)
+    if names:
+        query = query.options(serialization.load_fields(models.Development, names))
     
     if search:
         search_term = f"%{search}%"
@@ -33,18 +31,22 @@ def list_developments(search: str = None, limit: int = 1000, db: Session = Depen
             (models.Development.code.ilike(search_term))
         )
         
-    return query.order_by(models.Development.id.desc()).limit(limit).all()
+    developments, next_cursor = pagination.split_page(
+        pagination.keyset(query, DEVELOPMENT_ORDER, cursor, limit).all(), DEVELOPMENT_ORDER, limit
+    )
+    pagination.set_next_cursor(response, next_cursor)
+    if names:
+        return serialization.sparse_response(developments, schemas.DevelopmentResponse, names, response)
+    return developments
 
 @router.get("/{dev_id}", response_model=schemas.DevelopmentResponse)
-def get_development(dev_id: int, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
+def get_development(dev_id: int, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     dev = db.query(models.Development).filter(models.Development.id == dev_id, models.Development.tenant_id == user.tenant_id).first()
     if not dev: raise HTTPException(404, "Emprendimiento no encontrado")
     return dev
 
 @router.post("", response_model=schemas.DevelopmentResponse)
-def create_development(dev: schemas.DevelopmentCreate, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
+def create_development(dev: schemas.DevelopmentCreate, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     new_code = f"URB-D{uuid.uuid4().hex[:5].upper()}"
     
     db_dev = models.Development(**dev.dict(exclude={"typologies", "units"}), code=new_code, tenant_id=user.tenant_id)
@@ -55,19 +57,16 @@ def create_development(dev: schemas.DevelopmentCreate, db: Session = Depends(get
     for t in dev.typologies:
         db.add(models.Typology(**t.dict(), development_id=db_dev.id))
     
-    db.commit()
-    db.refresh(db_dev)
-
-    # Pipeline IA
-    sync_development_ai(db, db_dev)
+    # Pipeline IA en Background (job persistente, ya no bloquea el request)
+    job_queue.enqueue(db, job_queue.DEVELOPMENT_AI_SYNC, db_dev.id)
     
     db.add(models.ActivityLog(user_id=user.id, action="CREATE", entity_type="DEVELOPMENT", entity_id=db_dev.id, description=f"Creó emprendimiento: {db_dev.name}"))
     db.commit()
+    db.refresh(db_dev)
     return db_dev
 
 @router.delete("/{dev_id}")
-def delete_development(dev_id: int, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
+def delete_development(dev_id: int, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     dev = db.query(models.Development).filter(models.Development.id == dev_id, models.Development.tenant_id == user.tenant_id).first()
     if not dev: raise HTTPException(404)
     db.delete(dev)
@@ -1,91 +1,193 @@
-from fastapi import APIRouter, Depends, HTTPException, Response
-from sqlalchemy.orm import Session
-from sqlalchemy import cast, String
+import asyncio
+import threading
+from collections import OrderedDict
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import APIRouter, Depends, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 import xml.etree.ElementTree as ET
 import datetime
 
 import models
-from database import get_db
+import search
+from database import get_async_db
+from settings import settings
 
 router = APIRouter()
 
+# Los portales consultan el feed muy seguido y casi siempre sin cambios. Cada feed renderizado queda en memoria
+# con la versión de inventario del tenant (models.bump_inventory_version): mientras no cambie, se sirve del cache
+# (o 304 si el portal manda ETag / If-Modified-Since). Cuando cambia, se vuelve a generar en streaming desde un
+# cursor server-side, por lotes de feed_yield_per filas y solo con las columnas que van al XML.
+
+FEED_COLUMNS = [
+    models.Property.id, models.Property.code, models.Property.title, models.Property.description,
+    models.Property.type, models.Property.operation, models.Property.currency, models.Property.price,
+    models.Property.address, models.Property.city, models.Property.lat, models.Property.lng,
+    models.Property.surface, models.Property.surface_covered, models.Property.bedrooms, models.Property.bathrooms,
+    models.Property.garages_total, models.Property.rooms, models.Property.condition,
+    models.Property.image, models.Property.gallery,
+]
+
+XML_HEAD = b"<?xml version='1.0' encoding='utf-8'?>\n<properties>"
+XML_TAIL = b"</properties>"
+
+_feeds = OrderedDict() # (tenant_id, portal) -> (version, xml)
+_feeds_lock = threading.Lock()
+_feeds_bytes = 0
+
+def _feed_get(key, version: int):
+    with _feeds_lock:
+        entry = _feeds.get(key)
+        if entry is None or entry[0] != version:
+            return None
+        _feeds.move_to_end(key)
+        return entry[1]
+
+def _feed_put(key, version: int, xml: bytes):
+    global _feeds_bytes
+    with _feeds_lock:
+        previous = _feeds.pop(key, None)
+        if previous:
+            _feeds_bytes -= len(previous[1])
+        _feeds[key] = (version, xml)
+        _feeds_bytes += len(xml)
+        while _feeds_bytes > settings.feed_cache_max_bytes and _feeds:
+            _feeds_bytes -= len(_feeds.popitem(last=False)[1][1])
+
+def clear_feed_cache():
+    global _feeds_bytes
+    with _feeds_lock:
+        _feeds.clear()
+        _feeds_bytes = 0
+
+def not_modified(request: Request, etag: str, last_modified) -> bool:
+    """If-None-Match manda sobre If-Modified-Since (RFC 9110)."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            return last_modified.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
 @router.get("/{tenant_id}/{portal_name}.xml")
-def generate_portal_xml_feed(tenant_id: int, portal_name: str, db: Session = Depends(get_db)):
+async def generate_portal_xml_feed(tenant_id: int, portal_name: str, request: Request, db: AsyncSession = Depends(get_async_db)):
     """
     Genera un XML Feed estandarizado para la sincronización con un portal específico.
     inmobiliarios como Zonaprop, Argenprop, MercadoLibre, etc.
     Funciona recopilando todas las propiedades activas de la agencia (tenant) especificada.
     """
-    
-    query = db.query(models.Property).filter(
+    portal = portal_name.lower()
+    version, updated_at = (await db.execute(
+        select(models.Tenant.inventory_version, models.Tenant.inventory_updated_at).where(models.Tenant.id == tenant_id)
+    )).first() or (0, None)
+    if updated_at and updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=datetime.timezone.utc) # sqlite devuelve naive
+
+    etag = f'"{tenant_id}-{portal}-{version}"'
+    # no-cache: el portal puede guardar el feed pero revalida siempre (barato: 304 sin tocar properties)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if updated_at:
+        headers["Last-Modified"] = format_datetime(updated_at, usegmt=True)
+
+    if not_modified(request, etag, updated_at):
+        return Response(status_code=304, headers=headers)
+
+    cached = _feed_get((tenant_id, portal), version)
+    if cached is not None:
+        return Response(content=cached, media_type="application/xml", headers=headers)
+
+    query = select(*FEED_COLUMNS).where(
         models.Property.tenant_id == tenant_id,
         models.Property.status != "Deleted"
-    )
-    
+    ).order_by(models.Property.id).execution_options(yield_per=settings.feed_yield_per)
+
     # Filtrar solo si especifican un portal válido (ej. mercadolibre, zonaprop)
-    if portal_name.lower() != "all":
-        query = query.filter(cast(models.Property.published_on_portals, String).ilike(f'%"{portal_name}"%'))
-        
-    properties = query.all()
-
-    # Raíz del XML (Estándar tipo TokkoBroker / Inmuebles24 / genérico)
-    root = ET.Element("properties")
-
-    for prop in properties:
-        prop_xml = ET.SubElement(root, "property")
-        
-        ET.SubElement(prop_xml, "id").text = str(prop.id)
-        ET.SubElement(prop_xml, "reference_code").text = prop.code or ""
-        ET.SubElement(prop_xml, "title").text = prop.title or ""
-        ET.SubElement(prop_xml, "description").text = prop.description or ""
-        
-        # Operación y Tipo
-        ET.SubElement(prop_xml, "type").text = str(prop.type)
-        ET.SubElement(prop_xml, "operation").text = str(prop.operation)
-        
-        # Precios
-        prices_xml = ET.SubElement(prop_xml, "prices")
-        price_xml = ET.SubElement(prices_xml, "price")
-        ET.SubElement(price_xml, "currency").text = str(prop.currency)
-        ET.SubElement(price_xml, "amount").text = str(prop.price)
-        
-        # Ubicación
-        loc_xml = ET.SubElement(prop_xml, "location")
-        ET.SubElement(loc_xml, "address").text = str(prop.address)
-        ET.SubElement(loc_xml, "city").text = str(prop.city)
-        ET.SubElement(loc_xml, "latitude").text = str(prop.lat)
-        ET.SubElement(loc_xml, "longitude").text = str(prop.lng)
-        
-        # Superficies y características
-        features_xml = ET.SubElement(prop_xml, "features")
-        ET.SubElement(features_xml, "surface_total").text = str(prop.surface or 0)
-        ET.SubElement(features_xml, "surface_covered").text = str(prop.surface_covered or 0)
-        ET.SubElement(features_xml, "bedrooms").text = str(prop.bedrooms or 0)
-        ET.SubElement(features_xml, "bathrooms").text = str(prop.bathrooms or 0)
-        ET.SubElement(features_xml, "garages").text = str(prop.garages_total or 0)
-        ET.SubElement(features_xml, "rooms").text = str(prop.rooms or 0)
-        ET.SubElement(features_xml, "condition").text = str(prop.condition or "")
-
-        # Imágenes
-        pictures_xml = ET.SubElement(prop_xml, "pictures")
-        # Foto principal
-        if prop.image:
+    if portal != "all":
+        query = query.where(search.json_contains(models.Property.published_on_portals, [portal], db.get_bind().dialect.name))
+
+    return StreamingResponse(stream_feed(db, query, (tenant_id, portal), version), media_type="application/xml", headers=headers)
+
+async def stream_feed(db: AsyncSession, query, key, version: int):
+    chunks, size = [XML_HEAD], len(XML_HEAD)
+    yield XML_HEAD
+    result = await db.stream(query)
+    async for rows in result.partitions():
+        # Armar el XML es CPU puro: fuera del event loop, un lote por vez
+        chunk = await asyncio.to_thread(render_properties, rows)
+        yield chunk
+        if chunks is not None:
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > settings.feed_cache_max_bytes:
+                chunks = None # más grande que todo el cache: se sigue streameando sin guardarlo
+    yield XML_TAIL
+    if chunks is not None:
+        chunks.append(XML_TAIL)
+        _feed_put(key, version, b"".join(chunks))
+
+def render_properties(properties) -> bytes:
+    return b"".join(ET.tostring(property_element(prop), encoding="utf-8") for prop in properties)
+
+def property_element(prop) -> ET.Element:
+    # Estructura estándar tipo TokkoBroker / Inmuebles24 / genérico
+    prop_xml = ET.Element("property")
+
+    ET.SubElement(prop_xml, "id").text = str(prop.id)
+    ET.SubElement(prop_xml, "reference_code").text = prop.code or ""
+    ET.SubElement(prop_xml, "title").text = prop.title or ""
+    ET.SubElement(prop_xml, "description").text = prop.description or ""
+
+    # Operación y Tipo
+    ET.SubElement(prop_xml, "type").text = str(prop.type)
+    ET.SubElement(prop_xml, "operation").text = str(prop.operation)
+
+    # Precios
+    prices_xml = ET.SubElement(prop_xml, "prices")
+    price_xml = ET.SubElement(prices_xml, "price")
+    ET.SubElement(price_xml, "currency").text = str(prop.currency)
+    ET.SubElement(price_xml, "amount").text = str(prop.price)
+
+    # Ubicación
+    loc_xml = ET.SubElement(prop_xml, "location")
+    ET.SubElement(loc_xml, "address").text = str(prop.address)
+    ET.SubElement(loc_xml, "city").text = str(prop.city)
+    ET.SubElement(loc_xml, "latitude").text = str(prop.lat)
+    ET.SubElement(loc_xml, "longitude").text = str(prop.lng)
+
+    # Superficies y características
+    features_xml = ET.SubElement(prop_xml, "features")
+    ET.SubElement(features_xml, "surface_total").text = str(prop.surface or 0)
+    ET.SubElement(features_xml, "surface_covered").text = str(prop.surface_covered or 0)
+    ET.SubElement(features_xml, "bedrooms").text = str(prop.bedrooms or 0)
+    ET.SubElement(features_xml, "bathrooms").text = str(prop.bathrooms or 0)
+    ET.SubElement(features_xml, "garages").text = str(prop.garages_total or 0)
+    ET.SubElement(features_xml, "rooms").text = str(prop.rooms or 0)
+    ET.SubElement(features_xml, "condition").text = str(prop.condition or "")
+
+    # Imágenes
+    pictures_xml = ET.SubElement(prop_xml, "pictures")
+    # Foto principal
+    if prop.image:
+        pic_xml = ET.SubElement(pictures_xml, "picture")
+        ET.SubElement(pic_xml, "picture_url").text = prop.image
+        ET.SubElement(pic_xml, "is_cover").text = "true"
+
+    # Galería
+    if prop.gallery and isinstance(prop.gallery, list):
+        for idx, g in enumerate(prop.gallery):
             pic_xml = ET.SubElement(pictures_xml, "picture")
-            ET.SubElement(pic_xml, "picture_url").text = prop.image
-            ET.SubElement(pic_xml, "is_cover").text = "true"
-        
-        # Galería
-        if prop.gallery and isinstance(prop.gallery, list):
-            for idx, g in enumerate(prop.gallery):
-                pic_xml = ET.SubElement(pictures_xml, "picture")
-                if isinstance(g, dict) and "full" in g:
-                    ET.SubElement(pic_xml, "picture_url").text = g["full"]
-                elif isinstance(g, str):
-                    ET.SubElement(pic_xml, "picture_url").text = g
-                ET.SubElement(pic_xml, "is_cover").text = "false"
-        
-        ET.SubElement(prop_xml, "agency").text = "UrbanoCRM"
-
-    xml_str = ET.tostring(root, encoding="utf-8", xml_declaration=True)
-    
-    return Response(content=xml_str, media_type="application/xml")
+            if isinstance(g, dict) and "full" in g:
+                ET.SubElement(pic_xml, "picture_url").text = g["full"]
+            elif isinstance(g, str):
+                ET.SubElement(pic_xml, "picture_url").text = g
+            ET.SubElement(pic_xml, "is_cover").text = "false"
+
+    ET.SubElement(prop_xml, "agency").text = "UrbanoCRM"
+    return prop_xml
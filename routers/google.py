@@ -6,7 +6,7 @@ from datetime import datetime, timedelta, timezone
 from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from database import get_db
-from auth import get_current_user_email
+from auth import Principal, get_current_principal, get_current_user_email
 import models, schemas
 
 router = APIRouter()
@@ -100,10 +100,7 @@ def get_google_calendar_events(current_email: str = Depends(get_current_user_ema
     return res.json()
 
 @router.get("/agency/calendar/events")
-def get_agency_calendar_events(current_email: str = Depends(get_current_user_email), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == current_email).first()
-    if not user: raise HTTPException(401)
-    
+def get_agency_calendar_events(user: Principal = Depends(get_current_principal), db: Session = Depends(get_db)):
     agency = db.query(models.AgencyConfig).first()
     if not agency or not agency.google_refresh_token:
          return {"items": []}
@@ -183,9 +180,8 @@ def send_email(data: schemas.EmailSendRequest, email: str = Depends(get_current_
     return {"status": "success"}
 
 @router.get("/agency/status")
-def get_agency_integration_status(db: Session = Depends(get_db), current_email: str = Depends(get_current_user_email)):
+def get_agency_integration_status(db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     # Verify user is admin/broker
-    user = db.query(models.User).filter(models.User.email == current_email).first()
     if not user or user.role not in ['SUPER_ADMIN', 'BROKER_ADMIN']:
         raise HTTPException(403, "Insufficient permissions")
 
@@ -201,8 +197,7 @@ def get_agency_integration_status(db: Session = Depends(get_db), current_email:
     }
 
 @router.post("/agency/disconnect/{provider}")
-def disconnect_agency_provider(provider: str, db: Session = Depends(get_db), current_email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == current_email).first()
+def disconnect_agency_provider(provider: str, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     if not user or user.role not in ['SUPER_ADMIN', 'BROKER_ADMIN']:
         raise HTTPException(403, "Insufficient permissions")
         
@@ -9,21 +9,20 @@ from sqlalchemy.orm import Session
 from typing import List, Any, Dict, Set
 from database import get_db
 import models
+import phones
 from storage import minio_client, MINIO_BUCKET, MINIO_PUBLIC_DOMAIN, get_minio_client
 from PIL import Image
 
 import csv
 import codecs
 from fastapi import APIRouter, Depends, Body, HTTPException, UploadFile, File
-from auth import get_current_user_email
+from auth import Principal, get_current_principal
 
 router = APIRouter()
 logger = logging.getLogger("urbanocrm.import")
 
 @router.post("/contacts/csv")
-async def import_contacts_csv(file: UploadFile = File(...), db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
-    
+async def import_contacts_csv(file: UploadFile = File(...), db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     try:
         csvReader = csv.DictReader(codecs.iterdecode(file.file, 'utf-8'))
         
@@ -51,8 +50,9 @@ async def import_contacts_csv(file: UploadFile = File(...), db: Session = Depend
                 if contact_email:
                     if db.query(models.Contact).filter(models.Contact.tenant_id == user.tenant_id, models.Contact.email == contact_email).first():
                         exists = True
-                if not exists and phone:
-                     if db.query(models.Contact).filter(models.Contact.tenant_id == user.tenant_id, models.Contact.phone == phone).first():
+                phone_normalized = phones.normalize_phone(phone)
+                if not exists and phone_normalized:
+                     if db.query(models.Contact).filter(models.Contact.tenant_id == user.tenant_id, models.Contact.phone_normalized == phone_normalized).first():
                         exists = True
                 
                 if exists:
@@ -199,11 +199,7 @@ async def ingest_adinco_image(url: str) -> Dict[str, str]:
     except Exception: return None
 
 @router.post("/adinco/{agency_id}")
-async def import_adinco_xml(agency_id: str, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=401, detail="Unauthorized")
-
+async def import_adinco_xml(agency_id: str, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     # URL corregida según especificación del usuario
     xml_url = f"https://feeds.adinco.net/{agency_id}/ar_adinco.xml"
     
@@ -318,11 +314,7 @@ async def import_adinco_xml(agency_id: str, db: Session = Depends(get_db), email
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/clean")
-async def cleanup_imported_data(db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=401, detail="Unauthorized")
-
+async def cleanup_imported_data(db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     tenant_id = user.tenant_id
 
     # Borrar propiedades importadas (código empieza con IMP-) limitadas al tenant
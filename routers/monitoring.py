@@ -1,8 +1,9 @@
 
-from fastapi import APIRouter, Depends, HTTPException, Header, Query
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Response
 from sqlalchemy.orm import Session
 from database import get_db
 import models, schemas
+import pagination
 from typing import Optional, List
 from datetime import datetime, date
 
@@ -44,20 +45,22 @@ async def log_activity(
     db.commit()
     return {"status": "ok", "received": True, "user": user.email}
 
-from auth import get_current_user_email
+from auth import Principal, get_current_principal
+
+LOG_ORDER = (models.MonitoringLog.timestamp, models.MonitoringLog.id)
 
 @router.get("/user/{user_id}")
 def get_user_logs(
     user_id: int, 
+    response: Response,
     start_date: Optional[date] = Query(None),
     end_date: Optional[date] = Query(None),
+    cursor: Optional[str] = None,
+    limit: int = 500,
     db: Session = Depends(get_db),
-    email: str = Depends(get_current_user_email)
+    current_user: Principal = Depends(get_current_principal)
 ):
     # Authenticate user
-    current_user = db.query(models.User).filter(models.User.email == email).first()
-    if not current_user:
-        raise HTTPException(status_code=401, detail="Unauthorized")
 
     # Check if requested user belongs to same tenant
     target_user = db.query(models.User).filter(
@@ -77,5 +80,8 @@ def get_user_logs(
         end_dt = datetime.combine(end_date, datetime.max.time())
         query = query.filter(models.MonitoringLog.timestamp <= end_dt)
         
-    logs = query.order_by(models.MonitoringLog.timestamp.desc()).limit(500).all()
+    # Más recientes primero, paginado por cursor (header X-Next-Cursor, ver pagination.py)
+    limit = pagination.page_size(limit)
+    logs, next_cursor = pagination.split_page(pagination.keyset(query, LOG_ORDER, cursor, limit).all(), LOG_ORDER, limit)
+    pagination.set_next_cursor(response, next_cursor)
     return logs
@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session, joinedload
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
 from typing import List, Optional
 import models, schemas
-from database import get_db
-from auth import get_current_user_email
+import funnel
+import pagination
+import serialization
+from database import get_db, get_async_db
+from auth import Principal, get_current_principal
 import datetime
 
 class DealCommentCreate(schemas.BaseModel):
@@ -14,18 +19,13 @@ router = APIRouter()
 # --- PIPELINES ---
 
 @router.get("/pipelines", response_model=List[schemas.PipelineResponse])
-def list_pipelines(db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    return db.query(models.Pipeline).filter(models.Pipeline.tenant_id == user.tenant_id).all()
+async def list_pipelines(db: AsyncSession = Depends(get_async_db), user: Principal = Depends(get_current_principal)):
+    return (await db.scalars(
+        select(models.Pipeline).options(selectinload(models.Pipeline.stages)).where(models.Pipeline.tenant_id == user.tenant_id)
+    )).all()
 
 @router.post("/pipelines", response_model=schemas.PipelineResponse)
-def create_pipeline(pipeline: schemas.PipelineCreate, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
+def create_pipeline(pipeline: schemas.PipelineCreate, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     db_pipeline = models.Pipeline(
         name=pipeline.name,
         is_active=pipeline.is_active,
@@ -50,8 +50,7 @@ def create_pipeline(pipeline: schemas.PipelineCreate, db: Session = Depends(get_
     return db_pipeline
 
 @router.patch("/stages/{stage_id}", response_model=schemas.PipelineStageResponse)
-def update_stage(stage_id: int, stage_update: dict, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
+def update_stage(stage_id: int, stage_update: dict, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     db_stage = db.query(models.PipelineStage).join(models.Pipeline).filter(
         models.PipelineStage.id == stage_id,
         models.Pipeline.tenant_id == user.tenant_id
@@ -68,43 +67,176 @@ def update_stage(stage_id: int, stage_update: dict, db: Session = Depends(get_db
     db.refresh(db_stage)
     return db_stage
 
+# --- ANALYTICS ---
+
+@router.get("/analytics/funnel", response_class=serialization.OrjsonResponse)
+async def get_funnel_analytics(
+    pipeline_id: int,
+    agent_id: Optional[int] = None,
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    db: AsyncSession = Depends(get_async_db),
+    user: Principal = Depends(get_current_principal)
+):
+    """
+    Embudo del pipeline por etapa: entradas, avances, ganados / perdidos, conversión a la etapa siguiente, tiempo en
+    etapa (promedio, p50 / p75 / p90 en horas) y deals abiertos. Período por defecto: últimos 30 días.
+    agent_id=0 son los deals sin agente asignado.
+    """
+    # Lee los rollups que mantiene funnel.py (unas filas por etapa, por índice), no deals + deal_history
+    date_to = date_to or datetime.datetime.now(datetime.timezone.utc).date()
+    date_from = date_from or date_to - datetime.timedelta(days=29)
+    if date_from > date_to:
+        raise HTTPException(400, "date_from must be before date_to")
+    try:
+        report = await db.run_sync(lambda session: funnel.funnel_report(session, user.tenant_id, pipeline_id, date_from, date_to, agent_id))
+    except LookupError as e:
+        raise HTTPException(404, str(e))
+    return serialization.OrjsonResponse(report)
+
 # --- DEALS ---
 
+DEAL_RELATIONS = (
+    selectinload(models.Deal.property),
+    selectinload(models.Deal.contact),
+    selectinload(models.Deal.agent),
+    selectinload(models.Deal.comments),
+    selectinload(models.Deal.history),
+)
+
+def load_deal(db: Session, deal_id: int):
+    """Deal con todo lo que serializa DealResponse (respuesta de alta / movida / cierre / edición)."""
+    return db.query(models.Deal).options(*DEAL_RELATIONS).filter(models.Deal.id == deal_id).first()
+
+# --- TABLERO (KANBAN) ---
+# Por etapa: cantidad y valor de los deals (un GROUP BY) y las primeras `limit` tarjetas livianas (un ROW_NUMBER por
+# etapa), sin comentarios ni historia: esos van por /deals/{id}/comments y /deals/{id}/history. Cada columna pagina
+# con cursor keyset sobre (created_at, id) en /board/stages/{stage_id}.
+
+CARD_ORDER = (models.Deal.created_at, models.Deal.id)
+
+def card_select():
+    Deal, Contact, Property, User = models.Deal, models.Contact, models.Property, models.User
+    return select(
+        Deal.id, Deal.title, Deal.value, Deal.currency, Deal.priority, Deal.status, Deal.pipeline_stage_id,
+        Deal.close_date, Deal.created_at, Deal.updated_at, Deal.contact_id, Contact.name.label("contact_name"),
+        Deal.property_id, Property.code.label("property_code"), Property.title.label("property_title"),
+        Deal.assigned_agent_id, User.first_name.label("agent_first_name"), User.last_name.label("agent_last_name"),
+    ).outerjoin(Contact, Contact.id == Deal.contact_id) \
+     .outerjoin(Property, Property.id == Deal.property_id) \
+     .outerjoin(User, User.id == Deal.assigned_agent_id)
+
+def deal_filters(tenant_id: int, status: Optional[str], agent_id: Optional[int]):
+    filters = [models.Deal.tenant_id == tenant_id]
+    if status:
+        filters.append(models.Deal.status == status)
+    if agent_id:
+        filters.append(models.Deal.assigned_agent_id == agent_id)
+    return filters
+
+def to_card(row) -> dict:
+    card = {key: value for key, value in row._mapping.items() if key not in ("agent_first_name", "agent_last_name", "position")}
+    card["agent_name"] = " ".join(p for p in (row.agent_first_name, row.agent_last_name) if p) or None
+    return card
+
+def card_page(rows, limit: int) -> dict:
+    rows, next_cursor = pagination.split_page(rows, CARD_ORDER, limit)
+    return {"cards": [to_card(row) for row in rows], "next_cursor": next_cursor}
+
+@router.get("/board", response_model=schemas.DealBoardResponse)
+async def get_deal_board(
+    pipeline_id: int,
+    limit: int = Query(20, ge=1, le=100),
+    status: Optional[str] = "OPEN",
+    agent_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db),
+    user: Principal = Depends(get_current_principal)
+):
+    stages = (await db.execute(
+        select(models.PipelineStage.id, models.PipelineStage.name, models.PipelineStage.order, models.PipelineStage.color)
+        .join(models.Pipeline).where(models.PipelineStage.pipeline_id == pipeline_id, models.Pipeline.tenant_id == user.tenant_id)
+        .order_by(models.PipelineStage.order, models.PipelineStage.id)
+    )).all()
+    if not stages:
+        raise HTTPException(status_code=404, detail="Pipeline not found")
+
+    filters = [*deal_filters(user.tenant_id, status, agent_id), models.Deal.pipeline_stage_id.in_([s.id for s in stages])]
+    totals = {stage_id: (count, value) for stage_id, count, value in await db.execute(
+        select(models.Deal.pipeline_stage_id, func.count(models.Deal.id), func.coalesce(func.sum(models.Deal.value), 0.0))
+        .where(*filters).group_by(models.Deal.pipeline_stage_id)
+    )}
+    position = func.row_number().over(
+        partition_by=models.Deal.pipeline_stage_id, order_by=pagination.order_by(CARD_ORDER)
+    ).label("position")
+    ranked = card_select().add_columns(position).where(*filters).subquery()
+    rows_by_stage = {}
+    for row in await db.execute(
+        select(ranked).where(ranked.c.position <= limit + 1).order_by(ranked.c.pipeline_stage_id, ranked.c.position)
+    ):
+        rows_by_stage.setdefault(row.pipeline_stage_id, []).append(row)
+
+    return {"pipeline_id": pipeline_id, "stages": [{
+        "stage_id": stage.id,
+        "name": stage.name,
+        "order": stage.order,
+        "color": stage.color,
+        "count": totals.get(stage.id, (0, 0.0))[0],
+        "value": totals.get(stage.id, (0, 0.0))[1],
+        **card_page(rows_by_stage.get(stage.id, []), limit),
+    } for stage in stages]}
+
+@router.get("/board/stages/{stage_id}", response_model=schemas.DealCardPage)
+async def get_board_column(
+    stage_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    status: Optional[str] = "OPEN",
+    agent_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db),
+    user: Principal = Depends(get_current_principal)
+):
+    query = card_select().where(*deal_filters(user.tenant_id, status, agent_id), models.Deal.pipeline_stage_id == stage_id)
+    return card_page((await db.execute(pagination.keyset(query, CARD_ORDER, cursor, limit))).all(), limit)
+
+@router.get("/deals/{deal_id}/comments", response_model=List[schemas.DealCommentResponse])
+async def list_deal_comments(deal_id: int, db: AsyncSession = Depends(get_async_db), user: Principal = Depends(get_current_principal)):
+    return (await db.scalars(
+        select(models.DealComment).join(models.Deal)
+        .where(models.DealComment.deal_id == deal_id, models.Deal.tenant_id == user.tenant_id)
+        .order_by(models.DealComment.created_at, models.DealComment.id)
+    )).all()
+
+@router.get("/deals/{deal_id}/history", response_model=List[schemas.DealHistoryResponse])
+async def list_deal_history(deal_id: int, db: AsyncSession = Depends(get_async_db), user: Principal = Depends(get_current_principal)):
+    return (await db.scalars(
+        select(models.DealHistory).join(models.Deal)
+        .where(models.DealHistory.deal_id == deal_id, models.Deal.tenant_id == user.tenant_id)
+        .order_by(models.DealHistory.created_at, models.DealHistory.id)
+    )).all()
+
 @router.get("/deals", response_model=List[schemas.DealResponse])
-def list_deals(
+async def list_deals(
     stage_id: Optional[int] = None,
     status: Optional[str] = None,
     agent_id: Optional[int] = None,
-    db: Session = Depends(get_db), 
-    email: str = Depends(get_current_user_email)
+    db: AsyncSession = Depends(get_async_db), 
+    user: Principal = Depends(get_current_principal)
 ):
-    user = db.query(models.User).filter(models.User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    query = db.query(models.Deal).options(
-        joinedload(models.Deal.property),
-        joinedload(models.Deal.contact),
-        joinedload(models.Deal.agent),
-        joinedload(models.Deal.comments),
-        joinedload(models.Deal.history)
-    ).filter(models.Deal.tenant_id == user.tenant_id)
+    # Todo lo que serializa DealResponse se carga acá: en async no hay lazy load. selectinload (un IN por relación)
+    # en vez de JOINs que multiplican filas. Para el tablero usar /board: esta lista trae todo sin límite
+    query = select(models.Deal).options(*DEAL_RELATIONS).where(models.Deal.tenant_id == user.tenant_id)
     
     if stage_id:
-        query = query.filter(models.Deal.pipeline_stage_id == stage_id)
+        query = query.where(models.Deal.pipeline_stage_id == stage_id)
     if status:
-        query = query.filter(models.Deal.status == status)
+        query = query.where(models.Deal.status == status)
     if agent_id:
-        query = query.filter(models.Deal.assigned_agent_id == agent_id)
+        query = query.where(models.Deal.assigned_agent_id == agent_id)
         
-    return query.order_by(models.Deal.created_at.desc()).all()
+    return (await db.scalars(query.order_by(models.Deal.created_at.desc()))).all()
 
 @router.post("/deals", response_model=schemas.DealResponse)
-def create_deal(deal: schemas.DealCreate, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
+def create_deal(deal: schemas.DealCreate, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     # Optional check: deal.contact_id and deal.property_id belong to tenant
     if deal.contact_id:
         contact = db.query(models.Contact).filter(models.Contact.id == deal.contact_id, models.Contact.tenant_id == user.tenant_id).first()
@@ -140,20 +272,10 @@ def create_deal(deal: schemas.DealCreate, db: Session = Depends(get_db), email:
         
         db.commit()
 
-    return db.query(models.Deal).options(
-        joinedload(models.Deal.property),
-        joinedload(models.Deal.contact),
-        joinedload(models.Deal.agent),
-        joinedload(models.Deal.comments),
-        joinedload(models.Deal.history)
-    ).filter(models.Deal.id == db_deal.id, models.Deal.tenant_id == user.tenant_id).first()
+    return load_deal(db, db_deal.id)
 
 @router.put("/deals/{deal_id}/move", response_model=schemas.DealResponse)
-def move_deal(deal_id: int, stage_id: int, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
+def move_deal(deal_id: int, stage_id: int, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     db_deal = db.query(models.Deal).filter(models.Deal.id == deal_id, models.Deal.tenant_id == user.tenant_id).first()
     
     if not db_deal:
@@ -184,22 +306,15 @@ def move_deal(deal_id: int, stage_id: int, db: Session = Depends(get_db), email:
     db.add(db_history)
     
     db.commit()
-    return db.query(models.Deal).options(
-        joinedload(models.Deal.property),
-        joinedload(models.Deal.contact),
-        joinedload(models.Deal.agent),
-        joinedload(models.Deal.comments),
-        joinedload(models.Deal.history)
-    ).filter(models.Deal.id == deal_id).first()
+    return load_deal(db, deal_id)
 
 @router.post("/deals/{deal_id}/comments", response_model=schemas.DealCommentResponse)
 def add_deal_comment(
     deal_id: int, 
     comment: DealCommentCreate, 
     db: Session = Depends(get_db), 
-    email: str = Depends(get_current_user_email)
+    user: Principal = Depends(get_current_principal)
 ):
-    user = db.query(models.User).filter(models.User.email == email).first()
     db_deal = db.query(models.Deal).filter(models.Deal.id == deal_id, models.Deal.tenant_id == user.tenant_id).first()
     if not db_deal:
         raise HTTPException(status_code=404, detail="Deal not found")
@@ -215,11 +330,7 @@ def add_deal_comment(
     return db_comment
 
 @router.post("/deals/{deal_id}/won", response_model=schemas.DealResponse)
-def mark_deal_won(deal_id: int, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
+def mark_deal_won(deal_id: int, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     db_deal = db.query(models.Deal).filter(models.Deal.id == deal_id, models.Deal.tenant_id == user.tenant_id).first()
     
     if not db_deal:
@@ -235,20 +346,10 @@ def mark_deal_won(deal_id: int, db: Session = Depends(get_db), email: str = Depe
             db.add(contact)
             
     db.commit()
-    return db.query(models.Deal).options(
-        joinedload(models.Deal.property),
-        joinedload(models.Deal.contact),
-        joinedload(models.Deal.agent),
-        joinedload(models.Deal.comments),
-        joinedload(models.Deal.history)
-    ).filter(models.Deal.id == deal_id).first()
+    return load_deal(db, deal_id)
 
 @router.post("/deals/{deal_id}/lost", response_model=schemas.DealResponse)
-def mark_deal_lost(deal_id: int, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
+def mark_deal_lost(deal_id: int, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     db_deal = db.query(models.Deal).filter(models.Deal.id == deal_id, models.Deal.tenant_id == user.tenant_id).first()
     
     if not db_deal:
@@ -264,17 +365,10 @@ def mark_deal_lost(deal_id: int, db: Session = Depends(get_db), email: str = Dep
             db.add(contact)
             
     db.commit()
-    return db.query(models.Deal).options(
-        joinedload(models.Deal.property),
-        joinedload(models.Deal.contact),
-        joinedload(models.Deal.agent),
-        joinedload(models.Deal.comments),
-        joinedload(models.Deal.history)
-    ).filter(models.Deal.id == deal_id).first()
+    return load_deal(db, deal_id)
 
 @router.delete("/deals/{deal_id}")
-def delete_deal(deal_id: int, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
+def delete_deal(deal_id: int, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     db_deal = db.query(models.Deal).filter(models.Deal.id == deal_id, models.Deal.tenant_id == user.tenant_id).first()
     
     if not db_deal:
@@ -290,8 +384,7 @@ def delete_deal(deal_id: int, db: Session = Depends(get_db), email: str = Depend
     return {"message": "Deal deleted successfully"}
 
 @router.put("/deals/{deal_id}", response_model=schemas.DealResponse)
-def update_deal(deal_id: int, deal_update: schemas.DealUpdate, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
+def update_deal(deal_id: int, deal_update: schemas.DealUpdate, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     db_deal = db.query(models.Deal).filter(models.Deal.id == deal_id, models.Deal.tenant_id == user.tenant_id).first()
     
     if not db_deal:
@@ -310,10 +403,4 @@ def update_deal(deal_id: int, deal_update: schemas.DealUpdate, db: Session = Dep
             db.add(contact)
             
     db.commit()
-    return db.query(models.Deal).options(
-        joinedload(models.Deal.property),
-        joinedload(models.Deal.contact),
-        joinedload(models.Deal.agent),
-        joinedload(models.Deal.comments),
-        joinedload(models.Deal.history)
-    ).filter(models.Deal.id == deal_id).first()
+    return load_deal(db, deal_id)
@@ -1,132 +1,123 @@
 
 import uuid
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session, joinedload, defer
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 from typing import List
 import models, schemas
-from database import get_db
-from auth import get_current_user_email
+from database import get_db, get_async_db
+from auth import Principal, get_current_principal
 import datetime
-from . import ai_service
-from background_tasks import background_sync_property_ai
+import embedding_cache
+import job_queue
+import search
+import pagination
+import serialization
 
 router = APIRouter()
 
 
-def sync_property_ai(db: Session, property: models.Property):
-    """
-    Genera el string de contexto y obtiene el embedding de Gemini.
-    """
-    context_str = ai_service.generate_property_context_string(property)
-    property.search_content = context_str
-    vector = ai_service.get_embedding(context_str)
-    if vector:
-        property.embedding_descripcion = vector
-        db.commit()
+# Lecturas en async (get_async_db): no ocupan un hilo del threadpool mientras esperan a la base.
+# Las columnas pesadas (embedding, search_content, metadata) están diferidas en el modelo, no van en PropertyResponse.
 
 @router.get("/public/{code}", response_model=schemas.PropertyResponse)
-def get_public_property(code: str, db: Session = Depends(get_db)):
+async def get_public_property(code: str, db: AsyncSession = Depends(get_async_db)):
     # Try ID first if it looks like an int to support legacy links or direct ID access
-    query = db.query(models.Property).filter(models.Property.status != "Deleted")
+    query = select(models.Property).where(models.Property.status != "Deleted")
     
     if code.isdigit():
-        prop = query.filter(models.Property.id == int(code)).first()
+        prop = await db.scalar(query.where(models.Property.id == int(code)))
         if prop: return prop
         
-    prop = query.filter(models.Property.code == code).first()
+    prop = await db.scalar(query.where(models.Property.code == code))
     if not prop:
         raise HTTPException(404, "Propiedad no encontrada")
     return prop
 
-@router.get("/minimal")
-def list_minimal_properties(db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
-    if not user: return []
-    props = db.query(models.Property.id, models.Property.address, models.Property.owner_id).filter(
+@router.get("/minimal", response_class=serialization.OrjsonResponse)
+async def list_minimal_properties(db: AsyncSession = Depends(get_async_db), user: Principal = Depends(get_current_principal)):
+    props = (await db.execute(select(models.Property.id, models.Property.address, models.Property.owner_id).where(
         models.Property.tenant_id == user.tenant_id,
         models.Property.status != "Deleted",
         models.Property.owner_id != None
-    ).all()
-    return [{"id": p.id, "address": p.address, "owner_id": p.owner_id} for p in props]
+    ))).all()
+    return serialization.OrjsonResponse([{"id": p.id, "address": p.address, "owner_id": p.owner_id} for p in props])
 
 @router.get("", response_model=List[schemas.PropertyResponse])
-def list_properties(
-    limit: int = 100, 
-    offset: int = 0, 
-    search: str = None, 
+async def list_properties(
+    response: Response,
+    limit: int = None, 
+    offset: int = 0, # compatibilidad: preferir cursor (header X-Next-Cursor), que no se degrada con la profundidad
+    cursor: str = None,
+    fields: str = None, # sparse fieldset: ?fields=title,price,thumbnail_url (el id va siempre)
+    search_text: str = Query(None, alias="search"), 
     operation: str = None, 
     property_type: str = None, 
     min_price: float = None, 
     max_price: float = None, 
     bedrooms: int = None,
-    db: Session = Depends(get_db), 
-    email: str = Depends(get_current_user_email)
+    amenities: List[str] = Query(None),
+    portal: str = None,
+    db: AsyncSession = Depends(get_async_db), 
+    user: Principal = Depends(get_current_principal)
 ):
-    user = db.query(models.User).filter(models.User.email == email).first()
-    if not user: return []
-    
-    query = db.query(models.Property).options(
-        defer(models.Property.embedding_descripcion),
-        defer(models.Property.search_content),
-        defer(models.Property.description)
-    ).filter(
-        models.Property.tenant_id == user.tenant_id,
-        models.Property.status != "Deleted"
+    # Server-side Filtering (mismo motor que el bot y el matching: texto + vector fusionados, ver search.py)
+    conditions = search.property_filters(
+        tenant_id=user.tenant_id,
+        operation=operation if operation != 'All' else None,
+        property_type=property_type if property_type != 'All' else None,
+        min_price=min_price,
+        max_price=max_price,
+        bedrooms=bedrooms if bedrooms and str(bedrooms) != '4' else None,
+        min_bedrooms=4 if bedrooms and str(bedrooms) == '4' else None, # Logic for 4+
+        amenities=amenities, # ?amenities=pool&amenities=pets: todas (JSONB @>)
+        portals=[portal] if portal and portal != 'All' else None,
+        dialect=db.get_bind().dialect.name,
     )
-
-    # Server-side Filtering
-    if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            (models.Property.address.ilike(search_term)) | 
-            (models.Property.title.ilike(search_term)) |
-            (models.Property.code.ilike(search_term))
-        )
-    
-    if operation and operation != 'All':
-        query = query.filter(models.Property.operation == operation)
-        
-    if property_type and property_type != 'All':
-        query = query.filter(models.Property.type == property_type)
-        
-    if min_price:
-        query = query.filter(models.Property.price >= min_price)
-        
-    if max_price:
-        query = query.filter(models.Property.price <= max_price)
-        
-    if bedrooms and bedrooms != 'All': 
-        if str(bedrooms) == '4': # Logic for 4+
-            query = query.filter(models.Property.bedrooms >= 4)
-        else:
-            query = query.filter(models.Property.bedrooms == bedrooms)
-
-    return query.options(joinedload(models.Property.assigned_agent)).order_by(models.Property.id.desc()).limit(limit).offset(offset).all()
+    # El embedding de la búsqueda (HTTP a Gemini en un miss, cacheado en embedding_cache) va a un hilo; search.py corre
+    # sobre la misma conexión async vía run_sync. Buscar por código no lo necesita
+    query_vector = None
+    if search_text and search_text.strip() and db.get_bind().dialect.name == "postgresql" and not search.is_code_query(search_text):
+        query_vector = await asyncio.to_thread(embedding_cache.get_query_embedding, search_text)
+    limit = pagination.page_size(limit)
+    names = serialization.parse_fields(fields, schemas.PropertyResponse, models.Property)
+    options = (serialization.load_fields(models.Property, names),) if names else ()
+    try:
+        results, next_cursor = await db.run_sync(lambda session: search.search_page(
+            session, search_text, conditions, limit=limit, cursor=cursor, offset=offset, query_vector=query_vector,
+            semantic=query_vector is not None, options=options,
+        ))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    pagination.set_next_cursor(response, next_cursor)
+    props = [prop for prop, _ in results]
+    if names:
+        return serialization.sparse_response(props, schemas.PropertyResponse, names, response)
+    return props
 
 @router.get("/{prop_id}", response_model=schemas.PropertyResponse)
-def get_property(prop_id: int, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
-    prop = db.query(models.Property).filter(
+async def get_property(prop_id: int, db: AsyncSession = Depends(get_async_db), user: Principal = Depends(get_current_principal)):
+    prop = await db.scalar(select(models.Property).where(
         models.Property.id == prop_id, 
         models.Property.tenant_id == user.tenant_id,
         models.Property.status != "Deleted"
-    ).first()
+    ))
     if not prop:
         raise HTTPException(404, "Propiedad no encontrada")
     return prop
 
 @router.post("", response_model=schemas.PropertyResponse)
-def create_property(prop: schemas.PropertyCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
+def create_property(prop: schemas.PropertyCreate, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     code = f"URB-{uuid.uuid4().hex[:6].upper()}"
     
     db_prop = models.Property(**prop.dict(), code=code, tenant_id=user.tenant_id)
     db.add(db_prop)
-    db.commit()
-    db.refresh(db_prop)
+    db.flush()
     
-    # Pipeline IA en Background
-    background_tasks.add_task(background_sync_property_ai, db_prop.id)
+    # Pipeline IA en Background (job persistente, lo procesa worker.py)
+    job_queue.enqueue(db, job_queue.PROPERTY_AI_SYNC, db_prop.id)
     
     db.add(models.ActivityLog(
         user_id=user.id, 
@@ -139,18 +130,15 @@ def create_property(prop: schemas.PropertyCreate, background_tasks: BackgroundTa
     return db_prop
 
 @router.put("/{prop_id}", response_model=schemas.PropertyResponse)
-def update_property(prop_id: int, data: schemas.PropertyCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
+def update_property(prop_id: int, data: schemas.PropertyCreate, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     prop = db.query(models.Property).filter(models.Property.id == prop_id, models.Property.tenant_id == user.tenant_id).first()
     if not prop: raise HTTPException(404)
     
     for k, v in data.dict().items(): 
         setattr(prop, k, v)
     
-    db.commit()
-    
     # Actualizar Pipeline IA en Background
-    background_tasks.add_task(background_sync_property_ai, prop.id)
+    job_queue.enqueue(db, job_queue.PROPERTY_AI_SYNC, prop.id)
         
     db.add(models.ActivityLog(user_id=user.id, action="UPDATE", entity_type="PROPERTY", entity_id=prop.id, description=f"Actualizó propiedad: {prop.address}"))
     db.commit()
@@ -158,8 +146,7 @@ def update_property(prop_id: int, data: schemas.PropertyCreate, background_tasks
     return prop
 
 @router.delete("/{prop_id}")
-def delete_property(prop_id: int, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
+def delete_property(prop_id: int, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     prop = db.query(models.Property).filter(models.Property.id == prop_id, models.Property.tenant_id == user.tenant_id).first()
     if not prop: raise HTTPException(404, "Propiedad no encontrada")
     
@@ -181,8 +168,7 @@ def delete_property(prop_id: int, db: Session = Depends(get_db), email: str = De
         raise HTTPException(500, f"Error eliminando propiedad: {str(e)}")
 
 @router.patch("/{prop_id}")
-def patch_property(prop_id: int, data: dict, background_tasks: BackgroundTasks, db: Session = Depends(get_db), email: str = Depends(get_current_user_email)):
-    user = db.query(models.User).filter(models.User.email == email).first()
+def patch_property(prop_id: int, data: dict, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
     prop = db.query(models.Property).filter(models.Property.id == prop_id, models.Property.tenant_id == user.tenant_id).first()
     if not prop: raise HTTPException(404, "Propiedad no encontrada")
     
@@ -190,13 +176,11 @@ def patch_property(prop_id: int, data: dict, background_tasks: BackgroundTasks,
         if hasattr(prop, k):
             setattr(prop, k, v)
     
-    db.commit()
-    db.refresh(prop)
-    
     # Trigger AI sync si title o description cambia
     if "description" in data or "title" in data:
-        background_tasks.add_task(background_sync_property_ai, prop.id)
+        job_queue.enqueue(db, job_queue.PROPERTY_AI_SYNC, prop.id)
         
     db.add(models.ActivityLog(user_id=user.id, action="PATCH", entity_type="PROPERTY", entity_id=prop.id, description=f"Actualización parcial de propiedad: {prop.address}"))
     db.commit()
+    db.refresh(prop)
     return prop
@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from database import get_db
+from auth import Principal, get_current_principal
+import models
+import search
+
+router = APIRouter()
+
+@router.get("/suggest")
+def suggest(
+    q: str = Query(..., min_length=1),
+    limit: int = 10,
+    types: str = None,
+    db: Session = Depends(get_db),
+    user: Principal = Depends(get_current_principal)
+):
+    """
+    Type-ahead unificado: mejores coincidencias entre contactos, propiedades, emprendimientos y equipo.
+    `types` opcional: lista separada por comas (contact,property,development,user).
+    """
+    kinds = [t.strip() for t in types.split(",") if t.strip()] if types else None
+    return {"query": q, "results": search.suggest(db, user.tenant_id, q, limit=limit, types=kinds)}
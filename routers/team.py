@@ -1,22 +1,29 @@
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 from typing import List
 import models, schemas
+import pagination
+import serialization
 from database import get_db
-from auth import get_current_user_email, get_password_hash
+from auth import Principal, get_current_principal, get_password_hash, invalidate_principal
 import uuid
 
 router = APIRouter()
 
+TEAM_ORDER = (models.User.id,)
+
 @router.get("", response_model=List[schemas.UserResponse])
-def list_team(search: str = None, limit: int = 1000, db: Session = Depends(get_db), current_email: str = Depends(get_current_user_email)): 
-    """Retorna todos los usuarios de la inmobiliaria."""
-    user = db.query(models.User).filter(models.User.email == current_email).first()
+def list_team(response: Response, search: str = None, cursor: str = None, limit: int = None, fields: str = None, db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)): 
+    """Retorna los usuarios activos de la inmobiliaria, por id, paginados por cursor (header X-Next-Cursor). ?fields= recorta columnas."""
+    limit = pagination.page_size(limit, cursor, unpaged=1000)
+    names = serialization.parse_fields(fields, schemas.UserResponse, models.User)
     query = db.query(models.User).filter(
         models.User.tenant_id == user.tenant_id,
         models.User.is_active == True
     )
+    if names:
+        query = query.options(serialization.load_fields(models.User, names))
     
     if search:
         search_term = f"%{search}%"
@@ -26,12 +33,17 @@ def list_team(search: str = None, limit: int = 1000, db: Session = Depends(get_d
             (models.User.email.ilike(search_term))
         )
         
-    return query.order_by(models.User.id.asc()).limit(limit).all()
+    members, next_cursor = pagination.split_page(
+        pagination.keyset(query, TEAM_ORDER, cursor, limit, descending=False).all(), TEAM_ORDER, limit
+    )
+    pagination.set_next_cursor(response, next_cursor)
+    if names:
+        return serialization.sparse_response(members, schemas.UserResponse, names, response)
+    return members
 
 @router.put("/{user_id}", response_model=schemas.UserResponse)
-def update_member(user_id: int, data: schemas.UserProfileUpdate, db: Session = Depends(get_db), current_admin: str = Depends(get_current_user_email)):
+def update_member(user_id: int, data: schemas.UserProfileUpdate, db: Session = Depends(get_db), admin: Principal = Depends(get_current_principal)):
     # Verificar que el que edita es admin
-    admin = db.query(models.User).filter(models.User.email == current_admin).first()
     if not admin or admin.role not in ["SUPER_ADMIN", "BROKER_ADMIN"]:
         raise HTTPException(403, "No tienes permisos para gestionar el equipo")
         
@@ -57,17 +69,18 @@ def update_member(user_id: int, data: schemas.UserProfileUpdate, db: Session = D
             if existing:
                 raise HTTPException(400, "El email ya está en uso")
 
+    old_email = user.email
     for key, value in update_data.items():
         setattr(user, key, value)
         
     db.commit()
+    invalidate_principal(old_email, user.email)
     db.refresh(user)
     return user
 
 @router.post("/{user_id}/regenerate-token")
-def admin_regenerate_token(user_id: int, db: Session = Depends(get_db), current_admin: str = Depends(get_current_user_email)):
+def admin_regenerate_token(user_id: int, db: Session = Depends(get_db), admin: Principal = Depends(get_current_principal)):
     # Verificar permisos de administrador
-    admin = db.query(models.User).filter(models.User.email == current_admin).first()
     if not admin or admin.role not in ["SUPER_ADMIN", "BROKER_ADMIN"]:
         raise HTTPException(403, "No autorizado para regenerar tokens ajenos")
         
@@ -94,8 +107,7 @@ def admin_regenerate_token(user_id: int, db: Session = Depends(get_db), current_
     return {"monitoring_token": new_token}
 
 @router.delete("/{user_id}")
-def delete_member(user_id: int, db: Session = Depends(get_db), current_email: str = Depends(get_current_user_email)):
-    admin = db.query(models.User).filter(models.User.email == current_email).first()
+def delete_member(user_id: int, db: Session = Depends(get_db), admin: Principal = Depends(get_current_principal)):
     user = db.query(models.User).filter(
         models.User.id == user_id, 
         models.User.tenant_id == admin.tenant_id,
@@ -114,4 +126,5 @@ def delete_member(user_id: int, db: Session = Depends(get_db), current_email: st
         description=f"Eliminó miembro (Soft Delete): {user.email}"
     ))
     db.commit()
+    invalidate_principal(user.email)
     return {"status": "ok", "message": "Miembro desactivado correctamente"}
@@ -4,7 +4,7 @@ from sqlalchemy.orm import Session
 from typing import List
 import models, schemas, auth
 from database import get_db
-from auth import get_current_user_email, get_password_hash, verify_password
+from auth import Principal, get_current_principal, get_current_user_email, get_password_hash, verify_password, invalidate_principal
 import uuid
 
 router = APIRouter()
@@ -23,6 +23,7 @@ def update_profile(data: schemas.UserProfileUpdate, email: str = Depends(get_cur
     user = db.query(models.User).filter(models.User.email == email).first()
     for k, v in data.dict(exclude_unset=True).items(): setattr(user, k, v)
     db.commit()
+    invalidate_principal(email, user.email)
     db.refresh(user)
     return user
 
@@ -52,10 +53,9 @@ def change_password(data: schemas.PasswordUpdate, email: str = Depends(get_curre
 def get_activity(
     entity_type: str = None, 
     entity_id: int = None, 
-    email: str = Depends(get_current_user_email), 
+    user: Principal = Depends(get_current_principal), 
     db: Session = Depends(get_db)
 ):
-    user = db.query(models.User).filter(models.User.email == email).first()
     # It seems ActivityLogs are per-user, but should probably be filtered to all team activity if they are an admin
     # To keep it safe and avoid cross-tenant leakage, we filter by the user's ID
     query = db.query(models.ActivityLog).filter(models.ActivityLog.user_id == user.id)
@@ -1,14 +1,19 @@
 import os
+import hmac
+import hashlib
 import requests
 import logging
 import re
-from fastapi import APIRouter, Depends, HTTPException, Body, Request, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Body, Request, BackgroundTasks, Query
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from database import get_db
-from auth import get_current_user_email
+from database import get_db, get_async_db
+from auth import Principal, get_current_principal, get_current_user_email
 from datetime import datetime, timedelta, timezone
 import models
 import json
+import whatsapp_inbox
 
 def json_dumps(obj):
     return json.dumps(obj, ensure_ascii=True)
@@ -18,15 +23,22 @@ logger = logging.getLogger("urbanocrm.whatsapp")
 
 WA_ACCESS_TOKEN = os.getenv("WA_ACCESS_TOKEN", "").strip()
 WA_PHONE_NUMBER_ID = os.getenv("WA_PHONE_NUMBER_ID", "").strip()
+WA_VERIFY_TOKEN = os.getenv("WA_VERIFY_TOKEN", "").strip()
+# Firma de los webhooks de la Cloud API (X-Hub-Signature-256) y apikey de Evolution (la misma de routers/bots.py)
+WA_APP_SECRET = os.getenv("WA_APP_SECRET", "").strip()
+EVO_KEY = os.getenv("EVO_KEY", "")
 
-def call_wa_cloud(endpoint: str, payload: dict = None, method: str = "POST"):
-    if not WA_ACCESS_TOKEN or not WA_PHONE_NUMBER_ID:
+def call_wa_cloud(endpoint: str, payload: dict = None, method: str = "POST", access_token: str = None, phone_number_id: str = None):
+    """Cloud API con las credenciales globales (WA_*) o las de un bot (config.official_whatsapp)."""
+    access_token = access_token or WA_ACCESS_TOKEN
+    phone_number_id = phone_number_id or WA_PHONE_NUMBER_ID
+    if not access_token or not phone_number_id:
         logger.error("WhatsApp Cloud API credentials not configured.")
         return None
         
-    url = f"https://graph.facebook.com/v19.0/{WA_PHONE_NUMBER_ID}{endpoint}"
+    url = f"https://graph.facebook.com/v19.0/{phone_number_id}{endpoint}"
     headers = {
-        "Authorization": f"Bearer {WA_ACCESS_TOKEN}",
+        "Authorization": f"Bearer {access_token}",
         "Content-Type": "application/json"
     }
 
@@ -40,6 +52,64 @@ def call_wa_cloud(endpoint: str, payload: dict = None, method: str = "POST"):
         logger.error(f"WA Cloud API Connection error: {e}")
         return None
 
+@router.get("/webhook", response_class=PlainTextResponse)
+def verify_webhook(mode: str = Query(None, alias="hub.mode"), token: str = Query(None, alias="hub.verify_token"),
+                   challenge: str = Query(None, alias="hub.challenge")):
+    """Verificación de la suscripción del webhook de la Cloud API (Meta)."""
+    if mode == "subscribe" and WA_VERIFY_TOKEN and token == WA_VERIFY_TOKEN:
+        return challenge or ""
+    raise HTTPException(403, "Verify token inválido")
+
+def valid_signature(body: bytes, signature: str, secrets) -> bool:
+    """X-Hub-Signature-256 de Meta: "sha256=" + HMAC-SHA256 del cuerpo crudo con el app secret."""
+    if not signature or not signature.startswith("sha256="):
+        return False
+    received = signature[len("sha256="):]
+    return any(hmac.compare_digest(hmac.new(secret.encode(), body, hashlib.sha256).hexdigest(), received)
+               for secret in secrets if secret)
+
+def webhook_authenticated(db: Session, payload: dict, body: bytes, headers) -> bool:
+    """
+    Cloud API: firma con WA_APP_SECRET o con el app_secret del bot dueño del phone_number_id.
+    Evolution messages.upsert: apikey (header o cuerpo) igual a EVO_KEY. Los demás eventos no generan turnos.
+    """
+    if payload.get("object") == "whatsapp_business_account":
+        secrets = [WA_APP_SECRET, *whatsapp_inbox.cloud_app_secrets(db, payload)]
+        return valid_signature(body, headers.get("x-hub-signature-256"), secrets)
+    if payload.get("event") == "messages.upsert":
+        apikey = headers.get("apikey") or payload.get("apikey")
+        return bool(EVO_KEY) and isinstance(apikey, str) and hmac.compare_digest(apikey, EVO_KEY)
+    return True
+
+@router.post("/webhook")
+async def receive_webhook(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    Mensajes entrantes (Evolution messages.upsert o Cloud API). Guarda en whatsapp_buffer y responde enseguida; el
+    turno del bot corre después, una vez por ráfaga del remitente (ver whatsapp_inbox.py).
+    Sin firma / apikey válida responde 401: el webhook dispara turnos de Gemini y mensajes salientes.
+    """
+    body = await request.body()
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(400, "JSON inválido")
+    if not isinstance(payload, dict):
+        raise HTTPException(400, "JSON inválido")
+    if not await db.run_sync(lambda session: webhook_authenticated(session, payload, body, request.headers)):
+        logger.warning(f"WA webhook rechazado (firma / apikey inválida) desde {request.client.host if request.client else '?'}")
+        raise HTTPException(401, "Webhook no autenticado")
+    senders = await db.run_sync(lambda session: whatsapp_inbox.store(session, whatsapp_inbox.parse_webhook(session, payload)))
+    await db.commit()
+    dispatcher = whatsapp_inbox.get_dispatcher()
+    for instance, sender_id in senders:
+        dispatcher.touch(instance, sender_id)
+    return {"status": "ok", "queued": len(senders)}
+
+@router.get("/inbox-stats")
+def get_inbox_stats(email: str = Depends(get_current_user_email)):
+    """Mensajes recibidos / duplicados, turnos del bot y mensajes por turno (llamadas al modelo ahorradas)."""
+    return whatsapp_inbox.stats()
+
 @router.get("/status")
 def get_status(email: str = Depends(get_current_user_email), db: Session = Depends(get_db)):
     if WA_ACCESS_TOKEN and WA_PHONE_NUMBER_ID:
@@ -58,10 +128,9 @@ def send_whatsapp_message(
     media_url: str = Body(None),
     media_type: str = Body("image"), # image, video, document
     contact_vcard: dict = Body(None), # { "fullName": "...", "wuid": "..." }
-    email: str = Depends(get_current_user_email), 
+    user: Principal = Depends(get_current_principal), 
     db: Session = Depends(get_db)
 ):
-    user = db.query(models.User).filter(models.User.email == email).first()
     contact = db.query(models.Contact).filter(models.Contact.id == contact_id, models.Contact.tenant_id == user.tenant_id).first()
     if not contact or not contact.phone: raise HTTPException(404, "Contacto sin teléfono o no encontrado")
 
@@ -130,9 +199,7 @@ def logout_whatsapp(email: str = Depends(get_current_user_email), db: Session =
     return {"status": "ok"}
 
 @router.get("/messages/{contact_id}")
-def get_contact_messages(contact_id: int, email: str = Depends(get_current_user_email), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == email).first()
-    
+def get_contact_messages(contact_id: int, user: Principal = Depends(get_current_principal), db: Session = Depends(get_db)):
     # First verify the contact belongs to the tenant
     contact = db.query(models.Contact).filter(models.Contact.id == contact_id, models.Contact.tenant_id == user.tenant_id).first()
     if not contact:
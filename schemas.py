@@ -399,6 +399,42 @@ class DealUpdate(BaseModel):
     requirements: Optional[str] = None
     close_date: Optional[datetime] = None
 
+class DealCard(BaseModel):
+    """Tarjeta del tablero: solo lo que muestra la columna (sin comentarios ni historia)."""
+    id: int
+    title: Optional[str] = None
+    value: Optional[float] = None
+    currency: Optional[str] = None
+    priority: Optional[str] = None
+    status: Optional[str] = None
+    pipeline_stage_id: int
+    close_date: Optional[datetime] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    contact_id: Optional[int] = None
+    contact_name: Optional[str] = None
+    property_id: Optional[int] = None
+    property_code: Optional[str] = None
+    property_title: Optional[str] = None
+    assigned_agent_id: Optional[int] = None
+    agent_name: Optional[str] = None
+
+class DealCardPage(BaseModel):
+    cards: List[DealCard]
+    next_cursor: Optional[str] = None
+
+class DealBoardColumn(DealCardPage):
+    stage_id: int
+    name: Optional[str] = None
+    order: Optional[int] = None
+    color: Optional[str] = None
+    count: int = 0
+    value: float = 0.0
+
+class DealBoardResponse(BaseModel):
+    pipeline_id: int
+    stages: List[DealBoardColumn]
+
 class DealCommentResponse(BaseModel):
     id: int
     content: str
@@ -0,0 +1,331 @@
+import re
+import json
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import Float, Integer, String, and_, cast, func, literal, literal_column, or_, select, union_all
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Session
+
+from settings import settings
+import models
+import vector_search
+import embedding_cache
+import pagination
+
+logger = logging.getLogger("urbanocrm.search")
+
+# Búsqueda única de propiedades (listado del CRM, /api/bots/rag-search, bot_engine, /ai-matching/match).
+#
+# - Texto: columna generada properties.search_vector (tsvector 'spanish' sobre code/title, address/neighborhood/city
+#   y search_content, con pesos A/B/C) + índice GIN. Se crea en main.py / alembic, no está en el modelo porque
+#   SQLite (tests) no tiene to_tsvector.
+# - Semántica: pgvector sobre embedding_descripcion (vector_search, índice HNSW).
+# - Ambos rankings se fusionan en SQL con Reciprocal Rank Fusion: score = Σ 1 / (k + rank).
+# - Paginado (search_page): el ranking híbrido se arma con search_candidates candidatos por rama. Al agotarse esa
+#   ventana la página sigue con una del doble de ancho sin los resultados de la anterior, hasta search_candidates_max;
+#   el cursor lleva (score, id, ventana). Pasado el tope no hay más páginas.
+# - Una búsqueda que es solo códigos de propiedad (URB-123) va por ILIKE sobre code, sin ranking ni vector: los vecinos
+#   semánticos solo suman resultados que no tienen nada que ver (y una vuelta a Gemini), y el parser de tsvector
+#   parte 'URB-123' en 'urb' y el entero '-123'.
+# Fuera de Postgres se degrada a ILIKE por término, sin vector.
+#
+# - Amenities (attributes) y portales (published_on_portals) son arrays JSONB: filtro por contención (@>) con
+#   índices GIN jsonb_path_ops.
+#
+# suggest(): type-ahead sobre contactos, propiedades, emprendimientos y equipo (índices GIN pg_trgm).
+
+TEXT_SEARCH_CONFIG = literal_column("'spanish'::regconfig")
+SEARCH_VECTOR = literal_column("properties.search_vector")
+_TERMS = re.compile(r"\w+", re.UNICODE)
+CODE_PATTERN = re.compile(r"[A-Z]{2,5}-[A-Z0-9]{3,}", re.IGNORECASE)
+
+OPERATION_ALIASES = {"Sale": ("venta", "vend", "compr", "buy", "sale"), "Rent": ("alquil", "rent", "renta")}
+TYPE_ALIASES = {
+    "House": ("casa", "house"),
+    "Apartment": ("depto", "departamento", "dpto", "apartment", "monoambiente"),
+    "PH": ("ph",),
+    "Land": ("terreno", "lote", "land"),
+}
+
+def normalize_operation(value: str) -> Optional[str]:
+    """'venta', 'para comprar', 'Sale' -> 'Sale'; 'alquiler' -> 'Rent'. None si no se reconoce."""
+    value = (value or "").lower()
+    for operation, aliases in OPERATION_ALIASES.items():
+        if any(a in value for a in aliases):
+            return operation
+    return None
+
+def normalize_property_type(value: str) -> Optional[str]:
+    """'casa' -> 'House', 'depto' -> 'Apartment', 'lote' -> 'Land'... None si no se reconoce."""
+    value = (value or "").lower()
+    for property_type, aliases in TYPE_ALIASES.items():
+        if any(a in value for a in aliases):
+            return property_type
+    return None
+
+def json_contains(column, values: Sequence[str], dialect: str):
+    """`column @> '["pool", "pets"]'` (todos los valores). Fuera de Postgres, LIKE por valor sobre el JSON serializado."""
+    values = [v for v in values if v]
+    if dialect == "postgresql":
+        return column.op("@>")(literal(values, JSONB))
+    return and_(*(cast(column, String).like(f"%{json.dumps(v)}%") for v in values))
+
+def property_filters(
+    tenant_id: Optional[int] = None,
+    status: Optional[str] = None,
+    exclude_deleted: bool = True,
+    operation: Optional[str] = None,
+    property_type: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    bedrooms: Optional[int] = None,
+    min_bedrooms: Optional[int] = None,
+    min_rooms: Optional[int] = None,
+    neighborhood: Optional[str] = None,
+    amenities: Optional[Sequence[str]] = None,
+    portals: Optional[Sequence[str]] = None,
+    dialect: str = "postgresql",
+) -> list:
+    """Condiciones estructuradas comunes a todos los caminos de búsqueda."""
+    conditions = []
+    if tenant_id is not None: conditions.append(models.Property.tenant_id == tenant_id)
+    if status: conditions.append(models.Property.status == status)
+    elif exclude_deleted: conditions.append(models.Property.status != "Deleted")
+    if operation: conditions.append(models.Property.operation == operation)
+    if property_type: conditions.append(models.Property.type == property_type)
+    if min_price: conditions.append(models.Property.price >= min_price)
+    if max_price: conditions.append(models.Property.price <= max_price)
+    if bedrooms is not None: conditions.append(models.Property.bedrooms == bedrooms)
+    if min_bedrooms: conditions.append(models.Property.bedrooms >= min_bedrooms)
+    if min_rooms: conditions.append(models.Property.rooms >= min_rooms)
+    if neighborhood: conditions.append(models.Property.neighborhood.ilike(f"%{neighborhood}%"))
+    if amenities: conditions.append(json_contains(models.Property.attributes, amenities, dialect))
+    # Los portales se guardan en minúscula (Property._lower_portals): mismo criterio que el feed
+    if portals: conditions.append(json_contains(models.Property.published_on_portals, [p.lower() for p in portals if p], dialect))
+    return conditions
+
+def prefix_tsquery(text: str) -> Optional[str]:
+    """'depto Pichin' -> 'depto & pichin:*' (el último término como prefijo, para búsqueda mientras se tipea)."""
+    terms = [t.lower() for t in _TERMS.findall(text or "")]
+    if not terms:
+        return None
+    return " & ".join(terms[:-1] + [terms[-1] + ":*"])
+
+def is_code_query(text: Optional[str]) -> bool:
+    """'URB-123' / 'urb-a1 URB-B2': todos los términos son códigos de propiedad."""
+    terms = (text or "").split()
+    return bool(terms) and all(CODE_PATTERN.fullmatch(t) for t in terms)
+
+def _rrf(rank):
+    # double precision, no numeric: el cursor lleva el score como float y tiene que compararse igual al volver
+    return func.coalesce(cast(literal(1.0), Float) / (settings.search_rrf_k + rank), 0)
+
+def _hybrid_ranking(db: Session, text: str, query_vector, conditions: Sequence, candidates: int, name: str = "ranking"):
+    """Subquery (id, score) con la fusión RRF de los rankings léxico y semántico. `name` prefija sus CTEs."""
+    branches = []
+    tsquery = prefix_tsquery(text)
+    if tsquery:
+        q = func.to_tsquery(TEXT_SEARCH_CONFIG, tsquery)
+        rank = func.ts_rank_cd(SEARCH_VECTOR, q)
+        hits = select(models.Property.id.label("id"), rank.label("rank")).where(
+            SEARCH_VECTOR.op("@@")(q), *conditions
+        ).order_by(rank.desc(), models.Property.id.desc()).limit(candidates).subquery(f"{name}_lexical_hits")
+        # Desempate por id: con rank repetido la ventana anterior ("served") tiene que elegir las mismas filas
+        branches.append(select(hits.c.id, func.row_number().over(order_by=(hits.c.rank.desc(), hits.c.id.desc())).label("rnk"))
+                        .cte(f"{name}_lexical"))
+    if query_vector is not None:
+        # LIMIT antes de numerar: así el ORDER BY distancia usa el índice HNSW
+        vector_search.set_ef_search(db, max(settings.vector_search_ef_search, candidates))
+        hits = vector_search.nearest_query(
+            db, models.Property.embedding_descripcion, query_vector, models.Property.id,
+            filters=conditions, limit=candidates
+        ).subquery(f"{name}_semantic_hits")
+        branches.append(select(hits.c.id, func.row_number().over(order_by=hits.c.distance).label("rnk")).cte(f"{name}_semantic"))
+
+    if not branches:
+        return None
+    if len(branches) == 1:
+        only = branches[0]
+        return select(only.c.id, _rrf(only.c.rnk).label("score")).subquery(name)
+    lexical, semantic = branches
+    return select(
+        func.coalesce(lexical.c.id, semantic.c.id).label("id"),
+        (_rrf(lexical.c.rnk) + _rrf(semantic.c.rnk)).label("score"),
+    ).select_from(lexical.join(semantic, lexical.c.id == semantic.c.id, full=True)).subquery(name)
+
+def _ilike_terms(text: str) -> list:
+    columns = (models.Property.address, models.Property.title, models.Property.code,
+               models.Property.neighborhood, models.Property.search_content)
+    return [or_(*(c.ilike(f"%{term}%") for c in columns)) for term in _TERMS.findall(text or "")]
+
+PROPERTY_ORDER = (models.Property.id,)
+HYBRID_CURSOR = (literal_column("score", Float), models.Property.id, literal_column("window", Integer))
+
+def _plain_query(db: Session, text: str, conditions: Sequence, options: Sequence):
+    """Sin texto, por código o fuera de Postgres: ILIKE por término (el código completo), orden por id desc."""
+    query = db.query(models.Property).options(*options).filter(*conditions)
+    if is_code_query(text):
+        query = query.filter(or_(*(models.Property.code.ilike(code) for code in text.split())))
+    elif text:
+        query = query.filter(*_ilike_terms(text))
+    return query
+
+def _window(rows: int) -> int:
+    """Primera ventana (search_candidates por una potencia de 2) con lugar para `rows` filas."""
+    window = settings.search_candidates
+    while window < rows:
+        window *= 2
+    return window
+
+def _hybrid_rows(db: Session, text: str, query_vector, conditions: Sequence, options: Sequence, window: int,
+                 limit: int, offset: int = 0, after: Optional[Sequence] = None):
+    """
+    [(Property, score)] de la ventana `window` del ranking híbrido, después de `after` (score, id). Desde la segunda
+    ventana sin los candidatos de la anterior, que ya se sirvieron. None si no hay ranking (ni texto ni vector).
+    """
+    # La anterior se arma primero: el ef_search que queda es el de la ventana actual
+    served = _hybrid_ranking(db, text, query_vector, conditions, window // 2, "served") if window > settings.search_candidates else None
+    ranking = _hybrid_ranking(db, text, query_vector, conditions, window)
+    if ranking is None:
+        return None
+    query = db.query(models.Property, ranking.c.score).options(*options).join(ranking, models.Property.id == ranking.c.id)
+    if served is not None:
+        query = query.filter(models.Property.id.notin_(select(served.c.id)))
+    if after:
+        query = query.filter(pagination.after((ranking.c.score, models.Property.id), after))
+    return query.order_by(ranking.c.score.desc(), models.Property.id.desc()).limit(limit).offset(offset).all()
+
+def _window_exhausted(db: Session, text: str, query_vector, conditions: Sequence, window: int) -> bool:
+    """La ventana no cortó ninguna rama: si la fusión tiene menos de `window` candidatos no hay más resultados."""
+    ranking = _hybrid_ranking(db, text, query_vector, conditions, window)
+    return db.scalar(select(func.count()).select_from(ranking)) < window
+
+def search_properties(
+    db: Session,
+    text: Optional[str] = None,
+    conditions: Sequence = (),
+    limit: int = 20,
+    offset: int = 0,
+    semantic: bool = True,
+    query_vector: Optional[List[float]] = None,
+    options: Sequence = (),
+) -> list:
+    """
+    Devuelve [(Property, score)] ordenado por relevancia (score RRF) o, sin texto, por id desc (score None).
+    `conditions` sale de property_filters(); `options` son loader options (defer, joinedload...).
+    Con semantic=True y sin query_vector se embebe `text` con el cache de búsquedas.
+    """
+    text = (text or "").strip()
+    if not text or is_code_query(text) or db.get_bind().dialect.name != "postgresql":
+        rows = _plain_query(db, text, conditions, options).order_by(models.Property.id.desc()).limit(limit).offset(offset).all()
+        return [(p, None) for p in rows]
+
+    if semantic and query_vector is None:
+        query_vector = embedding_cache.get_query_embedding(text)
+    return _hybrid_rows(db, text, query_vector, conditions, options, _window(limit + offset), limit, offset) or []
+
+def search_page(
+    db: Session,
+    text: Optional[str] = None,
+    conditions: Sequence = (),
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    offset: int = 0,
+    semantic: bool = True,
+    query_vector: Optional[List[float]] = None,
+    options: Sequence = (),
+) -> Tuple[list, Optional[str]]:
+    """
+    Una página del listado: ([(Property, score)] hasta `limit`, cursor de la siguiente o None).
+    `cursor` es el de la página anterior: (id) sin score, (score, id, ventana) en el ranking híbrido. ValueError si
+    está mal formado.
+    """
+    text = (text or "").strip()
+    if not text or is_code_query(text) or db.get_bind().dialect.name != "postgresql":
+        query = _plain_query(db, text, conditions, options)
+        if cursor:
+            query = query.filter(pagination.after(PROPERTY_ORDER, pagination.decode_cursor(cursor, PROPERTY_ORDER)))
+        rows = query.order_by(models.Property.id.desc()).limit(limit + 1).offset(offset).all()
+        page = [(p, None) for p in rows[:limit]]
+        return page, pagination.encode_cursor(page[-1][0].id) if len(rows) > limit else None
+
+    if semantic and query_vector is None:
+        query_vector = embedding_cache.get_query_embedding(text)
+    after = None
+    window = _window(limit + 1 + offset)
+    if cursor:
+        score, last_id, window = pagination.decode_cursor(cursor, HYBRID_CURSOR)
+        if not isinstance(window, int) or not settings.search_candidates <= window <= settings.search_candidates_max:
+            raise ValueError("Invalid cursor")
+        after, offset = (score, last_id), 0
+
+    rows = [] # (Property, score, ventana)
+    while True:
+        found = _hybrid_rows(db, text, query_vector, conditions, options, window, limit + 1 - len(rows), offset, after)
+        if found is None:
+            return [], None
+        rows += [(p, score, window) for p, score in found]
+        if len(rows) > limit or window >= settings.search_candidates_max:
+            break
+        if _window_exhausted(db, text, query_vector, conditions, window):
+            break
+        window, after, offset = window * 2, None, 0
+
+    page = [(p, score) for p, score, _ in rows[:limit]]
+    if len(rows) <= limit:
+        return page, None
+    prop, score, window = rows[limit - 1]
+    return page, pagination.encode_cursor(float(score), prop.id, window)
+
+# --- Type-ahead (/api/search/suggest) ---
+
+SUGGEST_SOURCES = {
+    # tipo: (modelo, label, sublabel, columnas buscadas, condiciones extra)
+    "contact": (models.Contact, models.Contact.name, func.coalesce(models.Contact.phone, models.Contact.email),
+                (models.Contact.name, models.Contact.email, models.Contact.phone), ()),
+    "property": (models.Property, func.coalesce(models.Property.title, models.Property.address), models.Property.code,
+                 (models.Property.address, models.Property.title, models.Property.code),
+                 (models.Property.status != "Deleted",)),
+    "development": (models.Development, models.Development.name, models.Development.address,
+                    (models.Development.name, models.Development.address, models.Development.code), ()),
+    "user": (models.User, func.coalesce(models.User.first_name, "") + " " + func.coalesce(models.User.last_name, ""),
+             models.User.email, (models.User.first_name, models.User.last_name, models.User.email),
+             (models.User.is_active == True,)),
+}
+
+def _like_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def suggest(db: Session, tenant_id: int, q: str, limit: int = 10, types: Optional[Sequence[str]] = None) -> List[dict]:
+    """
+    Top-`limit` coincidencias entre tipos de entidad, en una sola consulta (UNION ALL con LIMIT por rama).
+    Ranking por word_similarity (pg_trgm). Consultas más cortas que search_suggest_min_chars devuelven []:
+    con menos de 3 caracteres no hay trigramas y el índice no sirve.
+    """
+    q = (q or "").strip()
+    if len(q) < settings.search_suggest_min_chars:
+        return []
+    limit = max(1, min(limit, settings.search_suggest_max_results))
+    pattern = f"%{_like_escape(q)}%"
+    is_postgres = db.get_bind().dialect.name == "postgresql"
+
+    branches = []
+    for kind in (types or SUGGEST_SOURCES):
+        if kind not in SUGGEST_SOURCES:
+            continue
+        model, label, sublabel, columns, extra = SUGGEST_SOURCES[kind]
+        score = func.greatest(*(func.word_similarity(q, c) for c in columns)) if is_postgres else literal(0.0)
+        branch = select(
+            literal(kind).label("type"), model.id.label("id"), label.label("label"),
+            sublabel.label("sublabel"), score.label("score")
+        ).where(
+            model.tenant_id == tenant_id, or_(*(c.ilike(pattern, escape="\\") for c in columns)), *extra
+        ).order_by(score.desc(), model.id.desc()).limit(limit).subquery()
+        branches.append(select(branch))
+
+    if not branches:
+        return []
+    combined = union_all(*branches).subquery("suggestions")
+    rows = db.execute(select(combined).order_by(combined.c.score.desc(), combined.c.label).limit(limit)).all()
+    return [{**row._mapping, "score": round(float(row.score or 0), 4)} for row in rows]
@@ -0,0 +1,72 @@
+import datetime
+import decimal
+from functools import lru_cache
+from typing import Any, List, Optional, Sequence, Tuple, Type
+
+import orjson
+from fastapi import HTTPException, Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, ConfigDict, TypeAdapter, create_model
+from sqlalchemy import inspect
+from sqlalchemy.orm import load_only
+
+# Serialización de listados.
+#
+# - Rutas con response_model: FastAPI ya serializa con el core de Pydantic (dump_json, Rust) directo a bytes, sin
+#   pasar por jsonable_encoder + json.dumps; no se les pone response_class para no perder ese camino.
+# - Rutas que arman dicts a mano (/properties/minimal, analytics): OrjsonResponse devuelta desde el endpoint, así
+#   FastAPI no recorre el contenido con jsonable_encoder.
+# - ?fields=id,title,price (sparse fieldset): load_only() de esas columnas en el SELECT y un modelo parcial del schema
+#   de respuesta (cacheado por combinación de campos) para el payload. El id va siempre: es la clave del cursor.
+# La compresión (gzip) la hace el middleware de main.py sobre cualquier respuesta de más de gzip_minimum_size.
+
+def _default(value: Any):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def dumps(content: Any) -> bytes:
+    """orjson: datetimes en ISO, claves no-string (ids) como string, Decimal como float."""
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+class OrjsonResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def parse_fields(fields: Optional[str], schema: Type[BaseModel], model) -> Optional[Tuple[str, ...]]:
+    """
+    'title, price' -> ('id', 'price', 'title') validado contra el schema de respuesta y las columnas del modelo.
+    None si no se pidió un fieldset (respuesta completa). Un campo desconocido es un 400 con los permitidos.
+    """
+    if not fields or not fields.strip():
+        return None
+    requested = {f.strip() for f in fields.split(",") if f.strip()}
+    allowed = set(schema.model_fields) & set(inspect(model).column_attrs.keys())
+    unknown = requested - allowed
+    if unknown:
+        raise HTTPException(400, f"Unknown fields: {', '.join(sorted(unknown))}. Allowed: {', '.join(sorted(allowed))}")
+    return tuple(sorted(requested | {"id"}))
+
+def load_fields(model, names: Sequence[str]):
+    """Loader option que trae solo esas columnas (el resto queda diferido)."""
+    return load_only(*(getattr(model, name) for name in names))
+
+@lru_cache(maxsize=256)
+def _partial_adapter(schema: Type[BaseModel], names: Tuple[str, ...]) -> TypeAdapter:
+    partial = create_model(
+        f"{schema.__name__}Fields",
+        __config__=ConfigDict(from_attributes=True),
+        **{name: (schema.model_fields[name].annotation, schema.model_fields[name]) for name in names},
+    )
+    return TypeAdapter(List[partial])
+
+def sparse_response(rows: Sequence, schema: Type[BaseModel], names: Tuple[str, ...], response: Response) -> Response:
+    """
+    Respuesta JSON con solo `names` de cada fila, copiando los headers ya puestos en `response` (X-Next-Cursor).
+    Los validadores del schema completo no se aplican: los listados con fieldset no tienen ninguno.
+    """
+    adapter = _partial_adapter(schema, names)
+    body = adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+    result = Response(content=body, media_type="application/json")
+    result.headers.update({k: v for k, v in response.headers.items() if k.lower() != "content-length"})
+    return result
@@ -27,6 +27,90 @@ class Settings(BaseSettings):
     google_api_key: Optional[str] = None
     openai_api_key: Optional[str] = None
 
+    # Pools de conexiones (database.py). Sync: rutas `def` (threadpool); async: rutas `async def` (asyncpg)
+    db_pool_size: int = 10
+    db_max_overflow: int = 10
+    db_pool_timeout_seconds: int = 30
+    db_pool_recycle_seconds: int = 3600
+    async_db_pool_size: int = 20
+    async_db_max_overflow: int = 20
+    threadpool_size: int = 40 # hilos de anyio para rutas y dependencias sync (default de Starlette: 40)
+
+    # Principal autenticado (auth.get_current_principal): cache por proceso, invalidado al editar usuarios
+    principal_cache_size: int = 10000
+    principal_cache_ttl_seconds: int = 60
+
+    # Feed XML de portales (routers/feed.py): cursor server-side por lotes + feeds renderizados por versión de inventario
+    feed_yield_per: int = 500
+    feed_cache_max_bytes: int = 64 * 1024 * 1024
+
+    # Disponibilidad de visitas (availability.py): slots por (propiedad, día), invalidados al escribir la agenda
+    availability_cache_properties: int = 2000
+    availability_cache_ttl_seconds: int = 300
+
+    # Listados paginados por cursor keyset (pagination.py)
+    page_size_default: int = 100
+    page_size_max: int = 500
+
+    # Motores del bot de WhatsApp (bot_registry.py): uno por instancia, reusado entre mensajes
+    bot_engine_ttl_seconds: int = 600
+    bot_engine_cache_size: int = 500
+    # Turnos del bot en curso a la vez (bot_processor.py), entre todas las conversaciones
+    bot_max_concurrency: int = 16
+    # Tools pedidas en una misma respuesta del modelo (bot_tools.py): lecturas en paralelo por turno, vueltas de function calling
+    bot_tool_parallelism: int = 4
+    bot_tool_max_rounds: int = 5
+    # Atajo sin Gemini para consultas puntuales sobre la propiedad de la conversación (bot_intents.py)
+    bot_fast_path_enabled: bool = True
+    bot_fast_path_max_words: int = 8
+    bot_fast_path_context_messages: int = 6
+    bot_fast_path_slots_per_day: int = 4
+    # Memoria de conversación (conversation_memory.py): turnos recientes que entran en el presupuesto + resumen del resto
+    bot_memory_token_budget: int = 1000
+    bot_memory_max_turns: int = 20
+    bot_memory_summary_trigger_tokens: int = 400
+    bot_memory_summary_max_tokens: int = 250
+    bot_memory_summary_max_rows: int = 40 # mensajes plegados por job; si queda más se encola otro
+
+    # Webhook de WhatsApp (whatsapp_inbox.py): los mensajes seguidos de un remitente van en un solo turno del bot
+    whatsapp_debounce_seconds: float = 4.0
+    whatsapp_debounce_max_seconds: float = 15.0
+    whatsapp_processing_timeout_seconds: int = 600
+
+    # Compresión de respuestas (GZipMiddleware en main.py; las chicas no se comprimen)
+    gzip_minimum_size: int = 1024
+    gzip_compresslevel: int = 6
+
+    # Embeddings (Gemini)
+    embedding_batch_size: int = 100
+    embedding_concurrency: int = 4
+    embedding_texts_per_minute: int = 1500 # textos embebidos por minuto (un batch de N textos consume N), no requests HTTP
+    embedding_backfill_chunk_size: int = 500
+    embedding_cache_size: int = 5000
+    query_embedding_cache_size: int = 2000
+    query_embedding_cache_ttl_seconds: int = 3600
+    query_embedding_cache_shared: bool = True # comparte hits entre workers vía la tabla embedding_cache
+
+    # Vector search (pgvector HNSW)
+    vector_search_ef_search: int = 40
+    vector_search_iterative_scan: str = "" # pgvector >= 0.8: "relaxed_order" sigue escaneando si los filtros descartan candidatos
+
+    # Búsqueda híbrida (search.py)
+    search_rrf_k: int = 60
+    search_candidates: int = 100 # candidatos por ranking (texto / vector) antes de fusionar
+    search_candidates_max: int = 1600 # tope de la ventana al paginar el ranking híbrido (se duplica desde search_candidates)
+    search_suggest_min_chars: int = 3
+    search_suggest_max_results: int = 20
+
+    # Job queue (worker.py)
+    job_worker_concurrency: int = 4
+    # Consumidores dentro de cada proceso web (lifespan de main.py); 0 cuando worker.py corre como servicio aparte
+    job_embedded_consumers: int = 2
+    job_poll_interval_seconds: float = 2.0
+    job_max_attempts: int = 5
+    job_retry_base_seconds: int = 10
+    job_lock_timeout_seconds: int = 600
+
     model_config = SettingsConfigDict(
         env_file=".env", 
         env_file_encoding="utf-8", 
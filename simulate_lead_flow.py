@@ -29,7 +29,7 @@ def send_msg(text):
     }
     
     try:
-        r = requests.post(BASE_URL, json=payload)
+        r = requests.post(BASE_URL, json=payload, headers={"apikey": os.getenv("EVO_KEY", "")})
         if r.status_code == 200:
             print(f"[API] Response: {r.text}")
             resp_json = r.json()
@@ -60,7 +60,7 @@ def send_msg(text):
     }
     print(f"\n[SIMULATION] Sending User Message: '{text}'")
     try:
-        r = requests.post(BASE_URL, json=payload)
+        r = requests.post(BASE_URL, json=payload, headers={"apikey": os.getenv("EVO_KEY", "")})
         print(f"[API] Status: {r.status_code}")
         if r.status_code != 200:
              print(f"[API] Response: {r.text}")
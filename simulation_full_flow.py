@@ -4,7 +4,7 @@ sys.path.append(os.getcwd())
 from dotenv import load_dotenv, find_dotenv
 load_dotenv(find_dotenv(), override=True) # Ensure vars loaded
 
-from bot_engine import BotEngine
+from bot_engine import get_engine
 from database import SessionLocal
 import models
 import datetime
@@ -42,14 +42,14 @@ print(f"User Phone: {PHONE}")
 # Turn 1
 msg1 = "Hola, busco departamento de 2 dormitorios en San Lorenzo 1000."
 print(f"\n[USER]: {msg1}")
-engine = BotEngine(instance)
+engine = get_engine(instance)
 response1 = engine.process_message(PHONE, msg1)
 print(f"[BOT]: {response1}")
 
 # Turn 2
 msg2 = "Genial. Quiero agendar una visita para hoy a las 16hs."
 print(f"\n[USER]: {msg2}")
-engine = BotEngine(instance)
+engine = get_engine(instance)
 response2 = engine.process_message(PHONE, msg2)
 print(f"[BOT]: {response2}")
 
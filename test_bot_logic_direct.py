@@ -54,7 +54,6 @@ def simulate_real_flow():
         # 4. Instanciar BotEngine y LLAMAR DIRECTAMENTE A LA HERRAMIENTA
         from bot_engine import BotEngine
         bot = BotEngine(instance_name)
-        bot.current_phone = phone # Simular contexto del bot
         
         # Fecha habilitada: Próximo lunes (San Lorenzo 1047 solo lunes 9-10)
         # 2026-02-16 es lunes
@@ -63,8 +62,9 @@ def simulate_real_flow():
         
         print(f"📅 Intentando agendar para: {test_date} {test_time}")
         
-        # Ejecutar la lógica de agendamiento
-        result = bot.schedule_visit(property_id, test_date, test_time)
+        # Ejecutar la lógica de agendamiento (en un turno: sesión y teléfono del contacto, como en process_message)
+        with bot.open_turn(phone):
+            result = bot.schedule_visit(property_id, test_date, test_time)
         print(f"🤖 RESULTADO TOOL: {result}")
 
         print("\n" + "="*50)
@@ -31,7 +31,6 @@ print(f"Testing with Instance: {instance}, Phone: {phone}")
 
 try:
     engine = BotEngine(instance)
-    engine.current_phone = phone
 
     # Get Property
     prop = db.query(models.Property).first()
@@ -41,7 +40,8 @@ try:
 
     print(f"Scheduling for Property {prop.id}...")
     # Call tool directly
-    result = engine.schedule_visit(prop.id, "2025-12-31", "10:00")
+    with engine.open_turn(phone):
+        result = engine.schedule_visit(prop.id, "2025-12-31", "10:00")
     print(f"Tool Result: {result}")
 
     # Verify DB
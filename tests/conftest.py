@@ -5,21 +5,38 @@ from sqlalchemy.orm import sessionmaker
 
 from main import app
 from auth import get_current_user_email
-from database import Base, get_db
+from database import Base, get_db, get_async_db
 import models
+import auth
+import availability
+import bot_registry
+import bot_intents
+import bot_tools
+from routers import feed
 
 # 1. Usaremos SQLite en memoria para que cada test sea rápido y 100% aislado
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
-
+import sqlite3
+import aiosqlite
 from sqlalchemy.pool import StaticPool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+# Una sola conexión en memoria compartida por el motor sync y el async (aiosqlite): las rutas async
+# ven lo que siembran los fixtures
+sqlite_connection = sqlite3.connect(":memory:", check_same_thread=False)
 
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False},
+    "sqlite://",
+    creator=lambda: sqlite_connection,
     poolclass=StaticPool
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async def async_creator():
+    return await aiosqlite.Connection(lambda: sqlite_connection, iter_chunk_size=64)
+
+async_engine = create_async_engine("sqlite+aiosqlite://", async_creator=async_creator, poolclass=StaticPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # Base para las pruebas (Sobreescribe get_db)
 def override_get_db():
     try:
@@ -28,6 +45,10 @@ def override_get_db():
     finally:
         db.close()
 
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
 # Usuario mock para no depender de Firebase/JWT en las pruebas uniatias
 TEST_EMAIL = "test_qa@urbanocrm.com"
 def override_get_current_user_email():
@@ -36,6 +57,7 @@ def override_get_current_user_email():
 # Aplicar los Mocks a FastAPI
 fastapi_app = app.other_asgi_app if hasattr(app, "other_asgi_app") else app
 fastapi_app.dependency_overrides[get_db] = override_get_db
+fastapi_app.dependency_overrides[get_async_db] = override_get_async_db
 fastapi_app.dependency_overrides[get_current_user_email] = override_get_current_user_email
 
 client = TestClient(fastapi_app)
@@ -47,6 +69,12 @@ def test_db():
     Garantiza que ningún test influencie al siguiente (Test Isolation).
     """
     Base.metadata.create_all(bind=engine)
+    auth.clear_principals()
+    feed.clear_feed_cache()
+    availability.clear_cache()
+    bot_registry.clear()
+    bot_tools.clear_stats()
+    bot_intents.clear_stats()
     db = TestingSessionLocal()
     
     # Pre-cargar datos mínimos para el test (El Tenant y el User)
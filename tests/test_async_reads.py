@@ -0,0 +1,70 @@
+import datetime
+import models
+from conftest import client
+
+def seed_deal(db):
+    user = db.query(models.User).first()
+    pipeline = models.Pipeline(tenant_id=user.tenant_id, name="Ventas")
+    db.add(pipeline)
+    db.flush()
+    stage = models.PipelineStage(pipeline_id=pipeline.id, name="Nuevo", order=0)
+    prop = models.Property(tenant_id=user.tenant_id, city="Rosario", code="URB-D1", title="Depto", address="Oroño 100", price=100000,
+                           operation="Sale", type="Apartment", status="Active", published_on_portals=["zonaprop"])
+    contact = models.Contact(tenant_id=user.tenant_id, name="Ana", phone="5493415551234")
+    db.add_all([stage, prop, contact])
+    db.flush()
+    deal = models.Deal(tenant_id=user.tenant_id, title="Venta Oroño", pipeline_stage_id=stage.id, property_id=prop.id,
+                       contact_id=contact.id, assigned_agent_id=user.id)
+    db.add(deal)
+    db.flush()
+    db.add_all([
+        models.DealComment(deal_id=deal.id, user_id=user.id, content="Llamar el lunes"),
+        models.DealHistory(deal_id=deal.id, to_stage_id=stage.id, user_id=user.id),
+    ])
+    db.commit()
+    return user, prop
+
+def test_async_deals_and_pipelines_serialize_relationships(test_db):
+    """Prueba 1: Las rutas async cargan todo lo que serializan (sin lazy load fuera del greenlet)"""
+    seed_deal(test_db)
+
+    response = client.get("/api/opportunities/deals")
+    assert response.status_code == 200
+    deal = response.json()[0]
+    assert deal["property"]["code"] == "URB-D1"
+    assert deal["contact"]["name"] == "Ana"
+    assert deal["agent"]["email"] == "test_qa@urbanocrm.com"
+    assert [c["content"] for c in deal["comments"]] == ["Llamar el lunes"]
+    assert len(deal["history"]) == 1
+
+    response = client.get("/api/opportunities/pipelines")
+    assert [s["name"] for s in response.json()[0]["stages"]] == ["Nuevo"]
+
+def test_async_feed_and_contact_reads(test_db):
+    """Prueba 2: Feed XML y lecturas de contactos sobre la sesión async"""
+    user, _ = seed_deal(test_db)
+
+    response = client.get(f"/api/feeds/{user.tenant_id}/zonaprop.xml")
+    assert response.status_code == 200
+    assert b"<reference_code>URB-D1</reference_code>" in response.content
+    assert b"<property>" not in client.get(f"/api/feeds/{user.tenant_id}/argenprop.xml").content
+
+    response = client.get("/api/contacts", params={"search": "ana"})
+    assert [c["name"] for c in response.json()] == ["Ana"]
+
+def test_async_bot_availability_respects_capacity(test_db):
+    """Prueba 3: Disponibilidad del bot (async) descuenta los slots con el cupo de la propiedad completo"""
+    user, prop = seed_deal(test_db)
+    prop.visit_availability = {"Mon": {"enabled": True, "start": "10:00", "end": "11:00"}}
+    prop.visit_duration = 30
+    prop.max_simultaneous_visits = 1
+    test_db.add_all([
+        models.Bot(user_id=user.id, instance_name="bot-qa", business_hours={}),
+        models.CalendarEvent(tenant_id=user.tenant_id, property_id=prop.id, status="CONFIRMED",
+                             start_time=datetime.datetime(2026, 10, 19, 10, 0), end_time=datetime.datetime(2026, 10, 19, 10, 30)),
+    ])
+    test_db.commit()
+
+    response = client.get("/api/bots/bot-qa/availability", params={"date": "2026-10-19", "days": 1, "property_id": prop.id})
+    assert response.status_code == 200
+    assert [s["start"] for s in response.json()["available_slots"]] == ["10:30"]
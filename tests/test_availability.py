@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+import models
+import availability
+from conftest import client
+
+MONDAY = {"Mon": {"enabled": True, "start": "10:00", "end": "12:00"}}
+
+def seed_property(db, **config):
+    user = db.query(models.User).first()
+    prop = models.Property(tenant_id=user.tenant_id, code="URB-V1", title="Casa", status="Active",
+                           visit_availability=MONDAY, **config)
+    db.add_all([prop, models.Bot(user_id=user.id, instance_name="bot-agenda", business_hours=MONDAY)])
+    db.commit()
+    return user, prop
+
+def visit(user, prop_id, start, minutes=30, **extra):
+    start = datetime(2026, 10, 19, *start)
+    return models.CalendarEvent(tenant_id=user.tenant_id, agent_id=user.id, property_id=prop_id, start_time=start,
+                                end_time=start + timedelta(minutes=minutes), **{"status": "CONFIRMED", **extra})
+
+def availability_for(prop_id=None, **params):
+    params = {"date": "2026-10-19", "days": 1, **params}
+    if prop_id:
+        params["property_id"] = prop_id
+    response = client.get("/api/bots/bot-agenda/availability", params=params)
+    assert response.status_code == 200
+    return [(s["start"], s["remaining"]) for s in response.json()["available_slots"]]
+
+def test_sweep_line_uses_peak_occupancy_and_separate_step(test_db):
+    """Prueba 1: Cupo por pico de visitas simultáneas, slots de 60 min cada 30 y eventos que arrancan antes del horario"""
+    user, prop = seed_property(test_db, visit_duration=60, max_simultaneous_visits=2)
+    test_db.add_all([
+        visit(user, prop.id, (9, 30), minutes=60), # 09:30-10:30, empieza antes del horario
+        visit(user, prop.id, (10, 0)),             # 10:00-10:30 -> pico de 2
+        visit(user, prop.id, (11, 0)),             # 11:00-11:30
+        visit(user, prop.id, (11, 30)),            # 11:30-12:00: consecutiva, no simultánea
+        visit(user, prop.id, (10, 45), status="CANCELLED"),
+    ])
+    test_db.commit()
+
+    assert availability_for(prop.id, step=30) == [("10:30", 1), ("11:00", 1)]
+    # Sin step: slots contiguos de la duración de la visita (como antes)
+    assert availability_for(prop.id) == [("11:00", 1)]
+
+def test_slots_are_cached_until_a_calendar_write_touches_the_property(test_db):
+    """Prueba 2: El día queda cacheado por propiedad y una visita nueva de esa propiedad lo invalida"""
+    user, prop = seed_property(test_db, visit_duration=30, max_simultaneous_visits=1)
+    assert len(availability_for(prop.id)) == 4
+    assert len(availability_for(prop.id)) == 4
+    assert availability.cache_stats()["hits"] == 1
+
+    response = client.post("/api/calendar/events", json={
+        "title": "Visita", "property_id": prop.id, "status": "CONFIRMED",
+        "start_time": "2026-10-19T10:30:00", "end_time": "2026-10-19T11:00:00",
+    })
+    assert response.status_code == 200
+    assert [start for start, _ in availability_for(prop.id)] == ["10:00", "11:00", "11:30"]
+
+def test_without_property_any_agent_event_blocks(test_db):
+    """Prueba 3: Sin propiedad manda la agenda del agente dueño del bot (slots de 30 min)"""
+    user, prop = seed_property(test_db)
+    test_db.add(visit(user, None, (11, 15), minutes=10, title="Dentista"))
+    test_db.commit()
+
+    assert [start for start, _ in availability_for()] == ["10:00", "10:30", "11:30"]
+    assert client.get("/api/bots/otro-bot/availability").status_code == 404
@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+import models
+import analytics
+from conftest import client
+
+def message(tenant_id, sender, role, text, ago):
+    at = datetime.now(timezone.utc).replace(tzinfo=None) - ago
+    return models.ChatHistory(tenant_id=tenant_id, sender_id=sender, role=role, parts=[text], created_at=at)
+
+def test_bot_analytics_is_aggregated_per_tenant(test_db):
+    """Prueba 1: Actividad, tiempo de respuesta y temas salen de SQL y solo con mensajes del tenant"""
+    tenant_id = test_db.query(models.User).first().tenant_id
+    test_db.add_all([
+        # Conversación 1: el bot responde a los 4s del último mensaje del usuario
+        message(tenant_id, "549341111", "user", "hola", timedelta(hours=5, seconds=30)),
+        message(tenant_id, "549341111", "user", "cual es el precio?", timedelta(hours=5, seconds=10)),
+        message(tenant_id, "549341111", "model", "El valor es USD 100.000", timedelta(hours=5, seconds=6)),
+        # Conversación 2, hace 3 días: responde a los 2s; la respuesta tardía (> 5 min) no cuenta
+        message(tenant_id, "549342222", "user", "quiero agendar una visita", timedelta(days=3, seconds=20)),
+        message(tenant_id, "549342222", "model", "Perfecto", timedelta(days=3, seconds=18)),
+        message(tenant_id, "549342222", "user", "donde queda?", timedelta(days=2, hours=1)),
+        message(tenant_id, "549342222", "model", "En Pichincha", timedelta(days=2)),
+        # Otro tenant y fuera del período
+        message(tenant_id + 1, "549343333", "user", "precio", timedelta(hours=1)),
+        message(tenant_id, "549344444", "user", "precio", timedelta(days=20)),
+    ])
+    test_db.add(models.Contact(tenant_id=tenant_id, name="Ana", status="HOT", lead_sentiment="positivo"))
+    test_db.commit()
+
+    data = client.get("/api/bots/analytics", params={"period": "7D"}).json()
+    assert data["kpis"]["active_conversations"] == 2
+    assert data["kpis"]["response_time"] == "3.0s"
+    assert data["kpis"]["hot_leads"] == 1
+    assert len(data["activity_data"]) == 7
+    assert sum(bucket["messages"] for bucket in data["activity_data"]) == 7
+    assert data["activity_data"][-1]["messages"] == 3
+    topics = {t["name"]: t["count"] for t in data["topic_data"]}
+    assert topics["Precios"] == 2 and topics["Agendar Visita"] == 1 and topics["Ubicación"] == 1
+    assert data["sentiment_data"][0] == {"name": "Positivo", "value": 100, "color": "#10B981"}
+
+    hoy = client.get("/api/bots/analytics", params={"period": "Hoy"}).json()
+    assert len(hoy["activity_data"]) == 8
+    assert hoy["kpis"]["active_conversations"] == 1
+
+def test_postgres_analytics_use_width_bucket_and_lag():
+    """Prueba 2: En Postgres los buckets usan width_bucket y la latencia LAG por conversación"""
+    class Bind:
+        dialect = postgresql.dialect()
+    class Recorder:
+        statements = []
+        def get_bind(self): return Bind
+        def execute(self, statement):
+            self.statements.append(str(statement.compile(dialect=postgresql.dialect())))
+            class Result:
+                def all(self): return []
+            return Result()
+        def scalar(self, statement):
+            self.statements.append(str(statement.compile(dialect=postgresql.dialect())))
+
+    db, now = Recorder(), datetime(2026, 10, 18)
+    assert analytics.activity_buckets(db, 1, now - timedelta(days=7), now, 7) == [0] * 7
+    analytics.response_time(db, 1, now - timedelta(days=7), now)
+    buckets, latency = db.statements
+    assert "width_bucket(EXTRACT(epoch FROM chat_history.created_at)" in buckets
+    assert "lag(lower(chat_history.role)) OVER (PARTITION BY chat_history.sender_id" in latency
+
+def test_topics_match_accented_text(test_db):
+    """Prueba 3: Los temas se buscan en el texto decodificado: el JSON guarda "dónde" como "d\\u00f3nde" """
+    tenant_id = test_db.query(models.User).first().tenant_id
+    test_db.add_all([
+        message(tenant_id, "549341111", "user", "¿Dónde queda? cuánto sale", timedelta(hours=1)),
+        message(tenant_id, "549342222", "user", "¿Tiene crédito?", timedelta(hours=1)),
+    ])
+    test_db.commit()
+
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    topics = analytics.topic_counts(test_db, tenant_id, now - timedelta(days=1), now)
+    assert topics == {"Precios": 1, "Agendar Visita": 0, "Financiación": 1, "Ubicación": 1, "Requisitos": 0}
+    compiled = str(select(analytics.message_text("postgresql")).compile(dialect=postgresql.dialect()))
+    assert "json_array_elements_text(" in compiled
@@ -0,0 +1,73 @@
+import models
+import bot_intents
+
+PHONE = "5493415551234"
+
+def test_only_short_single_topic_questions_take_the_fast_path():
+    """Prueba 1: Consultas puntuales de un solo tema van por plantilla; el resto (ambiguo o con más contenido) al modelo"""
+    cases = {
+        "requisitos?": "Requisitos",
+        "Hola! cuáles son los requisitos?": "Requisitos",
+        "precio?": "Precios",
+        "cuánto sale URB-1A2B3C?": "Precios",
+        "horarios para verla?": "Agendar Visita",
+        "dónde queda?": "Ubicación",
+        "precio y financiación?": None, # dos temas
+        "tiene financiación?": None, # tema sin plantilla
+        "quiero ver otras opciones en Fisherton": None,
+        "Busco un dos ambientes con balcón en Centro hasta 90 mil, cuál es el precio?": None,
+    }
+    for text, topic in cases.items():
+        intent = bot_intents.classify(text)
+        assert (intent.topic if intent else None) == topic, text
+
+def test_fast_path_answers_about_the_property_in_context(test_db):
+    """Prueba 2: La propiedad sale del último mensaje que nombra un código; varios códigos o sin datos van al modelo"""
+    tenant_id = test_db.query(models.Tenant.id).scalar()
+    test_db.add_all([
+        models.Property(tenant_id=tenant_id, code="URB-AAA111", title="PH en Fisherton", price=120000, currency="USD", operation="Sale",
+                        transaction_requirements="Garantía propietaria"),
+        models.Property(tenant_id=tenant_id, code="URB-BBB222", title="Depto Centro", price=None, operation="Rent"),
+        models.ChatHistory(tenant_id=tenant_id, sender_id=PHONE, role="user", parts=["Busco algo con patio"]),
+        models.ChatHistory(tenant_id=tenant_id, sender_id=PHONE, role="model", parts=["Te recomiendo el PH en Fisherton (URB-AAA111)."]),
+    ])
+    test_db.commit()
+    calls = []
+    tools = {"get_property_requisites": lambda property_id: calls.append(property_id) or "Requisitos: Garantía propietaria",
+             "get_availability": lambda property_id: {"available_slots": []}}
+
+    reply = bot_intents.answer(test_db, PHONE, "requisitos?", tools, tenant_id)
+    assert reply.startswith("Requisitos: Garantía propietaria")
+    assert calls == [test_db.query(models.Property.id).filter(models.Property.code == "URB-AAA111").scalar()]
+    assert "USD 120,000" in bot_intents.answer(test_db, PHONE, "precio?", tools, tenant_id)
+    # Sin horarios libres, sin precio o con dos propiedades en juego: que conteste el modelo
+    assert bot_intents.answer(test_db, PHONE, "horarios?", tools, tenant_id) is None
+    assert bot_intents.answer(test_db, PHONE, "precio de URB-BBB222?", tools, tenant_id) is None
+    test_db.add(models.ChatHistory(tenant_id=tenant_id, sender_id=PHONE, role="model", parts=["Tengo URB-AAA111 y URB-BBB222."]))
+    test_db.commit()
+    assert bot_intents.answer(test_db, PHONE, "precio?", tools, tenant_id) is None
+
+    bot_intents.record_llm_turn(1500.0)
+    stats = bot_intents.stats()
+    assert stats["handled"] == 2 and stats["turns"] == 5
+    assert stats["by_intent"] == {"Requisitos": 1, "Precios": 1}
+    assert stats["fallbacks"] == {"no_answer": 2, "no_property": 1}
+    # Lo ahorrado es contra el promedio de Gemini; el tiempo del atajo depende de la máquina
+    assert 0 < stats["saved_ms"] and abs(stats["saved_ms"] - 2 * (1500.0 - stats["avg_fast_path_ms"])) < 0.05
+
+def test_context_property_ignores_other_tenants_conversations(test_db):
+    """Prueba 3: El código en contexto sale solo de la conversación con el bot del mismo tenant"""
+    tenant_a = test_db.query(models.Tenant.id).scalar()
+    tenant_b = tenant_a + 1
+    test_db.add(models.Tenant(id=tenant_b, name="Otra inmobiliaria"))
+    test_db.add_all([
+        models.Property(tenant_id=tenant_a, code="URB-AAA111", title="PH en Fisherton"),
+        models.Property(tenant_id=tenant_b, code="URB-BBB222", title="Depto Centro"),
+        models.ChatHistory(tenant_id=tenant_a, sender_id=PHONE, role="model", parts=["Te recomiendo URB-AAA111."]),
+        models.ChatHistory(tenant_id=tenant_b, sender_id=PHONE, role="model", parts=["Mirá URB-AAA111, también URB-BBB222."]),
+    ])
+    test_db.commit()
+
+    assert bot_intents.context_property(test_db, PHONE, "precio?", tenant_a).code == "URB-AAA111"
+    # Del lado del tenant B el último mensaje nombra dos códigos: ambiguo, aunque el de A sea más viejo y tenga uno solo
+    assert bot_intents.context_property(test_db, PHONE, "precio?", tenant_b) is None
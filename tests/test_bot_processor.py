@@ -0,0 +1,72 @@
+import asyncio
+import gc
+import logging
+import threading
+import time
+import pytest
+from bot_processor import ConversationProcessor
+
+class StubTurn:
+    """Turno bloqueante (como process_message) que registra orden y concurrencia por teléfono."""
+    def __init__(self, seconds=0.01):
+        self.seconds = seconds
+        self.lock = threading.Lock()
+        self.running = {}
+        self.seen = {}
+        self.overlaps = 0
+
+    def __call__(self, instance_name, phone, text):
+        with self.lock:
+            if self.running.get(phone):
+                self.overlaps += 1
+            self.running[phone] = True
+        time.sleep(self.seconds)
+        with self.lock:
+            self.running[phone] = False
+            self.seen.setdefault(phone, []).append(text)
+        if text == "boom":
+            raise RuntimeError("Gemini caído")
+        return f"ok {text}"
+
+def test_messages_keep_order_per_phone_and_respect_the_global_limit():
+    """Prueba 1: Muchos teléfonos en paralelo (hasta el tope), cada uno en orden y sin turnos superpuestos"""
+    turn = StubTurn()
+    async def scenario():
+        processor = ConversationProcessor(turn, max_concurrency=4)
+        futures = [processor.submit("bot", f"549341000{p}", f"m{i}") for i in range(5) for p in range(8)]
+        await processor.shutdown()
+        return processor, [await f for f in futures]
+    processor, replies = asyncio.run(scenario())
+
+    assert replies[:2] == ["ok m0", "ok m0"]
+    assert all(texts == [f"m{i}" for i in range(5)] for texts in turn.seen.values()) and len(turn.seen) == 8
+    stats = processor.stats()
+    assert turn.overlaps == 0 and stats["max_in_flight"] == 4 and stats["processed"] == 40
+    assert stats["active_conversations"] == 0 and stats["queued"] == 0
+
+def test_failed_turn_does_not_block_the_conversation():
+    """Prueba 2: Si un turno falla, el future lleva el error y los siguientes mensajes del teléfono se procesan"""
+    turn = StubTurn(seconds=0)
+    async def scenario():
+        processor = ConversationProcessor(turn, max_concurrency=2)
+        failed = processor.submit("bot", "5493411", "boom")
+        after = processor.submit("bot", "5493411", "hola")
+        with pytest.raises(RuntimeError):
+            await failed
+        reply = await after
+        await processor.shutdown()
+        return processor, reply
+    processor, reply = asyncio.run(scenario())
+    assert reply == "ok hola" and processor.stats()["failed"] == 1
+
+def test_failures_are_logged_even_if_nobody_awaits_the_future(caplog):
+    """Prueba 3: Un turno que falla se loguea una vez aunque quien lo encoló no espere el future"""
+    async def scenario():
+        processor = ConversationProcessor(StubTurn(seconds=0), max_concurrency=1)
+        processor.submit("bot", "5493411", "boom") # como el webhook: sin await
+        await processor.shutdown()
+    with caplog.at_level(logging.ERROR):
+        asyncio.run(scenario())
+        gc.collect()
+    messages = [r.getMessage() for r in caplog.records]
+    assert messages == ["Bot turn failed for 5493411 (bot): Gemini caído"]
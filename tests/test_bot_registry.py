@@ -0,0 +1,30 @@
+import bot_registry
+import models
+from conftest import client, TestingSessionLocal
+
+class FakeEngine:
+    """Lo que el registro necesita de un BotEngine: el Bot (None si la instancia no existe). Sin Gemini."""
+    def __init__(self, instance_name):
+        with TestingSessionLocal() as db:
+            self.bot = db.query(models.Bot).filter(models.Bot.instance_name == instance_name).first()
+            self.system_prompt = self.bot.system_prompt if self.bot else None
+
+def test_engine_is_reused_until_configure_changes_the_prompt(test_db):
+    """Prueba 1: Un engine por instancia entre mensajes; configure_bot lo descarta y el siguiente ve el prompt nuevo"""
+    user = test_db.query(models.User).first()
+    test_db.add(models.Bot(user_id=user.id, platform="whatsapp", instance_name="whatsapp_cloud_1", system_prompt="Sos Agustina."))
+    test_db.commit()
+
+    first = bot_registry.get("whatsapp_cloud_1", FakeEngine)
+    assert bot_registry.get("whatsapp_cloud_1", FakeEngine) is first
+    assert first.system_prompt == "Sos Agustina."
+
+    response = client.post("/api/bots/configure", json={"platform": "whatsapp", "system_prompt": "Sos Martina."})
+    assert response.status_code == 200
+    rebuilt = bot_registry.get("whatsapp_cloud_1", FakeEngine)
+    assert rebuilt is not first and rebuilt.system_prompt == "Sos Martina."
+
+    # Instancia sin Bot: no se cachea (puede conectarse después)
+    assert bot_registry.get("desconocida", FakeEngine).bot is None
+    stats = client.get("/api/bots/engine-stats").json()
+    assert stats["hits"] == 1 and stats["misses"] == 3 and stats["entries"] == 1
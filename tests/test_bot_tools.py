@@ -0,0 +1,70 @@
+import time
+import threading
+import models
+import bot_tools
+from conftest import TestingSessionLocal
+
+def test_read_tools_run_in_parallel_and_writes_in_order():
+    """Prueba 1: Las lecturas de una respuesta corren a la vez; las escrituras después, en orden; resultados en el orden pedido"""
+    events = []
+    def get_property_requisites(property_id):
+        time.sleep(0.1)
+        events.append(("read", property_id))
+        return f"requisitos {property_id}"
+    def schedule_visit(property_id, date, time):
+        events.append(("write", property_id))
+        return "agendada"
+    def search_properties(zone=None):
+        raise RuntimeError("sin conexión")
+    functions = {f.__name__: f for f in (get_property_requisites, schedule_visit, search_properties)}
+
+    calls = [("schedule_visit", {"property_id": 1, "date": "2026-10-20", "time": "10:00"}),
+             ("get_property_requisites", {"property_id": 1}),
+             ("get_property_requisites", {"property_id": 2}),
+             ("get_property_requisites", {"property_id": 3}),
+             ("search_properties", {"zone": "Centro"}),
+             ("borrar_todo", {})]
+    started = time.perf_counter()
+    results = bot_tools.execute(calls, functions, parallelism=4)
+    assert time.perf_counter() - started < 0.25
+
+    assert [r.name for r in results] == [name for name, _ in calls]
+    assert results[1].result == "requisitos 1" and results[3].result == "requisitos 3"
+    assert events[-1] == ("write", 1)
+    assert results[4].error == "sin conexión" and results[5].error == "unknown tool"
+
+    stats = bot_tools.stats()
+    assert stats["tools"]["get_property_requisites"]["calls"] == 3
+    assert stats["tools"]["search_properties"]["errors"] == 1
+    assert stats["parallel_batches"] == 1 and stats["saved_ms"] > 100
+
+def test_turn_shares_one_session_and_memo_across_threads(test_db):
+    """Prueba 2: Las tools de un turno (en hilos distintos) comparten sesión y memo: cada propiedad y bot se consulta una vez"""
+    user = test_db.query(models.User).first()
+    test_db.add(models.Property(id=7, title="PH en Fisherton", status="Active", assigned_agent_id=user.id, transaction_requirements="Garantía propietaria"))
+    test_db.add(models.Bot(user_id=user.id, platform="whatsapp", instance_name="whatsapp_cloud_1"))
+    test_db.commit()
+
+    sessions, opened = set(), []
+    def session_factory():
+        opened.append(threading.get_ident())
+        return TestingSessionLocal()
+    def get_availability(property_id):
+        with bot_tools.turn_tools() as tools:
+            prop = tools.property(property_id)
+            with tools.read() as db:
+                sessions.add(id(db))
+            return tools.agent_bot(prop.assigned_agent_id).instance_name
+    def get_property_requisites(property_id):
+        with bot_tools.turn_tools() as tools:
+            with tools.read() as db:
+                sessions.add(id(db))
+                return tools.property(property_id).transaction_requirements
+
+    with bot_tools.open_turn(session_factory) as tools:
+        calls = [("get_availability", {"property_id": 7}), ("get_property_requisites", {"property_id": 7}),
+                 ("get_availability", {"property_id": 7.0})]
+        results = bot_tools.execute(calls, {"get_availability": get_availability, "get_property_requisites": get_property_requisites})
+        assert [r.result for r in results] == ["whatsapp_cloud_1", "Garantía propietaria", "whatsapp_cloud_1"]
+        assert len(opened) == 1 and len(sessions) == 1
+        assert tools.queries == 2 # una propiedad + un bot
@@ -0,0 +1,101 @@
+import models
+import job_queue
+import conversation_memory
+from conversation_memory import estimate_tokens
+
+PHONE = "5493415550000"
+
+def seed_conversation(db, turns: int, words: int = 60):
+    """Conversación de `turns` idas y vueltas con mensajes de ~`words` palabras."""
+    for i in range(turns):
+        db.add(models.ChatHistory(sender_id=PHONE, role="user", parts=[f"consulta {i} " + "quiero un dos ambientes con balcón " * (words // 6)]))
+        db.add(models.ChatHistory(sender_id=PHONE, role="model", parts=[f"respuesta {i} " + "te paso opciones en Centro y Fisherton " * (words // 6)]))
+    db.commit()
+
+def test_history_fits_budget_and_schedules_summary(test_db, monkeypatch):
+    """Prueba 1: Solo los turnos recientes que entran en el presupuesto (empezando por el usuario); el resto encola un resumen"""
+    monkeypatch.setattr(conversation_memory.settings, "bot_memory_token_budget", 500)
+    seed_conversation(test_db, turns=20)
+
+    memory = conversation_memory.load(test_db, PHONE)
+    assert memory.history[0]["role"] == "user"
+    assert memory.history[-1]["parts"][0].startswith("respuesta 19")
+    assert 0 < memory.prompt_tokens <= 500
+    assert sum(estimate_tokens(m["parts"][0]) for m in memory.history) == memory.prompt_tokens
+    assert memory.needs_summary
+
+    conversation_memory.schedule_summary(test_db, PHONE)
+    conversation_memory.schedule_summary(test_db, PHONE)
+    test_db.commit()
+    summary = test_db.query(models.ConversationSummary).one()
+    job = test_db.query(models.Job).one()
+    assert (job.kind, job.entity_id) == (job_queue.CONVERSATION_SUMMARY, summary.id)
+
+def test_summary_folds_older_turns(test_db, monkeypatch):
+    """Prueba 2: El resumen pliega lo que no entra; el historial siguiente es resumen + recientes y no vuelve a pedir resumen"""
+    monkeypatch.setattr(conversation_memory.settings, "bot_memory_token_budget", 800)
+    seed_conversation(test_db, turns=20)
+    conversation_memory.schedule_summary(test_db, PHONE)
+    test_db.commit()
+    summary = test_db.query(models.ConversationSummary).one()
+
+    folded = []
+    def fake_summarizer(previous, messages):
+        folded.extend(messages)
+        return "Busca dos ambientes con balcón en Centro o Fisherton."
+
+    assert conversation_memory.summarize(test_db, summary, summarizer=fake_summarizer) is True
+    test_db.commit()
+    assert folded[0]["parts"][0].startswith("consulta 0")
+    assert summary.summarized_until_id == test_db.query(models.ChatHistory.id).filter(
+        models.ChatHistory.parts == folded[-1]["parts"]).scalar()
+
+    memory = conversation_memory.load(test_db, PHONE)
+    assert memory.history[0]["parts"][0].startswith(conversation_memory.SUMMARY_PREFIX)
+    assert memory.history[1]["role"] == "model" and memory.history[2]["role"] == "user"
+    assert memory.prompt_tokens <= 800 and not memory.needs_summary
+    # Nada nuevo que plegar
+    assert conversation_memory.summarize(test_db, summary, summarizer=fake_summarizer) is False
+
+def test_backlog_is_folded_in_bounded_jobs(test_db, monkeypatch):
+    """Prueba 3: Un historial largo se pliega de a bot_memory_summary_max_rows mensajes, encolando un job por tramo"""
+    monkeypatch.setattr(conversation_memory.settings, "bot_memory_token_budget", 800)
+    monkeypatch.setattr(conversation_memory.settings, "bot_memory_summary_max_rows", 10)
+    seed_conversation(test_db, turns=20)
+    memory = conversation_memory.load(test_db, PHONE)
+    assert memory.recent_turns < 20 and memory.needs_summary
+    conversation_memory.schedule_summary(test_db, PHONE)
+    test_db.commit()
+    summary = test_db.query(models.ConversationSummary).one()
+    test_db.query(models.Job).update({"status": "done"})
+
+    batches, queued = [], []
+    summarizer = lambda previous, messages: batches.append(len(messages)) or f"Resumen {len(batches)}"
+    while conversation_memory.summarize(test_db, summary, summarizer=summarizer):
+        test_db.commit()
+        queued.append(test_db.query(models.Job).filter(models.Job.status == "pending").count())
+        test_db.query(models.Job).update({"status": "done"})
+    assert batches[:-1] == [10] * (len(batches) - 1) and 0 < batches[-1] <= 10 and len(batches) > 1
+    assert queued == [1] * (len(batches) - 1) + [0]
+    assert not conversation_memory.load(test_db, PHONE).needs_summary
+
+def test_memory_is_scoped_to_the_tenant(test_db):
+    """Prueba 4: El mismo cliente con bots de dos inmobiliarias: cada una ve solo su historial y su resumen"""
+    tenant_a = test_db.query(models.Tenant.id).scalar()
+    tenant_b = tenant_a + 1
+    test_db.add(models.Tenant(id=tenant_b, name="Otra inmobiliaria"))
+    test_db.add_all([
+        models.ChatHistory(tenant_id=tenant_a, sender_id=PHONE, role="user", parts=["Busco un PH en Fisherton"]),
+        models.ChatHistory(tenant_id=tenant_b, sender_id=PHONE, role="user", parts=["Quiero tasar mi casa"]),
+    ])
+    test_db.add(models.ConversationSummary(tenant_id=tenant_a, sender_id=PHONE, summary="Presupuesto USD 120.000", summarized_until_id=0))
+    test_db.commit()
+
+    memory_a = conversation_memory.load(test_db, PHONE, tenant_a)
+    memory_b = conversation_memory.load(test_db, PHONE, tenant_b)
+    assert "USD 120.000" in memory_a.history[0]["parts"][0] and memory_a.history[-1]["parts"] == ["Busco un PH en Fisherton"]
+    assert memory_b.history == [{"role": "user", "parts": ["Quiero tasar mi casa"]}]
+
+    conversation_memory.schedule_summary(test_db, PHONE, tenant_b)
+    test_db.commit()
+    assert test_db.query(models.ConversationSummary).filter(models.ConversationSummary.sender_id == PHONE).count() == 2
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+import models
+from conftest import client
+
+def seed_board(db, cards=5):
+    user = db.query(models.User).first()
+    pipeline = models.Pipeline(tenant_id=user.tenant_id, name="Ventas")
+    db.add(pipeline)
+    db.flush()
+    new, visit = models.PipelineStage(pipeline_id=pipeline.id, name="Nuevo", order=0), models.PipelineStage(pipeline_id=pipeline.id, name="Visita", order=1)
+    contact = models.Contact(tenant_id=user.tenant_id, name="Ana")
+    db.add_all([new, visit, contact])
+    db.flush()
+    start = datetime(2026, 10, 1)
+    deals = [models.Deal(tenant_id=user.tenant_id, title=f"Deal {i}", value=100, pipeline_stage_id=new.id, contact_id=contact.id,
+                         assigned_agent_id=user.id, created_at=start + timedelta(hours=i)) for i in range(cards)]
+    deals.append(models.Deal(tenant_id=user.tenant_id, title="Ganado", value=999, status="WON", pipeline_stage_id=visit.id, created_at=start))
+    db.add_all(deals)
+    db.flush()
+    db.add_all([models.DealComment(deal_id=deals[0].id, user_id=user.id, content="Llamar"),
+                models.DealHistory(deal_id=deals[0].id, to_stage_id=new.id, user_id=user.id)])
+    db.commit()
+    return pipeline, new, visit, deals
+
+def test_board_returns_totals_and_first_cards_per_stage(test_db):
+    """Prueba 1: Por etapa cantidad, valor y las primeras N tarjetas livianas (más nuevas primero)"""
+    pipeline, new, visit, deals = seed_board(test_db)
+
+    response = client.get("/api/opportunities/board", params={"pipeline_id": pipeline.id, "limit": 2})
+    assert response.status_code == 200
+    columns = response.json()["stages"]
+    assert [(c["name"], c["count"], c["value"]) for c in columns] == [("Nuevo", 5, 500), ("Visita", 0, 0)]
+    cards = columns[0]["cards"]
+    assert [c["title"] for c in cards] == ["Deal 4", "Deal 3"]
+    assert cards[0]["contact_name"] == "Ana" and cards[0]["agent_name"]
+    assert "comments" not in cards[0] and columns[0]["next_cursor"] and columns[1]["next_cursor"] is None
+
+    # Sin filtro de estado entra el ganado
+    everything = client.get("/api/opportunities/board", params={"pipeline_id": pipeline.id, "status": ""}).json()
+    assert everything["stages"][1]["count"] == 1
+    assert client.get("/api/opportunities/board", params={"pipeline_id": 999}).status_code == 404
+
+def test_board_column_cursor_pagination_and_lazy_relations(test_db):
+    """Prueba 2: Cada columna pagina con cursor keyset; comentarios e historia van por deal"""
+    pipeline, new, visit, deals = seed_board(test_db)
+    first = client.get("/api/opportunities/board", params={"pipeline_id": pipeline.id, "limit": 2}).json()["stages"][0]
+
+    titles, cursor = [c["title"] for c in first["cards"]], first["next_cursor"]
+    while cursor:
+        page = client.get(f"/api/opportunities/board/stages/{new.id}", params={"cursor": cursor, "limit": 2}).json()
+        titles += [c["title"] for c in page["cards"]]
+        cursor = page["next_cursor"]
+    assert titles == ["Deal 4", "Deal 3", "Deal 2", "Deal 1", "Deal 0"]
+    assert client.get(f"/api/opportunities/board/stages/{new.id}", params={"cursor": "basura"}).status_code == 400
+
+    assert [c["content"] for c in client.get(f"/api/opportunities/deals/{deals[0].id}/comments").json()] == ["Llamar"]
+    assert len(client.get(f"/api/opportunities/deals/{deals[0].id}/history").json()) == 1
+    assert client.get(f"/api/opportunities/deals/{deals[1].id}/comments").json() == []
@@ -0,0 +1,116 @@
+import datetime
+import models
+import embedding_cache
+from routers import ai_service
+from conftest import TestingSessionLocal
+
+def fake_embeddings(calls):
+    def _fake(texts, task_type="retrieval_document", **kwargs):
+        calls.append(list(texts))
+        return [[float(len(t))] * ai_service.EMBEDDING_DIMENSIONS for t in texts]
+    return _fake
+
+def test_unchanged_text_is_not_reembedded(test_db, monkeypatch):
+    """Prueba 1: Un contexto idéntico sale del cache (memoria y luego tabla) sin llamar a Gemini"""
+    calls = []
+    monkeypatch.setattr(embedding_cache, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(ai_service, "get_embeddings", fake_embeddings(calls))
+    embedding_cache.clear_memory()
+
+    first = embedding_cache.get_embedding("Propiedad en Pichincha. 2 ambientes.")
+    second = embedding_cache.get_embedding("Propiedad en Pichincha. 2 ambientes.")
+    assert first == second
+    assert len(calls) == 1
+
+    # Sin el LRU (ej. otro worker) el vector sale de la tabla embedding_cache
+    embedding_cache.clear_memory()
+    third = embedding_cache.get_embedding("Propiedad en Pichincha. 2 ambientes.")
+    assert third == first
+    assert len(calls) == 1
+    assert test_db.query(models.EmbeddingCache).count() == 1
+
+def test_batch_only_embeds_misses(test_db, monkeypatch):
+    """Prueba 2: En un lote sólo se envían a Gemini los textos nuevos (y los duplicados una vez)"""
+    calls = []
+    monkeypatch.setattr(embedding_cache, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(ai_service, "get_embeddings", fake_embeddings(calls))
+    embedding_cache.clear_memory()
+
+    embedding_cache.get_embeddings(["a", "bb"])
+    vectors = embedding_cache.get_embeddings(["a", "ccc", "ccc", ""])
+
+    assert calls == [["a", "bb"], ["ccc"]]
+    assert vectors[1] == vectors[2]
+    assert vectors[3] is None
+    assert embedding_cache.stats()["memory_hits"] >= 1
+
+def test_query_cache_normalizes_and_shares_hits(test_db, monkeypatch):
+    """Prueba 3: Búsquedas equivalentes comparten embedding; otro worker lo toma de la tabla compartida"""
+    calls = []
+    def fake_embedding(text, task_type="retrieval_query"):
+        calls.append(text)
+        return [0.5] * ai_service.EMBEDDING_DIMENSIONS
+    monkeypatch.setattr(embedding_cache, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(ai_service, "get_embedding", fake_embedding)
+    monkeypatch.setattr(embedding_cache.settings, "query_embedding_cache_shared", True)
+    embedding_cache.clear_memory()
+
+    embedding_cache.get_query_embedding("Depto 2 ambientes, Pichincha!")
+    embedding_cache.get_query_embedding("  depto 2 AMBIENTES   pichincha ")
+    # Se embebe el texto original; el normalizado es solo la clave
+    assert calls == ["Depto 2 ambientes, Pichincha!"]
+    assert embedding_cache.normalize_query("Jardín y parrillero") == "jardin y parrillero"
+
+    # Proceso nuevo (LRU vacío): hit en el backend compartido, sin llamar a Gemini
+    embedding_cache.clear_memory()
+    before = embedding_cache.query_stats()["shared_hits"]
+    embedding_cache.get_query_embedding("depto 2 ambientes pichincha")
+    assert len(calls) == 1
+    assert embedding_cache.query_stats()["shared_hits"] == before + 1
+
+def test_query_cache_ttl_and_size_bounds(monkeypatch):
+    """Prueba 4: Las entradas vencen por TTL y el LRU no supera el tamaño configurado"""
+    calls = []
+    monkeypatch.setattr(ai_service, "get_embedding", lambda text, task_type="retrieval_query": calls.append(text) or [1.0])
+    monkeypatch.setattr(embedding_cache.settings, "query_embedding_cache_shared", False)
+    monkeypatch.setattr(embedding_cache.settings, "query_embedding_cache_size", 2)
+    monkeypatch.setattr(embedding_cache.settings, "query_embedding_cache_ttl_seconds", 60)
+    embedding_cache.clear_memory()
+
+    for q in ["casa", "ph", "lote"]:
+        embedding_cache.get_query_embedding(q)
+    assert embedding_cache.query_stats()["entries"] == 2
+    embedding_cache.get_query_embedding("casa") # desalojada por tamaño
+    assert calls == ["casa", "ph", "lote", "casa"]
+
+    now = embedding_cache.time.monotonic()
+    monkeypatch.setattr(embedding_cache.time, "monotonic", lambda: now + 61)
+    embedding_cache.get_query_embedding("casa") # vencida por TTL
+    assert calls[-1] == "casa" and len(calls) == 5
+
+def test_shared_query_cache_honours_the_ttl(test_db, monkeypatch):
+    """Prueba 5: Un vector de la tabla compartida más viejo que el TTL no se usa; al volver a embeberlo se reemplaza"""
+    calls = []
+    def fake_embedding(text, task_type="retrieval_query"):
+        calls.append(text)
+        return [float(len(calls))] * ai_service.EMBEDDING_DIMENSIONS
+    monkeypatch.setattr(embedding_cache, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(ai_service, "get_embedding", fake_embedding)
+    monkeypatch.setattr(embedding_cache.settings, "query_embedding_cache_shared", True)
+    monkeypatch.setattr(embedding_cache.settings, "query_embedding_cache_ttl_seconds", 60)
+    embedding_cache.clear_memory()
+
+    embedding_cache.get_query_embedding("casa con jardín")
+    test_db.query(models.EmbeddingCache).update({models.EmbeddingCache.created_at: datetime.datetime(2020, 1, 1)})
+    test_db.commit()
+
+    embedding_cache.clear_memory()
+    assert embedding_cache.get_query_embedding("Casa con jardin")[0] == 2.0 # vencida en la tabla: otra vuelta a Gemini
+    assert calls == ["casa con jardín", "Casa con jardin"]
+    test_db.expire_all()
+    row = test_db.query(models.EmbeddingCache).one()
+    assert row.created_at > datetime.datetime(2020, 1, 1) and row.embedding[0] == 2.0
+
+    embedding_cache.clear_memory()
+    assert embedding_cache.get_query_embedding("casa con jardin")[0] == 2.0 # refrescada: hit compartido
+    assert len(calls) == 2
@@ -0,0 +1,63 @@
+import models
+from conftest import client
+
+def seed_property(db, **overrides):
+    user = db.query(models.User).first()
+    prop = models.Property(tenant_id=user.tenant_id, code="URB-F1", title="Casa Fisherton", address="Wilde 500", city="Rosario",
+                           price=250000, operation="Sale", type="House", status="Active", published_on_portals=["zonaprop"],
+                           **overrides)
+    db.add(prop)
+    db.commit()
+    return user.tenant_id, prop
+
+def test_feed_is_revalidated_with_etag_and_last_modified(test_db):
+    """Prueba 1: El feed lleva ETag / Last-Modified de la versión de inventario y responde 304 si no cambió"""
+    tenant_id, _ = seed_property(test_db)
+    url = f"/api/feeds/{tenant_id}/zonaprop.xml"
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.content.startswith(b"<?xml") and response.content.endswith(b"</properties>")
+    assert b"<reference_code>URB-F1</reference_code>" in response.content
+    etag, last_modified = response.headers["etag"], response.headers["last-modified"]
+
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(url, headers={"If-Modified-Since": last_modified}).status_code == 304
+    # If-None-Match manda aunque If-Modified-Since diga que no cambió
+    assert client.get(url, headers={"If-None-Match": '"otro"', "If-Modified-Since": last_modified}).status_code == 200
+
+def test_feed_cache_is_invalidated_by_property_changes(test_db):
+    """Prueba 2: Se sirve el feed cacheado hasta que cambia una propiedad del tenant; el embedding no cuenta"""
+    tenant_id, prop = seed_property(test_db)
+    url = f"/api/feeds/{tenant_id}/zonaprop.xml"
+    first = client.get(url)
+
+    prop.search_content = "texto para la IA"
+    test_db.commit()
+    cached = client.get(url)
+    assert cached.headers["etag"] == first.headers["etag"]
+    assert cached.content == first.content
+
+    prop.title = "Casa Fisherton con pileta"
+    test_db.commit()
+    updated = client.get(url, headers={"If-None-Match": first.headers["etag"]})
+    assert updated.status_code == 200
+    assert updated.headers["etag"] != first.headers["etag"]
+    assert b"<title>Casa Fisherton con pileta</title>" in updated.content
+
+def test_feed_streams_every_batch(test_db, monkeypatch):
+    """Prueba 3: Con varios lotes del cursor el XML sale completo, en orden y con una sola raíz"""
+    from settings import settings
+    monkeypatch.setattr(settings, "feed_yield_per", 2)
+    user = test_db.query(models.User).first()
+    test_db.add_all([
+        models.Property(tenant_id=user.tenant_id, code=f"URB-S{i}", status="Active", gallery=[{"full": f"https://img/{i}.jpg"}])
+        for i in range(5)
+    ])
+    test_db.commit()
+
+    content = client.get(f"/api/feeds/{user.tenant_id}/all.xml").content
+    assert content.count(b"<property>") == 5
+    assert content.count(b"<properties>") == 1
+    assert content.index(b"URB-S0") < content.index(b"URB-S4")
+    assert b"<picture_url>https://img/3.jpg</picture_url>" in content
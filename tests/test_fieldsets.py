@@ -0,0 +1,69 @@
+from contextlib import contextmanager
+from sqlalchemy import event
+import models
+import pagination
+from conftest import client, engine
+
+@contextmanager
+def captured_selects():
+    """SELECTs que llegan a la base (el motor async comparte la conexión, pero el evento es por Engine)."""
+    from conftest import async_engine
+    statements = []
+    def capture(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append(statement)
+    engines = (engine, async_engine.sync_engine)
+    for e in engines:
+        event.listen(e, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        for e in engines:
+            event.remove(e, "before_cursor_execute", capture)
+
+def test_fields_trim_select_and_payload(test_db):
+    """Prueba 1: ?fields= trae solo esas columnas (más el id), pagina igual y rechaza campos desconocidos"""
+    tenant_id = test_db.query(models.User).first().tenant_id
+    test_db.add_all([models.Property(tenant_id=tenant_id, code=f"URB-F{i}", title=f"Casa {i}", address=f"Calle {i}", price=1000 + i,
+                                     operation="Sale", type="House", city="Rosario", status="Active",
+                                     gallery=[f"https://cdn/{i}/{n}.webp" for n in range(20)]) for i in range(3)])
+    test_db.add(models.Development(tenant_id=tenant_id, name="Torre", code="DEV-1", description="x" * 500))
+    test_db.commit()
+
+    with captured_selects() as statements:
+        response = client.get("/api/properties", params={"fields": "title, price", "limit": 2})
+    assert response.status_code == 200
+    assert response.json() == [{"id": 3, "price": 1002, "title": "Casa 2"}, {"id": 2, "price": 1001, "title": "Casa 1"}]
+    property_select = next(s for s in statements if "FROM properties" in s)
+    assert "properties.gallery" not in property_select and "properties.title" in property_select
+
+    cursor = response.headers[pagination.NEXT_CURSOR_HEADER]
+    last = client.get("/api/properties", params={"fields": "code", "cursor": cursor}).json()
+    assert last == [{"code": "URB-F0", "id": 1}]
+
+    assert client.get("/api/developments", params={"fields": "name"}).json() == [{"id": 1, "name": "Torre"}]
+    assert client.get("/api/team", params={"fields": "email"}).json() == [{"email": "test_qa@urbanocrm.com", "id": 1}]
+    full = client.get("/api/properties").json()
+    assert len(full) == 3 and len(full[0]["gallery"]) == 20
+
+    response = client.get("/api/contacts", params={"fields": "name,embedding_preferences"})
+    assert response.status_code == 400 and "embedding_preferences" in response.json()["detail"]
+
+def test_heavy_columns_deferred_and_large_lists_gzipped(test_db):
+    """Prueba 2: Vectores y texto para la IA no viajan en los listados; las respuestas grandes salen comprimidas"""
+    tenant_id = test_db.query(models.User).first().tenant_id
+    test_db.add_all([models.Contact(tenant_id=tenant_id, name=f"Contacto {i}", notes="nota " * 50) for i in range(20)])
+    test_db.add(models.Property(tenant_id=tenant_id, code="URB-H1", title="Casa", address="Calle 1", price=1000,
+                                search_content="texto para la IA", status="Active", operation="Sale", type="House", city="Rosario"))
+    test_db.commit()
+
+    with captured_selects() as statements:
+        contacts = client.get("/api/contacts", headers={"Accept-Encoding": "gzip"})
+        client.get("/api/properties")
+    assert contacts.headers["content-encoding"] == "gzip" and len(contacts.json()) == 20
+    selects = " ".join(statements)
+    assert "embedding_preferences" not in selects
+    assert "embedding_descripcion" not in selects and "properties.search_content" not in selects
+
+    small = client.get("/api/team", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta, timezone
+import models
+import funnel
+from conftest import client
+
+def seed_pipeline():
+    response = client.post("/api/opportunities/pipelines", json={"name": "Ventas", "stages": [
+        {"name": "Contacto", "order": 0}, {"name": "Visita", "order": 1}, {"name": "Reserva", "order": 2},
+    ]})
+    assert response.status_code == 200
+    pipeline = response.json()
+    return pipeline["id"], [s["id"] for s in sorted(pipeline["stages"], key=lambda s: s["order"])]
+
+def create_deal(stage_id, value, **extra):
+    response = client.post("/api/opportunities/deals", json={"title": "Deal", "value": value, "pipeline_stage_id": stage_id, **extra})
+    assert response.status_code == 200
+    return response.json()["id"]
+
+def report(pipeline_id, **params):
+    response = client.get("/api/opportunities/analytics/funnel", params={"pipeline_id": pipeline_id, **params})
+    assert response.status_code == 200
+    return response.json()
+
+def test_funnel_rollups_follow_moves_closes_and_deletes(test_db):
+    """Prueba 1: Altas, movidas, ganados / perdidos y bajas actualizan los rollups en la misma transacción"""
+    agent_id = test_db.query(models.User).first().id
+    pipeline_id, (contact, visit, booking) = seed_pipeline()
+    a, b, c = create_deal(contact, 100, assigned_agent_id=agent_id), create_deal(contact, 200), create_deal(contact, 300)
+    assert client.put(f"/api/opportunities/deals/{a}/move", params={"stage_id": visit}).status_code == 200
+    assert client.put(f"/api/opportunities/deals/{b}/move", params={"stage_id": visit}).status_code == 200
+    assert client.put(f"/api/opportunities/deals/{a}/move", params={"stage_id": booking}).status_code == 200
+    assert client.post(f"/api/opportunities/deals/{a}/won").status_code == 200
+    assert client.post(f"/api/opportunities/deals/{b}/lost").status_code == 200
+    assert client.delete(f"/api/opportunities/deals/{c}").status_code == 200
+
+    data = report(pipeline_id)
+    stages = {s["name"]: s for s in data["stages"]}
+    assert [stages[n]["entered"] for n in ("Contacto", "Visita", "Reserva")] == [3, 2, 1]
+    assert stages["Contacto"]["conversion_rate"] == 0.667 and stages["Visita"]["conversion_rate"] == 0.5
+    assert stages["Contacto"]["advanced"] == 2 and stages["Contacto"]["time_in_stage_hours"]["deals"] == 2
+    assert stages["Contacto"]["time_in_stage_hours"]["p50"] is not None
+    assert (stages["Reserva"]["won"], stages["Reserva"]["won_value"]) == (1, 100)
+    assert (stages["Visita"]["lost"], stages["Visita"]["lost_value"]) == (1, 200)
+    assert data["totals"]["open_deals"] == 0 and data["totals"]["win_rate"] == 0.5
+
+    # Por agente: solo el deal asignado
+    mine = {s["name"]: s for s in report(pipeline_id, agent_id=agent_id)["stages"]}
+    assert [mine[n]["entered"] for n in ("Contacto", "Visita", "Reserva")] == [1, 1, 1]
+    assert report(pipeline_id, date_from="2020-01-01", date_to="2020-01-31")["totals"]["entered"] == 0
+    assert client.get("/api/opportunities/analytics/funnel", params={"pipeline_id": 999}).status_code == 404
+
+def test_rebuild_replays_history_with_stage_duration_percentiles(test_db):
+    """Prueba 2: rebuild() reconstruye los rollups desde deal_history (con días en etapa) y completa stage_entered_at"""
+    tenant_id = test_db.query(models.User).first().tenant_id
+    pipeline_id, (contact, visit, booking) = seed_pipeline()
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    for days_in_contact in (1, 2, 3, 10):
+        created = now - timedelta(days=12)
+        deal = models.Deal(tenant_id=tenant_id, title="Viejo", value=50, pipeline_stage_id=visit, status="OPEN", created_at=created)
+        deal.history.append(models.DealHistory(from_stage_id=contact, to_stage_id=visit, created_at=created + timedelta(days=days_in_contact)))
+        test_db.add(deal)
+    test_db.commit()
+
+    assert funnel.rebuild(test_db) == 4
+    stages = {s["name"]: s for s in report(pipeline_id)["stages"]}
+    assert stages["Contacto"]["entered"] == 4 and stages["Visita"]["entered"] == 4
+    assert stages["Visita"]["open_deals"] == 4 and stages["Visita"]["open_value"] == 200
+    durations = stages["Contacto"]["time_in_stage_hours"]
+    assert durations["deals"] == 4 and durations["avg"] == 96.0
+    # Percentiles interpolados en buckets de √2: caen en el bucket de la muestra (48 h -> [45.3, 64), 240 h -> [181, 256))
+    assert 45 <= durations["p50"] <= 64 and 181 <= durations["p90"] <= 256
+    deal = test_db.query(models.Deal).first()
+    test_db.refresh(deal)
+    assert deal.stage_entered_at == deal.history[0].created_at
+
+    # Idempotente: correrlo de nuevo no duplica
+    funnel.rebuild(test_db)
+    assert {s["name"]: s for s in report(pipeline_id)["stages"]}["Contacto"]["entered"] == 4
@@ -0,0 +1,105 @@
+import time
+import datetime
+import models
+import job_queue
+from conftest import client, TestingSessionLocal
+
+def test_enqueue_deduplicates_pending_jobs(test_db):
+    """Prueba 1: Dos ediciones seguidas de la misma propiedad dejan un solo job pendiente"""
+    job_queue.enqueue(test_db, job_queue.PROPERTY_AI_SYNC, 1)
+    job_queue.enqueue(test_db, job_queue.PROPERTY_AI_SYNC, 1)
+    job_queue.enqueue(test_db, job_queue.DEVELOPMENT_AI_SYNC, 1)
+    test_db.commit()
+
+    assert test_db.query(models.Job).count() == 2
+
+def test_failed_job_is_retried_with_backoff(test_db, monkeypatch):
+    """Prueba 2: Un handler que falla vuelve a 'pending' con run_after futuro y termina en 'failed'"""
+    monkeypatch.setattr(job_queue, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setitem(job_queue.HANDLERS, job_queue.PROPERTY_AI_SYNC, lambda entity_id: 1 / 0)
+    monkeypatch.setattr(job_queue.settings, "job_max_attempts", 2)
+
+    job_queue.enqueue(test_db, job_queue.PROPERTY_AI_SYNC, 7)
+    test_db.commit()
+
+    assert job_queue.process_next_job() is True
+    test_db.expire_all()
+    job = test_db.query(models.Job).one()
+    assert job.status == "pending"
+    assert job.attempts == 1
+    assert job.run_after > datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    assert "division by zero" in job.last_error
+
+    # Todavía no venció el backoff: no hay nada para tomar
+    assert job_queue.process_next_job() is False
+
+    job.run_after = datetime.datetime(2000, 1, 1)
+    test_db.commit()
+    assert job_queue.process_next_job() is True
+    test_db.expire_all()
+    assert test_db.query(models.Job).one().status == "failed"
+
+def test_property_create_enqueues_ai_sync(test_db):
+    """Prueba 3: Crear una propiedad no llama a Gemini en el request, deja el job en la cola"""
+    payload = {"title": "Depto QA", "address": "Calle 1", "city": "Rosario", "price": 1000, "type": "Apartment", "operation": "Sale"}
+    response = client.post("/api/properties", json=payload)
+    assert response.status_code == 200, response.text
+
+    job = test_db.query(models.Job).one()
+    assert job.kind == job_queue.PROPERTY_AI_SYNC
+    assert job.entity_id == response.json()["id"]
+    assert job.status == "pending"
+
+def test_embedded_consumers_process_the_queue(test_db, monkeypatch):
+    """Prueba: Sin worker.py, los consumidores del proceso web (lifespan) procesan los jobs encolados"""
+    monkeypatch.setattr(job_queue, "SessionLocal", TestingSessionLocal)
+    processed = []
+    monkeypatch.setitem(job_queue.HANDLERS, job_queue.PROPERTY_AI_SYNC, processed.append)
+    monkeypatch.setattr(job_queue.settings, "job_poll_interval_seconds", 0.05)
+
+    job_queue.enqueue(test_db, job_queue.PROPERTY_AI_SYNC, 3)
+    test_db.commit()
+    job_queue.start_embedded_consumers(1)
+    try:
+        deadline = time.monotonic() + 5
+        while not processed and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        job_queue.stop_embedded_consumers()
+    assert processed == [3]
+    test_db.expire_all()
+    assert test_db.query(models.Job).one().status == "done"
+
+def test_retry_conflicting_with_new_job_is_superseded(test_db, monkeypatch):
+    """Prueba: Si enqueue mete un pendiente mientras se reprograma un job fallido, el fallido queda superseded"""
+    monkeypatch.setattr(job_queue, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setitem(job_queue.HANDLERS, job_queue.PROPERTY_AI_SYNC, lambda entity_id: 1 / 0)
+    job_queue.enqueue(test_db, job_queue.PROPERTY_AI_SYNC, 5)
+    test_db.commit()
+
+    def enqueue_during_retry(low, high):
+        # Después del chequeo de `newer` y antes del commit del reintento
+        with TestingSessionLocal() as db:
+            job_queue.enqueue(db, job_queue.PROPERTY_AI_SYNC, 5)
+            db.commit()
+        return low
+    monkeypatch.setattr(job_queue.random, "uniform", enqueue_during_retry)
+
+    assert job_queue.process_next_job() is True
+    test_db.expire_all()
+    assert sorted(j.status for j in test_db.query(models.Job).all()) == ["pending", "superseded"]
+
+def test_stale_job_without_attempts_left_fails(test_db, monkeypatch):
+    """Prueba: Un job 'running' con el lock vencido y sin intentos restantes pasa a failed en vez de reintentarse"""
+    monkeypatch.setattr(job_queue, "SessionLocal", TestingSessionLocal)
+    stale = datetime.datetime(2000, 1, 1)
+    test_db.add_all([
+        models.Job(kind=job_queue.PROPERTY_AI_SYNC, entity_id=1, status="running", attempts=5, max_attempts=5, locked_at=stale, run_after=stale),
+        models.Job(kind=job_queue.PROPERTY_AI_SYNC, entity_id=2, status="running", attempts=1, max_attempts=5, locked_at=stale, run_after=stale),
+    ])
+    test_db.commit()
+
+    assert job_queue.claim_next_job()[2] == 2
+    assert job_queue.claim_next_job() is None
+    test_db.expire_all()
+    assert {j.entity_id: (j.status, j.attempts) for j in test_db.query(models.Job)} == {1: ("failed", 5), 2: ("running", 2)}
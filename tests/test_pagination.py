@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta
+import models
+import pagination
+from conftest import client
+
+def walk(url, **params):
+    """Recorre todas las páginas siguiendo X-Next-Cursor; devuelve (items, páginas)."""
+    items, pages, cursor = [], 0, None
+    while True:
+        response = client.get(url, params={**params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        items += response.json()
+        pages += 1
+        cursor = response.headers.get(pagination.NEXT_CURSOR_HEADER)
+        if not cursor:
+            return items, pages
+
+def test_contacts_and_properties_paginate_by_cursor(test_db):
+    """Prueba 1: Contactos y propiedades (con y sin búsqueda) se recorren por cursor sin repetir ni saltear filas"""
+    tenant_id = test_db.query(models.User).first().tenant_id
+    test_db.add_all([models.Contact(tenant_id=tenant_id, name=f"Contacto {i}") for i in range(5)])
+    test_db.add_all([models.Property(tenant_id=tenant_id, code=f"URB-P{i}", title="Casa" if i % 2 else "Depto", address=f"Calle {i}",
+                                     price=1000, operation="Sale", type="House", status="Active", city="Rosario") for i in range(5)])
+    test_db.commit()
+
+    contacts, pages = walk("/api/contacts", limit=2)
+    assert [c["name"] for c in contacts] == [f"Contacto {i}" for i in range(4, -1, -1)] and pages == 3
+    properties, _ = walk("/api/properties", limit=2)
+    assert [p["code"] for p in properties] == [f"URB-P{i}" for i in range(4, -1, -1)]
+    houses, _ = walk("/api/properties", limit=1, search="casa")
+    assert [p["code"] for p in houses] == ["URB-P3", "URB-P1"]
+
+    assert client.get("/api/contacts", params={"cursor": "no-es-un-cursor"}).status_code == 400
+    assert client.get("/api/properties", params={"cursor": pagination.encode_cursor(1, 2, 3)}).status_code == 400
+
+def test_page_size_is_bounded(test_db, monkeypatch):
+    """Prueba 2: limit se acota a page_size_max; sin limit ni cursor se devuelve lo de antes y con cursor page_size_default"""
+    monkeypatch.setattr(pagination.settings, "page_size_max", 3)
+    monkeypatch.setattr(pagination.settings, "page_size_default", 2)
+    user = test_db.query(models.User).first()
+    test_db.add_all([models.User(email=f"agente{i}@urbanocrm.com", tenant_id=user.tenant_id, is_active=True) for i in range(4)])
+    test_db.commit()
+
+    assert len(client.get("/api/team", params={"limit": 1000}).json()) == 3
+    # Un cliente que no lee X-Next-Cursor sigue recibiendo todo
+    response = client.get("/api/team")
+    assert len(response.json()) == 5 and pagination.NEXT_CURSOR_HEADER not in response.headers
+    first = client.get("/api/team", params={"limit": 1})
+    second = client.get("/api/team", params={"cursor": first.headers[pagination.NEXT_CURSOR_HEADER]})
+    assert len(second.json()) == 2 and second.headers[pagination.NEXT_CURSOR_HEADER]
+    members, _ = walk("/api/team", limit=2)
+    assert [m["email"] for m in members][0] == user.email and len(members) == 5
+
+def test_interactions_and_monitoring_logs_paginate_on_timestamp_and_id(test_db):
+    """Prueba 3: Bitácora y logs de monitoreo: más recientes primero, empates de fecha desempatados por id"""
+    user = test_db.query(models.User).first()
+    contact = models.Contact(tenant_id=user.tenant_id, name="Ana")
+    test_db.add(contact)
+    test_db.flush()
+    same_day = datetime(2026, 10, 1, 12, 0)
+    test_db.add_all([models.ContactInteraction(contact_id=contact.id, type="CALL", notes=f"n{i}", date=same_day + timedelta(days=i // 2))
+                     for i in range(5)])
+    test_db.add_all([models.MonitoringLog(user_id=user.id, app_name=f"app{i}", timestamp=same_day + timedelta(minutes=i % 3))
+                     for i in range(5)])
+    test_db.commit()
+
+    interactions, pages = walk(f"/api/contacts/{contact.id}/interactions", limit=2)
+    assert [i["notes"] for i in interactions] == ["n4", "n3", "n2", "n1", "n0"] and pages == 3
+    logs, _ = walk(f"/api/monitoring/user/{user.id}", limit=2)
+    assert [log["app_name"] for log in logs] == ["app2", "app4", "app1", "app3", "app0"]
+
+def test_null_sort_keys_are_not_skipped(test_db):
+    """Prueba 4: Filas viejas sin fecha: van primero (DESC, como en Postgres) y el cursor no las saltea ni corta"""
+    user = test_db.query(models.User).first()
+    at = datetime(2026, 10, 1, 12, 0)
+    stamps = [at, None, at + timedelta(minutes=1), None, at]
+    test_db.add_all([models.MonitoringLog(user_id=user.id, app_name=f"app{i}", timestamp=at) for i in range(5)])
+    test_db.commit()
+    for log, stamp in zip(test_db.query(models.MonitoringLog).order_by(models.MonitoringLog.id), stamps):
+        log.timestamp = stamp # el default completa la fecha al insertar
+    test_db.commit()
+
+    logs, _ = walk(f"/api/monitoring/user/{user.id}", limit=1)
+    assert [log["app_name"] for log in logs] == ["app3", "app1", "app2", "app4", "app0"]
+
+    # Ascendente: los NULL al final
+    columns = (models.MonitoringLog.timestamp, models.MonitoringLog.id)
+    query = test_db.query(models.MonitoringLog).filter(models.MonitoringLog.user_id == user.id)
+    seen, cursor = [], None
+    while True:
+        page, cursor = pagination.split_page(pagination.keyset(query, columns, cursor, 2, descending=False).all(), columns, 2)
+        seen += [log.app_name for log in page]
+        if not cursor:
+            break
+    assert seen == ["app0", "app4", "app2", "app1", "app3"]
@@ -0,0 +1,72 @@
+import re
+import sqlite3
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
+import models
+import phones
+from conftest import client, engine
+
+def test_phone_normalized_on_write(test_db):
+    """Prueba 1: phone_normalized se completa al crear y al editar, sin importar el formato"""
+    response = client.post("/api/contacts", json={"name": "Ana", "phone": "+54 9 (341) 555-1234", "type": "CLIENT"})
+    assert response.status_code == 200
+    contact = test_db.get(models.Contact, response.json()["id"])
+    assert contact.phone_normalized == "5493415551234"
+
+    contact.phone = "0054 9 341 555-9999"
+    assert contact.phone_normalized == "5493415559999"
+    assert phones.normalize_phone("5493415551234:7@s.whatsapp.net") == "5493415551234"
+    assert phones.normalize_phone("sin número") is None
+
+def test_duplicate_phone_in_other_format(test_db):
+    """Prueba 2: el mismo teléfono con otro formato se detecta como duplicado"""
+    assert client.post("/api/contacts", json={"name": "Ana", "phone": "5493415551234", "type": "CLIENT"}).status_code == 200
+    response = client.post("/api/contacts", json={"name": "Ana bis", "phone": "+54 9 341 555-1234", "type": "CLIENT"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Phone already registered"
+
+def test_conversation_names_in_one_query(test_db):
+    """Prueba 3: el listado de conversaciones resuelve los nombres con una sola consulta a contacts"""
+    tenant_id = test_db.query(models.User).first().tenant_id
+    test_db.add_all([
+        models.Contact(tenant_id=tenant_id, name="Ana", phone="+54 9 341 555-1234"),
+        models.Contact(tenant_id=tenant_id, name="Beto", phone="(341) 666-4321"),
+        models.BotConversation(phone="5493415551234@s.whatsapp.net", last_sender="user"),
+        models.BotConversation(phone="5493416664321@s.whatsapp.net", last_sender="bot"),
+        models.BotConversation(phone="5491100000000@s.whatsapp.net", last_sender="user"),
+    ])
+    test_db.commit()
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        response = client.get("/api/bots/conversations/list")
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert response.status_code == 200
+    names = {c["phone"]: c["contact_name"] for c in response.json()}
+    assert names == {
+        "5493415551234@s.whatsapp.net": "Ana",
+        "5493416664321@s.whatsapp.net": "Beto",
+        "5491100000000@s.whatsapp.net": None,
+    }
+    assert sum("FROM contacts" in s for s in statements) == 1
+
+def test_suffix_condition_uses_reversed_prefix_on_postgres():
+    """Prueba 4: en Postgres el sufijo se busca como prefijo de reverse() (usa ix_contacts_phone_reversed)"""
+    condition = phones.match_condition(models.Contact.phone_normalized, "+54 9 341 555-1234", "postgresql")
+    compiled = condition.compile(dialect=postgresql.dialect())
+    assert str(compiled).startswith("reverse(contacts.phone_normalized) LIKE %(reverse_1)s")
+    assert compiled.params == {"reverse_1": "43215551%"}
+
+def test_normalize_sql_matches_normalize_phone():
+    """Prueba: El backfill en SQL normaliza igual que normalize_phone, también los jid con ":device@dominio" """
+    db = sqlite3.connect(":memory:")
+    # split_part / regexp_replace de Postgres, para evaluar la misma expresión
+    db.create_function("split_part", 3, lambda text, sep, n: (text.split(sep) + [""] * n)[n - 1])
+    db.create_function("regexp_replace", -1, lambda text, pattern, repl, flags="": re.sub(pattern, repl, text, count=0 if "g" in flags else 1))
+    for raw in ("+54 9 (341) 555-1234", "0054 9 341 555-9999", "5493415551234:7@s.whatsapp.net", "5493415551234@s.whatsapp.net", "sin número"):
+        (normalized,) = db.execute(f"SELECT {phones.NORMALIZE_SQL} FROM (SELECT ? AS phone)", (raw,)).fetchone()
+        assert normalized == phones.normalize_phone(raw), raw
@@ -0,0 +1,45 @@
+from sqlalchemy import event
+import models
+import auth
+from conftest import client, engine, async_engine, TEST_EMAIL
+
+def count_user_queries(fn):
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    # Las rutas async pasan por el sync_engine del motor async
+    engines = (engine, async_engine.sync_engine)
+    for target in engines:
+        event.listen(target, "before_cursor_execute", listener)
+    try:
+        fn()
+    finally:
+        for target in engines:
+            event.remove(target, "before_cursor_execute", listener)
+    return sum("FROM users" in s for s in statements)
+
+def test_principal_is_cached_between_requests(test_db):
+    """Prueba 1: Solo el primer request busca el usuario; los siguientes salen del cache"""
+    assert count_user_queries(lambda: client.get("/api/contacts")) == 1
+    assert count_user_queries(lambda: [client.get("/api/contacts") for _ in range(3)]) == 0
+    assert auth.principal_stats()["hits"] >= 3
+
+def test_update_member_invalidates_principal(test_db):
+    """Prueba 2: Cambiar el rol desde el equipo se ve en el request siguiente (sin esperar el TTL)"""
+    me = test_db.query(models.User).filter(models.User.email == TEST_EMAIL).first()
+    assert client.get("/api/team").status_code == 200
+
+    response = client.put(f"/api/team/{me.id}", json={"role": "AGENT"})
+    assert response.status_code == 200
+    assert response.json()["role"] == "AGENT"
+    # Ya no es admin: no puede volver a editar al equipo
+    assert client.put(f"/api/team/{me.id}", json={"role": "SUPER_ADMIN"}).status_code == 403
+
+def test_deactivated_user_is_rejected(test_db):
+    """Prueba 3: Un usuario desactivado recibe 403 aunque estuviera cacheado"""
+    me = test_db.query(models.User).filter(models.User.email == TEST_EMAIL).first()
+    assert client.get("/api/contacts").status_code == 200
+
+    me.is_active = False
+    test_db.commit()
+    auth.invalidate_principal(TEST_EMAIL)
+    assert client.get("/api/contacts").status_code == 403
@@ -0,0 +1,197 @@
+import math
+import os
+from types import SimpleNamespace
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import sessionmaker
+from database import Base
+import models
+import search
+import pagination
+import embedding_cache
+from conftest import client
+
+# El ranking híbrido (tsvector + pgvector) solo corre en Postgres: TEST_POSTGRES_URL apunta a una base descartable
+# con las extensiones vector y pg_trgm disponibles. Sin ella esos tests se saltean.
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+SEARCH_VECTOR_DDL = (  # igual que main.py
+    "ALTER TABLE properties ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('spanish'::regconfig, coalesce(code, '') || ' ' || coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('spanish'::regconfig, coalesce(address, '') || ' ' || coalesce(neighborhood, '') || ' ' || coalesce(city, '')), 'B') || "
+    "setweight(to_tsvector('spanish'::regconfig, coalesce(search_content, '')), 'C')) STORED"
+)
+
+@pytest.fixture
+def pg_db():
+    if not TEST_POSTGRES_URL:
+        pytest.skip("TEST_POSTGRES_URL no configurada")
+    engine = create_engine(TEST_POSTGRES_URL)
+    with engine.begin() as conn:
+        for extension in ("vector", "pg_trgm"): # igual que main.py
+            conn.execute(text(f"CREATE EXTENSION IF NOT EXISTS {extension}"))
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text(SEARCH_VECTOR_DDL))
+    db = sessionmaker(bind=engine)()
+    try:
+        yield db
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=engine)
+        engine.dispose()
+
+def unit_vector(angle):
+    return [math.cos(angle), math.sin(angle)] + [0.0] * 766
+
+def seed_properties(db):
+    tenant_id = db.query(models.User).first().tenant_id
+    db.add_all([
+        models.Property(tenant_id=tenant_id, city="Rosario", code="URB-A1", title="Depto luminoso", address="Oroño 100", neighborhood="Pichincha", operation="Sale", type="Apartment", price=100000, bedrooms=1, status="Active"),
+        models.Property(tenant_id=tenant_id, city="Rosario", code="URB-B2", title="Casa con patio", address="Av. Pellegrini 200", neighborhood="Centro", operation="Rent", type="House", price=500, bedrooms=3, status="Active"),
+        models.Property(tenant_id=tenant_id, city="Rosario", code="URB-C3", title="Depto dado de baja", address="Oroño 300", neighborhood="Pichincha", operation="Sale", type="Apartment", price=90000, bedrooms=1, status="Deleted"),
+    ])
+    db.commit()
+
+def test_list_properties_search_and_filters(test_db):
+    """Prueba 1: El listado usa el módulo de búsqueda (texto por término + filtros estructurados)"""
+    seed_properties(test_db)
+
+    response = client.get("/api/properties", params={"search": "depto pichincha"})
+    assert response.status_code == 200
+    assert [p["code"] for p in response.json()] == ["URB-A1"]
+
+    response = client.get("/api/properties", params={"operation": "Rent", "property_type": "House"})
+    assert [p["code"] for p in response.json()] == ["URB-B2"]
+
+def test_bot_rag_search_maps_spanish_filters(test_db):
+    """Prueba 2: rag-search traduce 'venta'/'depto' y sólo devuelve propiedades activas"""
+    seed_properties(test_db)
+    response = client.post("/api/bots/rag-search", json={"operation": "venta", "type": "depto", "neighborhood": "pichincha"})
+    assert response.status_code == 200
+    assert [p["title"] for p in response.json()] == ["Depto luminoso"]
+
+def test_hybrid_ranking_fuses_text_and_vector_in_sql(test_db):
+    """Prueba 3: En Postgres ambos rankings se fusionan con RRF en una sola sentencia"""
+    conditions = search.property_filters(tenant_id=1)
+    ranking = search._hybrid_ranking(test_db, "depto Pichin", [0.1] * 768, conditions, 100)
+    sql = str(test_db.query(models.Property.id, ranking.c.score).join(ranking, models.Property.id == ranking.c.id)
+              .statement.compile(dialect=postgresql.dialect()))
+
+    assert "properties.search_vector @@ to_tsquery('spanish'::regconfig" in sql
+    assert "FULL OUTER JOIN ranking_semantic" in sql
+    assert "ORDER BY distance" in sql
+    assert search.prefix_tsquery("depto Pichin!") == "depto & pichin:*"
+    assert search.normalize_operation("alquiler temporario") == "Rent"
+    assert search.normalize_property_type("Departamento") == "Apartment"
+
+def test_suggest_ranks_across_entity_types(test_db):
+    """Prueba 4: /api/search/suggest mezcla contactos y propiedades, respeta el tope y la longitud mínima"""
+    seed_properties(test_db)
+    tenant_id = test_db.query(models.User).first().tenant_id
+    test_db.add(models.Contact(tenant_id=tenant_id, name="Oroño Martínez", phone="3415550000"))
+    test_db.add(models.Contact(tenant_id=tenant_id + 1, name="Oroño Otro Tenant"))
+    test_db.commit()
+
+    response = client.get("/api/search/suggest", params={"q": "oroño"})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert {(r["type"], r["label"]) for r in results} == {("contact", "Oroño Martínez"), ("property", "Depto luminoso")}
+
+    assert len(client.get("/api/search/suggest", params={"q": "oroño", "limit": 1}).json()["results"]) == 1
+    assert client.get("/api/search/suggest", params={"q": "or"}).json()["results"] == []
+    assert client.get("/api/search/suggest", params={"q": "100%"}).json()["results"] == []
+
+def test_amenity_and_portal_containment_filters(test_db):
+    """Prueba 5: Amenities y portales filtran por contención JSONB (@>) en Postgres y siguen andando en SQLite"""
+    tenant_id = test_db.query(models.User).first().tenant_id
+    listing = dict(tenant_id=tenant_id, city="Rosario", address="Oroño 500", operation="Sale", type="House", price=1, status="Active")
+    test_db.add_all([
+        models.Property(code="URB-P1", title="Casa con pileta", attributes=["pool", "pets", "grill"],
+                        published_on_portals=["Zonaprop"], **listing),
+        models.Property(code="URB-P2", title="Depto sin mascotas", attributes=["pool", "balcony"],
+                        published_on_portals=["argenprop"], **listing),
+    ])
+    test_db.commit()
+
+    response = client.get("/api/properties", params=[("amenities", "pool"), ("amenities", "pets")])
+    assert [p["code"] for p in response.json()] == ["URB-P1"]
+    response = client.get("/api/properties", params={"portal": "zonaprop"})
+    assert [p["code"] for p in response.json()] == ["URB-P1"]
+    response = client.get("/api/properties", params={"portal": "ZonaProp"})
+    assert [p["code"] for p in response.json()] == ["URB-P1"]
+    # En Postgres @> distingue mayúsculas (el LIKE de SQLite no): el valor ya va en minúscula
+    (portal_filter,) = search.property_filters(portals=["ZonaProp"], exclude_deleted=False)
+    assert portal_filter.right.value == ["zonaprop"]
+    response = client.post("/api/bots/rag-search", json={"amenities": "pool,balcony"})
+    assert [p["title"] for p in response.json()] == ["Depto sin mascotas"]
+
+    condition = search.json_contains(models.Property.attributes, ["pool", "pets"], "postgresql")
+    compiled = condition.compile(dialect=postgresql.dialect())
+    assert str(compiled) == "properties.attributes @> %(param_1)s::JSONB"
+    assert compiled.params == {"param_1": ["pool", "pets"]}
+
+def test_hybrid_pages_widen_the_candidate_window(monkeypatch):
+    """Prueba 6: Al agotarse la ventana de candidatos el cursor sigue con una del doble, sin repetir, hasta el tope"""
+    monkeypatch.setattr(search.settings, "search_candidates", 4)
+    monkeypatch.setattr(search.settings, "search_candidates_max", 16)
+    matches = [SimpleNamespace(id=i) for i in range(40, 0, -1)] # mejor score primero
+    score = lambda p: p.id / 100
+
+    def hybrid_rows(db, text, query_vector, conditions, options, window, limit, offset=0, after=None):
+        served = matches[:window // 2] if window > 4 else []
+        rows = [(p, score(p)) for p in matches[:window] if p not in served]
+        if after:
+            rows = [(p, s) for p, s in rows if (s, p.id) < tuple(after)]
+        return rows[offset:offset + limit]
+    monkeypatch.setattr(search, "_hybrid_rows", hybrid_rows)
+    monkeypatch.setattr(search, "_window_exhausted", lambda db, text, query_vector, conditions, window: window >= len(matches))
+    db = SimpleNamespace(get_bind=lambda: SimpleNamespace(dialect=SimpleNamespace(name="postgresql")))
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = search.search_page(db, "depto", limit=3, cursor=cursor, query_vector=[0.1])
+        seen += [p.id for p, _ in page]
+        if not cursor:
+            break
+    # 16 candidatos (el tope) en orden y sin repetir, aunque la primera ventana era de 4
+    assert seen == list(range(40, 24, -1))
+
+def test_hybrid_pages_run_the_real_ranking_query(pg_db, monkeypatch):
+    """Prueba 7: En Postgres el cursor (score, id, ventana) y las ventanas dobles recorren todo el ranking sin repetir"""
+    monkeypatch.setattr(search.settings, "search_candidates", 4)
+    monkeypatch.setattr(search.settings, "search_candidates_max", 16)
+    pg_db.add_all([
+        models.Property(code=f"URB-{i:03}", title=f"Depto {i}", city="Rosario", status="Active", embedding_descripcion=unit_vector(i / 10))
+        for i in range(12)
+    ] + [models.Property(code="URB-900", title="Casa quinta", city="Funes", status="Active", embedding_descripcion=unit_vector(3))])
+    pg_db.commit()
+    query_vector = unit_vector(0)
+
+    seen, windows, cursor = [], [], None
+    while True:
+        page, cursor = search.search_page(pg_db, "depto", limit=3, cursor=cursor, query_vector=query_vector)
+        seen += [p.code for p, _ in page]
+        if not cursor:
+            break
+        windows.append(pagination.decode_cursor(cursor, search.HYBRID_CURSOR)[2])
+    # Sin repetir aunque haya scores empatados en el borde de página; la casa entra solo por la rama semántica
+    assert len(seen) == len(set(seen))
+    assert sorted(seen) == sorted([f"URB-{i:03}" for i in range(12)] + ["URB-900"])
+    assert windows == sorted(windows) and windows[0] == 4 and windows[-1] > 4
+    # El más parecido al vector y con el término entra en la primera página
+    assert "URB-000" in seen[:3]
+
+def test_code_search_skips_the_vector_branch(pg_db, monkeypatch):
+    """Prueba 8: Buscar un código va directo a la columna code: no embebe el texto ni trae vecinos semánticos"""
+    monkeypatch.setattr(embedding_cache, "get_query_embedding", lambda text: pytest.fail("no debe embeber un código"))
+    assert search.is_code_query("URB-001") and search.is_code_query("urb-001 URB-002")
+    assert not search.is_code_query("depto URB-001") and not search.is_code_query("")
+    pg_db.add_all([models.Property(code=f"URB-{i:03}", title=f"Depto {i}", status="Active", embedding_descripcion=unit_vector(i / 10))
+                   for i in range(3)])
+    pg_db.commit()
+
+    # El parser de tsvector parte 'URB-001' en 'urb' y '-001': por ranking no aparecería
+    page, cursor = search.search_page(pg_db, "URB-001")
+    assert [p.code for p, _ in page] == ["URB-001"] and cursor is None
+    assert [p.code for p, _ in search.search_properties(pg_db, "urb-002 URB-000")] == ["URB-002", "URB-000"]
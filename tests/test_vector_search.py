@@ -0,0 +1,54 @@
+import pytest
+from sqlalchemy.dialects import postgresql
+import models
+import vector_search
+
+def compile_pg(query):
+    return str(query.statement.compile(dialect=postgresql.dialect()))
+
+def test_nearest_query_can_use_hnsw_index(test_db):
+    """Prueba 1: ORDER BY distancia ASC sobre la columna indexada, con filtros de tenant y estado"""
+    query = vector_search.nearest_query(
+        test_db, models.Property.embedding_descripcion, [0.1] * 768,
+        models.Property.id, tenant_id=1, exclude_status="Deleted", limit=6
+    )
+    sql = compile_pg(query)
+
+    assert "properties.embedding_descripcion <=> %(query_vector)s AS distance" in sql
+    assert "ORDER BY distance" in sql and "DESC" not in sql
+    assert "properties.embedding_descripcion IS NOT NULL" in sql
+    assert "properties.tenant_id = %(tenant_id_1)s" in sql
+    assert "properties.status NOT IN" in sql
+    assert "LIMIT" in sql
+
+def test_set_ef_search_is_noop_outside_postgres(test_db):
+    """Prueba 2: En SQLite no se intenta fijar hnsw.ef_search"""
+    vector_search.set_ef_search(test_db, 100)
+    assert vector_search.score(0.25) == 0.75
+
+def test_query_vector_is_a_typed_bind_parameter(test_db):
+    """Prueba 3: El vector no se embebe en el SQL; dos búsquedas distintas generan el mismo texto"""
+    from pgvector.sqlalchemy import Vector
+    first = vector_search.nearest_query(test_db, models.Contact.embedding_preferences, [0.1] * 768, tenant_id=1)
+    second = vector_search.nearest_query(test_db, models.Contact.embedding_preferences, [0.9] * 768, tenant_id=1)
+
+    assert compile_pg(first) == compile_pg(second)
+    assert "0.1" not in compile_pg(first)
+    param = first.statement.compile(dialect=postgresql.dialect()).binds["query_vector"]
+    assert isinstance(param.type, Vector)
+
+def test_bot_search_without_semantic_query(test_db, monkeypatch):
+    """Prueba 4: search_properties del bot sin texto semántico filtra y ordena sin pgvector"""
+    pytest.importorskip("google.generativeai")
+    import bot_engine
+    from conftest import TestingSessionLocal
+    monkeypatch.setattr(bot_engine, "SessionLocal", TestingSessionLocal)
+    test_db.add_all([
+        models.Property(title="Casa", code="B-1", operation="Sale", price=100, currency="USD", status="Active"),
+        models.Property(title="Depto", code="B-2", operation="Rent", price=50, currency="USD", status="Active"),
+        models.Property(title="Baja", code="B-3", operation="Sale", price=90, currency="USD", status="Deleted"),
+    ])
+    test_db.commit()
+
+    results = bot_engine.search_properties(operation="sale")
+    assert [r["code"] for r in results] == ["B-1"]
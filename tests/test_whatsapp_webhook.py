@@ -0,0 +1,168 @@
+import asyncio
+import datetime
+import hashlib
+import hmac
+import json
+import models
+import whatsapp_inbox
+from bot_processor import ConversationProcessor
+from conftest import client, TestingSessionLocal
+from routers import whatsapp as whatsapp_router
+from routers import bots as bots_router
+
+EVO_HEADERS = {"apikey": "evo-secret"}
+
+def signed(payload, secret="app-secret"):
+    body = json.dumps(payload).encode()
+    signature = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return {"content": body, "headers": {"Content-Type": "application/json", "X-Hub-Signature-256": signature}}
+
+def evolution(text, message_id, phone="5493415551234", instance="whatsapp_cloud_1"):
+    return {"event": "messages.upsert", "instance": instance,
+            "data": {"key": {"remoteJid": f"{phone}@s.whatsapp.net", "fromMe": False, "id": message_id},
+                     "pushName": "Ana", "message": {"conversation": text}}}
+
+class Recorder:
+    def __init__(self):
+        self.touched = []
+
+    def touch(self, instance, sender_id):
+        self.touched.append((instance, sender_id))
+
+def test_webhook_buffers_messages_and_drops_provider_retries(test_db, monkeypatch):
+    """Prueba 1: El webhook guarda y responde; un reintento con el mismo id no duplica; Cloud API por phone_number_id"""
+    recorder = Recorder()
+    monkeypatch.setattr(whatsapp_inbox, "get_dispatcher", lambda: recorder)
+    monkeypatch.setattr(whatsapp_router, "EVO_KEY", "evo-secret")
+    monkeypatch.setattr(whatsapp_router, "WA_APP_SECRET", "")
+    user = test_db.query(models.User).first()
+    test_db.add(models.Bot(user_id=user.id, platform="whatsapp", instance_name="whatsapp_cloud_1", status="connected",
+                           config={"official_whatsapp": {"phone_number_id": "10987", "access_token": "t", "app_secret": "app-secret"}}))
+    test_db.commit()
+
+    assert client.post("/api/whatsapp/webhook", json=evolution("hola", "ABC1"), headers=EVO_HEADERS).json()["queued"] == 1
+    assert client.post("/api/whatsapp/webhook", json=evolution("hola", "ABC1"), headers=EVO_HEADERS).json()["queued"] == 0
+    own = evolution("respuesta", "ABC2")
+    own["data"]["key"]["fromMe"] = True
+    assert client.post("/api/whatsapp/webhook", json=own, headers=EVO_HEADERS).json()["queued"] == 0
+    cloud = {"object": "whatsapp_business_account", "entry": [{"changes": [{"value": {
+        "metadata": {"phone_number_id": "10987"},
+        "messages": [{"id": "wamid.1", "from": "5493415550000", "type": "text", "text": {"body": "busco depto"}}]}}]}]}
+    assert client.post("/api/whatsapp/webhook", **signed(cloud)).json()["queued"] == 1
+
+    rows = test_db.query(models.WhatsappBuffer).order_by(models.WhatsappBuffer.id).all()
+    assert [(r.sender_id, r.message_content, r.status) for r in rows] == [
+        ("5493415551234", "hola", "pending"), ("5493415550000", "busco depto", "pending")]
+    assert recorder.touched == [("whatsapp_cloud_1", "5493415551234"), ("whatsapp_cloud_1", "5493415550000")]
+
+def test_burst_is_merged_into_one_bot_turn(test_db, monkeypatch):
+    """Prueba 2: Tres mensajes seguidos del mismo remitente -> un solo turno con el texto unido, filas en done"""
+    turns, replies = [], []
+    monkeypatch.setattr(whatsapp_inbox, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(whatsapp_inbox, "run_bot_turn", lambda instance, sender, text: turns.append(text) or "¡Hola Ana!")
+    monkeypatch.setattr(whatsapp_inbox, "send_reply", lambda credentials, sender, text: replies.append((sender, text)))
+    user = test_db.query(models.User).first()
+    test_db.add(models.Bot(user_id=user.id, platform="whatsapp", instance_name="whatsapp_cloud_1", status="connected",
+                           config={"official_whatsapp": {"phone_number_id": "10987", "access_token": "t"}}))
+    test_db.add(models.Contact(tenant_id=user.tenant_id, name="Ana", phone="+54 9 341 555-1234"))
+    test_db.commit()
+
+    async def scenario():
+        processor = ConversationProcessor(max_concurrency=2)
+        dispatcher = whatsapp_inbox.BurstDispatcher(quiet_seconds=0.05, max_wait_seconds=1, processor=processor)
+        for i, text in enumerate(["hola", "busco depto", "en centro"]):
+            with TestingSessionLocal() as db:
+                for key in whatsapp_inbox.store(db, whatsapp_inbox.parse_webhook(db, evolution(text, f"M{i}"))):
+                    dispatcher.touch(*key)
+                db.commit()
+            await asyncio.sleep(0.01)
+        assert turns == [] and dispatcher.pending() == 1
+        await asyncio.sleep(0.1)
+        await processor.shutdown()
+    asyncio.run(scenario())
+
+    assert turns == ["hola\nbusco depto\nen centro"] and replies == [("5493415551234", "¡Hola Ana!")]
+    test_db.expire_all()
+    assert {r.status for r in test_db.query(models.WhatsappBuffer).all()} == {"done"}
+    assert test_db.query(models.Contact).first().last_contact_date is not None
+    stats = whatsapp_inbox.stats()
+    assert stats["messages_per_turn"] and stats["llm_calls_saved"] >= 2
+
+def test_webhook_rejects_unauthenticated_payloads(test_db, monkeypatch):
+    """Prueba 3: Sin apikey de Evolution o sin firma válida de Meta el webhook responde 401 y no guarda nada"""
+    monkeypatch.setattr(whatsapp_inbox, "get_dispatcher", lambda: Recorder())
+    monkeypatch.setattr(whatsapp_router, "EVO_KEY", "evo-secret")
+    monkeypatch.setattr(whatsapp_router, "WA_APP_SECRET", "app-secret")
+    cloud = {"object": "whatsapp_business_account", "entry": [{"changes": [{"value": {
+        "metadata": {"phone_number_id": "10987"},
+        "messages": [{"id": "wamid.2", "from": "5493415550000", "type": "text", "text": {"body": "hola"}}]}}]}]}
+
+    assert client.post("/api/whatsapp/webhook", json=evolution("hola", "X1")).status_code == 401
+    assert client.post("/api/whatsapp/webhook", json=evolution("hola", "X2"), headers={"apikey": "otra"}).status_code == 401
+    assert client.post("/api/whatsapp/webhook", json=cloud).status_code == 401
+    assert client.post("/api/whatsapp/webhook", **signed(cloud, secret="otro")).status_code == 401
+    tampered = signed(cloud)
+    tampered["content"] = tampered["content"].replace(b"hola", b"chau")
+    assert client.post("/api/whatsapp/webhook", **tampered).status_code == 401
+    assert test_db.query(models.WhatsappBuffer).count() == 0
+
+def test_disconnected_bot_gets_no_turn_and_no_reply(test_db, monkeypatch):
+    """Prueba 4: Después de /disconnect los mensajes de la instancia quedan ignored: sin turno ni respuesta global"""
+    turns, sent = [], []
+    monkeypatch.setattr(whatsapp_inbox, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(whatsapp_inbox, "run_bot_turn", lambda instance, sender, text: turns.append(text) or "hola")
+    monkeypatch.setattr(whatsapp_router.requests, "request", lambda *args, **kwargs: sent.append(kwargs))
+    monkeypatch.setattr(whatsapp_router, "WA_ACCESS_TOKEN", "global-token")
+    monkeypatch.setattr(whatsapp_router, "WA_PHONE_NUMBER_ID", "global-number")
+    user = test_db.query(models.User).first()
+    test_db.add(models.Bot(user_id=user.id, platform="whatsapp", instance_name=f"whatsapp_cloud_{user.id}", status="connected",
+                           config={"official_whatsapp": {"phone_number_id": "10987", "access_token": "t"}, "tags": []}))
+    test_db.commit()
+    assert client.post("/api/bots/disconnect", json={"platform": "whatsapp"}).status_code == 200
+    test_db.expire_all()
+    assert "official_whatsapp" not in test_db.query(models.Bot).one().config
+
+    with TestingSessionLocal() as db:
+        whatsapp_inbox.store(db, whatsapp_inbox.parse_webhook(db, evolution("hola", "D1", instance=f"whatsapp_cloud_{user.id}")))
+        db.commit()
+    assert whatsapp_inbox.process_pending(f"whatsapp_cloud_{user.id}", "5493415551234") is None
+    assert turns == [] and sent == []
+    test_db.expire_all()
+    assert test_db.query(models.WhatsappBuffer).one().status == "ignored"
+
+def test_evolution_only_bot_replies_through_its_instance(test_db, monkeypatch):
+    """Prueba 5: Un bot conectado sin credenciales de la Cloud API responde por su instancia de Evolution"""
+    sent = []
+    monkeypatch.setattr(whatsapp_inbox, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(whatsapp_inbox, "run_bot_turn", lambda instance, sender, text: "hola, soy el bot")
+    monkeypatch.setattr(bots_router, "EVO_URL", "https://evo.test")
+    monkeypatch.setattr(bots_router, "EVO_KEY", "evo-secret")
+    monkeypatch.setattr(bots_router.requests, "request", lambda method, url, **kwargs: sent.append((url, kwargs["json"])))
+    user = test_db.query(models.User).first()
+    test_db.add(models.Bot(user_id=user.id, platform="whatsapp", instance_name="urbano_crm_user_1", status="connected", config={}))
+    test_db.commit()
+
+    with TestingSessionLocal() as db:
+        whatsapp_inbox.store(db, whatsapp_inbox.parse_webhook(db, evolution("hola", "E1", instance="urbano_crm_user_1")))
+        db.commit()
+    assert whatsapp_inbox.process_pending("urbano_crm_user_1", "5493415551234") == "hola, soy el bot"
+    assert sent == [("https://evo.test/message/sendText/urbano_crm_user_1", {"number": "5493415551234", "text": "hola, soy el bot"})]
+    test_db.expire_all()
+    assert test_db.query(models.WhatsappBuffer).one().status == "done"
+
+def test_recover_measures_the_timeout_from_the_claim(test_db):
+    """Prueba 6: recover() libera lo que se tomó hace más del timeout, no lo viejo que otro worker acaba de tomar"""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    long_ago = now - datetime.timedelta(hours=2)
+    test_db.add_all([
+        models.WhatsappBuffer(instance="i1", sender_id="111", provider_message_id="R1", message_content="hola",
+                              status="processing", received_at=long_ago, claimed_at=now),
+        models.WhatsappBuffer(instance="i1", sender_id="222", provider_message_id="R2", message_content="hola",
+                              status="processing", received_at=long_ago, claimed_at=long_ago),
+    ])
+    test_db.commit()
+
+    assert whatsapp_inbox.recover(test_db) == [("i1", "222")]
+    test_db.expire_all()
+    statuses = dict(test_db.query(models.WhatsappBuffer.sender_id, models.WhatsappBuffer.status).all())
+    assert statuses == {"111": "processing", "222": "pending"}
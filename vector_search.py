@@ -0,0 +1,80 @@
+import math
+import logging
+from typing import List, Optional, Sequence
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+from settings import settings
+
+logger = logging.getLogger("urbanocrm.vector_search")
+
+# Búsqueda ANN sobre los índices HNSW (vector_cosine_ops) de properties.embedding_descripcion,
+# developments.embedding_proyecto y contacts.embedding_preferences.
+# Para que Postgres use el índice la consulta tiene que ser ORDER BY <distancia> ASC LIMIT n
+# sobre la columna indexada; el score (1 - distancia) se calcula aparte.
+
+def set_ef_search(db: Session, ef_search: int):
+    """
+    Fija hnsw.ef_search (y opcionalmente hnsw.iterative_scan) para la transacción actual.
+    Más alto = mejor recall y más latencia. En SQLite (tests) no hace nada.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    db.execute(text("SELECT set_config('hnsw.ef_search', :ef, true)"), {"ef": str(ef_search)})
+    if settings.vector_search_iterative_scan:
+        db.execute(text("SELECT set_config('hnsw.iterative_scan', :mode, true)"), {"mode": settings.vector_search_iterative_scan})
+
+def nearest_query(
+    db: Session,
+    vector_column,
+    query_vector: List[float],
+    *columns,
+    tenant_id: Optional[int] = None,
+    status: Optional[Sequence[str]] = None,
+    exclude_status: Optional[Sequence[str]] = None,
+    filters: Sequence = (),
+    limit: int = 10,
+):
+    """
+    Arma (sin ejecutar) la consulta de los `limit` vecinos más cercanos por distancia coseno.
+
+    - `vector_column`: columna indexada, ej. models.Property.embedding_descripcion.
+    - `columns`: qué seleccionar (por defecto la entidad completa). Cada fila trae además `distance`.
+    - `tenant_id` / `status` / `exclude_status`: filtros estándar sobre la tabla de la columna.
+    - `filters`: condiciones extra (operación, precio, zona...).
+    """
+    model = vector_column.class_
+    # El vector viaja como parámetro tipado (pgvector Vector), nunca como literal en el SQL:
+    # el texto de la sentencia es siempre el mismo y se puede cachear/preparar.
+    vector_param = bindparam("query_vector", query_vector, type_=vector_column.type)
+    distance = vector_column.cosine_distance(vector_param).label("distance")
+
+    query = db.query(*(columns or (model,)), distance).filter(vector_column.isnot(None))
+    if tenant_id is not None:
+        query = query.filter(model.tenant_id == tenant_id)
+    if status:
+        query = query.filter(model.status.in_([status] if isinstance(status, str) else list(status)))
+    if exclude_status:
+        query = query.filter(model.status.notin_([exclude_status] if isinstance(exclude_status, str) else list(exclude_status)))
+    for condition in filters:
+        query = query.filter(condition)
+    return query.order_by(distance).limit(limit)
+
+def nearest(db: Session, vector_column, query_vector: List[float], *columns, limit: int = 10, ef_search: Optional[int] = None, **kwargs):
+    """Ejecuta nearest_query con hnsw.ef_search fijado para la transacción."""
+    # ef_search < limit haría que el índice devuelva menos filas de las pedidas
+    set_ef_search(db, max(ef_search or settings.vector_search_ef_search, limit))
+    return nearest_query(db, vector_column, query_vector, *columns, limit=limit, **kwargs).all()
+
+def score(distance: float) -> float:
+    """Similaridad coseno (1 - distancia), lo que exponen los endpoints como `score`."""
+    return 1 - distance if distance is not None else 0.0
+
+def cosine_similarity(a, b) -> float:
+    """Similaridad coseno calculada en Python (para filas que no vienen ordenadas por distancia)."""
+    if a is None or b is None:
+        return 0.0
+    a, b = [float(x) for x in a], [float(x) for x in b]
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(x * x for x in b))
+    return sum(x * y for x, y in zip(a, b)) / norm if norm else 0.0
@@ -0,0 +1,332 @@
+import asyncio
+import datetime
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import or_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from settings import settings
+from database import SessionLocal
+import models
+import phones
+import bot_processor
+
+logger = logging.getLogger("urbanocrm.whatsapp_inbox")
+
+# Entrada de WhatsApp: webhook -> whatsapp_buffer -> un turno del bot por ráfaga.
+#
+# - El webhook (routers/whatsapp.py) solo parsea, guarda en whatsapp_buffer y responde 200: los proveedores reintentan
+#   si tardamos. Los reintentos traen el mismo id de mensaje: unique (instance, provider_message_id) + ON CONFLICT
+#   DO NOTHING los descarta.
+# - La gente manda "hola" / "busco depto" / "en centro" en tres mensajes. BurstDispatcher espera a que el remitente
+#   haga silencio whatsapp_debounce_seconds (como mucho whatsapp_debounce_max_seconds desde el primero) y recién
+#   ahí encola un turno en bot_processor (orden por teléfono, tope global).
+# - El turno (process_pending, en un hilo) toma los pendientes del remitente con un UPDATE ... RETURNING (cada fila
+#   la procesa un solo proceso aunque haya varios workers), los une en un solo mensaje, corre el BotEngine, manda la
+#   respuesta y marca done / failed. Solo con el bot conectado y con un canal propio para responder: sus credenciales
+#   de la Cloud API o, sin ellas, su instancia de Evolution (EVO_URL / EVO_KEY). Si no, los mensajes quedan ignored
+#   (nunca se responde con las credenciales globales WA_* en nombre de un bot).
+# - Al arrancar, recover() reencola lo que quedó pendiente y libera lo que quedó en processing tras una caída.
+
+PENDING, PROCESSING, DONE, FAILED = "pending", "processing", "done", "failed"
+IGNORED = "ignored" # el bot de la instancia no está conectado: ni turno ni respuesta
+Key = Tuple[str, str] # (instance, sender_id)
+
+_counters = {"received": 0, "duplicates": 0, "turns": 0, "merged_messages": 0, "ignored": 0}
+_counters_lock = threading.Lock()
+
+def _count(name: str, n: int = 1):
+    with _counters_lock:
+        _counters[name] += n
+
+@dataclass
+class InboundMessage:
+    instance: str
+    sender_id: str # dígitos del número (jid sin @s.whatsapp.net)
+    provider_message_id: Optional[str]
+    text: Optional[str]
+    file_url: Optional[str] = None
+
+# --- Parseo del webhook ---
+
+def _evolution_text(message: dict) -> Optional[str]:
+    return (message.get("conversation")
+            or (message.get("extendedTextMessage") or {}).get("text")
+            or (message.get("imageMessage") or {}).get("caption")
+            or (message.get("videoMessage") or {}).get("caption")
+            or (message.get("documentMessage") or {}).get("caption"))
+
+def _cloud_text(message: dict) -> Optional[str]:
+    kind = message.get("type")
+    if kind == "text":
+        return (message.get("text") or {}).get("body")
+    if kind == "button":
+        return (message.get("button") or {}).get("text")
+    if kind == "interactive":
+        interactive = message.get("interactive") or {}
+        reply = interactive.get("button_reply") or interactive.get("list_reply") or {}
+        return reply.get("title")
+    return (message.get(kind) or {}).get("caption") if kind else None
+
+def cloud_instances(db: Session) -> Dict[str, str]:
+    """phone_number_id de la Cloud API -> instance_name del bot que lo tiene configurado."""
+    bots = db.query(models.Bot.instance_name, models.Bot.config).filter(models.Bot.instance_name != None).all()
+    return {
+        str(config["official_whatsapp"]["phone_number_id"]): instance_name
+        for instance_name, config in bots
+        if config and (config.get("official_whatsapp") or {}).get("phone_number_id")
+    }
+
+def _cloud_phone_number_ids(payload: dict) -> set:
+    return {
+        str(((change.get("value") or {}).get("metadata") or {}).get("phone_number_id"))
+        for entry in payload.get("entry") or [] for change in entry.get("changes") or []
+    }
+
+def cloud_app_secrets(db: Session, payload: dict) -> List[str]:
+    """app_secret (config.official_whatsapp) de los bots dueños de los phone_number_id del payload: firma del webhook."""
+    phone_number_ids = _cloud_phone_number_ids(payload)
+    bots = db.query(models.Bot.config).filter(models.Bot.instance_name != None).all()
+    return [
+        official["app_secret"]
+        for (config,) in bots
+        for official in [(config or {}).get("official_whatsapp") or {}]
+        if official.get("app_secret") and str(official.get("phone_number_id")) in phone_number_ids
+    ]
+
+def parse_webhook(db: Session, payload: dict) -> List[InboundMessage]:
+    """Mensajes entrantes de un payload de Evolution (messages.upsert) o de la Cloud API de Meta. Ignora los propios."""
+    messages = []
+    if payload.get("event") == "messages.upsert":
+        data = payload.get("data") or {}
+        for item in data if isinstance(data, list) else [data]:
+            key = item.get("key") or {}
+            sender = phones.normalize_phone(key.get("remoteJid"))
+            if key.get("fromMe") or not sender or str(key.get("remoteJid", "")).endswith("@g.us"):
+                continue
+            messages.append(InboundMessage(payload.get("instance"), sender, key.get("id"), _evolution_text(item.get("message") or {})))
+    elif payload.get("object") == "whatsapp_business_account":
+        instances = None
+        for entry in payload.get("entry") or []:
+            for change in entry.get("changes") or []:
+                value = change.get("value") or {}
+                if not value.get("messages"):
+                    continue # statuses (entregado / leído)
+                if instances is None:
+                    instances = cloud_instances(db)
+                instance = instances.get(str((value.get("metadata") or {}).get("phone_number_id")))
+                if not instance:
+                    logger.warning(f"WA webhook: phone_number_id sin bot configurado: {value.get('metadata')}")
+                    continue
+                for message in value["messages"]:
+                    sender = phones.normalize_phone(message.get("from"))
+                    if sender:
+                        messages.append(InboundMessage(instance, sender, message.get("id"), _cloud_text(message)))
+    return [m for m in messages if m.instance and (m.text or m.file_url)]
+
+# --- Buffer ---
+
+def store(db: Session, messages: Sequence[InboundMessage]) -> List[Key]:
+    """Guarda los mensajes nuevos (sin commit); devuelve los remitentes con algo nuevo. Los duplicados no cuentan."""
+    insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    senders = []
+    for m in messages:
+        stmt = insert(models.WhatsappBuffer).values(
+            instance=m.instance, sender_id=m.sender_id, provider_message_id=m.provider_message_id,
+            message_content=m.text, file_url=m.file_url, status=PENDING,
+        ).on_conflict_do_nothing(index_elements=["instance", "provider_message_id"])
+        if db.execute(stmt).rowcount:
+            _count("received")
+            if (m.instance, m.sender_id) not in senders:
+                senders.append((m.instance, m.sender_id))
+        else:
+            _count("duplicates")
+    return senders
+
+def claim(db: Session, instance: str, sender_id: str) -> list:
+    """Pasa a processing los pendientes del remitente y los devuelve en orden de llegada (con commit)."""
+    buffer = models.WhatsappBuffer
+    rows = db.execute(
+        update(buffer).where(buffer.instance == instance, buffer.sender_id == sender_id, buffer.status == PENDING)
+        .values(status=PROCESSING, claimed_at=datetime.datetime.now(datetime.timezone.utc)).returning(buffer.id, buffer.message_content, buffer.file_url, buffer.received_at)
+    ).all()
+    db.commit()
+    return sorted(rows, key=lambda r: (r.received_at, r.id))
+
+def finish(db: Session, ids: Sequence[int], status: str):
+    if ids:
+        db.execute(update(models.WhatsappBuffer).where(models.WhatsappBuffer.id.in_(ids)).values(status=status))
+        db.commit()
+
+def merge(rows: Sequence) -> str:
+    """Un solo mensaje para el bot con la ráfaga, en orden, un renglón por mensaje."""
+    return "\n".join(part for r in rows for part in (r.message_content, r.file_url) if part)
+
+# --- Turno ---
+
+def run_bot_turn(instance: str, sender_id: str, text: str) -> str:
+    return bot_processor.run_turn(instance, sender_id, text)
+
+def bot_credentials(db: Session, instance: str) -> Optional[dict]:
+    """Canal de respuesta del bot si está conectado: config.official_whatsapp (con token y phone_number_id) o, sin
+    esas credenciales, su instancia de Evolution. None si no está conectado o no tiene por dónde responder."""
+    bot = db.query(models.Bot.status, models.Bot.config).filter(models.Bot.instance_name == instance).first()
+    if not bot or bot.status != "connected":
+        return None
+    official = (bot.config or {}).get("official_whatsapp") or {}
+    if official.get("access_token") and official.get("phone_number_id"):
+        return {**official, "provider": "cloud"}
+    from routers.bots import EVO_URL, EVO_KEY
+    if EVO_URL and EVO_KEY:
+        return {"provider": "evolution", "instance": instance}
+    return None
+
+def send_reply(credentials: dict, sender_id: str, text: str):
+    """Respuesta por el canal del bot (bot_credentials): la Cloud API o la instancia de Evolution."""
+    if credentials["provider"] == "evolution":
+        from routers.bots import call_evolution
+        call_evolution("POST", f"/message/sendText/{credentials['instance']}", {"number": sender_id, "text": text})
+        return
+    from routers.whatsapp import call_wa_cloud
+    call_wa_cloud("/messages", {"messaging_product": "whatsapp", "to": sender_id, "type": "text", "text": {"body": text}},
+                  access_token=credentials["access_token"], phone_number_id=credentials["phone_number_id"])
+
+def touch_contact(db: Session, instance: str, sender_id: str):
+    """last_contact_date del contacto del remitente (dentro del tenant del dueño del bot)."""
+    tenant_id = db.query(models.User.tenant_id).join(models.Bot, models.Bot.user_id == models.User.id).filter(
+        models.Bot.instance_name == instance).scalar()
+    condition = phones.match_condition(models.Contact.phone_normalized, sender_id, db.get_bind().dialect.name)
+    if tenant_id is None or condition is None:
+        return
+    db.query(models.Contact).filter(models.Contact.tenant_id == tenant_id, condition).update(
+        {models.Contact.last_contact_date: datetime.datetime.now(datetime.timezone.utc)}, synchronize_session=False)
+    db.commit()
+
+def process_pending(instance: str, sender_id: str, _text: Optional[str] = None) -> Optional[str]:
+    """Turno de bot_processor (hilo): los pendientes del remitente como un solo mensaje. None si no había nada."""
+    with SessionLocal() as db:
+        rows = claim(db, instance, sender_id)
+        if not rows:
+            return None
+        ids = [r.id for r in rows]
+        credentials = bot_credentials(db, instance)
+        if credentials is None:
+            logger.warning(f"WA inbox: {instance} no está conectado, {len(ids)} mensajes de {sender_id} ignorados")
+            _count("ignored", len(ids))
+            finish(db, ids, IGNORED)
+            return None
+        _count("turns")
+        _count("merged_messages", len(rows))
+        try:
+            touch_contact(db, instance, sender_id)
+            reply = run_bot_turn(instance, sender_id, merge(rows))
+            if reply:
+                send_reply(credentials, sender_id, reply)
+        except Exception:
+            finish(db, ids, FAILED)
+            raise
+        finish(db, ids, DONE)
+        return reply
+
+# --- Debounce ---
+
+class BurstDispatcher:
+    """Un timer por remitente en el event loop; cada mensaje nuevo lo corre hasta el tope de espera."""
+    def __init__(self, quiet_seconds: Optional[float] = None, max_wait_seconds: Optional[float] = None,
+                 turn: Callable = process_pending, processor: Optional[bot_processor.ConversationProcessor] = None):
+        self.quiet_seconds = settings.whatsapp_debounce_seconds if quiet_seconds is None else quiet_seconds
+        self.max_wait_seconds = settings.whatsapp_debounce_max_seconds if max_wait_seconds is None else max_wait_seconds
+        self.turn = turn
+        self.processor = processor
+        self._timers: Dict[Key, asyncio.TimerHandle] = {}
+        self._first_seen: Dict[Key, float] = {}
+        self._dispatched = set()
+
+    def touch(self, instance: str, sender_id: str):
+        """Llamar desde el event loop después de guardar un mensaje nuevo del remitente."""
+        key = (instance, sender_id)
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        first = self._first_seen.setdefault(key, now)
+        delay = max(0.0, min(self.quiet_seconds, first + self.max_wait_seconds - now))
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        self._timers[key] = loop.call_later(delay, self._dispatch, key)
+
+    def _dispatch(self, key: Key):
+        self._timers.pop(key, None)
+        self._first_seen.pop(key, None)
+        processor = self.processor or bot_processor.get_processor()
+        future = processor.submit(*key, None, turn=self.turn)
+        self._dispatched.add(future)
+        future.add_done_callback(self._done)
+
+    def _done(self, future: asyncio.Future):
+        # El error ya lo loguea bot_processor (done-callback del turno)
+        self._dispatched.discard(future)
+
+    def pending(self) -> int:
+        return len(self._timers)
+
+    async def flush(self):
+        """Despacha ya los timers pendientes y espera los turnos (apagado, tests)."""
+        for key, timer in list(self._timers.items()):
+            timer.cancel()
+            self._dispatch(key)
+        if self._dispatched:
+            await asyncio.gather(*list(self._dispatched), return_exceptions=True)
+
+def recover(db: Session) -> List[Key]:
+    """Remitentes con mensajes pendientes tras un reinicio; los processing viejos (turno cortado) vuelven a pending.
+    El timeout se mide desde claimed_at: un mensaje viejo que otro worker acaba de tomar sigue siendo suyo. Sin
+    claimed_at (tomados antes de la columna) cuentan como viejos."""
+    buffer = models.WhatsappBuffer
+    stale = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=settings.whatsapp_processing_timeout_seconds)
+    db.execute(update(buffer).where(buffer.status == PROCESSING, or_(buffer.claimed_at == None, buffer.claimed_at < stale))
+               .values(status=PENDING, claimed_at=None))
+    db.commit()
+    return [tuple(r) for r in db.query(buffer.instance, buffer.sender_id).filter(
+        buffer.status == PENDING, buffer.instance != None).distinct().all()]
+
+def stats() -> dict:
+    with _counters_lock:
+        counters = dict(_counters)
+    turns = counters["turns"]
+    return {
+        **counters,
+        "messages_per_turn": round(counters["merged_messages"] / turns, 2) if turns else None,
+        "llm_calls_saved": counters["merged_messages"] - turns,
+        "waiting_senders": _dispatcher.pending() if _dispatcher else 0,
+    }
+
+_dispatcher: Optional[BurstDispatcher] = None
+
+def get_dispatcher() -> BurstDispatcher:
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = BurstDispatcher()
+    return _dispatcher
+
+async def start():
+    """Lifespan de main.py: reencola los remitentes con mensajes pendientes."""
+    senders = await asyncio.to_thread(_recover)
+    dispatcher = get_dispatcher()
+    for instance, sender_id in senders:
+        dispatcher.touch(instance, sender_id)
+    if senders:
+        logger.info(f"WA inbox: {len(senders)} conversaciones pendientes reencoladas")
+
+def _recover() -> List[Key]:
+    with SessionLocal() as db:
+        return recover(db)
+
+async def shutdown():
+    global _dispatcher
+    if _dispatcher is not None:
+        await _dispatcher.flush()
+        _dispatcher = None
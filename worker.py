@@ -0,0 +1,59 @@
+"""
+Worker de la cola de jobs (sincronización IA de propiedades, emprendimientos y preferencias de leads, resúmenes de
+conversación del bot). Corre fuera de los workers web:
+
+  python worker.py --concurrency 4
+
+Por defecto cada proceso web ya consume la cola (job_embedded_consumers, lifespan de main.py). Para escalar la cola
+aparte, correr este worker como otro servicio con la misma imagen y JOB_EMBEDDED_CONSUMERS=0 en la web:
+
+  docker run --env-file .env <imagen> python worker.py
+"""
+import os
+import sys
+import signal
+import logging
+import argparse
+import threading
+
+sys.path.append(os.getcwd())
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from settings import settings
+import job_queue
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+logger = logging.getLogger("urbanocrm.jobs")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=settings.job_worker_concurrency)
+    parser.add_argument("--poll-interval", type=float, default=settings.job_poll_interval_seconds)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+    stop_event = threading.Event()
+
+    def shutdown(signum, frame):
+        logger.info("Worker: señal recibida, terminando jobs en curso...")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    consumers = [
+        threading.Thread(target=job_queue.run_consumer, args=(stop_event, args.poll_interval), name=f"consumer-{i}")
+        for i in range(args.concurrency)
+    ]
+    for t in consumers:
+        t.start()
+    logger.info(f"Worker: {args.concurrency} consumidores activos ({', '.join(job_queue.HANDLERS)}).")
+
+    for t in consumers:
+        t.join()
+    logger.info("Worker detenido.")
+
+if __name__ == "__main__":
+    main()